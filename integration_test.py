@@ -6,16 +6,23 @@ Tests the complete audio system integration between floors
 
 import paho.mqtt.client as mqtt
 import json
+import os
+import sys
 import time
 import threading
 from datetime import datetime
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'python'))
+from mqtt_client import load_mqtt_config
+
 class AudioIntegrationTest:
     def __init__(self):
-        self.mqtt_broker = "192.168.1.102" 
-        self.mqtt_port = 1883
-        self.mqtt_user = "homeguard"
-        self.mqtt_pass = "pu2clr123456"
+        # Broker/credenciais: homeguard_mqtt_config.json ou HOMEGUARD_MQTT_*
+        mqtt_config = load_mqtt_config()
+        self.mqtt_broker = mqtt_config['host']
+        self.mqtt_port = mqtt_config['port']
+        self.mqtt_user = mqtt_config['username']
+        self.mqtt_pass = mqtt_config['password']
         
         self.client = None
         self.messages_received = []
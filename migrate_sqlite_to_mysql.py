@@ -5,29 +5,219 @@
 HomeGuard - SQLite to MySQL Data Migration
 Script para migrar dados do SQLite para MySQL
 ============================================
+
+Motor genérico de migração:
+- lê cada tabela em blocos por chave primária (WHERE id > ? LIMIT n), sem fetchall()
+- grava com executemany multi-row + ON DUPLICATE KEY UPDATE, um commit por bloco
+- migra as tabelas em paralelo (uma thread e conexões próprias por tabela)
+- grava checkpoint por tabela: uma execução interrompida continua de onde parou,
+  e uma nova execução copia só as linhas com id acima do último migrado
+- mostra progresso em linhas/s
+
+Uso:
+    python3 migrate_sqlite_to_mysql.py
+    python3 migrate_sqlite_to_mysql.py --tables activity relay_activity --workers 2
+    python3 migrate_sqlite_to_mysql.py --reset          # ignora checkpoints anteriores
 """
 
 import sqlite3
 import mysql.connector
 from mysql.connector import Error
+import argparse
 import json
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
-class HomeGuardDataMigration:
+# Destino MySQL (DDL, colunas e upsert) compartilhado com web/db_replicator.py
+try:
+    from storage import MySQLTarget
+except ImportError:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'web'))
+    from storage import MySQLTarget
+
+# Tabelas para migrar (na ordem de exibição)
+DEFAULT_TABLES = [
+    'activity',
+    'motion_sensors',
+    'relay_activity',
+    'dht11_sensors',
+    'sensor_alerts'
+]
+
+DEFAULT_CHUNK_SIZE = 5000
+DEFAULT_WORKERS = 3
+PROGRESS_INTERVAL = 5.0  # segundos entre linhas de progresso
+CHECKPOINT_FILE = 'migration_checkpoint.json'
+
+class MigrationCheckpoint:
+    """Progresso por tabela persistido em JSON (escrita atômica)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = {}
+        if os.path.exists(path):
+            try:
+                with open(path, 'r') as f:
+                    self.state = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️  Checkpoint inválido ({e}), começando do zero")
+
+    def get(self, table):
+        with self.lock:
+            return dict(self.state.get(table, {'last_id': 0, 'rows': 0, 'done': False}))
+
+    def update(self, table, **values):
+        with self.lock:
+            entry = self.state.setdefault(table, {'last_id': 0, 'rows': 0, 'done': False})
+            entry.update(values)
+            entry['updated_at'] = datetime.now().isoformat()
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.state, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def reset(self):
+        with self.lock:
+            self.state = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+class TableMigrator:
+    """Migra uma tabela em blocos, com checkpoint após cada commit"""
+
+    def __init__(self, sqlite_path, target, table, checkpoint, chunk_size, progress):
+        self.sqlite_path = sqlite_path
+        self.target = target
+        self.table = table
+        self.checkpoint = checkpoint
+        self.chunk_size = chunk_size
+        self.progress = progress
+
+    def _open_sqlite(self):
+        # Somente leitura: não bloqueia o logger que continua gravando
+        return sqlite3.connect(f'file:{os.path.abspath(self.sqlite_path)}?mode=ro', uri=True)
+
+    def run(self):
+        sqlite_conn = self._open_sqlite()
+        target_conn = self.target.connect()
+        try:
+            sqlite_columns = sqlite_conn.execute(f"PRAGMA table_info({self.table})").fetchall()
+            source_columns = [col[1] for col in sqlite_columns]
+            key = 'id'
+
+            target_columns = self.target.columns(target_conn, self.table)
+            if not target_columns:
+                print(f"   🆕 {self.table}: criando tabela no destino")
+                self.target.create_table(target_conn, self.table, sqlite_columns, key)
+                target_columns = self.target.columns(target_conn, self.table)
+
+            columns = [c for c in source_columns if c in target_columns]
+            skipped = [c for c in source_columns if c not in target_columns]
+            if skipped:
+                print(f"   ⚠️  {self.table}: colunas ausentes no destino ignoradas: {skipped}")
+            if key not in columns:
+                raise ValueError(f"tabela {self.table} sem coluna '{key}' na origem ou no destino")
+
+            select_sql = (f"SELECT {', '.join(columns)} FROM {self.table} "
+                          f"WHERE {key} > ? ORDER BY {key} LIMIT {self.chunk_size}")
+            upsert_sql = self.target.upsert_sql(self.table, columns, key)
+            key_index = columns.index(key)
+
+            state = self.checkpoint.get(self.table)
+            last_id = state['last_id']
+            migrated = state['rows']
+            max_id = sqlite_conn.execute(f"SELECT MAX({key}) FROM {self.table}").fetchone()[0] or 0
+            self.progress.register(self.table, last_id, max_id)
+
+            if last_id:
+                print(f"   ⏩ {self.table}: retomando após id {last_id} ({migrated:,} linhas já migradas)")
+
+            while True:
+                rows = sqlite_conn.execute(select_sql, (last_id,)).fetchall()
+                if not rows:
+                    break
+
+                self.target.upsert_many(target_conn, upsert_sql, rows)
+                target_conn.commit()
+
+                last_id = rows[-1][key_index]
+                migrated += len(rows)
+                self.checkpoint.update(self.table, last_id=last_id, rows=migrated, done=False)
+                self.progress.advance(self.table, len(rows), last_id)
+
+            self.checkpoint.update(self.table, last_id=last_id, rows=migrated, done=True)
+            return self.table, migrated
+
+        except Exception:
+            try:
+                target_conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            sqlite_conn.close()
+            target_conn.close()
+
+
+class MigrationProgress:
+    """Relatório de progresso compartilhado entre as threads"""
+
     def __init__(self):
-        self.sqlite_db_path = '../db/homeguard.db'
+        self.lock = threading.Lock()
+        self.start_time = time.monotonic()
+        self.last_report = self.start_time
+        self.tables = {}
+
+    def register(self, table, last_id, max_id):
+        with self.lock:
+            self.tables[table] = {'rows': 0, 'last_id': last_id, 'max_id': max_id,
+                                  'start': time.monotonic()}
+
+    def advance(self, table, rows, last_id):
+        with self.lock:
+            entry = self.tables[table]
+            entry['rows'] += rows
+            entry['last_id'] = last_id
+            now = time.monotonic()
+            if now - self.last_report < PROGRESS_INTERVAL:
+                return
+            self.last_report = now
+            for name, info in self.tables.items():
+                elapsed = max(now - info['start'], 1e-6)
+                percent = 100.0 * info['last_id'] / info['max_id'] if info['max_id'] else 100.0
+                print(f"   📈 {name:<16} {info['rows']:>10,} linhas  {info['rows'] / elapsed:>9,.0f} linhas/s"
+                      f"  ({min(percent, 100.0):5.1f}%)")
+
+    def total_rows(self):
+        with self.lock:
+            return sum(info['rows'] for info in self.tables.values())
+
+    def elapsed(self):
+        return time.monotonic() - self.start_time
+
+
+class HomeGuardDataMigration:
+    def __init__(self, sqlite_db_path='../db/homeguard.db', tables=None,
+                 chunk_size=DEFAULT_CHUNK_SIZE, workers=DEFAULT_WORKERS,
+                 checkpoint_file=CHECKPOINT_FILE, assume_yes=False):
+        self.sqlite_db_path = sqlite_db_path
         self.mysql_config_file = 'homeguard_mysql_config.json'
         self.mysql_config = self._load_mysql_config()
-        
+        self.target = MySQLTarget(self.mysql_config)
+
         # Tabelas para migrar
-        self.tables_to_migrate = [
-            'motion_sensors',
-            'dht11_sensors', 
-            'sensor_alerts'
-        ]
-        
+        self.tables_to_migrate = tables or list(DEFAULT_TABLES)
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.checkpoint = MigrationCheckpoint(checkpoint_file)
+        self.assume_yes = assume_yes
+
         print("🔄 HomeGuard Data Migration: SQLite → MySQL")
         print("=" * 50)
 
@@ -38,7 +228,7 @@ class HomeGuardDataMigration:
             f"~/{self.mysql_config_file}",
             f"../web/{self.mysql_config_file}"
         ]
-        
+
         for config_path in config_paths:
             expanded_path = os.path.expanduser(config_path)
             if os.path.exists(expanded_path):
@@ -50,13 +240,13 @@ class HomeGuardDataMigration:
                 except Exception as e:
                     print(f"❌ Erro ao carregar configuração: {e}")
                     continue
-        
+
         # Configuração padrão se não encontrar arquivo
         print("⚠️  Usando configuração MySQL padrão")
         return {
             "host": "localhost",
             "port": 3306,
-            "database": "homeguard", 
+            "database": "homeguard",
             "user": "homeguard",
             "password": input("Digite a senha do MySQL para o usuário 'homeguard': "),
             "charset": "utf8mb4"
@@ -68,11 +258,11 @@ class HomeGuardDataMigration:
             if not os.path.exists(self.sqlite_db_path):
                 print(f"❌ Arquivo SQLite não encontrado: {self.sqlite_db_path}")
                 return None
-                
+
             conn = sqlite3.connect(self.sqlite_db_path)
             print(f"✅ Conectado ao SQLite: {self.sqlite_db_path}")
             return conn
-            
+
         except Exception as e:
             print(f"❌ Erro ao conectar ao SQLite: {e}")
             return None
@@ -80,19 +270,10 @@ class HomeGuardDataMigration:
     def connect_mysql(self):
         """Conectar ao MySQL"""
         try:
-            connection = mysql.connector.connect(
-                host=self.mysql_config['host'],
-                port=self.mysql_config['port'],
-                database=self.mysql_config['database'],
-                user=self.mysql_config['user'],
-                password=self.mysql_config['password'],
-                charset=self.mysql_config['charset'],
-                autocommit=True
-            )
-            
+            connection = self.target.connect()
             print(f"✅ Conectado ao MySQL: {self.mysql_config['host']}:{self.mysql_config['port']}")
             return connection
-            
+
         except Error as e:
             print(f"❌ Erro ao conectar ao MySQL: {e}")
             return None
@@ -103,234 +284,77 @@ class HomeGuardDataMigration:
             cursor = sqlite_conn.cursor()
             cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
             tables = [row[0] for row in cursor.fetchall()]
-            
+
             existing_tables = []
             for table in self.tables_to_migrate:
                 if table in tables:
-                    cursor.execute(f"SELECT COUNT(*) FROM {table}")
-                    count = cursor.fetchone()[0]
-                    existing_tables.append((table, count))
-                    print(f"📊 {table}: {count} registros")
+                    # MAX(id) usa o índice da chave primária (sem varrer a tabela)
+                    cursor.execute(f"SELECT MAX(rowid) FROM {table}")
+                    max_id = cursor.fetchone()[0] or 0
+                    state = self.checkpoint.get(table)
+                    existing_tables.append((table, max_id))
+
+                    if not state['done']:
+                        status = f"checkpoint id {state['last_id']}"
+                    elif max_id > state['last_id']:
+                        status = f"concluída até id {state['last_id']}, novos registros desde então"
+                    else:
+                        status = "✅ concluída"
+                    print(f"📊 {table}: ~{max_id:,} registros ({status})")
                 else:
                     print(f"⚠️  Tabela {table} não encontrada no SQLite")
-            
+
             return existing_tables
-            
+
         except Exception as e:
             print(f"❌ Erro ao verificar tabelas SQLite: {e}")
             return []
 
-    def migrate_motion_sensors(self, sqlite_conn, mysql_conn):
-        """Migrar tabela motion_sensors"""
-        table_name = 'motion_sensors'
-        print(f"\n🔄 Migrando {table_name}...")
-        
-        try:
-            sqlite_cursor = sqlite_conn.cursor()
-            mysql_cursor = mysql_conn.cursor()
-            
-            # Buscar dados do SQLite
-            sqlite_cursor.execute(f"SELECT * FROM {table_name}")
-            rows = sqlite_cursor.fetchall()
-            
-            # Obter nomes das colunas
-            sqlite_cursor.execute(f"PRAGMA table_info({table_name})")
-            columns_info = sqlite_cursor.fetchall()
-            columns = [col[1] for col in columns_info]
-            
-            print(f"   Colunas encontradas: {columns}")
-            
-            if not rows:
-                print(f"   ⚠️  Nenhum dado encontrado em {table_name}")
-                return True
-            
-            # Preparar query de inserção MySQL
-            placeholders = ', '.join(['%s'] * len(columns))
-            mysql_insert_query = f"""
-                INSERT INTO {table_name} 
-                ({', '.join(columns)}) 
-                VALUES ({placeholders})
-                ON DUPLICATE KEY UPDATE
-                device_name = VALUES(device_name),
-                location = VALUES(location),
-                motion_detected = VALUES(motion_detected),
-                rssi = VALUES(rssi),
-                uptime = VALUES(uptime),
-                battery_level = VALUES(battery_level),
-                timestamp_received = VALUES(timestamp_received),
-                unix_timestamp = VALUES(unix_timestamp),
-                raw_payload = VALUES(raw_payload)
-            """
-            
-            # Inserir dados no MySQL
-            successful_inserts = 0
-            for row in rows:
-                try:
-                    mysql_cursor.execute(mysql_insert_query, row)
-                    successful_inserts += 1
-                except Error as e:
-                    print(f"   ⚠️  Erro ao inserir registro {row[0]}: {e}")
-            
-            print(f"   ✅ {successful_inserts}/{len(rows)} registros migrados")
-            return True
-            
-        except Exception as e:
-            print(f"   ❌ Erro na migração de {table_name}: {e}")
-            return False
+    def migrate_tables(self, tables):
+        """Migrar tabelas em paralelo; retorna {tabela: linhas} das bem-sucedidas"""
+        progress = MigrationProgress()
+        results = {}
 
-    def migrate_dht11_sensors(self, sqlite_conn, mysql_conn):
-        """Migrar tabela dht11_sensors"""
-        table_name = 'dht11_sensors'
-        print(f"\n🔄 Migrando {table_name}...")
-        
-        try:
-            sqlite_cursor = sqlite_conn.cursor()
-            mysql_cursor = mysql_conn.cursor()
-            
-            # Buscar dados do SQLite
-            sqlite_cursor.execute(f"SELECT * FROM {table_name}")
-            rows = sqlite_cursor.fetchall()
-            
-            # Obter nomes das colunas
-            sqlite_cursor.execute(f"PRAGMA table_info({table_name})")
-            columns_info = sqlite_cursor.fetchall()
-            columns = [col[1] for col in columns_info]
-            
-            print(f"   Colunas encontradas: {columns}")
-            
-            if not rows:
-                print(f"   ⚠️  Nenhum dado encontrado em {table_name}")
-                return True
-            
-            # Preparar query de inserção MySQL
-            placeholders = ', '.join(['%s'] * len(columns))
-            mysql_insert_query = f"""
-                INSERT INTO {table_name} 
-                ({', '.join(columns)}) 
-                VALUES ({placeholders})
-                ON DUPLICATE KEY UPDATE
-                device_name = VALUES(device_name),
-                location = VALUES(location),
-                sensor_type = VALUES(sensor_type),
-                temperature = VALUES(temperature),
-                humidity = VALUES(humidity),
-                rssi = VALUES(rssi),
-                uptime = VALUES(uptime),
-                timestamp_received = VALUES(timestamp_received),
-                raw_payload = VALUES(raw_payload)
-            """
-            
-            # Inserir dados no MySQL
-            successful_inserts = 0
-            for row in rows:
-                try:
-                    mysql_cursor.execute(mysql_insert_query, row)
-                    successful_inserts += 1
-                except Error as e:
-                    print(f"   ⚠️  Erro ao inserir registro {row[0]}: {e}")
-            
-            print(f"   ✅ {successful_inserts}/{len(rows)} registros migrados")
-            return True
-            
-        except Exception as e:
-            print(f"   ❌ Erro na migração de {table_name}: {e}")
-            return False
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            futures = {
+                executor.submit(TableMigrator(self.sqlite_db_path, self.target, table,
+                                              self.checkpoint, self.chunk_size, progress).run): table
+                for table in tables
+            }
 
-    def migrate_sensor_alerts(self, sqlite_conn, mysql_conn):
-        """Migrar tabela sensor_alerts"""
-        table_name = 'sensor_alerts'
-        print(f"\n🔄 Migrando {table_name}...")
-        
-        try:
-            sqlite_cursor = sqlite_conn.cursor()
-            mysql_cursor = mysql_conn.cursor()
-            
-            # Verificar se tabela existe
-            sqlite_cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?", (table_name,))
-            if not sqlite_cursor.fetchone():
-                print(f"   ⚠️  Tabela {table_name} não existe no SQLite")
-                return True
-            
-            # Buscar dados do SQLite
-            sqlite_cursor.execute(f"SELECT * FROM {table_name}")
-            rows = sqlite_cursor.fetchall()
-            
-            # Obter nomes das colunas
-            sqlite_cursor.execute(f"PRAGMA table_info({table_name})")
-            columns_info = sqlite_cursor.fetchall()
-            columns = [col[1] for col in columns_info]
-            
-            print(f"   Colunas encontradas: {columns}")
-            
-            if not rows:
-                print(f"   ⚠️  Nenhum dado encontrado em {table_name}")
-                return True
-            
-            # Preparar query de inserção MySQL
-            placeholders = ', '.join(['%s'] * len(columns))
-            mysql_insert_query = f"""
-                INSERT INTO {table_name} 
-                ({', '.join(columns)}) 
-                VALUES ({placeholders})
-                ON DUPLICATE KEY UPDATE
-                device_name = VALUES(device_name),
-                location = VALUES(location),
-                alert_type = VALUES(alert_type),
-                sensor_value = VALUES(sensor_value),
-                threshold_value = VALUES(threshold_value),
-                message = VALUES(message),
-                severity = VALUES(severity),
-                is_active = VALUES(is_active),
-                timestamp_created = VALUES(timestamp_created),
-                timestamp_resolved = VALUES(timestamp_resolved)
-            """
-            
-            # Inserir dados no MySQL
-            successful_inserts = 0
-            for row in rows:
+            for future in as_completed(futures):
+                table = futures[future]
                 try:
-                    mysql_cursor.execute(mysql_insert_query, row)
-                    successful_inserts += 1
-                except Error as e:
-                    print(f"   ⚠️  Erro ao inserir registro {row[0]}: {e}")
-            
-            print(f"   ✅ {successful_inserts}/{len(rows)} registros migrados")
-            return True
-            
-        except Exception as e:
-            print(f"   ❌ Erro na migração de {table_name}: {e}")
-            return False
+                    _, rows = future.result()
+                    results[table] = rows
+                    print(f"   ✅ {table}: {rows:,} registros migrados")
+                except Exception as e:
+                    print(f"   ❌ Erro na migração de {table}: {e}")
+                    print(f"      Execute novamente para continuar a partir do checkpoint")
+
+        elapsed = progress.elapsed()
+        total = progress.total_rows()
+        print(f"\n⏱️  {total:,} linhas em {elapsed:.1f}s ({total / max(elapsed, 1e-6):,.0f} linhas/s)")
+        return results
 
     def verify_migration(self, mysql_conn):
         """Verificar se a migração foi bem-sucedida"""
         print(f"\n🔍 Verificando migração...")
-        
+
         try:
             cursor = mysql_conn.cursor()
-            
+
             for table in self.tables_to_migrate:
-                cursor.execute(f"SELECT COUNT(*) FROM {table}")
-                count = cursor.fetchone()[0]
-                print(f"   📊 {table}: {count} registros no MySQL")
-                
-                # Verificar alguns registros recentes
-                cursor.execute(f"""
-                    SELECT device_id, timestamp_received 
-                    FROM {table} 
-                    ORDER BY id DESC 
-                    LIMIT 3
-                """)
-                
-                recent = cursor.fetchall()
-                if recent:
-                    print(f"      Registros recentes:")
-                    for row in recent:
-                        print(f"        - {row[0]}: {row[1]}")
-                else:
-                    print(f"      Nenhum registro encontrado")
-            
+                if not self.target.columns(mysql_conn, table):
+                    continue
+                cursor.execute(f"SELECT COUNT(*), MAX(id) FROM `{table}`")
+                count, max_id = cursor.fetchone()
+                state = self.checkpoint.get(table)
+                print(f"   📊 {table}: {count} registros no MySQL (último id {max_id}, "
+                      f"checkpoint {state['last_id']})")
+
             return True
-            
+
         except Error as e:
             print(f"   ❌ Erro na verificação: {e}")
             return False
@@ -338,17 +362,17 @@ class HomeGuardDataMigration:
     def create_backup(self, mysql_conn):
         """Criar backup após migração"""
         print(f"\n💾 Criando backup pós-migração...")
-        
+
         try:
             backup_dir = os.path.expanduser("~/backup/mysql")
             os.makedirs(backup_dir, exist_ok=True)
-            
+
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             backup_file = f"{backup_dir}/homeguard_migration_{timestamp}.sql"
-            
+
             # Usar mysqldump para backup
             import subprocess
-            
+
             cmd = [
                 'mysqldump',
                 f"-h{self.mysql_config['host']}",
@@ -356,17 +380,17 @@ class HomeGuardDataMigration:
                 f"-p{self.mysql_config['password']}",
                 self.mysql_config['database']
             ]
-            
+
             with open(backup_file, 'w') as f:
                 result = subprocess.run(cmd, stdout=f, stderr=subprocess.PIPE, text=True)
-            
+
             if result.returncode == 0:
                 print(f"   ✅ Backup criado: {backup_file}")
                 return True
             else:
                 print(f"   ⚠️  Erro no backup: {result.stderr}")
                 return False
-                
+
         except Exception as e:
             print(f"   ❌ Erro ao criar backup: {e}")
             return False
@@ -374,85 +398,104 @@ class HomeGuardDataMigration:
     def run_migration(self):
         """Executar migração completa"""
         print(f"\n🚀 Iniciando migração de dados...")
-        
+
         # Conectar aos bancos
         sqlite_conn = self.connect_sqlite()
         if not sqlite_conn:
             return False
-            
+
         mysql_conn = self.connect_mysql()
         if not mysql_conn:
             return False
-        
+
         try:
             # Verificar tabelas SQLite
             tables_info = self.check_sqlite_tables(sqlite_conn)
             if not tables_info:
                 print("❌ Nenhuma tabela encontrada para migrar")
                 return False
-            
-            print(f"\n📋 Tabelas para migrar: {len(tables_info)}")
-            
+
+            # Tabelas concluídas voltam a migrar se chegaram linhas após o id do checkpoint
+            pending = [table for table, max_id in tables_info
+                       if not self.checkpoint.get(table)['done'] or max_id > self.checkpoint.get(table)['last_id']]
+            print(f"\n📋 Tabelas para migrar: {len(pending)} "
+                  f"(blocos de {self.chunk_size}, {self.workers} threads)")
+            if not pending:
+                print("✅ Todas as tabelas estão em dia (use --reset para migrar novamente)")
+                return True
+
             # Confirmar migração
-            response = input("\n🔄 Deseja continuar com a migração? (y/n): ")
-            if response.lower() != 'y':
-                print("❌ Migração cancelada pelo usuário")
-                return False
-            
+            if not self.assume_yes:
+                response = input("\n🔄 Deseja continuar com a migração? (y/n): ")
+                if response.lower() != 'y':
+                    print("❌ Migração cancelada pelo usuário")
+                    return False
+
             # Executar migrações
-            migrations = [
-                ('motion_sensors', self.migrate_motion_sensors),
-                ('dht11_sensors', self.migrate_dht11_sensors),
-                ('sensor_alerts', self.migrate_sensor_alerts)
-            ]
-            
-            successful_migrations = 0
-            for table_name, migration_func in migrations:
-                if any(table_name == info[0] for info in tables_info):
-                    if migration_func(sqlite_conn, mysql_conn):
-                        successful_migrations += 1
-                    else:
-                        print(f"❌ Falha na migração de {table_name}")
-                else:
-                    print(f"⏭️  Pulando {table_name} (não encontrada no SQLite)")
-            
+            results = self.migrate_tables(pending)
+            successful_migrations = len(results)
+
             # Verificar resultado
-            if successful_migrations > 0:
+            if successful_migrations == len(pending):
                 self.verify_migration(mysql_conn)
                 self.create_backup(mysql_conn)
-                
+
                 print(f"\n🎉 MIGRAÇÃO CONCLUÍDA!")
                 print(f"   ✅ {successful_migrations} tabelas migradas com sucesso")
                 print(f"   💾 Backup criado automaticamente")
                 print(f"   🔧 Use homeguard_flask_mysql.py para conectar ao MySQL")
                 return True
             else:
-                print(f"\n❌ MIGRAÇÃO FALHOU")
-                print(f"   Nenhuma tabela foi migrada com sucesso")
+                print(f"\n❌ MIGRAÇÃO INCOMPLETA")
+                print(f"   {successful_migrations}/{len(pending)} tabelas migradas")
+                print(f"   📍 Progresso salvo em {self.checkpoint.path}")
                 return False
-                
+
         finally:
             # Fechar conexões
             if sqlite_conn:
                 sqlite_conn.close()
                 print("🔌 Conexão SQLite fechada")
-                
+
             if mysql_conn and mysql_conn.is_connected():
-                mysql_conn.close() 
+                mysql_conn.close()
                 print("🔌 Conexão MySQL fechada")
 
 def main():
     """Função principal"""
-    migration = HomeGuardDataMigration()
-    
+    parser = argparse.ArgumentParser(description='HomeGuard - Migração SQLite → MySQL')
+    parser.add_argument('--sqlite', default='../db/homeguard.db', help='Arquivo SQLite de origem')
+    parser.add_argument('--tables', nargs='+', default=None,
+                        help=f"Tabelas a migrar (padrão: {' '.join(DEFAULT_TABLES)})")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help=f'Linhas por bloco/transação (padrão: {DEFAULT_CHUNK_SIZE})')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help=f'Tabelas migradas em paralelo (padrão: {DEFAULT_WORKERS})')
+    parser.add_argument('--checkpoint', default=CHECKPOINT_FILE, help='Arquivo de checkpoint')
+    parser.add_argument('--reset', action='store_true', help='Ignorar checkpoint e migrar tudo novamente')
+    parser.add_argument('--yes', action='store_true', help='Não pedir confirmação')
+    args = parser.parse_args()
+
+    migration = HomeGuardDataMigration(
+        sqlite_db_path=args.sqlite,
+        tables=args.tables,
+        chunk_size=args.chunk_size,
+        workers=args.workers,
+        checkpoint_file=args.checkpoint,
+        assume_yes=args.yes
+    )
+    if args.reset:
+        migration.checkpoint.reset()
+
     try:
         success = migration.run_migration()
         sys.exit(0 if success else 1)
-        
+
     except KeyboardInterrupt:
         print(f"\n❌ Migração interrompida pelo usuário")
+        print(f"   📍 Execute novamente para continuar a partir do checkpoint")
         sys.exit(1)
-        
+
     except Exception as e:
         print(f"\n❌ Erro fatal na migração: {e}")
         sys.exit(1)
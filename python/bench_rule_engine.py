@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Rule Engine - Microbenchmark
+Rule evaluation cost per message with hundreds of rules, and the cost of
+re-arming an off-delay (timer wheel vs one threading.Timer per event)
+
+Usage:
+    python bench_rule_engine.py
+    python bench_rule_engine.py --rules 1000 --messages 50000
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+
+import paho.mqtt.client as mqtt
+
+from rule_engine import RuleEngine
+from topic_router import subscription_filter
+
+
+def build_rules(count, rng):
+    """Motion rules per room plus threshold rules on wildcard sensor topics"""
+    rules = []
+    rooms = max(1, count * 3 // 4)
+    for i in range(rooms):
+        rules.append({
+            'name': f'motion_{i:04d}',
+            'trigger': f'home/motion_room{i:04d}/motion',
+            'relay': f'home/relay/RELAY_{i:04d}/command',
+            'off_delay': rng.choice([30, 60, 120, 300]),
+            'between': rng.choice([None, ['18:00', '06:30'], ['00:00', '23:59']]),
+        })
+    for i in range(count - rooms):
+        rules.append({
+            'name': f'threshold_{i:04d}',
+            'type': 'threshold',
+            'trigger': 'home/temperature/+device_id/data' if i == 0 else f'home/temperature/DHT_{i:04d}/data',
+            'field': 'temperature',
+            'on_above': rng.choice([28, 30, 32]),
+            'off_below': 26,
+            'relay': 'home/relay/fan_{device_id}/command' if i == 0 else f'home/relay/FAN_{i:04d}/command',
+        })
+    return rules, rooms
+
+
+def build_messages(count, rooms, sensors, rng):
+    messages = []
+    for _ in range(count):
+        if rng.random() < 0.7:
+            event = rng.choice(['MOTION_DETECTED', 'MOTION_CLEARED'])
+            messages.append((f'home/motion_room{rng.randrange(rooms):04d}/motion',
+                             json.dumps({'event': event, 'location': 'room'})))
+        else:
+            messages.append((f'home/temperature/DHT_{rng.randrange(max(1, sensors)):04d}/data',
+                             json.dumps({'temperature': round(rng.uniform(20, 35), 1)})))
+    return messages
+
+
+def bench_linear(rules, messages):
+    """Every rule checked against every message (what a list of if/elif grows into)"""
+    compiled = RuleEngine(publish=lambda topic, payload: None)
+    for spec in rules:
+        compiled.add_rule(spec)
+    filters = [(subscription_filter(rule.trigger), rule) for rule in compiled.rules.values()]
+    evaluated = 0
+    start = time.perf_counter()
+    for topic, payload in messages:
+        data = json.loads(payload)
+        for topic_filter, rule in filters:
+            if mqtt.topic_matches_sub(topic_filter, topic):
+                rule.evaluate(payload, data)
+                evaluated += 1
+    return time.perf_counter() - start, evaluated
+
+
+def bench_engine(rules, messages):
+    sent = [0]
+    engine = RuleEngine(publish=lambda topic, payload: sent.__setitem__(0, sent[0] + 1))
+    for spec in rules:
+        engine.add_rule(spec)
+    now = time.time()
+    start = time.perf_counter()
+    for topic, payload in messages:
+        engine.handle(topic, payload, now=now)
+    elapsed = time.perf_counter() - start
+    return elapsed, engine.evaluations, sent[0], engine
+
+
+def bench_timers(count):
+    """Re-arming an off-delay: threading.Timer cancel+start vs wheel key reschedule"""
+    engine = RuleEngine(publish=lambda topic, payload: None)
+    start = time.perf_counter()
+    for i in range(count):
+        engine.wheel.schedule(('rule', i % 500), 120, None)
+    wheel_time = time.perf_counter() - start
+
+    timers = {}
+    threads_before = threading.active_count()
+    start = time.perf_counter()
+    for i in range(count):
+        key = i % 500
+        if key in timers:
+            timers[key].cancel()
+        timers[key] = threading.Timer(120, lambda: None)
+        timers[key].start()
+    timer_time = time.perf_counter() - start
+    threads_peak = threading.active_count() - threads_before
+    for timer in timers.values():
+        timer.cancel()
+    return wheel_time, timer_time, threads_peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do motor de regras')
+    parser.add_argument('--rules', type=int, default=500, help='Número de regras')
+    parser.add_argument('--messages', type=int, default=20000, help='Mensagens avaliadas pelo motor')
+    parser.add_argument('--linear-messages', type=int, default=2000,
+                        help='Mensagens avaliadas pela varredura linear')
+    parser.add_argument('--timers', type=int, default=2000, help='Re-armes de off-delay medidos')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    rules, rooms = build_rules(args.rules, rng)
+    messages = build_messages(args.messages, rooms, args.rules - rooms, rng)
+    linear_messages = messages[:args.linear_messages]
+
+    print(f"🧪 {len(rules)} regras ({rooms} de movimento, {len(rules) - rooms} de limiar)")
+
+    linear_time, linear_evaluated = bench_linear(rules, linear_messages)
+    _, check_evaluated, _, _ = bench_engine(rules, linear_messages)
+    if check_evaluated != linear_evaluated:
+        print(f"❌ Resultado divergente: linear={linear_evaluated} motor={check_evaluated}")
+        return 1
+
+    engine_time, evaluated, sent, engine = bench_engine(rules, messages)
+    pending = engine.pending_timers()
+    tick_start = time.perf_counter()
+    engine.tick(time.time() + 3600)
+    tick_time = time.perf_counter() - tick_start
+    wheel_time, timer_time, threads_peak = bench_timers(args.timers)
+
+    linear_us = linear_time / len(linear_messages) * 1e6
+    engine_us = engine_time / len(messages) * 1e6
+    print(f"🐢 Linear (topic_matches_sub): {linear_us:8.1f} µs/mensagem  ({len(linear_messages)} mensagens)")
+    print(f"🌳 Motor indexado:             {engine_us:8.1f} µs/mensagem  ({len(messages)} mensagens)")
+    print(f"📈 Ganho: {linear_us / engine_us:.0f}x  ({evaluated / len(messages):.2f} regras avaliadas por mensagem)")
+    print(f"📤 {sent} comandos enviados, {pending} off-delays pendentes antes do tick")
+    print(f"⏰ Tick expirando todos os off-delays: {tick_time * 1000:.2f} ms")
+    print(f"⏱️  Re-armar off-delay: wheel {wheel_time / args.timers * 1e6:.1f} µs, "
+          f"threading.Timer {timer_time / args.timers * 1e6:.1f} µs "
+          f"({threads_peak} threads vivas vs 1)")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
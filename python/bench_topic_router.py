@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Topic Router - Microbenchmark
+Compares TopicRouter (trie) with a linear scan using paho's topic_matches_sub()
+
+Usage:
+    python bench_topic_router.py
+    python bench_topic_router.py --patterns 5000 --messages 50000
+"""
+
+import argparse
+import random
+import time
+
+import paho.mqtt.client as mqtt
+
+from topic_router import TopicRouter, subscription_filter
+
+MESSAGE_TYPES = ['motion', 'status', 'command', 'heartbeat', 'config', 'info']
+
+
+def build_patterns(count, rng):
+    """Mix of literal device topics and wildcard patterns, like a large installation"""
+    patterns = [f"home/+device/{message_type}" for message_type in MESSAGE_TYPES]
+    devices = max(1, count // 4)
+    for i in range(count):
+        device = f"device_{i % devices:05d}"
+        kind = i % 10
+        if kind < 6:
+            patterns.append(f"home/{device}/{rng.choice(MESSAGE_TYPES)}")
+        elif kind < 8:
+            patterns.append(f"home/relay/{device}/+message_type")
+        elif kind == 8:
+            patterns.append(f"home/{device}/+message_type")
+        else:
+            patterns.append(f"home/{device}/#rest")
+    return patterns, devices
+
+
+def build_topics(count, devices, rng):
+    topics = []
+    for _ in range(count):
+        device = f"device_{rng.randrange(devices):05d}"
+        if rng.random() < 0.3:
+            topics.append(f"home/relay/{device}/{rng.choice(MESSAGE_TYPES)}")
+        else:
+            topics.append(f"home/{device}/{rng.choice(MESSAGE_TYPES)}")
+    return topics
+
+
+def bench_linear(patterns, topics):
+    filters = [(subscription_filter(p), i) for i, p in enumerate(patterns)]
+    matched = 0
+    start = time.perf_counter()
+    for topic in topics:
+        for topic_filter, handler in filters:
+            if mqtt.topic_matches_sub(topic_filter, topic):
+                matched += 1
+    return time.perf_counter() - start, matched
+
+
+def bench_router(patterns, topics, cache_size):
+    router = TopicRouter(cache_size=cache_size)
+    build_start = time.perf_counter()
+    for i, pattern in enumerate(patterns):
+        router.add(pattern, i)
+    build_time = time.perf_counter() - build_start
+
+    matched = 0
+    start = time.perf_counter()
+    for topic in topics:
+        matched += len(router.match(topic))
+    return time.perf_counter() - start, matched, build_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do roteador de tópicos MQTT')
+    parser.add_argument('--patterns', type=int, default=2000, help='Número de padrões registrados')
+    parser.add_argument('--messages', type=int, default=20000, help='Mensagens roteadas pelo trie')
+    parser.add_argument('--linear-messages', type=int, default=500,
+                        help='Mensagens roteadas pela varredura linear (é lenta)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    patterns, devices = build_patterns(args.patterns, rng)
+    topics = build_topics(args.messages, devices, rng)
+    linear_topics = topics[:args.linear_messages]
+
+    print(f"🧪 {len(patterns)} padrões, {devices} dispositivos")
+
+    linear_time, linear_matched = bench_linear(patterns, linear_topics)
+    _, check_matched, _ = bench_router(patterns, linear_topics, cache_size=0)
+    if check_matched != linear_matched:
+        print(f"❌ Resultado divergente: linear={linear_matched} trie={check_matched}")
+        return 1
+
+    trie_time, trie_matched, build_time = bench_router(patterns, topics, cache_size=0)
+    cached_time, _, _ = bench_router(patterns, topics, cache_size=len(set(topics)))
+
+    linear_us = linear_time / len(linear_topics) * 1e6
+    trie_us = trie_time / len(topics) * 1e6
+    cached_us = cached_time / len(topics) * 1e6
+
+    print(f"🏗️  Compilação do trie: {build_time * 1000:.1f} ms")
+    print(f"🐢 Linear (topic_matches_sub): {linear_us:10.1f} µs/mensagem  ({len(linear_topics)} mensagens)")
+    print(f"🌳 Trie sem cache:             {trie_us:10.1f} µs/mensagem  ({len(topics)} mensagens)")
+    print(f"⚡ Trie com cache:             {cached_us:10.1f} µs/mensagem")
+    print(f"📈 Ganho: {linear_us / trie_us:.0f}x (sem cache), {linear_us / cached_us:.0f}x (com cache)")
+    print(f"✅ {trie_matched} correspondências em {len(topics)} mensagens")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Liveness Tracker
+Online/stale/offline state of every device, driven by heartbeat expiry timers
+
+Every message from a device calls seen(); that (re)arms the device's timer in
+a TimerWheel instead of comparing last_seen timestamps in a periodic scan:
+
+    online  --(stale_after intervals without messages)-->  stale
+    stale   --(offline_after intervals)-->                  offline
+    any     --(next message)-->                             online
+
+Transitions are delivered to listeners (MQTT publisher, SQLite log, console).
+The per-tick cost depends on the timers that expire, not on the fleet size.
+
+Usage:
+    tracker = LivenessTracker(default_interval=60)
+    tracker.add_listener(MqttLivenessPublisher(client))
+    tracker.add_listener(SQLiteLivenessLog('db/homeguard.db'))
+    tracker.start()                             # background tick thread
+    tracker.seen('ESP01_RELAY_001', interval=30)
+"""
+
+import json
+import logging
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from timer_wheel import TimerWheel
+
+logger = logging.getLogger(__name__)
+
+ONLINE = 'online'
+STALE = 'stale'
+OFFLINE = 'offline'
+
+LIVENESS_CONFIG = {
+    'default_interval': 60,     # heartbeat esperado (s) quando o dispositivo não informa
+    'stale_after': 2.0,         # intervalos sem mensagem até STALE
+    'offline_after': 5.0,       # intervalos sem mensagem até OFFLINE
+    'tick': 1.0,                # resolução do timer wheel (atraso máximo de detecção)
+    'topic': 'home/liveness/{device_id}',
+    'table': 'device_liveness',
+}
+
+
+def heartbeat_interval(data, default=None):
+    """Heartbeat interval announced by the device payload (seconds), if any"""
+    if isinstance(data, dict):
+        value = data.get('heartbeat_interval')
+        if isinstance(value, (int, float)) and value > 0:
+            return value
+    return default
+
+
+class LivenessTracker:
+    """Heartbeat expiry for many devices on a single timer wheel"""
+
+    def __init__(self, default_interval=LIVENESS_CONFIG['default_interval'],
+                 stale_after=LIVENESS_CONFIG['stale_after'],
+                 offline_after=LIVENESS_CONFIG['offline_after'],
+                 tick=LIVENESS_CONFIG['tick'], clock=time.time):
+        self.default_interval = default_interval
+        self.stale_after = stale_after
+        self.offline_after = offline_after
+        self.clock = clock
+        self.wheel = TimerWheel(tick=tick, clock=clock)
+        self.devices = {}      # device_id -> record
+        self.online = set()    # device_ids currently ONLINE
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    # --------------------------------------------------------------- events
+
+    def add_listener(self, listener):
+        """listener(record, previous_state) for every transition"""
+        self.listeners.append(listener)
+        return listener
+
+    def _emit(self, record, previous):
+        for listener in self.listeners:
+            try:
+                listener(dict(record), previous)
+            except Exception as e:
+                logger.error(f"❌ Liveness listener error for {record['device_id']}: {e}")
+
+    # ------------------------------------------------------------- tracking
+
+    def expect(self, device_id, interval):
+        """Register a device and its heartbeat interval before it is seen"""
+        with self.lock:
+            record = self._record(device_id)
+            record['interval'] = interval
+
+    def _record(self, device_id):
+        record = self.devices.get(device_id)
+        if record is None:
+            record = self.devices[device_id] = {
+                'device_id': device_id,
+                'state': None,
+                'interval': self.default_interval,
+                'last_seen': None,
+                'since': None,
+            }
+        return record
+
+    def seen(self, device_id, interval=None, now=None):
+        """A message arrived from `device_id`; returns True if it just came online"""
+        if now is None:
+            now = self.clock()
+        with self.lock:
+            record = self._record(device_id)
+            if interval:
+                record['interval'] = interval
+            record['last_seen'] = now
+            self.wheel.schedule(device_id, record['interval'] * self.stale_after, STALE, now=now)
+            previous = record['state']
+            if previous == ONLINE:
+                return False
+            record['state'] = ONLINE
+            record['since'] = now
+            self.online.add(device_id)
+        self._emit(record, previous)
+        return True
+
+    def mark_offline(self, device_id, now=None):
+        """Explicit offline (last will / 'OFFLINE' status message)"""
+        if now is None:
+            now = self.clock()
+        with self.lock:
+            record = self._record(device_id)
+            self.wheel.cancel(device_id)
+            previous = record['state']
+            if previous == OFFLINE:
+                return False
+            self._set_state(record, OFFLINE, now)
+        self._emit(record, previous)
+        return True
+
+    def _set_state(self, record, state, now):
+        record['state'] = state
+        record['since'] = now
+        self.online.discard(record['device_id'])
+
+    def tick(self, now=None):
+        """Process expired timers; returns the transitions [(record, previous_state)]"""
+        if now is None:
+            now = self.clock()
+        transitions = []
+        with self.lock:
+            for device_id, state in self.wheel.advance(now):
+                record = self.devices[device_id]
+                previous = record['state']
+                self._set_state(record, state, now)
+                if state == STALE:
+                    remaining = record['interval'] * (self.offline_after - self.stale_after)
+                    self.wheel.schedule(device_id, remaining, OFFLINE, now=now)
+                transitions.append((dict(record), previous))
+        for record, previous in transitions:
+            self._emit(record, previous)
+        return transitions
+
+    # -------------------------------------------------------------- queries
+
+    def state(self, device_id):
+        record = self.devices.get(device_id)
+        return record['state'] if record else None
+
+    def record(self, device_id):
+        record = self.devices.get(device_id)
+        return dict(record) if record else None
+
+    def online_devices(self):
+        """device_ids currently ONLINE (kept up to date by the transitions)"""
+        with self.lock:
+            return set(self.online)
+
+    def counts(self):
+        counts = {ONLINE: 0, STALE: 0, OFFLINE: 0}
+        with self.lock:
+            for record in self.devices.values():
+                if record['state'] in counts:
+                    counts[record['state']] += 1
+        return counts
+
+    # ------------------------------------------------------------ lifecycle
+
+    def start(self):
+        """Tick the wheel from a background thread"""
+        if self.thread is not None:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name='liveness', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stop_event.wait(self.wheel.tick):
+            self.tick()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
+
+
+# ================ LISTENERS ================
+
+def liveness_event(record, previous):
+    """JSON-ready description of a transition"""
+    return {
+        'device_id': record['device_id'],
+        'state': record['state'],
+        'previous': previous,
+        'last_seen': datetime.fromtimestamp(record['last_seen']).strftime('%Y-%m-%d %H:%M:%S')
+        if record['last_seen'] else None,
+        'interval': record['interval'],
+        'timestamp': datetime.fromtimestamp(record['since']).strftime('%Y-%m-%d %H:%M:%S'),
+    }
+
+
+class MqttLivenessPublisher:
+    """Publish transitions as retained JSON on home/liveness/<device_id>"""
+
+    def __init__(self, publish, topic=LIVENESS_CONFIG['topic']):
+        # publish(topic, payload, qos, retain): client.publish or MonitorDaemon.publish
+        self.publish = publish
+        self.topic = topic
+
+    def __call__(self, record, previous):
+        event = liveness_event(record, previous)
+        self.publish(self.topic.format(device_id=record['device_id']), json.dumps(event), 1, True)
+
+
+LIVENESS_TABLE_SQL = f"""
+    CREATE TABLE IF NOT EXISTS {LIVENESS_CONFIG['table']} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        device_id TEXT NOT NULL,
+        state TEXT NOT NULL,
+        previous TEXT,
+        last_seen TEXT,
+        interval INTEGER,
+        timestamp TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+LIVENESS_COLUMNS = ('device_id', 'state', 'previous', 'last_seen', 'interval', 'timestamp')
+
+
+def init_liveness_table(conn):
+    conn.execute(LIVENESS_TABLE_SQL)
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_liveness_device "
+                 f"ON {LIVENESS_CONFIG['table']}(device_id, id)")
+    conn.commit()
+
+
+class SQLiteLivenessLog:
+    """Append transitions to the device_liveness table"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        conn = sqlite3.connect(db_path)
+        init_liveness_table(conn)
+        conn.close()
+
+    def __call__(self, record, previous):
+        event = liveness_event(record, previous)
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            conn.execute(f"INSERT INTO {LIVENESS_CONFIG['table']} ({', '.join(LIVENESS_COLUMNS)}) "
+                         f"VALUES ({', '.join('?' for _ in LIVENESS_COLUMNS)})",
+                         tuple(event[column] for column in LIVENESS_COLUMNS))
+            conn.commit()
+        finally:
+            conn.close()
@@ -3,10 +3,8 @@
 HomeGuard Motion Monitor
 Python script for monitoring motion detection events from ESP-01S motion detector
 
-Based on the working MQTT configuration:
-- Broker: 192.168.1.102
-- User: homeguard  
-- Pass: pu2clr123456
+Broker and credentials: homeguard_mqtt_config.json or HOMEGUARD_MQTT_*
+(see mqtt_client.py); --broker/--username/--password override them.
 
 Usage:
     python motion_monitor.py
@@ -21,11 +19,18 @@ import logging
 from datetime import datetime
 from typing import Dict, List
 
-import paho.mqtt.client as mqtt
+from mqtt_client import ResilientMqttClient, load_mqtt_config
+from topic_router import TopicRouter
 
 class MotionMonitor:
-    def __init__(self, broker_host="192.168.1.102", broker_port=1883, 
-                 username="homeguard", password="pu2clr123456"):
+    SUBSCRIPTIONS = [
+        "home/motion1/#",
+        "home/+/motion",  # Support multiple motion detectors
+        "home/+/status",
+        "home/+/heartbeat"
+    ]
+    
+    def __init__(self, broker_host=None, broker_port=None, username=None, password=None):
         """
         Initialize Motion Monitor
         
@@ -34,71 +39,64 @@ class MotionMonitor:
             broker_port: MQTT broker port  
             username: MQTT username
             password: MQTT password
+            (None = homeguard_mqtt_config.json / HOMEGUARD_MQTT_*)
         """
-        self.broker_host = broker_host
-        self.broker_port = broker_port
-        self.username = username
-        self.password = password
+        config = load_mqtt_config(host=broker_host, port=broker_port, username=username, password=password)
+        self.broker_host = config['host']
+        self.broker_port = config['port']
+        self.username = config['username']
         
-        self.client = mqtt.Client()
+        # Messages of one topic are handled in order on the client worker
+        self.client = ResilientMqttClient(config=config, workers=1)
         self.connected = False
         self.devices = {}
+        self.router = self._build_router()
         
-        # Setup MQTT callbacks
-        self.client.on_connect = self._on_connect
-        self.client.on_disconnect = self._on_disconnect
-        self.client.on_message = self._on_message
-        
-        # Set credentials
-        self.client.username_pw_set(username, password)
+        for topic in self.SUBSCRIPTIONS:
+            self.client.subscribe(topic, self._on_message)
+        self.client.add_connect_listener(self._on_connect)
+        self.client.add_disconnect_listener(self._on_disconnect)
     
-    def _on_connect(self, client, userdata, flags, rc):
-        """MQTT connection callback"""
-        if rc == 0:
-            self.connected = True
-            print(f"✅ Connected to MQTT broker at {self.broker_host}")
-            
-            # Subscribe to all motion detector topics
-            client.subscribe("home/motion1/#")
-            client.subscribe("home/+/motion")  # Support multiple motion detectors
-            client.subscribe("home/+/status")
-            client.subscribe("home/+/heartbeat")
-            
-            print("📡 Subscribed to motion detector topics")
-            
-        else:
-            print(f"❌ Failed to connect to MQTT broker: {rc}")
+    def _on_connect(self, client, session_present):
+        """MQTT connection callback (subscriptions are restored by the client)"""
+        self.connected = True
+        print(f"✅ Connected to MQTT broker at {self.broker_host}")
+        print("📡 Subscribed to motion detector topics")
     
-    def _on_disconnect(self, client, userdata, rc):
+    def _on_disconnect(self, client, rc):
         """MQTT disconnection callback"""
         self.connected = False
         print("📡 Disconnected from MQTT broker")
     
-    def _on_message(self, client, userdata, msg):
+    def _on_message(self, message):
         """MQTT message callback"""
         try:
-            topic_parts = msg.topic.split('/')
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            if len(topic_parts) >= 3:
-                device_type = topic_parts[1]  # motion1, motion2, etc.
-                message_type = topic_parts[2]  # motion, status, heartbeat, etc.
-                
-                # Handle different message types
-                if message_type == "motion":
-                    self._handle_motion_event(msg.payload.decode(), timestamp, device_type)
-                elif message_type == "status":
-                    self._handle_status_message(msg.payload.decode(), timestamp, device_type)
-                elif message_type == "heartbeat":
-                    self._handle_heartbeat(msg.payload.decode(), timestamp, device_type)
-                elif message_type == "config":
-                    self._handle_config_message(msg.payload.decode(), timestamp, device_type)
-                else:
-                    print(f"[{timestamp}] {msg.topic}: {msg.payload.decode()}")
-                    
+            self._dispatch(message.topic, message.text)
         except Exception as e:
             print(f"❌ Error processing message: {e}")
     
+    def _build_router(self):
+        """Message type handlers; the device (motion1, motion2, ...) is captured from the topic"""
+        router = TopicRouter()
+        router.add("home/+device/motion", self._handle_motion_event)
+        router.add("home/+device/status", self._handle_status_message)
+        router.add("home/+device/heartbeat", self._handle_heartbeat)
+        router.add("home/+device/config", self._handle_config_message)
+        return router
+    
+    def _dispatch(self, topic, payload):
+        """Route a decoded message by its topic pattern"""
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        
+        if not self.router.dispatch(topic, payload, timestamp):
+            print(f"[{timestamp}] {topic}: {payload}")
+    
+    def setup(self, daemon):
+        """Plugin for web/monitor_daemon.py: share the daemon's MQTT connection"""
+        self.client = daemon.client
+        for topic in self.SUBSCRIPTIONS:
+            daemon.register(topic, self._on_message)
+    
     def _handle_motion_event(self, payload, timestamp, device):
         """Handle motion detection events"""
         try:
@@ -191,10 +189,10 @@ class MotionMonitor:
         print(f"⚙️ [{timestamp}] CONFIG - {device}: {payload}")
     
     def connect(self):
-        """Connect to MQTT broker"""
+        """Connect to MQTT broker in the background (retries with backoff)"""
         try:
             print(f"🔗 Connecting to MQTT broker {self.broker_host}:{self.broker_port}...")
-            self.client.connect(self.broker_host, self.broker_port, 60)
+            self.client.start()
             return True
         except Exception as e:
             print(f"❌ Connection failed: {e}")
@@ -204,15 +202,16 @@ class MotionMonitor:
         """Start monitoring motion events"""
         print("🎯 Starting motion monitoring...")
         print("📋 Commands you can use in another terminal:")
-        print(f"   Status: mosquitto_pub -h {self.broker_host} -t home/motion1/cmnd -m 'STATUS' -u {self.username} -P {self.password}")
-        print(f"   High Sens: mosquitto_pub -h {self.broker_host} -t home/motion1/cmnd -m 'SENSITIVITY_HIGH' -u {self.username} -P {self.password}")
-        print(f"   Set Location: mosquitto_pub -h {self.broker_host} -t home/motion1/cmnd -m 'LOCATION_Kitchen' -u {self.username} -P {self.password}")
+        print(f"   Status: mosquitto_pub -h {self.broker_host} -t home/motion1/cmnd -m 'STATUS' -u {self.username} -P <password>")
+        print(f"   High Sens: mosquitto_pub -h {self.broker_host} -t home/motion1/cmnd -m 'SENSITIVITY_HIGH' -u {self.username} -P <password>")
+        print(f"   Set Location: mosquitto_pub -h {self.broker_host} -t home/motion1/cmnd -m 'LOCATION_Kitchen' -u {self.username} -P <password>")
         print("")
         print("👁️ Monitoring motion events (Press Ctrl+C to stop)...")
         print("=" * 80)
         
         try:
-            self.client.loop_forever()
+            while True:
+                time.sleep(1)
         except KeyboardInterrupt:
             print("\n🛑 Monitoring stopped by user")
         except Exception as e:
@@ -244,10 +243,10 @@ class MotionMonitor:
 
 def main():
     parser = argparse.ArgumentParser(description='HomeGuard Motion Monitor')
-    parser.add_argument('--broker', default='192.168.1.102', help='MQTT broker IP')
-    parser.add_argument('--port', type=int, default=1883, help='MQTT broker port')
-    parser.add_argument('--username', default='homeguard', help='MQTT username')
-    parser.add_argument('--password', default='pu2clr123456', help='MQTT password')
+    parser.add_argument('--broker', help='MQTT broker IP (default: homeguard_mqtt_config.json)')
+    parser.add_argument('--port', type=int, help='MQTT broker port')
+    parser.add_argument('--username', help='MQTT username')
+    parser.add_argument('--password', help='MQTT password')
     parser.add_argument('--device', help='Send command to specific device')
     parser.add_argument('--command', help='Command to send (STATUS, SENSITIVITY_HIGH, etc.)')
     parser.add_argument('--log-file', help='Log events to file')
@@ -278,28 +277,25 @@ def main():
     if not monitor.connect():
         return
     
-    # Start monitoring
-    monitor.client.loop_start()
-    
     # Send command if specified
     if args.device and args.command:
         time.sleep(1)  # Wait for connection
         monitor.send_command(args.device, args.command)
         time.sleep(2)  # Wait for response
-        monitor.client.loop_stop()
+        monitor.client.stop()
         return
     
     # Show summary if requested
     if args.summary:
         time.sleep(10)  # Collect data for 10 seconds
         monitor.show_device_summary()
-        monitor.client.loop_stop()
+        monitor.client.stop()
         return
     
     try:
         monitor.start_monitoring()
     finally:
-        monitor.client.loop_stop()
+        monitor.client.stop()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,491 @@
+#!/usr/bin/env python3
+"""
+HomeGuard MQTT Client
+Shared MQTT connection used by the logger, monitors and audio simulators
+
+What every component used to do by hand, once:
+    - broker address and credentials from one place (load_mqtt_config):
+      environment (HOMEGUARD_MQTT_HOST/PORT/USER/PASSWORD) over
+      homeguard_mqtt_config.json ({"mqtt": {...}}) over MQTT_DEFAULTS
+    - reconnect with exponential backoff (reconnect_min .. reconnect_max),
+      including when the broker is down at startup
+    - persistent sessions (clean_session=False + stable client id): the
+      broker keeps QoS 1 messages while the client is offline
+    - handlers run on a bounded worker pool, never on the paho network
+      thread, so a slow handler (DB write, a sound playing) cannot stall
+      keepalives. Each topic is always handled by the same worker, so the
+      messages of one topic are processed in arrival order.
+
+Handlers receive a Message (payload decoded once, JSON parsed once) with the
+named wildcards of their pattern in message.captures (python/topic_router.py).
+
+Usage:
+    client = ResilientMqttClient('homeguard-audio-ground', workers=2)
+    client.subscribe('home/audio/ground/cmnd', on_command)
+    client.subscribe('home/motion/+device_id/detected', on_motion)   # captures['device_id']
+    client.start()                       # background network thread
+    client.publish('home/audio/ground/status', 'ONLINE')
+    client.stats()                       # in_flight, handler latency, reconnects, ...
+    client.stop()
+"""
+
+import json
+import logging
+import os
+import queue
+import socket
+import sys
+import threading
+import time
+from collections import deque
+
+import paho.mqtt.client as mqtt
+
+try:
+    from topic_router import TopicRouter, subscription_filter
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from topic_router import TopicRouter, subscription_filter
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+
+logger = logging.getLogger('homeguard.mqtt')
+
+MQTT_DEFAULTS = {
+    'host': '192.168.1.102',
+    'port': 1883,
+    'username': None,          # credenciais: homeguard_mqtt_config.json ou variáveis de ambiente
+    'password': None,
+    'keepalive': 60,
+    'reconnect_min': 1,        # backoff exponencial entre tentativas (s)
+    'reconnect_max': 60,
+    'workers': 2,              # threads que executam os handlers
+    'queue_size': 1000,        # mensagens pendentes por worker
+    'overflow': 'block',       # fila cheia: 'block' (pressão no broker) ou 'drop'
+    'config_file': 'homeguard_mqtt_config.json',
+}
+
+ENV_OVERRIDES = {
+    'host': 'HOMEGUARD_MQTT_HOST',
+    'port': 'HOMEGUARD_MQTT_PORT',
+    'username': 'HOMEGUARD_MQTT_USER',
+    'password': 'HOMEGUARD_MQTT_PASSWORD',
+}
+
+_UNSET = object()
+
+
+def load_mqtt_config(defaults=None, **overrides):
+    """Broker settings: keyword arguments > environment > config file > defaults > MQTT_DEFAULTS
+
+    `defaults` are the component's own settings (e.g. mqtt_broker of an audio
+    config), which deployment-wide settings still override. Values that are
+    None are ignored, so argparse values can be passed as-is.
+    """
+    config = dict(MQTT_DEFAULTS)
+    config.update({key: value for key, value in (defaults or {}).items() if value is not None})
+    filename = overrides.get('config_file') or os.environ.get('HOMEGUARD_MQTT_CONFIG') or config['config_file']
+    for config_path in (filename, os.path.join(SCRIPT_DIR, filename),
+                        os.path.join(PROJECT_ROOT, filename), f'~/{filename}'):
+        expanded_path = os.path.expanduser(config_path)
+        if os.path.exists(expanded_path):
+            with open(expanded_path, 'r') as f:
+                config.update(json.load(f).get('mqtt', {}))
+            break
+    for key, variable in ENV_OVERRIDES.items():
+        if os.environ.get(variable):
+            config[key] = os.environ[variable]
+    config.update({key: value for key, value in overrides.items() if value is not None})
+    config['port'] = int(config['port'])
+    return config
+
+
+class Message:
+    """A received message, decoded once and shared by every handler"""
+
+    __slots__ = ('topic', 'payload', 'qos', 'retain', 'timestamp', 'captures', '_text', '_parts', '_json')
+
+    def __init__(self, topic, payload, timestamp=None, qos=0, retain=False):
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+        self.retain = retain
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self.captures = {}  # named wildcards of the pattern being handled
+        self._text = None
+        self._parts = None
+        self._json = _UNSET
+
+    @property
+    def text(self):
+        if self._text is None:
+            self._text = self.payload.decode('utf-8', errors='replace')
+        return self._text
+
+    @property
+    def parts(self):
+        if self._parts is None:
+            self._parts = self.topic.split('/')
+        return self._parts
+
+    @property
+    def json(self):
+        """Decoded JSON payload, or None if the payload is not a JSON object"""
+        if self._json is _UNSET:
+            self._json = None
+            text = self.text
+            if text.startswith('{'):
+                try:
+                    self._json = json.loads(text)
+                except ValueError:
+                    pass
+        return self._json
+
+
+def pattern_covers(general, specific):
+    """True if every topic matched by `specific` is matched by `general`"""
+    general_levels = general.split('/')
+    specific_levels = specific.split('/')
+    for i, level in enumerate(general_levels):
+        if level == '#':
+            return True
+        if i >= len(specific_levels):
+            return False
+        other = specific_levels[i]
+        if level == '+':
+            if other == '#':
+                return False
+        elif level != other:
+            return False
+    return len(general_levels) == len(specific_levels)
+
+
+def minimal_subscriptions(patterns):
+    """Drop patterns already covered by another one (avoids duplicate deliveries)"""
+    unique = sorted(set(patterns))
+    return [p for p in unique
+            if not any(other != p and pattern_covers(other, p) for other in unique)]
+
+
+class OrderedExecutor:
+    """Bounded worker pool; tasks with the same key run in order on the same worker"""
+
+    _STOP = object()
+
+    def __init__(self, workers=MQTT_DEFAULTS['workers'], queue_size=MQTT_DEFAULTS['queue_size'],
+                 overflow=MQTT_DEFAULTS['overflow'], name='mqtt-worker'):
+        if overflow not in ('block', 'drop'):
+            raise ValueError(f"overflow must be 'block' or 'drop', not {overflow!r}")
+        self.overflow = overflow
+        self.name = name
+        self.queues = [queue.Queue(maxsize=queue_size) for _ in range(max(1, workers))]
+        self.threads = []
+        self.dropped = 0
+        self.started = False
+
+    def start(self):
+        if not self.started:
+            self.started = True
+            self.threads = [threading.Thread(target=self._worker, args=(q,), name=f'{self.name}-{i}', daemon=True)
+                            for i, q in enumerate(self.queues)]
+            for thread in self.threads:
+                thread.start()
+
+    def submit(self, key, function, *args):
+        """Queue function(*args) on the worker owning `key`; False if it was dropped"""
+        target = self.queues[hash(key) % len(self.queues)]
+        try:
+            target.put((function, args), block=self.overflow == 'block')
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def pending(self):
+        return sum(q.qsize() for q in self.queues)
+
+    def _worker(self, tasks):
+        while True:
+            item = tasks.get()
+            if item is self._STOP:
+                return
+            function, args = item
+            try:
+                function(*args)
+            except Exception as e:
+                logger.error(f"❌ Worker task failed: {e}")
+
+    def stop(self, drain=True, timeout=5.0):
+        """Stop the workers; with drain, tasks already queued run first"""
+        if not self.started:
+            return
+        for tasks in self.queues:
+            if not drain:
+                try:
+                    while True:
+                        tasks.get_nowait()
+                except queue.Empty:
+                    pass
+            tasks.put(self._STOP)
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        self.started = False
+
+
+class ResilientMqttClient:
+    """paho client with backoff reconnect, persistent session and worker-pool dispatch"""
+
+    def __init__(self, client_id='', config=None, clean_session=True, workers=None, queue_size=None,
+                 overflow=None, qos=None):
+        self.config = dict(config) if config is not None else load_mqtt_config()
+        if not clean_session and not client_id:
+            # A persistent session is bound to the client id, so it must be stable
+            client_id = f"homeguard-{socket.gethostname()}-{os.path.basename(sys.argv[0]).rsplit('.', 1)[0]}"
+        self.client_id = client_id
+        self.clean_session = clean_session
+        # Persistent sessions only queue QoS 1/2 messages for the client
+        self.default_qos = qos if qos is not None else (0 if clean_session else 1)
+
+        self.router = TopicRouter()
+        self.topic_qos = {}             # subscription filter -> qos
+        self.connect_listeners = []     # fn(client, session_present), network thread
+        self.disconnect_listeners = []  # fn(client, rc), network thread
+        self.executor = None
+        workers = self.config['workers'] if workers is None else workers
+        if workers > 0:
+            self.executor = OrderedExecutor(
+                workers,
+                self.config['queue_size'] if queue_size is None else queue_size,
+                overflow or self.config['overflow'])
+
+        self.connected = False
+        self.connect_count = 0
+        self.disconnect_count = 0
+        self.received = 0
+        self.handled = 0
+        self.unmatched = 0
+        self.dropped = 0
+        self.handler_errors = 0
+        self.last_disconnect = None
+        self.started_at = None
+        self._stats_lock = threading.Lock()
+        self._handler_times = deque(maxlen=1000)   # s, últimas mensagens
+        self._queue_delays = deque(maxlen=1000)
+        self._handler_max = 0.0
+        self._stopping = False
+
+        self.client = mqtt.Client(client_id=client_id, clean_session=clean_session)
+        if self.config.get('username'):
+            self.client.username_pw_set(self.config['username'], self.config.get('password'))
+        self.client.reconnect_delay_set(self.config['reconnect_min'], self.config['reconnect_max'])
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_message = self._on_message
+
+    # ---------------------------------------------------------- subscriptions
+
+    def subscribe(self, pattern, handler, qos=None):
+        """Call handler(message) for every message matching the pattern
+
+        Named wildcards ('+device_id', '#rest') are available as message.captures.
+        """
+        self.router.add(pattern, handler)
+        topic_filter = subscription_filter(pattern)
+        qos = self.default_qos if qos is None else qos
+        self.topic_qos[topic_filter] = max(qos, self.topic_qos.get(topic_filter, 0))
+        if self.connected:
+            self.client.subscribe(topic_filter, self.topic_qos[topic_filter])
+        return topic_filter
+
+    def subscriptions(self):
+        """[(filter, qos)] sent to the broker, without filters covered by another one"""
+        filters = minimal_subscriptions(self.topic_qos)
+        return [(topic_filter, max(qos for other, qos in self.topic_qos.items()
+                                   if pattern_covers(topic_filter, other)))
+                for topic_filter in filters]
+
+    def add_connect_listener(self, listener):
+        self.connect_listeners.append(listener)
+
+    def add_disconnect_listener(self, listener):
+        self.disconnect_listeners.append(listener)
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        return self.client.publish(topic, payload, qos=qos, retain=retain)
+
+    # ---------------------------------------------------------- MQTT events
+
+    def _on_connect(self, client, userdata, flags, rc):
+        if rc != 0:
+            logger.error(f"❌ Failed to connect to MQTT broker: {mqtt.connack_string(rc)}")
+            return
+
+        self.connected = True
+        self.connect_count += 1
+        session_present = bool(flags.get('session present'))
+        if self.connect_count > 1:
+            downtime = time.time() - self.last_disconnect if self.last_disconnect else 0
+            logger.info(f"🔄 Reconnected to MQTT broker after {downtime:.1f}s"
+                        f"{' (session resumed)' if session_present else ''}")
+        else:
+            logger.info(f"✅ Connected to MQTT broker {self.config['host']}:{self.config['port']}")
+
+        subscriptions = self.subscriptions()
+        if subscriptions:
+            client.subscribe(subscriptions)
+            for topic_filter, qos in subscriptions:
+                logger.info(f"📡 Subscribed to {topic_filter} (QoS {qos})")
+
+        for listener in self.connect_listeners:
+            try:
+                listener(self, session_present)
+            except Exception as e:
+                logger.error(f"❌ Connect listener error: {e}")
+
+    def _on_disconnect(self, client, userdata, rc):
+        self.connected = False
+        self.disconnect_count += 1
+        self.last_disconnect = time.time()
+        if rc != 0 and not self._stopping:
+            logger.warning(f"🔌 Unexpected MQTT disconnection ({rc}). Reconnecting with backoff "
+                           f"{self.config['reconnect_min']}-{self.config['reconnect_max']}s...")
+        for listener in self.disconnect_listeners:
+            try:
+                listener(self, rc)
+            except Exception as e:
+                logger.error(f"❌ Disconnect listener error: {e}")
+
+    def _on_message(self, client, userdata, msg):
+        message = Message(msg.topic, msg.payload, qos=msg.qos, retain=msg.retain)
+        with self._stats_lock:
+            self.received += 1
+        if self.executor is None:
+            self._handle(message)
+        elif not self.executor.submit(message.topic, self._handle, message):
+            with self._stats_lock:
+                self.dropped += 1
+            logger.warning(f"⚠️  Handler queue full, message dropped: {message.topic}")
+
+    def dispatch(self, message):
+        """Handle a message in the calling thread (tests, replays); returns the number of handlers"""
+        with self._stats_lock:
+            self.received += 1
+        return self._handle(message)
+
+    def _handle(self, message):
+        """Run every handler whose pattern matches (one failing handler does not stop the others)
+
+        A handler subscribed under overlapping patterns runs once, with the
+        captures of the first pattern it was subscribed with.
+        """
+        started = time.time()
+        matches = self.router.match(message.topic)
+        errors = 0
+        called = []
+        for handler, captures in matches:
+            if handler in called:
+                continue
+            called.append(handler)
+            message.captures = captures
+            try:
+                handler(message)
+            except Exception as e:
+                errors += 1
+                logger.error(f"❌ Handler error for {message.topic}: {e}")
+        elapsed = time.time() - started
+        with self._stats_lock:
+            self.handled += 1
+            self.handler_errors += errors
+            if not matches:
+                self.unmatched += 1
+            self._handler_times.append(elapsed)
+            self._queue_delays.append(max(0.0, started - message.timestamp))
+            self._handler_max = max(self._handler_max, elapsed)
+        return len(called)
+
+    # ------------------------------------------------------------- lifecycle
+
+    def start(self):
+        """Connect in the background (retries with backoff until the broker answers)"""
+        self._start_workers()
+        logger.info(f"🔌 Connecting to MQTT broker {self.config['host']}:{self.config['port']}...")
+        self.client.connect_async(self.config['host'], self.config['port'], self.config['keepalive'])
+        self.client.loop_start()
+
+    def run(self):
+        """Connect and run the network loop in this thread until stop()"""
+        self._start_workers()
+        logger.info(f"🔌 Connecting to MQTT broker {self.config['host']}:{self.config['port']}...")
+        self.client.connect_async(self.config['host'], self.config['port'], self.config['keepalive'])
+        self.client.loop_forever(retry_first_connection=True)
+
+    def _start_workers(self):
+        self._stopping = False
+        self.started_at = time.time()
+        if self.executor is not None:
+            self.executor.start()
+
+    def disconnect(self):
+        """Graceful disconnect; makes run() return"""
+        self._stopping = True
+        self.client.disconnect()
+
+    def stop(self, drain=True, timeout=5.0):
+        """Disconnect, stop the network thread and the workers (queued messages are handled first)"""
+        self._stopping = True
+        try:
+            self.client.disconnect()
+        finally:
+            self.client.loop_stop()
+        if self.executor is not None:
+            self.executor.stop(drain=drain, timeout=timeout)
+
+    def wait_idle(self, timeout=5.0):
+        """Wait until every received message was handled; False on timeout"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self._stats_lock:
+                idle = self.handled + self.dropped >= self.received
+            if idle:
+                return True
+            time.sleep(0.01)
+        return False
+
+    # ----------------------------------------------------------------- stats
+
+    def stats(self):
+        with self._stats_lock:
+            times = sorted(self._handler_times)
+            delays = list(self._queue_delays)
+            snapshot = {
+                'connected': self.connected,
+                'connects': self.connect_count,
+                'reconnects': max(0, self.connect_count - 1),
+                'disconnects': self.disconnect_count,
+                'received': self.received,
+                'handled': self.handled,
+                'in_flight': self.received - self.handled - self.dropped,
+                'dropped': self.dropped,
+                'unmatched': self.unmatched,
+                'handler_errors': self.handler_errors,
+                'handler_max_ms': self._handler_max * 1000,
+            }
+        snapshot['queued'] = self.executor.pending() if self.executor else 0
+        snapshot['handler_avg_ms'] = sum(times) / len(times) * 1000 if times else 0.0
+        snapshot['handler_p95_ms'] = times[min(len(times) - 1, int(len(times) * 0.95))] * 1000 if times else 0.0
+        snapshot['queue_delay_avg_ms'] = sum(delays) / len(delays) * 1000 if delays else 0.0
+        snapshot['uptime'] = time.time() - self.started_at if self.started_at else 0.0
+        return snapshot
+
+    def gauges(self, prefix='mqtt_'):
+        """Numeric stats for a metrics exporter (ingest_metrics gauge source)"""
+        return {f'{prefix}{name}': int(value) if isinstance(value, bool) else value
+                for name, value in self.stats().items()}
+
+    def format_stats(self):
+        s = self.stats()
+        return (f"{s['received']} received, {s['in_flight']} in flight, {s['dropped']} dropped, "
+                f"handler avg {s['handler_avg_ms']:.1f} ms / p95 {s['handler_p95_ms']:.1f} ms, "
+                f"{s['reconnects']} reconnects")
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Rule Engine
+Declarative motion -> relay and sensor threshold -> relay bindings
+
+Rules are plain dicts (usually a JSON file, see examples/light_rules.json):
+
+    {"name": "garagem", "trigger": "home/motion_garagem/motion",
+     "relay": "home/relay/ESP01_RELAY_001/command", "off_delay": 120,
+     "between": ["18:00", "06:30"]}
+
+    {"name": "estufa", "type": "threshold", "trigger": "home/sensor/+device_id/data",
+     "field": "temperature", "on_above": 30, "off_below": 28,
+     "relay": "home/relay/fan_{device_id}/command"}
+
+Every trigger is compiled into one TopicRouter, so a message only evaluates
+the rules bound to its topic (named captures can be used in the relay topic).
+Off-delays are keys in a single TimerWheel ticked by one thread: a new
+detection re-arms or cancels the key instead of creating a threading.Timer.
+Several rules may hold the same relay; it is switched off when the last one
+releases it.
+
+Usage:
+    engine = RuleEngine(publish=client.publish)
+    engine.load('examples/light_rules.json')
+    engine.start()                                  # timer thread
+    engine.handle(msg.topic, msg.payload.decode())  # from on_message
+"""
+
+import json
+import logging
+import threading
+import time
+from datetime import datetime
+
+from timer_wheel import TimerWheel
+from topic_router import TopicRouter
+
+logger = logging.getLogger(__name__)
+
+RULE_CONFIG = {
+    'tick': 0.5,                 # resolução dos off-delays (s)
+    'on_payload': 'ON',
+    'off_payload': 'OFF',
+}
+
+MOTION_ON = {'MOTION_DETECTED', 'DETECTED', 'MOTION', 'ON', '1', 'TRUE'}
+MOTION_OFF = {'MOTION_CLEARED', 'CLEARED', 'CLEAR', 'NO_MOTION', 'OFF', '0', 'FALSE'}
+
+
+def motion_state(payload, data):
+    """True (motion), False (cleared) or None for a motion message"""
+    if isinstance(data, dict):
+        for field in ('event', 'motion', 'state'):
+            if field in data:
+                value = str(data[field]).strip().upper()
+                if value in MOTION_ON:
+                    return True
+                if value in MOTION_OFF:
+                    return False
+        return None
+    value = payload.strip().upper()
+    if value in MOTION_ON:
+        return True
+    if value in MOTION_OFF:
+        return False
+    return None
+
+
+def parse_time_of_day(value):
+    """'HH:MM' -> minutes since midnight"""
+    hour, minute = value.split(':')
+    hour, minute = int(hour), int(minute)
+    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+        raise ValueError(f"Invalid time of day: {value}")
+    return hour * 60 + minute
+
+
+class Rule:
+    """A compiled rule: trigger pattern, condition and target relay"""
+
+    def __init__(self, spec):
+        for field in ('name', 'trigger', 'relay'):
+            if not spec.get(field):
+                raise ValueError(f"Rule missing required field: {field}")
+        self.spec = spec
+        self.name = spec['name']
+        self.trigger = spec['trigger']
+        self.relay = spec['relay']
+        self.status = spec.get('status')
+        self.type = spec.get('type', 'motion')
+        self.off_delay = float(spec.get('off_delay', 0))
+        if self.off_delay < 0:
+            raise ValueError(f"Rule {self.name}: off_delay must be positive")
+
+        self.window = None
+        if spec.get('between'):
+            start, end = spec['between']
+            self.window = (parse_time_of_day(start), parse_time_of_day(end))
+        self.days = str(spec['days']) if spec.get('days') else None
+
+        if self.type == 'motion':
+            self.evaluate = self._evaluate_motion
+        elif self.type == 'threshold':
+            self.field = spec.get('field')
+            if not self.field:
+                raise ValueError(f"Rule {self.name}: threshold rules need a field")
+            if 'on_above' in spec:
+                self.on_above = float(spec['on_above'])
+                self.off_below = float(spec.get('off_below', self.on_above))
+                self.evaluate = self._evaluate_above
+            elif 'on_below' in spec:
+                self.on_below = float(spec['on_below'])
+                self.off_above = float(spec.get('off_above', self.on_below))
+                self.evaluate = self._evaluate_below
+            else:
+                raise ValueError(f"Rule {self.name}: threshold rules need on_above or on_below")
+        else:
+            raise ValueError(f"Rule {self.name}: unknown type {self.type}")
+
+    def relay_topic(self, captures):
+        return self.relay.format(**captures) if captures else self.relay
+
+    def allowed(self, now):
+        """Time-of-day/day-of-week condition (only gates switching ON)"""
+        if self.window is None and self.days is None:
+            return True
+        moment = datetime.fromtimestamp(now)
+        if self.days is not None and str(moment.isoweekday()) not in self.days:
+            return False
+        if self.window is not None:
+            minutes = moment.hour * 60 + moment.minute
+            start, end = self.window
+            if start <= end:
+                return start <= minutes < end
+            return minutes >= start or minutes < end  # crosses midnight
+        return True
+
+    # evaluate(payload, data) -> True (on), False (off) or None (no change)
+
+    def _evaluate_motion(self, payload, data):
+        return motion_state(payload, data)
+
+    def _value(self, data):
+        if isinstance(data, dict):
+            value = data.get(self.field)
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                return value
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return None
+        return None
+
+    def _evaluate_above(self, payload, data):
+        value = self._value(data)
+        if value is None:
+            return None
+        if value > self.on_above:
+            return True
+        if value < self.off_below:
+            return False
+        return None
+
+    def _evaluate_below(self, payload, data):
+        value = self._value(data)
+        if value is None:
+            return None
+        if value < self.on_below:
+            return True
+        if value > self.off_above:
+            return False
+        return None
+
+
+class _RelayStatus:
+    """Router handler that syncs the known state of a relay from its status topic"""
+
+    def __init__(self, relay):
+        self.relay = relay
+
+
+class RuleEngine:
+    """Topic-indexed rules with off-delays on a single timer wheel"""
+
+    def __init__(self, publish, tick=RULE_CONFIG['tick'], clock=time.time,
+                 on_payload=RULE_CONFIG['on_payload'], off_payload=RULE_CONFIG['off_payload']):
+        # publish(topic, payload): client.publish, MonitorDaemon.publish...
+        self.publish = publish
+        self.clock = clock
+        self.on_payload = on_payload
+        self.off_payload = off_payload
+        self.router = TopicRouter()
+        self.wheel = TimerWheel(tick=tick, clock=clock)
+        self.rules = {}
+        self.holders = {}      # relay topic -> {(rule name, relay topic)}
+        self.relay_state = {}  # relay topic -> True/False (last command or status)
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.evaluations = 0
+
+    # ---------------------------------------------------------------- rules
+
+    def add_rule(self, spec):
+        rule = Rule(spec)
+        if rule.name in self.rules:
+            raise ValueError(f"Duplicate rule name: {rule.name}")
+        self.rules[rule.name] = rule
+        self.router.add(rule.trigger, rule)
+        if rule.status:
+            self.router.add(rule.status, _RelayStatus(rule.relay))
+        return rule
+
+    def load(self, path):
+        """Add the rules of a JSON file ({"rules": [...]} or a list)"""
+        with open(path, 'r') as f:
+            data = json.load(f)
+        specs = data.get('rules', []) if isinstance(data, dict) else data
+        for spec in specs:
+            self.add_rule(spec)
+        logger.info(f"📜 {len(specs)} rules loaded from {path}")
+        return len(specs)
+
+    def subscriptions(self):
+        return self.router.subscriptions()
+
+    def add_listener(self, listener):
+        """listener(rule, relay_topic, on, reason) for every command sent"""
+        self.listeners.append(listener)
+        return listener
+
+    # ------------------------------------------------------------- messages
+
+    def handle(self, topic, payload, now=None):
+        """Evaluate the rules bound to `topic`; returns the number of commands sent"""
+        matches = self.router.match(topic)
+        if not matches:
+            return 0
+        if now is None:
+            now = self.clock()
+        if isinstance(payload, bytes):
+            payload = payload.decode('utf-8', errors='replace')
+        try:
+            data = json.loads(payload)
+        except ValueError:
+            data = None
+
+        actions = []
+        with self.lock:
+            for handler, captures in matches:
+                if isinstance(handler, _RelayStatus):
+                    self._sync_status(handler.relay.format(**captures) if captures else handler.relay, payload)
+                    continue
+                self.evaluations += 1
+                desired = handler.evaluate(payload, data)
+                if desired is None:
+                    continue
+                relay = handler.relay_topic(captures)
+                key = (handler.name, relay)
+                if desired:
+                    self.wheel.cancel(key)
+                    if key in self.holders.get(relay, ()) or handler.allowed(now):
+                        self._hold(key, handler, relay, actions)
+                elif key in self.holders.get(relay, ()):
+                    if handler.off_delay > 0:
+                        self.wheel.schedule(key, handler.off_delay, handler, now=now)
+                    else:
+                        self._release(key, handler, relay, 'cleared', actions)
+        return self._send(actions)
+
+    def _sync_status(self, relay, payload):
+        status = payload.strip().upper()
+        if status in ('ON', 'OFF'):
+            self.relay_state[relay] = status == 'ON'
+
+    def _hold(self, key, rule, relay, actions):
+        self.holders.setdefault(relay, set()).add(key)
+        if not self.relay_state.get(relay):
+            self.relay_state[relay] = True
+            actions.append((rule, relay, True, 'triggered'))
+
+    def _release(self, key, rule, relay, reason, actions):
+        holders = self.holders.get(relay)
+        if holders is None:
+            return
+        holders.discard(key)
+        if holders:
+            return  # still held by another rule
+        del self.holders[relay]
+        if self.relay_state.get(relay, True):
+            self.relay_state[relay] = False
+            actions.append((rule, relay, False, reason))
+
+    def _send(self, actions):
+        for rule, relay, on, reason in actions:
+            try:
+                self.publish(relay, self.on_payload if on else self.off_payload)
+            except Exception as e:
+                logger.error(f"❌ Rule {rule.name}: publish to {relay} failed: {e}")
+            for listener in self.listeners:
+                try:
+                    listener(rule, relay, on, reason)
+                except Exception as e:
+                    logger.error(f"❌ Rule listener error: {e}")
+        return len(actions)
+
+    # --------------------------------------------------------------- timers
+
+    def tick(self, now=None):
+        """Expire off-delays; returns the number of commands sent"""
+        if now is None:
+            now = self.clock()
+        actions = []
+        with self.lock:
+            for (name, relay), rule in self.wheel.advance(now):
+                self._release((name, relay), rule, relay, 'off_delay', actions)
+        return self._send(actions)
+
+    def pending_timers(self):
+        return len(self.wheel)
+
+    def active_relays(self):
+        """{relay topic: [rule names holding it]}"""
+        with self.lock:
+            return {relay: sorted(name for name, _ in keys) for relay, keys in self.holders.items()}
+
+    # ------------------------------------------------------------ lifecycle
+
+    def start(self):
+        """Tick the wheel from one background thread"""
+        if self.thread is not None:
+            return
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, name='rule-engine', daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while not self.stop_event.wait(self.wheel.tick):
+            self.tick()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+            self.thread = None
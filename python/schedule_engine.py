@@ -0,0 +1,401 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Schedule Engine
+Server-side relay schedules: many schedules per device, fired over MQTT
+
+Schedules use the same format as the ESP-01S schedules of schedule_manager.py
+({active, hour, minute, duration, action, days}), but live on the server, so a
+device can have any number of them. The next fire time of every schedule is
+kept in a heap; the engine sleeps until the earliest one, publishes the relay
+command and pushes that schedule's following occurrence. Editing a schedule
+only pushes its new entry (old entries are skipped lazily), so the cost of a
+change is O(log n) regardless of how many schedules exist.
+
+A VirtualClock can replace the wall clock to fast-forward days in tests:
+
+    clock = VirtualClock(datetime(2025, 1, 6, 0, 0).timestamp())
+    engine = ScheduleEngine(publish=print, clock=clock)
+    engine.add_schedule('ESP01_RELAY_001', {...})
+    engine.run_until(clock.now() + 7 * 86400)
+
+Usage:
+    python schedule_engine.py                        # broker from homeguard_mqtt_config.json
+    python schedule_engine.py --broker 192.168.1.102 --username homeguard --password PASS
+    python schedule_engine.py --add ESP01_RELAY_001 --schedule examples/evening_lights.json
+                                                     # a running engine picks it up from the store file
+    python schedule_engine.py --list
+    python schedule_engine.py --simulate 48          # fast-forward 48h, print what would fire
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+ENGINE_CONFIG = {
+    'store_file': os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server_schedules.json'),
+    'command_topic': 'homeguard/{device_id}/cmnd',   # same as schedule_manager.send_command()
+    'qos': 1,
+    'watch_interval': 10,   # s entre verificações do arquivo de agendamentos (--add/--remove de outro processo)
+}
+
+REQUIRED_FIELDS = ('active', 'hour', 'minute', 'duration', 'action', 'days')
+
+
+class SystemClock:
+    """Wall clock; wait() returns early when woken"""
+
+    def now(self):
+        return time.time()
+
+    def wait(self, event, timeout):
+        return event.wait(timeout)
+
+
+class VirtualClock:
+    """Clock that only moves when told to (tests and --simulate)"""
+
+    def __init__(self, start=None):
+        self.current = time.time() if start is None else start
+
+    def now(self):
+        return self.current
+
+    def set(self, when):
+        if when > self.current:
+            self.current = when
+
+    def advance(self, seconds):
+        self.current += seconds
+
+    def wait(self, event, timeout):
+        # Sleeping on a virtual clock is just jumping ahead
+        if timeout is not None:
+            self.current += max(0.0, timeout)
+        return event.is_set()
+
+
+def validate_schedule(schedule):
+    """Raise ValueError if the schedule is not usable"""
+    for field in REQUIRED_FIELDS:
+        if field not in schedule:
+            raise ValueError(f"Missing required field: {field}")
+    if not 0 <= schedule['hour'] <= 23:
+        raise ValueError("Hour must be between 0 and 23")
+    if not 0 <= schedule['minute'] <= 59:
+        raise ValueError("Minute must be between 0 and 59")
+    if schedule['duration'] < 0:
+        raise ValueError("Duration must be positive")
+    days = str(schedule['days'])
+    if not days or any(day not in '01234567' for day in days):
+        raise ValueError("Days must contain 1-7 (Monday-Sunday) or 0 (once)")
+
+
+def next_occurrence(schedule, after):
+    """Epoch of the next start strictly after `after` (local time), or None"""
+    days = str(schedule['days'])
+    base = datetime.fromtimestamp(after)
+    candidate = base.replace(hour=schedule['hour'], minute=schedule['minute'], second=0, microsecond=0)
+    for offset in range(8):
+        when = candidate + timedelta(days=offset)
+        if when.timestamp() <= after:
+            continue
+        if days == '0' or str(when.isoweekday()) in days:
+            return when.timestamp()
+    return None
+
+
+class ScheduleEngine:
+    """Heap of next fire times for every active schedule"""
+
+    START = 'start'
+    END = 'end'
+
+    def __init__(self, publish, clock=None, store_file=None,
+                 command_topic=ENGINE_CONFIG['command_topic']):
+        # publish(topic, payload): client.publish, MonitorDaemon.publish, print...
+        self.publish = publish
+        self.clock = clock or SystemClock()
+        self.store_file = store_file
+        self.command_topic = command_topic
+        self.schedules = {}   # id -> schedule (with 'id' and 'device_id')
+        self.versions = {}    # id -> version of its valid heap entries
+        self.heap = []        # (when, seq, schedule_id, kind, version)
+        self.open_windows = {}  # id -> end time of a duration that is running
+        self.seq = itertools.count()
+        self.lock = threading.RLock()
+        self.wakeup = threading.Event()
+        self.running = False
+        self.fired = 0
+        self.store_mtime = None
+
+    # ------------------------------------------------------------ schedules
+
+    def load(self):
+        """Load schedules from store_file"""
+        if not self.store_file or not os.path.exists(self.store_file):
+            return 0
+        self.store_mtime = self._store_mtime()
+        with open(self.store_file, 'r') as f:
+            data = json.load(f)
+        with self.lock:
+            for schedule in data.get('schedules', []):
+                self._put(dict(schedule), save=False)
+        logger.info(f"📅 {len(self.schedules)} schedules loaded from {self.store_file}")
+        return len(self.schedules)
+
+    def save(self):
+        if not self.store_file:
+            return
+        with self.lock:
+            data = {'schedules': sorted(self.schedules.values(), key=lambda s: (s['device_id'], s['id']))}
+        tmp_path = self.store_file + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_path, self.store_file)
+        self.store_mtime = self._store_mtime()  # own writes are not reloaded
+
+    def _store_mtime(self):
+        try:
+            return os.stat(self.store_file).st_mtime_ns
+        except OSError:
+            return None
+
+    def check_store(self):
+        """Reload the store file if another process (--add/--remove) changed it"""
+        if not self.store_file:
+            return False
+        mtime = self._store_mtime()
+        if mtime == self.store_mtime:
+            return False
+        self.store_mtime = mtime
+        return self.reload()
+
+    def reload(self):
+        """Apply the store file: only added, edited or removed schedules are rescheduled"""
+        try:
+            with open(self.store_file, 'r') as f:
+                stored = {schedule['id']: schedule for schedule in json.load(f).get('schedules', [])}
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"⚠️  Could not reload {self.store_file}: {e}")
+            return False
+        with self.lock:
+            removed = [sid for sid in self.schedules if sid not in stored]
+            changed = [schedule for sid, schedule in stored.items() if self.schedules.get(sid) != schedule]
+        for schedule_id in removed:
+            self.remove_schedule(schedule_id, save=False)
+        with self.lock:
+            for schedule in changed:
+                try:
+                    self._put(dict(schedule), save=False)
+                except ValueError as e:
+                    logger.warning(f"⚠️  Schedule {schedule['id']} ignored: {e}")
+        if removed or changed:
+            logger.info(f"🔄 {self.store_file} changed: {len(changed)} added/edited, {len(removed)} removed")
+        return True
+
+    def add_schedule(self, device_id, schedule, schedule_id=None):
+        """Add a schedule for a device; returns its id"""
+        schedule = dict(schedule, device_id=device_id)
+        schedule['id'] = schedule_id or schedule.get('id') or uuid.uuid4().hex[:8]
+        with self.lock:
+            self._put(schedule)
+        return schedule['id']
+
+    def update_schedule(self, schedule_id, **changes):
+        """Change fields of a schedule; only that schedule is rescheduled"""
+        with self.lock:
+            schedule = dict(self.schedules[schedule_id], **changes)
+            self._put(schedule)
+        return schedule
+
+    def remove_schedule(self, schedule_id, save=True):
+        with self.lock:
+            schedule = self.schedules.pop(schedule_id, None)
+            if schedule is None:
+                return False
+            self.versions.pop(schedule_id, None)  # heap entries become stale
+            ending = self.open_windows.pop(schedule_id, None) is not None
+            if save:
+                self.save()
+        if ending:
+            self._fire(schedule, self.END)  # do not leave the relay in the schedule state
+        self.wakeup.set()
+        return True
+
+    def _put(self, schedule, save=True):
+        validate_schedule(schedule)
+        schedule_id = schedule['id']
+        self.schedules[schedule_id] = schedule
+        version = self.versions.get(schedule_id, 0) + 1
+        self.versions[schedule_id] = version
+        if schedule['active']:
+            when = next_occurrence(schedule, self.clock.now())
+            if when is not None:
+                heapq.heappush(self.heap, (when, next(self.seq), schedule_id, self.START, version))
+        if schedule_id in self.open_windows:
+            # Edited while running: the current window still ends as planned
+            heapq.heappush(self.heap, (self.open_windows[schedule_id], next(self.seq),
+                                       schedule_id, self.END, version))
+        if save:
+            self.save()
+        self.wakeup.set()
+
+    def next_events(self, count=10):
+        """Upcoming (when, schedule, kind), earliest first"""
+        with self.lock:
+            valid = [entry for entry in self.heap if self.versions.get(entry[2]) == entry[4]]
+            return [(when, self.schedules[sid], kind) for when, _, sid, kind, _ in heapq.nsmallest(count, valid)]
+
+    # -------------------------------------------------------------- firing
+
+    def _fire(self, schedule, kind):
+        on = bool(schedule['action']) if kind == self.START else not schedule['action']
+        topic = self.command_topic.format(device_id=schedule['device_id'])
+        payload = 'ON' if on else 'OFF'
+        self.fired += 1
+        logger.info(f"⏰ {schedule['device_id']}: {payload} "
+                    f"({schedule.get('description') or schedule['id']}, {kind})")
+        try:
+            self.publish(topic, payload)
+        except Exception as e:
+            logger.error(f"❌ Publish failed for {schedule['device_id']}: {e}")
+
+    def run_pending(self):
+        """Fire every event due now; returns the time of the next event (or None)"""
+        while True:
+            with self.lock:
+                if not self.heap:
+                    return None
+                when, _, schedule_id, kind, version = self.heap[0]
+                if self.versions.get(schedule_id) != version:
+                    heapq.heappop(self.heap)  # edited or removed
+                    continue
+                if when > self.clock.now():
+                    return when
+                heapq.heappop(self.heap)
+                schedule = self.schedules[schedule_id]
+
+                # Push what comes next for this schedule before firing
+                if kind == self.END:
+                    self.open_windows.pop(schedule_id, None)
+                elif schedule['duration'] > 0:
+                    end = when + schedule['duration'] * 60
+                    self.open_windows[schedule_id] = end
+                    heapq.heappush(self.heap, (end, next(self.seq), schedule_id, self.END, version))
+                if kind == self.START and str(schedule['days']) == '0':
+                    schedule['active'] = False  # one-time schedule
+                    self.save()
+                elif kind == self.START:
+                    following = next_occurrence(schedule, when)
+                    if following is not None:
+                        heapq.heappush(self.heap, (following, next(self.seq), schedule_id, self.START, version))
+            self._fire(schedule, kind)
+
+    def run(self):
+        """Fire events until stop(); sleeps until the next event, an edit or a store check"""
+        self.running = True
+        logger.info(f"📅 Schedule engine running ({len(self.schedules)} schedules)")
+        while self.running:
+            # Cleared before run_pending(): an edit made while it runs still wakes the wait
+            self.wakeup.clear()
+            self.check_store()
+            next_time = self.run_pending()
+            timeout = None if next_time is None else max(0.0, next_time - self.clock.now())
+            if self.store_file:
+                timeout = min(timeout if timeout is not None else ENGINE_CONFIG['watch_interval'],
+                              ENGINE_CONFIG['watch_interval'])
+            self.clock.wait(self.wakeup, timeout)
+
+    def run_until(self, end_time):
+        """Fast-forward a VirtualClock to end_time, firing everything on the way"""
+        while True:
+            next_time = self.run_pending()
+            if next_time is None or next_time > end_time:
+                self.clock.set(end_time)
+                return self.fired
+            self.clock.set(next_time)
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    parser = argparse.ArgumentParser(description='HomeGuard Schedule Engine (agendamentos no servidor)')
+    parser.add_argument('--broker', help='MQTT broker IP address (default: homeguard_mqtt_config.json)')
+    parser.add_argument('--port', type=int, help='MQTT broker port')
+    parser.add_argument('--username', help='MQTT username')
+    parser.add_argument('--password', help='MQTT password')
+    parser.add_argument('--store', default=ENGINE_CONFIG['store_file'], help='Schedules JSON file')
+    parser.add_argument('--topic', default=ENGINE_CONFIG['command_topic'],
+                        help='Command topic (home/relay/{device_id}/command for the ESP01 relays)')
+    parser.add_argument('--add', metavar='DEVICE_ID', help='Add --schedule to a device and exit')
+    parser.add_argument('--schedule', help='Schedule JSON file (same format as schedule_manager.py)')
+    parser.add_argument('--remove', metavar='SCHEDULE_ID', help='Remove a schedule and exit')
+    parser.add_argument('--list', action='store_true', help='List schedules and the next events')
+    parser.add_argument('--simulate', type=float, metavar='HOURS',
+                        help='Fast-forward HOURS on a virtual clock and print the commands')
+    args = parser.parse_args()
+
+    if args.simulate is not None:
+        clock = VirtualClock()
+        engine = ScheduleEngine(publish=lambda topic, payload: print(
+            f"{datetime.fromtimestamp(clock.now()):%Y-%m-%d %H:%M} {topic} {payload}"),
+            clock=clock, store_file=args.store, command_topic=args.topic)
+        engine.load()
+        engine.store_file = None  # simulation never writes the store
+        fired = engine.run_until(clock.now() + args.simulate * 3600)
+        print(f"✅ {fired} commands in {args.simulate:g}h")
+        return
+
+    engine = ScheduleEngine(publish=None, store_file=args.store, command_topic=args.topic)
+    engine.load()
+
+    if args.add:
+        with open(args.schedule, 'r') as f:
+            schedule_id = engine.add_schedule(args.add, json.load(f))
+        print(f"✅ Schedule {schedule_id} added to {args.add}")
+        return
+    if args.remove:
+        print("✅ Removed" if engine.remove_schedule(args.remove) else f"❌ Schedule {args.remove} not found")
+        return
+    if args.list:
+        for schedule in sorted(engine.schedules.values(), key=lambda s: (s['device_id'], s['id'])):
+            state = 'ON ' if schedule['active'] else 'OFF'
+            print(f"[{state}] {schedule['id']} {schedule['device_id']:<20} {schedule['hour']:02d}:"
+                  f"{schedule['minute']:02d} {schedule['duration']:>4} min days={schedule['days']} "
+                  f"{schedule.get('description', '')}")
+        print("\nNext events:")
+        for when, schedule, kind in engine.next_events():
+            print(f"   {datetime.fromtimestamp(when):%Y-%m-%d %H:%M} {schedule['device_id']} ({kind})")
+        return
+
+    from mqtt_client import ResilientMqttClient, load_mqtt_config
+    # QoS 1 commands published while reconnecting are queued by paho and sent afterwards
+    client = ResilientMqttClient('homeguard-schedule-engine', workers=0, config=load_mqtt_config(
+        host=args.broker, port=args.port, username=args.username, password=args.password))
+    engine.publish = lambda topic, payload: client.publish(topic, payload, qos=ENGINE_CONFIG['qos'])
+    client.start()
+    try:
+        engine.run()
+    except KeyboardInterrupt:
+        logger.info("🛑 Schedule engine stopped")
+    finally:
+        engine.stop()
+        client.stop()
+        client.disconnect()
+
+
+if __name__ == '__main__':
+    main()
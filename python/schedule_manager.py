@@ -11,20 +11,27 @@ Requirements:
 Usage:
     python schedule_manager.py --device homeguard_abc123 --schedule schedule.json
     python schedule_manager.py --list-devices
+    python schedule_manager.py --list-devices --refresh --expect homeguard_abc123,homeguard_def456
     python schedule_manager.py --monitor
 """
 
 import json
+import os
 import time
 import argparse
+import fnmatch
 import logging
-from datetime import datetime, timedelta
+import threading
+from collections import deque
+from datetime import datetime
 from typing import Dict, List, Optional
 
 import paho.mqtt.client as mqtt
 from dateutil import tz
 import pytz
 
+from liveness import LivenessTracker, heartbeat_interval
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -32,6 +39,78 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Active discovery: the request is published on request_topic and every known
+# device also gets a STATUS command; answers arrive on homeguard/<id>/stat.
+DISCOVERY_CONFIG = {
+    'request_topic': 'homeguard/discover',
+    'registry_file': os.path.join(os.path.dirname(os.path.abspath(__file__)), 'device_registry.json'),
+    'ttl': 300,            # seconds a cached discovery stays valid
+    'quiet_period': 2.0,   # stop after this long without a new answer
+}
+
+# Bulk fan-out: QoS 1 publishes, at most `window` devices awaiting confirmation
+BULK_CONFIG = {
+    'window': 8,
+    'ack_timeout': 5.0,   # seconds to wait for homeguard/<id>/stat
+    'retries': 2,
+}
+
+class DeviceRegistry:
+    """Discovered devices persisted in a JSON file, valid for `ttl` seconds"""
+    
+    def __init__(self, path: str = DISCOVERY_CONFIG['registry_file'], ttl: float = DISCOVERY_CONFIG['ttl']):
+        self.path = path
+        self.ttl = ttl
+        self.updated_at = 0.0
+        self.devices = {}  # device_id -> info (last_seen as 'YYYY-MM-DD HH:MM:SS', seen_at as epoch)
+        self.load()
+    
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            self.updated_at = data.get('updated_at', 0.0)
+            self.devices = data.get('devices', {})
+        except FileNotFoundError:
+            pass
+        except (ValueError, OSError) as e:
+            logger.warning(f"Ignoring unreadable device registry {self.path}: {e}")
+    
+    def save(self):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'updated_at': self.updated_at, 'devices': self.devices}, f, indent=2)
+        os.replace(tmp_path, self.path)
+    
+    def is_fresh(self, now: float = None) -> bool:
+        now = time.time() if now is None else now
+        return bool(self.devices) and now - self.updated_at < self.ttl
+    
+    def active_devices(self, now: float = None) -> Dict:
+        """Cached devices seen within the TTL"""
+        now = time.time() if now is None else now
+        return {device_id: info for device_id, info in self.devices.items()
+                if now - info.get('seen_at', 0) < self.ttl}
+    
+    def update(self, devices: Dict, now: float = None):
+        """Merge a discovery result and persist it"""
+        now = time.time() if now is None else now
+        for device_id, info in devices.items():
+            entry = {key: value for key, value in info.items() if key != 'last_seen'}
+            last_seen = info.get('last_seen')
+            if isinstance(last_seen, datetime):
+                entry['seen_at'] = last_seen.timestamp()
+                entry['last_seen'] = last_seen.strftime('%Y-%m-%d %H:%M:%S')
+            else:
+                entry['seen_at'] = info.get('seen_at', now)
+                entry['last_seen'] = last_seen
+            self.devices[device_id] = entry
+        self.updated_at = now
+        try:
+            self.save()
+        except OSError as e:
+            logger.warning(f"Could not save device registry {self.path}: {e}")
+
 class HomeGuardScheduleManager:
     def __init__(self, broker_host: str, broker_port: int = 1883, 
                  username: str = None, password: str = None):
@@ -52,11 +131,25 @@ class HomeGuardScheduleManager:
         self.client = mqtt.Client()
         self.devices = {}  # Store discovered devices
         self.connected = False
+        self.registry = DeviceRegistry()
+        
+        # Discovery answers (device_id -> time of the first message since the request)
+        # and device confirmations on homeguard/<id>/stat (device_id -> time of the last one)
+        self.message_cond = threading.Condition()
+        self.responses = {}
+        self.confirmations = {}
+        self.pubacks = {}  # mid -> time the broker acknowledged a QoS 1 publish
+        
+        # Liveness: a device is "online" while heartbeats keep arriving
+        # (ESP-01S relays beat every 30s; stale after 2 missed beats = 60s)
+        self.liveness = LivenessTracker(default_interval=30)
+        self.liveness.add_listener(self._on_liveness_change)
         
         # Setup MQTT callbacks
         self.client.on_connect = self._on_connect
         self.client.on_disconnect = self._on_disconnect
         self.client.on_message = self._on_message
+        self.client.on_publish = self._on_publish
         
         # Set credentials if provided
         if username and password:
@@ -88,7 +181,13 @@ class HomeGuardScheduleManager:
                 device_id = topic_parts[1]
                 message_type = topic_parts[2]
                 
-                payload = json.loads(msg.payload.decode())
+                text = msg.payload.decode()
+                try:
+                    payload = json.loads(text)
+                except ValueError:
+                    payload = None
+                if not isinstance(payload, dict):
+                    payload = {'state': text}  # plain STATUS answer ("ON"/"OFF")
                 
                 # Update device information
                 if device_id not in self.devices:
@@ -100,19 +199,43 @@ class HomeGuardScheduleManager:
                 
                 self.devices[device_id].update(payload)
                 self.devices[device_id]['last_seen'] = datetime.now()
+                self.liveness.seen(device_id, interval=heartbeat_interval(payload))
                 
                 if message_type == 'heartbeat':
-                    self.devices[device_id]['status'] = 'online'
                     logger.debug(f"Heartbeat from {device_id}")
                 
+                # Wake up discover_devices() / bulk_publish()
+                with self.message_cond:
+                    now = time.time()
+                    if message_type == 'stat':
+                        self.confirmations[device_id] = now
+                    if device_id not in self.responses:
+                        self.responses[device_id] = now
+                    self.message_cond.notify_all()
+                
         except Exception as e:
             logger.error(f"Error processing message: {e}")
     
+    def _on_publish(self, client, userdata, mid):
+        """QoS 1 publish acknowledged by the broker (PUBACK)"""
+        with self.message_cond:
+            self.pubacks[mid] = time.time()
+            self.message_cond.notify_all()
+    
+    def _on_liveness_change(self, record, previous):
+        """Liveness transition (online/stale/offline)"""
+        device = self.devices.get(record['device_id'])
+        if device is not None:
+            device['status'] = record['state']
+        if previous is not None:
+            logger.info(f"Device {record['device_id']} is now {record['state']}")
+    
     def connect(self) -> bool:
         """Connect to MQTT broker"""
         try:
             self.client.connect(self.broker_host, self.broker_port, 60)
             self.client.loop_start()
+            self.liveness.start()
             
             # Wait for connection
             timeout = 10
@@ -128,34 +251,75 @@ class HomeGuardScheduleManager:
     
     def disconnect(self):
         """Disconnect from MQTT broker"""
+        self.liveness.stop()
         self.client.loop_stop()
         self.client.disconnect()
     
-    def discover_devices(self, timeout: int = 10) -> Dict:
+    def discover_devices(self, timeout: int = 10, expected: Optional[List[str]] = None,
+                         quiet_period: float = DISCOVERY_CONFIG['quiet_period'],
+                         use_cache: bool = True) -> Dict:
         """
         Discover HomeGuard devices on the network
         
+        Publishes a discovery request (plus STATUS to every known device) and
+        returns as soon as all expected devices answered, no new device answered
+        for `quiet_period` seconds, or `timeout` expired.
+        
         Args:
-            timeout: Discovery timeout in seconds
+            timeout: Maximum discovery time in seconds
+            expected: Device IDs to wait for (default: devices in the registry)
+            quiet_period: Seconds without new answers that end the discovery
+            use_cache: Return the persistent registry when it is still fresh
             
         Returns:
             Dictionary of discovered devices
         """
-        logger.info(f"Discovering devices for {timeout} seconds...")
+        expected = set(expected or [])
+        if use_cache and self.registry.is_fresh():
+            cached = self.registry.active_devices()
+            if expected <= set(cached):
+                logger.info(f"Found {len(cached)} devices in registry cache")
+                return cached
         
+        if not expected:
+            expected = set(self.registry.devices)
+        
+        logger.info(f"Discovering devices (up to {timeout} seconds)...")
         start_time = time.time()
-        while time.time() - start_time < timeout:
-            time.sleep(1)
+        with self.message_cond:
+            self.responses = {}
+        
+        self.client.publish(DISCOVERY_CONFIG['request_topic'],
+                            json.dumps({'action': 'discover', 'reply': 'homeguard/<id>/stat'}))
+        for device_id in sorted(expected):
+            self.client.publish(f"homeguard/{device_id}/cmnd", "STATUS")
         
-        # Filter active devices (seen in last 60 seconds)
-        active_devices = {}
-        cutoff_time = datetime.now() - timedelta(seconds=60)
+        deadline = start_time + timeout
+        with self.message_cond:
+            while True:
+                now = time.time()
+                answered = set(self.responses)
+                if expected and expected <= answered:
+                    logger.info("All expected devices answered")
+                    break
+                last_answer = max(self.responses.values(), default=start_time)
+                quiet_deadline = last_answer + quiet_period
+                if now >= deadline or now >= quiet_deadline:
+                    break
+                self.message_cond.wait(min(deadline, quiet_deadline) - now)
+            answered = set(self.responses)
+        
+        # Answers to this request plus devices whose heartbeats keep them online
+        active_devices = {device_id: self.devices[device_id]
+                          for device_id in answered | self.liveness.online_devices()
+                          if device_id in self.devices}
         
-        for device_id, device_info in self.devices.items():
-            if device_info['last_seen'] > cutoff_time:
-                active_devices[device_id] = device_info
+        missing = expected - set(active_devices)
+        if missing:
+            logger.warning(f"No answer from: {', '.join(sorted(missing))}")
         
-        logger.info(f"Found {len(active_devices)} active devices")
+        self.registry.update(active_devices)
+        logger.info(f"Found {len(active_devices)} active devices in {time.time() - start_time:.1f}s")
         return active_devices
     
     def send_schedule(self, device_id: str, schedule: Dict) -> bool:
@@ -170,24 +334,7 @@ class HomeGuardScheduleManager:
             True if schedule was sent successfully
         """
         try:
-            # Validate schedule format
-            required_fields = ['active', 'hour', 'minute', 'duration', 'action', 'days']
-            for field in required_fields:
-                if field not in schedule:
-                    logger.error(f"Missing required field: {field}")
-                    return False
-            
-            # Validate values
-            if not (0 <= schedule['hour'] <= 23):
-                logger.error("Hour must be between 0 and 23")
-                return False
-            
-            if not (0 <= schedule['minute'] <= 59):
-                logger.error("Minute must be between 0 and 59")
-                return False
-            
-            if schedule['duration'] < 0:
-                logger.error("Duration must be positive")
+            if not validate_schedule(schedule):
                 return False
             
             # Send schedule
@@ -233,6 +380,119 @@ class HomeGuardScheduleManager:
             logger.error(f"Error sending command: {e}")
             return False
     
+    def bulk_publish(self, device_ids: List[str], suffix: str, payload: str,
+                     window: int = BULK_CONFIG['window'], ack_timeout: float = BULK_CONFIG['ack_timeout'],
+                     retries: int = BULK_CONFIG['retries']) -> Dict:
+        """
+        Publish the same payload to many devices over this connection
+        
+        Publishes with QoS 1, keeping at most `window` devices in flight. A
+        device is confirmed by its next message on homeguard/<id>/stat;
+        devices that do not confirm within `ack_timeout` are retried up to
+        `retries` times.
+        
+        Args:
+            device_ids: Target device IDs
+            suffix: Topic suffix (homeguard/<id>/<suffix>): 'schedule' or 'cmnd'
+            payload: Message payload
+            
+        Returns:
+            {device_id: {'ok', 'attempts', 'latency', 'broker_latency', 'error'}}
+        """
+        pending = deque(dict.fromkeys(device_ids))  # unique, in order
+        inflight = {}  # device_id -> {'sent_at', 'first_sent', 'attempts', 'mid'}
+        results = {}
+        start_time = time.time()
+        
+        outbox = []  # device_ids to (re)publish once message_cond is released
+        
+        def send(device_id, state):
+            self.pubacks.pop(state.get('mid'), None)
+            state['mid'] = None
+            state['sent_at'] = time.time()
+            state['attempts'] += 1
+            outbox.append(device_id)
+        
+        def publish(device_id):
+            result = self.client.publish(f"homeguard/{device_id}/{suffix}", payload, qos=1)
+            if result.rc != mqtt.MQTT_ERR_SUCCESS:
+                logger.warning(f"Publish to {device_id} failed (rc={result.rc})")
+            return result.mid
+        
+        def finish(device_id, ok, now, error=None):
+            state = inflight.pop(device_id)
+            puback = self.pubacks.pop(state['mid'], None)
+            results[device_id] = {
+                'ok': ok,
+                'attempts': state['attempts'],
+                'latency': now - state['first_sent'] if ok else None,
+                'broker_latency': puback - state['sent_at'] if puback else None,
+                'error': error,
+            }
+        
+        with self.message_cond:
+            self.pubacks.clear()
+        while True:
+            # Publish without holding message_cond: paho runs _on_publish (which
+            # takes message_cond) while holding the outgoing-message lock that
+            # publish() needs, so publishing under the condition can deadlock
+            sent = [(device_id, publish(device_id)) for device_id in outbox]
+            outbox.clear()
+            
+            with self.message_cond:
+                for device_id, mid in sent:
+                    inflight[device_id]['mid'] = mid
+                if not (pending or inflight):
+                    break
+                
+                # Fill the window
+                while pending and len(inflight) < window:
+                    device_id = pending.popleft()
+                    state = inflight[device_id] = {'attempts': 0, 'first_sent': time.time()}
+                    send(device_id, state)
+                if outbox:
+                    continue
+                
+                now = time.time()
+                next_timeout = now + ack_timeout
+                for device_id, state in list(inflight.items()):
+                    if self.confirmations.get(device_id, 0) >= state['sent_at']:
+                        finish(device_id, True, now)
+                    elif now - state['sent_at'] >= ack_timeout:
+                        if state['attempts'] <= retries:
+                            logger.info(f"Retrying {device_id} (attempt {state['attempts'] + 1})")
+                            send(device_id, state)
+                        else:
+                            error = 'no confirmation' if state['mid'] in self.pubacks else 'no broker ack'
+                            finish(device_id, False, now, error)
+                    else:
+                        next_timeout = min(next_timeout, state['sent_at'] + ack_timeout)
+                
+                if inflight and not outbox and not (pending and len(inflight) < window):
+                    self.message_cond.wait(max(0.0, next_timeout - time.time()))
+        
+        elapsed = time.time() - start_time
+        confirmed = sum(1 for r in results.values() if r['ok'])
+        logger.info(f"Bulk {suffix}: {confirmed}/{len(results)} devices confirmed in {elapsed:.1f}s")
+        return results
+    
+    def send_schedule_bulk(self, device_ids: List[str], schedule: Dict, **options) -> Dict:
+        """Send one schedule to many devices (see bulk_publish)"""
+        if not validate_schedule(schedule):
+            return {}
+        return self.bulk_publish(device_ids, 'schedule', json.dumps(schedule), **options)
+    
+    def send_command_bulk(self, device_ids: List[str], command: str, **options) -> Dict:
+        """Send one command to many devices (see bulk_publish)"""
+        return self.bulk_publish(device_ids, 'cmnd', command.upper(), **options)
+    
+    def select_devices(self, pattern: str) -> List[str]:
+        """Device IDs (registry + discovered) matching a shell-style pattern"""
+        known = set(self.registry.devices) | set(self.devices)
+        if not known:
+            known = set(self.discover_devices())
+        return sorted(device_id for device_id in known if fnmatch.fnmatch(device_id, pattern))
+    
     def monitor_devices(self):
         """Monitor device activity in real-time"""
         logger.info("Monitoring devices... Press Ctrl+C to stop")
@@ -244,6 +504,30 @@ class HomeGuardScheduleManager:
         except KeyboardInterrupt:
             logger.info("Monitoring stopped")
 
+def validate_schedule(schedule: Dict) -> bool:
+    """Check schedule fields and ranges (errors are logged)"""
+    # Validate schedule format
+    required_fields = ['active', 'hour', 'minute', 'duration', 'action', 'days']
+    for field in required_fields:
+        if field not in schedule:
+            logger.error(f"Missing required field: {field}")
+            return False
+    
+    # Validate values
+    if not (0 <= schedule['hour'] <= 23):
+        logger.error("Hour must be between 0 and 23")
+        return False
+    
+    if not (0 <= schedule['minute'] <= 59):
+        logger.error("Minute must be between 0 and 59")
+        return False
+    
+    if schedule['duration'] < 0:
+        logger.error("Duration must be positive")
+        return False
+    
+    return True
+
 def load_schedule_from_file(filename: str) -> Dict:
     """Load schedule from JSON file"""
     try:
@@ -253,6 +537,34 @@ def load_schedule_from_file(filename: str) -> Dict:
         logger.error(f"Error loading schedule file: {e}")
         return {}
 
+def load_device_group(filename: str, group: str) -> List[str]:
+    """Device IDs of a group file: {"group_name": ["device_id", ...]}"""
+    with open(filename, 'r') as f:
+        groups = json.load(f)
+    if group not in groups:
+        raise KeyError(f"Group '{group}' not found in {filename}")
+    return list(groups[group])
+
+def print_bulk_report(results: Dict):
+    """Per-device result of a bulk operation"""
+    print("\nBulk Results:")
+    print("-" * 70)
+    print(f"{'Device ID':<28} {'Result':<10} {'Attempts':<9} {'Latency':<10} {'Broker'}")
+    print("-" * 70)
+    for device_id, r in results.items():
+        result = "OK" if r['ok'] else "FAILED"
+        latency = f"{r['latency'] * 1000:.0f} ms" if r['latency'] is not None else (r['error'] or '-')
+        broker = f"{r['broker_latency'] * 1000:.0f} ms" if r['broker_latency'] is not None else '-'
+        print(f"{device_id:<28} {result:<10} {r['attempts']:<9} {latency:<10} {broker}")
+    print("-" * 70)
+    ok = [r for r in results.values() if r['ok']]
+    retried = sum(1 for r in results.values() if r['attempts'] > 1)
+    print(f"Confirmed: {len(ok)}/{len(results)}  Retried: {retried}  Failed: {len(results) - len(ok)}")
+    if ok:
+        latencies = sorted(r['latency'] for r in ok)
+        print(f"Latency: median {latencies[len(latencies) // 2] * 1000:.0f} ms, "
+              f"max {latencies[-1] * 1000:.0f} ms")
+
 def create_sample_schedule() -> Dict:
     """Create a sample schedule"""
     return {
@@ -264,6 +576,18 @@ def create_sample_schedule() -> Dict:
         "days": "1234567"  # Monday to Sunday
     }
 
+def print_devices(devices: Dict):
+    """Print a discovery result"""
+    print("\nDiscovered Devices:")
+    print("-" * 50)
+    for device_id, info in devices.items():
+        print(f"Device ID: {device_id}")
+        print(f"  MAC: {info.get('mac', 'Unknown')}")
+        print(f"  IP: {info.get('ip', 'Unknown')}")
+        print(f"  Status: {info.get('status', 'Unknown')}")
+        print(f"  Last Seen: {info['last_seen']}")
+        print()
+
 def main():
     parser = argparse.ArgumentParser(description='HomeGuard Schedule Manager')
     parser.add_argument('--broker', required=True, help='MQTT broker IP address')
@@ -271,9 +595,22 @@ def main():
     parser.add_argument('--username', help='MQTT username')
     parser.add_argument('--password', help='MQTT password')
     parser.add_argument('--device', help='Target device ID')
+    parser.add_argument('--devices', help='Bulk mode: comma-separated device IDs')
+    parser.add_argument('--select', help='Bulk mode: device ID pattern, e.g. "ESP01_RELAY_*"')
+    parser.add_argument('--group-file', help='Bulk mode: JSON file with device groups')
+    parser.add_argument('--group', help='Bulk mode: group name in --group-file')
+    parser.add_argument('--window', type=int, default=BULK_CONFIG['window'],
+                        help='Bulk mode: devices awaiting confirmation at once')
+    parser.add_argument('--ack-timeout', type=float, default=BULK_CONFIG['ack_timeout'],
+                        help='Bulk mode: seconds to wait for each confirmation')
+    parser.add_argument('--retries', type=int, default=BULK_CONFIG['retries'],
+                        help='Bulk mode: retries per device')
     parser.add_argument('--schedule', help='Schedule JSON file')
     parser.add_argument('--command', help='Direct command (ON, OFF, STATUS, RESTART)')
     parser.add_argument('--list-devices', action='store_true', help='List discovered devices')
+    parser.add_argument('--refresh', action='store_true', help='Ignore the device registry cache')
+    parser.add_argument('--expect', help='Comma-separated device IDs to wait for during discovery')
+    parser.add_argument('--timeout', type=int, default=10, help='Discovery timeout in seconds')
     parser.add_argument('--monitor', action='store_true', help='Monitor device activity')
     parser.add_argument('--create-sample', help='Create sample schedule file')
     
@@ -287,6 +624,16 @@ def main():
         logger.info(f"Sample schedule created: {args.create_sample}")
         return
     
+    expected = [d.strip() for d in args.expect.split(',')] if args.expect else None
+    
+    # Repeated --list-devices calls are answered from the registry without connecting
+    if args.list_devices and not args.refresh:
+        registry = DeviceRegistry()
+        cached = registry.active_devices()
+        if registry.is_fresh() and set(expected or []) <= set(cached):
+            print_devices(cached)
+            return
+    
     # Initialize manager
     manager = HomeGuardScheduleManager(
         broker_host=args.broker,
@@ -301,18 +648,29 @@ def main():
         return
     
     try:
+        # Bulk targets (one connection for the whole fleet)
+        targets = []
+        if args.devices:
+            targets += [d.strip() for d in args.devices.split(',') if d.strip()]
+        if args.group_file and args.group:
+            targets += load_device_group(args.group_file, args.group)
+        if args.select:
+            targets += manager.select_devices(args.select)
+        bulk_options = {'window': args.window, 'ack_timeout': args.ack_timeout, 'retries': args.retries}
+        
         # List devices
         if args.list_devices:
-            devices = manager.discover_devices()
-            print("\nDiscovered Devices:")
-            print("-" * 50)
-            for device_id, info in devices.items():
-                print(f"Device ID: {device_id}")
-                print(f"  MAC: {info.get('mac', 'Unknown')}")
-                print(f"  IP: {info.get('ip', 'Unknown')}")
-                print(f"  Status: {info.get('status', 'Unknown')}")
-                print(f"  Last Seen: {info['last_seen']}")
-                print()
+            devices = manager.discover_devices(timeout=args.timeout, expected=expected, use_cache=False)
+            print_devices(devices)
+        
+        # Bulk schedule / command
+        elif targets and args.schedule:
+            schedule = load_schedule_from_file(args.schedule)
+            if schedule:
+                print_bulk_report(manager.send_schedule_bulk(targets, schedule, **bulk_options))
+        
+        elif targets and args.command:
+            print_bulk_report(manager.send_command_bulk(targets, args.command, **bulk_options))
         
         # Send schedule
         elif args.device and args.schedule:
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Timer Wheel
+Hashed timer wheel for large numbers of keyed timeouts (device liveness, off-delays)
+
+Each key has at most one pending timer: scheduling a key again replaces its
+previous deadline (a heartbeat simply pushes the expiry forward). Timers are
+hashed into `slots` buckets of `tick` seconds, so scheduling, rescheduling and
+cancelling are O(1) and each advance() only visits the buckets of the ticks
+that elapsed - the cost follows the number of timers due, not the number of
+keys being tracked. Expiry is reported at most one tick late.
+
+Usage:
+    wheel = TimerWheel(tick=1.0)
+    wheel.schedule('motion_garagem', 180, payload='offline')
+    ...
+    for key, payload in wheel.advance():   # call every tick
+        ...
+"""
+
+import math
+import time
+
+
+class TimerWheel:
+    """Hashed timer wheel with one replaceable timer per key"""
+
+    def __init__(self, tick=1.0, slots=512, clock=time.monotonic):
+        if tick <= 0 or slots <= 0:
+            raise ValueError("tick and slots must be positive")
+        self.tick = tick
+        self.slots = slots
+        self.clock = clock
+        self.wheel = [[] for _ in range(slots)]
+        self.timers = {}  # key -> (deadline, deadline_tick, payload, generation)
+        self.generation = 0
+        self.current_tick = self._tick_of(clock())
+
+    def __len__(self):
+        return len(self.timers)
+
+    def __contains__(self, key):
+        return key in self.timers
+
+    def _tick_of(self, when):
+        return math.floor(when / self.tick)
+
+    def schedule(self, key, delay, payload=None, now=None):
+        """(Re)arm the timer of `key` to fire `delay` seconds from now; returns the deadline"""
+        if now is None:
+            now = self.clock()
+        deadline = now + delay
+        # Never in a tick that was already processed
+        deadline_tick = max(math.ceil(deadline / self.tick), self.current_tick + 1)
+        self.generation += 1
+        self.timers[key] = (deadline, deadline_tick, payload, self.generation)
+        self.wheel[deadline_tick % self.slots].append((key, self.generation))
+        return deadline
+
+    def cancel(self, key):
+        """Cancel the pending timer of `key` (stale bucket entries are dropped lazily)"""
+        return self.timers.pop(key, None) is not None
+
+    def deadline(self, key):
+        timer = self.timers.get(key)
+        return timer[0] if timer else None
+
+    def advance(self, now=None):
+        """Expire every timer due up to `now`; returns [(key, payload)] in deadline order"""
+        if now is None:
+            now = self.clock()
+        target_tick = self._tick_of(now)
+        expired = []
+
+        # After a long pause there is no need to walk more than one full turn
+        first_tick = max(self.current_tick + 1, target_tick - self.slots + 1)
+        for tick in range(first_tick, target_tick + 1):
+            bucket_index = tick % self.slots
+            bucket = self.wheel[bucket_index]
+            if not bucket:
+                continue
+            remaining = []
+            for key, generation in bucket:
+                timer = self.timers.get(key)
+                if timer is None or timer[3] != generation:
+                    continue  # cancelled or rescheduled
+                if timer[1] <= target_tick:
+                    del self.timers[key]
+                    expired.append((timer[0], key, timer[2]))
+                else:
+                    remaining.append((key, generation))  # due in a later turn of the wheel
+            self.wheel[bucket_index] = remaining
+
+        if target_tick > self.current_tick:
+            self.current_tick = target_tick
+        expired.sort(key=lambda item: item[0])
+        return [(key, payload) for _, key, payload in expired]
+
+    def next_deadline(self):
+        """Earliest pending deadline (O(n); for diagnostics and tests)"""
+        return min((timer[0] for timer in self.timers.values()), default=None)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Topic Router
+Compiled MQTT topic-pattern router used to dispatch incoming messages
+
+Patterns use the MQTT wildcards and may name them to extract captures:
+
+    home/relay/+device_id/+message_type   -> {'device_id': ..., 'message_type': ...}
+    home/+device/motion                   -> {'device': ...}
+    home/audio/#rest                      -> {'rest': 'ground/cmnd'}
+    home/+/status                         -> {} (anonymous wildcard)
+
+All patterns are compiled into a trie (one node per topic level), so a
+message is routed in a single walk over its levels instead of testing every
+pattern with substring checks or topic_matches_sub(). Handlers are returned
+in registration order together with their captures.
+
+Usage:
+    router = TopicRouter()
+    router.add('home/relay/+device_id/status', on_relay_status)
+    for handler, captures in router.match('home/relay/ESP01_RELAY_001/status'):
+        handler(payload, **captures)
+
+    router.dispatch(topic, payload)      # same as above
+    router.subscriptions()               # plain MQTT filters for client.subscribe()
+"""
+
+import re
+import threading
+
+_NAME_RE = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+
+
+class _Node:
+    """One topic level of the trie"""
+
+    __slots__ = ('children', 'plus', 'hash_routes', 'routes')
+
+    def __init__(self):
+        self.children = {}      # literal level -> _Node
+        self.plus = None        # '+' child
+        self.hash_routes = []   # routes ending in '#' at this level
+        self.routes = []        # routes ending exactly at this level
+
+
+class Route:
+    """A compiled pattern: handler, capture names and registration order"""
+
+    __slots__ = ('pattern', 'handler', 'names', 'hash_name', 'order')
+
+    def __init__(self, pattern, handler, names, hash_name, order):
+        self.pattern = pattern
+        self.handler = handler
+        self.names = names          # one entry per '+' level (None = anonymous)
+        self.hash_name = hash_name  # capture for the '#' level (None = anonymous)
+        self.order = order
+
+    def captures(self, values, rest=None):
+        captures = {name: value for name, value in zip(self.names, values) if name}
+        if self.hash_name:
+            captures[self.hash_name] = rest
+        return captures
+
+    def __repr__(self):
+        return f"Route({self.pattern!r})"
+
+
+def parse_pattern(pattern):
+    """Split a pattern into [(kind, value)] where kind is 'literal', '+' or '#'
+
+    Raises ValueError for patterns that are not valid MQTT filters.
+    """
+    if not pattern:
+        raise ValueError("empty topic pattern")
+    levels = pattern.split('/')
+    parsed = []
+    for i, level in enumerate(levels):
+        if level[:1] in ('+', '#'):
+            kind, name = level[0], level[1:]
+            if name and not _NAME_RE.match(name):
+                raise ValueError(f"invalid capture name {name!r} in {pattern!r}")
+            if kind == '#' and i != len(levels) - 1:
+                raise ValueError(f"'#' must be the last level in {pattern!r}")
+            parsed.append((kind, name or None))
+        elif '+' in level or '#' in level:
+            raise ValueError(f"wildcards must occupy a whole level in {pattern!r}")
+        else:
+            parsed.append(('literal', level))
+    return parsed
+
+
+def subscription_filter(pattern):
+    """Plain MQTT filter for a pattern (capture names removed)"""
+    return '/'.join(kind if kind != 'literal' else value
+                    for kind, value in parse_pattern(pattern))
+
+
+class TopicRouter:
+    """MQTT wildcard patterns compiled into a trie"""
+
+    def __init__(self, cache_size=1024):
+        self.root = _Node()
+        self.cache_size = cache_size
+        self._cache = {}
+        # Several dispatch workers may match at once: the cache is only touched under the lock
+        self._cache_lock = threading.Lock()
+        self._generation = 0
+        self._order = 0
+        self._routes = []
+
+    def __len__(self):
+        return len(self._routes)
+
+    def add(self, pattern, handler):
+        """Route topics matching `pattern` to `handler`; returns the Route"""
+        node = self.root
+        names = []
+        hash_name = None
+        is_hash = False
+        for kind, value in parse_pattern(pattern):
+            if kind == 'literal':
+                node = node.children.setdefault(value, _Node())
+            elif kind == '+':
+                if node.plus is None:
+                    node.plus = _Node()
+                node = node.plus
+                names.append(value)
+            else:
+                hash_name = value
+                is_hash = True
+
+        route = Route(pattern, handler, tuple(names), hash_name, self._order)
+        self._order += 1
+        (node.hash_routes if is_hash else node.routes).append(route)
+        self._routes.append(route)
+        self._invalidate()
+        return route
+
+    def remove(self, pattern, handler=None):
+        """Remove the routes for `pattern` (only `handler`'s, if given); returns how many"""
+        removed = [r for r in self._routes
+                   if r.pattern == pattern and (handler is None or r.handler == handler)]
+        if not removed:
+            return 0
+        for route in removed:
+            self._routes.remove(route)
+        self._rebuild()
+        return len(removed)
+
+    def _rebuild(self):
+        routes = self._routes
+        self.root = _Node()
+        self._routes = []
+        self._invalidate()
+        for route in routes:
+            self.add(route.pattern, route.handler)
+
+    def _invalidate(self):
+        with self._cache_lock:
+            self._cache.clear()
+            self._generation += 1
+
+    def match(self, topic):
+        """[(handler, captures)] for every pattern matching `topic`, in registration order
+
+        Results are cached per topic; every call gets its own captures dicts.
+        """
+        with self._cache_lock:
+            cached = self._cache.get(topic)
+            generation = self._generation
+        if cached is not None:
+            return [(handler, dict(captures)) for handler, captures in cached]
+
+        levels = topic.split('/')
+        last = len(levels)
+        found = []
+        # Topics starting with '$' ($SYS/...) are not matched by a leading wildcard
+        wildcard_root = not topic.startswith('$')
+
+        stack = [(self.root, 0, ())]
+        while stack:
+            node, i, values = stack.pop()
+            if node.hash_routes and (i > 0 or wildcard_root):
+                # '#' also matches the parent level ('home/#' matches 'home')
+                rest = '/'.join(levels[i:])
+                for route in node.hash_routes:
+                    found.append((route, route.captures(values, rest)))
+            if i == last:
+                for route in node.routes:
+                    found.append((route, route.captures(values)))
+                continue
+            level = levels[i]
+            child = node.children.get(level)
+            if child is not None:
+                stack.append((child, i + 1, values))
+            if node.plus is not None and (i > 0 or wildcard_root):
+                stack.append((node.plus, i + 1, values + (level,)))
+
+        if len(found) > 1:
+            found.sort(key=lambda item: item[0].order)
+        result = [(route.handler, captures) for route, captures in found]
+
+        if self.cache_size:
+            with self._cache_lock:
+                # Routes changed during the walk: the result may be stale, do not cache it
+                if generation == self._generation and topic not in self._cache:
+                    if len(self._cache) >= self.cache_size:
+                        # Descarta o tópico mais antigo (dict mantém a ordem de inserção)
+                        del self._cache[next(iter(self._cache))]
+                    self._cache[topic] = result
+            return [(handler, dict(captures)) for handler, captures in result]
+        return result
+
+    def dispatch(self, topic, *args):
+        """Call handler(*args, **captures) for every match; returns the number of handlers called"""
+        matches = self.match(topic)
+        for handler, captures in matches:
+            handler(*args, **captures)
+        return len(matches)
+
+    def subscriptions(self):
+        """Plain MQTT filters for every registered pattern (unique, in order)"""
+        filters = []
+        for route in self._routes:
+            topic_filter = subscription_filter(route.pattern)
+            if topic_filter not in filters:
+                filters.append(topic_filter)
+        return filters
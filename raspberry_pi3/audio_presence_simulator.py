@@ -25,26 +25,50 @@ import pygame
 import json
 import random
 import time
-import schedule
-import threading
 import os
 import sys
 from datetime import datetime, timedelta
-import paho.mqtt.client as mqtt
 from pathlib import Path
 
+try:
+    from mqtt_client import ResilientMqttClient, load_mqtt_config
+except ImportError:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python'))
+    from mqtt_client import ResilientMqttClient, load_mqtt_config
+
+try:
+    from sound_cache import SoundCache, SOUND_CACHE_CONFIG
+    from playback_engine import PlaybackEngine, PLAYBACK_CONFIG, MOTION, ROUTINE
+    from routine_scheduler import RoutineScheduler, SCHEDULER_CONFIG
+    from audio_manifest import AudioManifest
+    from transcode_cache import TranscodeCache, TRANSCODE_CONFIG
+except ImportError:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shared'))
+    from sound_cache import SoundCache, SOUND_CACHE_CONFIG
+    from playback_engine import PlaybackEngine, PLAYBACK_CONFIG, MOTION, ROUTINE
+    from routine_scheduler import RoutineScheduler, SCHEDULER_CONFIG
+    from audio_manifest import AudioManifest
+    from transcode_cache import TranscodeCache, TRANSCODE_CONFIG
+
 class AudioPresenceSimulator:
+    # Daily routines of the config -> simulate_presence_routine() type
+    SCHEDULED_ROUTINES = {'morning_routine': 'morning', 'evening_routine': 'evening'}
+    
     def __init__(self, config_file="audio_config.json"):
         """Initialize the Audio Presence Simulator"""
         
         # Load configuration
         self.config = self.load_config(config_file)
         
-        # MQTT Configuration
-        self.mqtt_broker = self.config.get('mqtt_broker', '192.168.1.102')
-        self.mqtt_port = self.config.get('mqtt_port', 1883)
-        self.mqtt_user = self.config.get('mqtt_user', 'homeguard')
-        self.mqtt_pass = self.config.get('mqtt_pass', 'pu2clr123456')
+        # MQTT Configuration (credentials: homeguard_mqtt_config.json or HOMEGUARD_MQTT_*)
+        self.mqtt_config = load_mqtt_config(defaults={
+            'host': self.config.get('mqtt_broker'),
+            'port': self.config.get('mqtt_port'),
+            'username': self.config.get('mqtt_user'),
+            'password': self.config.get('mqtt_pass'),
+        })
+        self.mqtt_broker = self.mqtt_config['host']
+        self.mqtt_port = self.mqtt_config['port']
         
         # Device info
         self.device_id = "audio_presence_rpi3_ground_floor"
@@ -57,6 +81,7 @@ class AudioPresenceSimulator:
             'status': 'home/audio/ground/status', 
             'events': 'home/audio/ground/events',
             'heartbeat': 'home/audio/ground/heartbeat',
+            'schedule': 'home/audio/ground/schedule',     # Next planned routines (retained)
             'motion_trigger': 'homeguard/motion/+/detected',  # Listen to all motion sensors
             'relay_trigger': 'homeguard/relay/+/status',      # Listen to relay events
             'audio_control': 'home/audio/ground/control', # Direct audio control
@@ -80,19 +105,26 @@ class AudioPresenceSimulator:
         
         # State variables
         self.presence_mode = self.config.get('default_mode', 'home')  # home, away, night, vacation
-        self.is_playing = False
         self.current_schedule = None
         self.motion_triggered_sounds = self.config.get('motion_triggered', True)
         self.background_playing = False
         
         # Load audio files
         self.load_audio_files()
-        
-        # MQTT Client
-        self.mqtt_client = mqtt.Client()
-        self.mqtt_client.on_connect = self.on_mqtt_connect
-        self.mqtt_client.on_message = self.on_mqtt_message
-        self.mqtt_client.username_pw_set(self.mqtt_user, self.mqtt_pass)
+        self.transcoder = TranscodeCache(self.manifest,
+                                         normalize=self.config.get('normalize_audio', TRANSCODE_CONFIG['normalize']),
+                                         target_dbfs=self.config.get('target_dbfs', TRANSCODE_CONFIG['target_dbfs']))
+        self.sound_cache = SoundCache(budget_mb=self.config.get('sound_cache_mb', SOUND_CACHE_CONFIG['budget_mb']),
+                                      resolver=self.transcoder.resolve)
+        self.playback = PlaybackEngine(self.sound_cache,
+                                       channels=self.config.get('mixer_channels', PLAYBACK_CONFIG['channels']))
+        
+        # MQTT Client: handlers only queue sounds (delays included) on the playback engine
+        self.mqtt_client = ResilientMqttClient(self.device_id, config=self.mqtt_config, workers=1)
+        self.mqtt_client.subscribe(self.topics['cmd'], lambda message: self.handle_command(message.text))
+        self.mqtt_client.subscribe(self.topics['motion_trigger'], self.on_motion_message)
+        self.mqtt_client.subscribe(self.topics['relay_trigger'], self.on_relay_message)
+        self.mqtt_client.add_connect_listener(self.on_mqtt_connect)
         
         # Scheduling
         self.setup_schedules()
@@ -107,8 +139,6 @@ class AudioPresenceSimulator:
         default_config = {
             "mqtt_broker": "192.168.1.102",
             "mqtt_port": 1883,
-            "mqtt_user": "homeguard",
-            "mqtt_pass": "pu2clr123456",
             "location": "Living Room",
             "audio_path": "./audio_files",
             "default_mode": "home",
@@ -155,26 +185,62 @@ class AudioPresenceSimulator:
             for category in self.audio_categories.keys():
                 category_path = self.audio_base_path / category
                 category_path.mkdir(exist_ok=True)
-                
-                # Load audio files (mp3, wav, ogg)
-                for ext in ['*.mp3', '*.wav', '*.ogg']:
-                    self.audio_categories[category].extend(category_path.glob(ext))
-                
+            
+            # Load audio files (mp3, wav, ogg) from the manifest: only new/changed files are read
+            self.manifest = AudioManifest(self.audio_base_path, self.audio_categories.keys(),
+                                          extensions=('.mp3', '.wav', '.ogg'))
+            self.manifest.open()
+            for category in self.audio_categories.keys():
+                self.audio_categories[category] = [Path(f) for f in self.manifest.files(category)]
                 print(f"📁 {category}: {len(self.audio_categories[category])} files")
         
         except Exception as e:
             print(f"❌ Error loading audio files: {e}")
     
-    def play_sound(self, category, volume=None, random_select=True):
-        """Play sound from category"""
+    def on_audio_library_change(self, changes):
+        """Sound added/replaced/removed in audio_files: update categories without restart"""
+        for category in self.audio_categories.keys():
+            self.audio_categories[category] = [Path(f) for f in self.manifest.files(category)]
+        self.sound_cache.discard(changes['changed'] + changes['removed'])
+        if changes['added'] or changes['changed']:
+            self.prepare_sounds(changes['added'] + changes['changed'])
+        print(f"🗂️  Audio library updated: +{len(changes['added'])} "
+              f"~{len(changes['changed'])} -{len(changes['removed'])}")
+    
+    def prepare_sounds(self, paths, warm=None):
+        """Transcode paths in the background, then decode `warm` (default: all of them) into the cache"""
+        paths = list(paths)
+        warm = paths if warm is None else list(warm)
+        if self.config.get('transcode_audio', True):
+            self.transcoder.enqueue(paths, on_ready=self.sound_cache.discard,
+                                    on_done=lambda: self.sound_cache.warm(warm))
+        else:
+            self.sound_cache.warm(warm)
+    
+    def warm_up_files(self):
+        """Files to pre-decode: alerts and motion responses first, then scheduled routines"""
+        order = ['dogs', 'alerts', 'footsteps', 'doors']
+        for routine in self.config.get('schedules', {}).values():
+            order.extend(routine.get('sounds', []))
+        files = []
+        for category in dict.fromkeys(order):
+            files.extend(self.audio_categories.get(category, []))
+        return files
+    
+    def audio_busy(self):
+        """True while a sound is playing on any mixer channel or stream"""
+        return self.playback.busy()
+    
+    def play_sound(self, category, volume=None, random_select=True, priority=MOTION, delay=0, on_end=None):
+        """Queue sound from category; returns its Playback (on_end is called when it ends)"""
         try:
             if category not in self.audio_categories:
                 print(f"❌ Unknown category: {category}")
-                return False
+                return None
             
             if not self.audio_categories[category]:
                 print(f"❌ No audio files in category: {category}")
-                return False
+                return None
             
             # Select audio file
             if random_select:
@@ -186,41 +252,30 @@ class AudioPresenceSimulator:
             if volume is None:
                 volume = self.config.get('volume_levels', {}).get(category, 0.7)
             
-            # Play sound
-            pygame.mixer.music.load(str(audio_file))
-            pygame.mixer.music.set_volume(volume)
-            pygame.mixer.music.play()
-            
             # Log event
             self.log_audio_event(category, audio_file.name, volume)
             
-            return True
+            # Played by the engine thread (decoded buffer from the cache, or streamed from disk)
+            return self.playback.play(audio_file, volume, priority=priority, delay=delay, on_end=on_end)
             
         except Exception as e:
             print(f"❌ Error playing sound: {e}")
-            return False
+            return None
     
-    def play_sequence(self, categories, delays=None):
-        """Play sequence of sounds with delays"""
-        def play_seq():
-            try:
-                for i, category in enumerate(categories):
-                    if delays and i < len(delays):
-                        time.sleep(delays[i])
-                    
-                    self.play_sound(category)
-                    
-                    # Wait for sound to finish
-                    while pygame.mixer.music.get_busy():
-                        time.sleep(0.1)
-                        
-            except Exception as e:
-                print(f"❌ Error in sound sequence: {e}")
-        
-        # Run in separate thread
-        threading.Thread(target=play_seq, daemon=True).start()
+    def play_sequence(self, categories, delays=None, priority=ROUTINE):
+        """Play sequence of sounds with delays (each sound queues the next when it ends)"""
+        def play_step(index):
+            while index < len(categories):
+                delay = delays[index] if delays and index < len(delays) else 0
+                playback = self.play_sound(categories[index], priority=priority, delay=delay,
+                                           on_end=lambda p: p.state != 'stopped' and play_step(index + 1))
+                if playback is not None:
+                    return
+                index += 1  # categoria sem arquivos: segue para a próxima
+        
+        play_step(0)
     
-    def simulate_presence_routine(self, routine_type="general"):
+    def simulate_presence_routine(self, routine_type="general", start_delay=0):
         """Simulate different presence routines"""
         routines = {
             "morning": {
@@ -248,7 +303,9 @@ class AudioPresenceSimulator:
         if routine_type in routines:
             routine = routines[routine_type]
             print(f"🎭 Starting {routine['description']}")
-            self.play_sequence(routine["sounds"], routine["delays"])
+            delays = list(routine["delays"])
+            delays[0] += start_delay
+            self.play_sequence(routine["sounds"], delays)
             
             # Publish event
             self.publish_audio_event("ROUTINE_STARTED", routine_type, routine["description"])
@@ -275,87 +332,77 @@ class AudioPresenceSimulator:
     def on_relay_activated(self, device_id, state):
         """Handle relay activation (lights, etc.)"""
         if state == "ON" and self.presence_mode == "away":
-            # Light turned on while away - simulate activity
-            time.sleep(random.randint(5, 15))  # Delay response
-            self.simulate_presence_routine("random_activity")
+            # Light turned on while away - simulate activity (delayed response)
+            self.simulate_presence_routine("random_activity", start_delay=random.randint(5, 15))
             
             self.publish_audio_event("RELAY_RESPONSE", device_id, f"Response to relay {state}")
     
     def setup_schedules(self):
-        """Setup scheduled routines"""
+        """Setup scheduled routines (heap scheduler: sleeps until the next one is due)"""
         schedules_config = self.config.get('schedules', {})
+        jitter = self.config.get('schedule_jitter', SCHEDULER_CONFIG['jitter_minutes'])
+        self.scheduler = RoutineScheduler(on_routine=self.on_scheduled_routine, seed=self.device_id,
+                                          jitter_minutes=jitter)
         
-        # Morning routine
-        if 'morning_routine' in schedules_config:
-            time_str = schedules_config['morning_routine']['time']
-            schedule.every().day.at(time_str).do(
-                lambda: self.simulate_presence_routine("morning")
-            )
-        
-        # Evening routine  
-        if 'evening_routine' in schedules_config:
-            time_str = schedules_config['evening_routine']['time']
-            schedule.every().day.at(time_str).do(
-                lambda: self.simulate_presence_routine("evening")
-            )
+        # Morning and evening routines (daily, with a different random offset each day)
+        self.scheduler.set_routines({name: schedules_config[name] for name in self.SCHEDULED_ROUTINES
+                                     if name in schedules_config})
         
         # Random activity
         if 'random_activity' in schedules_config:
             interval = schedules_config['random_activity'].get('interval', 30)
-            schedule.every(interval).minutes.do(
+            self.scheduler.every('random_activity', interval * 60,
                 lambda: self.simulate_presence_routine("random_activity") if random.random() < 0.3 else None
             )
+        
+        # Heartbeat every 60 seconds
+        self.scheduler.every('heartbeat', 60, lambda: self.publish_status("HEARTBEAT"))
     
-    def on_mqtt_connect(self, client, userdata, flags, rc):
-        """MQTT connection callback"""
-        if rc == 0:
-            print("✅ Connected to MQTT broker")
-            
-            # Subscribe to topics
-            for topic_name, topic in self.topics.items():
-                client.subscribe(topic)
-                print(f"📡 Subscribed to {topic}")
-            
-            # Announce online
-            self.publish_status("ONLINE")
-            
-        else:
-            print(f"❌ MQTT connection failed: {rc}")
+    def on_scheduled_routine(self, name):
+        """Daily routine due"""
+        self.simulate_presence_routine(self.SCHEDULED_ROUTINES[name])
+        self.publish_schedule()
     
-    def on_mqtt_message(self, client, userdata, msg):
-        """MQTT message callback"""
+    def publish_schedule(self, count=5):
+        """Publish the next planned routines (retained)"""
         try:
-            topic = msg.topic
-            payload = msg.payload.decode()
-            
-            # Command messages
-            if topic == self.topics['cmd']:
-                self.handle_command(payload)
-            
-            # Motion sensor messages
-            elif 'motion' in topic and payload:
-                try:
-                    data = json.loads(payload)
-                    if data.get('event') == 'MOTION_DETECTED':
-                        device_id = data.get('device_id', 'unknown')
-                        location = data.get('location', 'unknown')
-                        self.on_motion_detected(device_id, location)
-                except json.JSONDecodeError:
-                    pass
+            schedule_data = {
+                "device_id": self.device_id,
+                "location": self.device_location,
+                "timestamp": int(time.time()),
+                "jitter_minutes": self.scheduler.jitter_minutes,
+                "next": self.scheduler.next_routines(count)
+            }
+            self.mqtt_client.publish(self.topics['schedule'], json.dumps(schedule_data), retain=True)
             
-            # Relay messages
-            elif 'relay' in topic and payload:
-                try:
-                    data = json.loads(payload)
-                    if data.get('event') in ['RELAY_ON', 'RELAY_OFF']:
-                        device_id = data.get('device_id', 'unknown')
-                        state = data.get('state', 'unknown')
-                        self.on_relay_activated(device_id, state)
-                except json.JSONDecodeError:
-                    pass
-                    
         except Exception as e:
-            print(f"❌ Error processing MQTT message: {e}")
+            print(f"❌ Error publishing schedule: {e}")
+    
+    def on_mqtt_connect(self, client, session_present):
+        """MQTT connection callback (subscriptions are restored by the client)"""
+        print("✅ Connected to MQTT broker")
+        for topic, qos in client.subscriptions():
+            print(f"📡 Subscribed to {topic}")
+        
+        # Announce online
+        self.publish_status("ONLINE")
+        self.publish_schedule()
+    
+    def on_motion_message(self, message):
+        """Motion sensor messages"""
+        data = message.json
+        if data and data.get('event') == 'MOTION_DETECTED':
+            device_id = data.get('device_id', 'unknown')
+            location = data.get('location', 'unknown')
+            self.on_motion_detected(device_id, location)
+    
+    def on_relay_message(self, message):
+        """Relay messages"""
+        data = message.json
+        if data and data.get('event') in ['RELAY_ON', 'RELAY_OFF']:
+            device_id = data.get('device_id', 'unknown')
+            state = data.get('state', 'unknown')
+            self.on_relay_activated(device_id, state)
     
     def handle_command(self, command):
         """Handle MQTT commands"""
@@ -366,6 +413,9 @@ class AudioPresenceSimulator:
         if cmd == "STATUS":
             self.publish_status("STATUS_REPORT")
         
+        elif cmd == "SCHEDULE":
+            self.publish_schedule()
+        
         elif cmd in ["DOGS", "DOG_BARK"]:
             self.play_sound("dogs")
         
@@ -400,7 +450,7 @@ class AudioPresenceSimulator:
                 self.publish_audio_event("MODE_CHANGED", new_mode, f"Presence mode set to {new_mode}")
         
         elif cmd == "STOP":
-            pygame.mixer.music.stop()
+            self.playback.stop()
             self.publish_audio_event("STOPPED", "manual", "Audio playback stopped")
         
         else:
@@ -415,8 +465,12 @@ class AudioPresenceSimulator:
                 "timestamp": int(time.time()),
                 "status": status_type,
                 "presence_mode": self.presence_mode,
-                "is_playing": pygame.mixer.music.get_busy(),
+                "is_playing": self.audio_busy(),
                 "audio_files_loaded": sum(len(cat) for cat in self.audio_categories.values()),
+                "sound_cache": self.sound_cache.stats(),
+                "library": self.manifest.stats(),
+                "transcode": self.transcoder.stats(),
+                "playback": self.playback.stats(),
                 "motion_triggered": self.motion_triggered_sounds
             }
             
@@ -448,43 +502,30 @@ class AudioPresenceSimulator:
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         print(f"🔊 [{timestamp}] Playing {category}: {filename} (vol: {volume:.1f})")
     
-    def run_scheduler(self):
-        """Run scheduled tasks"""
-        while True:
-            try:
-                schedule.run_pending()
-                time.sleep(1)
-            except Exception as e:
-                print(f"❌ Scheduler error: {e}")
-                time.sleep(60)
-    
     def run(self):
         """Main run loop"""
         try:
             # Connect to MQTT
+            self.playback.start()
             print("🔄 Connecting to MQTT broker...")
-            self.mqtt_client.connect(self.mqtt_broker, self.mqtt_port, 60)
-            self.mqtt_client.loop_start()
+            self.mqtt_client.start()
             
-            # Start scheduler in separate thread
-            scheduler_thread = threading.Thread(target=self.run_scheduler, daemon=True)
-            scheduler_thread.start()
+            # Routines, random activity and heartbeat: one thread sleeping until the next one
+            self.scheduler.start()
             
-            # Publish heartbeat every 60 seconds
-            last_heartbeat = 0
+            # Sources converted to mixer-format WAV, then the response sounds decoded before the first trigger
+            urgent = self.warm_up_files()
+            library = [f for files in self.audio_categories.values() for f in files]
+            self.prepare_sounds(urgent + library, warm=urgent)
+            if self.config.get('watch_audio', True):
+                self.manifest.watch(self.on_audio_library_change)
             
             print("🎵 Audio Presence Simulator is running...")
-            print("📋 Available commands: DOGS, FOOTSTEPS, TOILET, TV, DOOR, MORNING, EVENING, RANDOM, ALERT, MODE_HOME, MODE_AWAY, STOP")
+            print("📋 Available commands: DOGS, FOOTSTEPS, TOILET, TV, DOOR, MORNING, EVENING, RANDOM, ALERT, MODE_HOME, MODE_AWAY, SCHEDULE, STOP")
+            self.publish_status("HEARTBEAT")
             
             while True:
-                current_time = time.time()
-                
-                # Send heartbeat
-                if current_time - last_heartbeat > 60:
-                    self.publish_status("HEARTBEAT")
-                    last_heartbeat = current_time
-                
-                time.sleep(1)
+                time.sleep(3600)
                 
         except KeyboardInterrupt:
             print("\n👋 Shutting down Audio Presence Simulator...")
@@ -493,9 +534,13 @@ class AudioPresenceSimulator:
             print(f"❌ Runtime error: {e}")
         
         finally:
+            self.scheduler.stop()
+            self.manifest.stop()
+            self.transcoder.stop()
+            self.playback.shutdown()
             pygame.mixer.quit()
-            self.mqtt_client.loop_stop()
-            self.mqtt_client.disconnect()
+            self.mqtt_client.stop(drain=False)
+            print(f"📡 MQTT: {self.mqtt_client.format_stats()}")
 
 
 def main():
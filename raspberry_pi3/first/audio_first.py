@@ -5,52 +5,43 @@ Primeiro Andar: portas, passos, banheiro, chuveiro, quartos
 """
 
 import sys
-import json
 import os
-import threading
 import random
 
 # Add shared directory to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'shared'))
 
 from base_audio_simulator import BaseAudioPresenceSimulator
+from playback_engine import MOTION
 
 class FirstFloorAudioSimulator(BaseAudioPresenceSimulator):
     """First floor audio simulation"""
     
-    def __init__(self):
+    # Subpastas de audio_files
+    AUDIO_CATEGORIES = (
+        'doors',      # Portas dos quartos
+        'footsteps',  # Passos no corredor/quartos
+        'toilets',    # Banheiro
+        'shower',     # Chuveiro
+        'bedroom',    # Sons de quarto
+        'alerts',     # Alertas de segurança
+    )
+    
+    def __init__(self, base_dir=None):
         floor_config = {
             'floor': 'first',
             'floor_name': 'Primeiro Andar',
             'config_file': 'first_config.json',
-            'audio_categories': {
-                'doors': [],     # Portas dos quartos
-                'footsteps': [], # Passos no corredor/quartos
-                'toilets': [],   # Banheiro
-                'shower': [],    # Chuveiro
-                'bedroom': [],   # Sons de quarto
-                'alerts': []     # Alertas de segurança
-            }
+            'base_dir': base_dir,
+            'audio_categories': {category: [] for category in self.AUDIO_CATEGORIES}
         }
         super().__init__(floor_config)
-        # Carregar programação de áudio agendada
-        self.audio_schedule = self.load_audio_schedule()
-
-    def load_audio_schedule(self):
-        try:
-            with open('audio_schedule.json', 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"⚠️  Falha ao carregar audio_schedule.json: {e}")
-            return {}
 
     def get_default_config(self):
         """First floor specific configuration"""
         return {
             "mqtt_broker": "192.168.1.102",
             "mqtt_port": 1883,
-            "mqtt_user": "homeguard",
-            "mqtt_pass": "pu2clr123456",
             "location": "Primeiro Andar",
             "floor": "first",
             "audio_path": "./audio_files",
@@ -141,9 +132,7 @@ class FirstFloorAudioSimulator(BaseAudioPresenceSimulator):
         
         if available_sounds:
             sound_category = random.choice(available_sounds)
-            self.is_playing = True
-            threading.Thread(target=self._play_sound_thread, 
-                           args=(sound_category, 0.5)).start()
+            self.play_sound_category(sound_category, 0.5, priority=MOTION)
             
         self.publish_audio_event("MOTION_RESPONSE", device_id, 
                                f"Primeiro andar response to motion at {location}")
@@ -177,9 +166,7 @@ class FirstFloorAudioSimulator(BaseAudioPresenceSimulator):
             
             if available_sounds:
                 sound_category = random.choice(available_sounds)
-                self.is_playing = True
-                threading.Thread(target=self._play_sound_thread, 
-                               args=(sound_category, 0.4)).start()
+                self.play_sound_category(sound_category, 0.4, priority=MOTION)
                 
             self.publish_audio_event("RELAY_RESPONSE", device_id, 
                                    f"Primeiro andar response to relay {state}")
@@ -13,10 +13,10 @@ if ! command -v python3 &> /dev/null; then
 fi
 
 # Check required dependencies
-python3 -c "import pygame, paho.mqtt.client as mqtt, schedule" 2>/dev/null
+python3 -c "import pygame, numpy, paho.mqtt.client as mqtt" 2>/dev/null
 if [ $? -ne 0 ]; then
     echo "⚠️  Missing dependencies. Installing..."
-    pip3 install pygame paho-mqtt schedule
+    pip3 install pygame paho-mqtt numpy
 fi
 
 # Set PYTHONPATH to include shared directory
@@ -41,7 +41,7 @@ pip install --upgrade pip
 # Install system dependencies for audio
 echo -e "${BLUE}🔊 Installing system audio dependencies...${NC}"
 sudo apt-get update -qq
-sudo apt-get install -y python3-pygame python3-dev libasound2-dev
+sudo apt-get install -y python3-pygame python3-numpy python3-dev libasound2-dev
 
 # Install Python dependencies
 echo -e "${BLUE}📋 Installing Python dependencies...${NC}"
@@ -57,9 +57,6 @@ print('✅ pygame imported successfully')
 import paho.mqtt.client as mqtt
 print('✅ paho-mqtt imported successfully')
 
-import schedule
-print('✅ schedule imported successfully')
-
 import json, random, time, threading, os, sys
 from datetime import datetime, timedelta
 from pathlib import Path
@@ -115,12 +112,6 @@ try:
 except ImportError as e:
     print(f"❌ time: {e}")
 
-try:
-    import schedule
-    print("✅ schedule: OK")
-except ImportError as e:
-    print(f"❌ schedule: {e}")
-
 try:
     import threading
     print("✅ threading: OK")
@@ -151,6 +142,12 @@ try:
 except ImportError as e:
     print(f"❌ paho-mqtt: {e}")
 
+try:
+    import numpy
+    print("✅ numpy: OK")
+except ImportError as e:
+    print(f"❌ numpy: {e} (rotinas sem mixagem em camadas)")
+
 try:
     from pathlib import Path
     print("✅ pathlib: OK")
@@ -5,52 +5,43 @@ Térreo: cachorro, portas, passos, alertas, tv_radio
 """
 
 import sys
-import json
 import os
-import threading
 import random
 
 # Add shared directory to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'shared'))
 
 from base_audio_simulator import BaseAudioPresenceSimulator
+from playback_engine import MOTION
 
 class GroundFloorAudioSimulator(BaseAudioPresenceSimulator):
     """Ground floor audio simulation"""
     
-    def __init__(self):
+    # Subpastas de audio_files
+    AUDIO_CATEGORIES = (
+        'dogs',        # Cachorros
+        'footsteps',   # Passos
+        'doors',       # Portas
+        'tv_radio',    # TV/Rádio
+        'alerts',      # Alertas
+        'background',  # Ruídos de fundo
+    )
+    
+    def __init__(self, base_dir=None):
         floor_config = {
             'floor': 'ground',
             'floor_name': 'Térreo',
             'config_file': 'ground_config.json',
-            'audio_categories': {
-                'dogs': [],      # Cachorros
-                'footsteps': [], # Passos
-                'doors': [],     # Portas
-                'tv_radio': [],  # TV/Rádio
-                'alerts': [],    # Alertas
-                'background': [] # Ruídos de fundo
-            }
+            'base_dir': base_dir,
+            'audio_categories': {category: [] for category in self.AUDIO_CATEGORIES}
         }
         super().__init__(floor_config)
-        # Carregar programação de áudio agendada
-        self.audio_schedule = self.load_audio_schedule()
-
-    def load_audio_schedule(self):
-        try:
-            with open('audio_schedule.json', 'r') as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"⚠️  Falha ao carregar audio_schedule.json: {e}")
-            return {}
 
     def get_default_config(self):
         """Ground floor specific configuration"""
         return {
             "mqtt_broker": "192.168.1.102",
             "mqtt_port": 1883,
-            "mqtt_user": "homeguard",
-            "mqtt_pass": "pu2clr123456",
             "location": "Térreo",
             "floor": "ground",
             "audio_path": "./audio_files",
@@ -139,9 +130,7 @@ class GroundFloorAudioSimulator(BaseAudioPresenceSimulator):
         
         if available_sounds:
             sound_category = random.choice(available_sounds)
-            self.is_playing = True
-            threading.Thread(target=self._play_sound_thread, 
-                           args=(sound_category, 0.6)).start()
+            self.play_sound_category(sound_category, 0.6, priority=MOTION)
             
         self.publish_audio_event("MOTION_RESPONSE", device_id, 
                                f"Térreo response to motion at {location}")
@@ -175,9 +164,7 @@ class GroundFloorAudioSimulator(BaseAudioPresenceSimulator):
             
             if available_sounds:
                 sound_category = random.choice(available_sounds)
-                self.is_playing = True
-                threading.Thread(target=self._play_sound_thread, 
-                               args=(sound_category, 0.5)).start()
+                self.play_sound_category(sound_category, 0.5, priority=MOTION)
                 
             self.publish_audio_event("RELAY_RESPONSE", device_id, 
                                    f"Térreo response to relay {state}")
@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Audio - Headless Harness
+Both floor simulators in one process: SDL dummy audio, in-process MQTT, virtual clock
+
+No sound card and no broker needed: SDL_AUDIODRIVER=dummy (set before pygame
+is imported) consumes the audio in real time, LocalBroker delivers the MQTT
+messages on one thread like the paho network loop, and the routine scheduler
+runs on a ScaledClock (default 60x from 06:55: one virtual minute per second)
+so the morning routines of audio_schedule.json fire during the run.
+
+Scripted load, one phase after the other:
+    idle        nothing (baseline CPU and threads)
+    commands    layered PLAY commands on both floors, one every 0.5 s
+    motion      bursts of motion triggers (both floors listen to them)
+    routines    overlapping ROUTINE commands on both floors + a joint event
+    emergency   home/emergency/security and fire while everything plays
+
+Measured: command-to-playback latency (publish -> sound started by the
+engine) per kind, threads, RSS and CPU per phase, and the stats of every
+component. --json saves it all to compare before deploying to the Pis.
+
+Both floors share the pygame mixer of the process: the harness doubles
+mixer_channels and reserves channel 1 for the ambience of the first floor.
+The sync ping keeps its real period; the heartbeat runs on virtual time.
+
+Usage:
+    python3 headless_harness.py
+    python3 headless_harness.py --bursts 10 --burst-size 30 --json before.json
+    python3 headless_harness.py --real-audio --speed 120
+"""
+
+import argparse
+import array
+import contextlib
+import json
+import os
+import queue
+import random
+import re
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import wave
+from collections import Counter
+from datetime import datetime
+
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, 'ground'))
+sys.path.insert(0, os.path.join(HERE, 'first'))
+
+from audio_ground import GroundFloorAudioSimulator   # noqa: E402 (sys.path de shared/ e python/)
+from audio_first import FirstFloorAudioSimulator     # noqa: E402
+from mqtt_client import ResilientMqttClient, Message  # noqa: E402
+from playback_engine import EMERGENCY, MOTION         # noqa: E402
+from floor_sync import SYNC_CONFIG                    # noqa: E402
+
+HARNESS_CONFIG = {
+    'speed': 60,             # segundos virtuais por segundo real (agendador de rotinas)
+    'start': '06:55',        # hora virtual inicial
+    'idle': 3,               # s sem carga
+    'commands': 20,          # comandos PLAY por andar
+    'bursts': 5,             # rajadas de movimento
+    'burst_size': 20,        # gatilhos por rajada
+    'routines': 4,           # rotinas sobrepostas por andar
+    'settle': 3,             # s de espera no fim de cada fase
+    'sample_interval': 0.1,  # s entre amostras de threads/RSS
+}
+
+FLOORS = {
+    'ground': (GroundFloorAudioSimulator, 'ground_config.json'),
+    'first': (FirstFloorAudioSimulator, 'first_config.json'),
+}
+
+# Duração (s) dos sons sintéticos: fundos longos, eventos curtos
+SYNTHETIC_SECONDS = {'tv_radio': (20, 40), 'background': (20, 40), 'shower': (20, 40)}
+EVENT_SECONDS = (0.5, 3)
+
+MOTION_LOCATIONS = ['entrance', 'living_room', 'kitchen', 'garage', 'backyard', 'hallway', 'bedroom']
+
+
+class LocalBroker:
+    """In-process stand-in for the MQTT broker: delivers on one thread, like the paho network loop"""
+
+    def __init__(self):
+        self.clients = []
+        self.queue = queue.Queue()
+        self.published = 0
+        self.delivered = 0
+        self.thread = threading.Thread(target=self._run, name='local-broker', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join(2.0)
+
+    def attach(self, client):
+        self.clients.append(client)
+
+    def detach(self, client):
+        if client in self.clients:
+            self.clients.remove(client)
+
+    def publish(self, topic, payload):
+        if isinstance(payload, str):
+            payload = payload.encode()
+        self.published += 1
+        self.queue.put((topic, payload))
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            topic, payload = item
+            for client in list(self.clients):
+                # Uma Message por cliente, com o horário de chegada (como on_message)
+                if client.dispatch(Message(topic, payload)):
+                    self.delivered += 1
+
+
+class LocalMqttClient(ResilientMqttClient):
+    """ResilientMqttClient attached to a LocalBroker instead of a network connection"""
+
+    def __init__(self, broker, client_id, config):
+        super().__init__(client_id, config=config, workers=0)
+        self.broker = broker
+
+    def start(self):
+        self._start_workers()
+        self.connected = True
+        self.connect_count += 1
+        self.broker.attach(self)
+        for listener in self.connect_listeners:
+            listener(self, False)
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.broker.publish(topic, payload)
+
+    def stop(self, drain=True, timeout=5.0):
+        self._stopping = True
+        self.connected = False
+        self.broker.detach(self)
+        if self.executor is not None:
+            self.executor.stop(drain=drain, timeout=timeout)
+
+
+class ScaledClock:
+    """Virtual wall clock running `speed` times faster than real time (RoutineScheduler clock)"""
+
+    def __init__(self, start, speed):
+        self.start = start
+        self.speed = speed
+        self.origin = time.monotonic()
+
+    def now(self):
+        return self.start + (time.monotonic() - self.origin) * self.speed
+
+    def set(self, when):
+        pass  # o relógio anda sozinho
+
+    def wait(self, event, timeout):
+        return event.wait(None if timeout is None else timeout / self.speed)
+
+
+class Probe:
+    """Stimuli published by the script vs sounds started by the engines, plus threads/RSS/CPU"""
+
+    def __init__(self, sample_interval):
+        self.lock = threading.Lock()
+        self.stimuli = {floor: [] for floor in FLOORS}   # [sent, kind, matched]
+        self.latencies = {}                              # kind -> [s]
+        self.sent = Counter()
+        self.routines = Counter()                        # floor -> rotinas do agendador
+        self.sample_interval = sample_interval
+        self.phases = []
+        self.current = None
+        self.running = False
+        self.thread = None
+
+    # --------------------------------------------------------- latencies
+
+    def stimulus(self, floors, kind):
+        sent = time.time()
+        with self.lock:
+            for floor in floors:
+                self.stimuli[floor].append([sent, kind, False])
+                self.sent[kind] += 1
+
+    def listener(self, floor):
+        def on_event(event, playback):
+            if event != 'started' or playback.priority not in (EMERGENCY, MOTION):
+                return
+            with self.lock:
+                # O estímulo mais recente antes do pedido; camadas do mesmo estímulo contam uma vez
+                for stimulus in reversed(self.stimuli[floor]):
+                    if stimulus[0] <= playback.requested:
+                        if not stimulus[2]:
+                            stimulus[2] = True
+                            self.latencies.setdefault(stimulus[1], []).append(playback.started - stimulus[0])
+                        break
+        return on_event
+
+    def scheduled(self, floor, on_routine):
+        """Count the routines fired by the scheduler (its own counter includes heartbeat/sync)"""
+        def counted(routine_type):
+            with self.lock:
+                self.routines[floor] += 1
+            on_routine(routine_type)
+        return counted
+
+    def latency_summary(self):
+        summary = {}
+        for kind, sent in self.sent.items():
+            values = sorted(v * 1000 for v in self.latencies.get(kind, []))
+            row = {'sent': sent, 'played': len(values)}
+            if values:
+                row.update(avg_ms=round(statistics.mean(values), 2),
+                           p50_ms=round(values[len(values) // 2], 2),
+                           p95_ms=round(values[min(len(values) - 1, int(0.95 * len(values)))], 2),
+                           max_ms=round(values[-1], 2))
+            summary[kind] = row
+        return summary
+
+    # ---------------------------------------------------------- resources
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._sample, name='harness-probe', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join(1.0)
+
+    def _sample(self):
+        while self.running:
+            phase = self.current
+            if phase is not None:
+                phase['threads_max'] = max(phase['threads_max'], threading.active_count())
+                phase['rss_max_mb'] = max(phase['rss_max_mb'], rss_mb())
+            time.sleep(self.sample_interval)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        phase = {'name': name, 'threads_max': threading.active_count(), 'rss_max_mb': rss_mb()}
+        wall, cpu = time.monotonic(), time.process_time()
+        self.current = phase
+        try:
+            yield phase
+        finally:
+            self.current = None
+            phase['seconds'] = round(time.monotonic() - wall, 2)
+            phase['cpu_pct'] = round((time.process_time() - cpu) / phase['seconds'] * 100, 1)
+            phase['rss_max_mb'] = round(phase['rss_max_mb'], 1)
+            self.phases.append(phase)
+            log(f"   {name:<10} {phase['seconds']:6.1f} s   CPU {phase['cpu_pct']:5.1f}%   "
+                f"threads {phase['threads_max']:3d}   RSS {phase['rss_max_mb']:6.1f} MB")
+
+
+def rss_mb():
+    """Current resident memory (MB); peak from getrusage where /proc is missing"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def thread_groups():
+    """Live threads by name without the numeric suffix ('audio-task-0' -> 'audio-task')"""
+    return dict(Counter(re.sub(r'[-_ ]?\d+( \(.*\))?$', '', t.name) for t in threading.enumerate()))
+
+
+def log(text):
+    print(text, file=sys.__stdout__, flush=True)
+
+
+# ------------------------------------------------------------------ setup
+
+def write_wav(path, seconds, level, rng, rate=44100):
+    """Stereo 16-bit noise: one random second repeated (fast and already mixer-format)"""
+    amplitude = int(32767 * level)
+    second = array.array('h', (rng.randint(-amplitude, amplitude) for _ in range(rate * 2))).tobytes()
+    frames = int(seconds * rate)
+    data = second * (frames // rate) + second[:(frames % rate) * 4]
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(2)
+        f.setsampwidth(2)
+        f.setframerate(rate)
+        f.writeframes(data)
+
+
+def prepare_floor(root, floor, config_name, categories, args, rng):
+    """Floor directory for the harness: repo config + schedule, synthetic or real library"""
+    source = os.path.join(HERE, floor)
+    target = os.path.join(root, floor)
+    os.makedirs(target)
+    with open(os.path.join(source, config_name)) as f:
+        config = json.load(f)
+    if args.real_audio:
+        config['audio_path'] = os.path.join(source, 'audio_files')
+    else:
+        config['audio_path'] = 'audio_files'
+        for category in categories:
+            directory = os.path.join(target, 'audio_files', category)
+            os.makedirs(directory)
+            low, high = SYNTHETIC_SECONDS.get(category, EVENT_SECONDS)
+            for i in range(3):
+                write_wav(os.path.join(directory, f"{category}{i}.wav"), rng.uniform(low, high), 0.3, rng)
+    # Dois andares num só mixer: canais em dobro e canal reservado próprio para o ambiente
+    config['mixer_channels'] = 2 * config.get('mixer_channels', 8)
+    config['ambience_channel'] = list(FLOORS).index(floor)
+    config['sync_interval'] = SYNC_CONFIG['interval'] * args.speed
+    with open(os.path.join(target, config_name), 'w') as f:
+        json.dump(config, f)
+    schedule = os.path.join(source, 'audio_schedule.json')
+    if os.path.exists(schedule):
+        shutil.copy(schedule, target)
+    return target
+
+
+def start_floors(base_dirs, broker, probe, clock):
+    """Build both simulators on the harness directories and start them (ground first)"""
+    floors = {}
+    for floor, (simulator_class, config_name) in FLOORS.items():
+        simulator = simulator_class(base_dir=base_dirs[floor])
+        simulator.create_mqtt_client = lambda s=simulator: LocalMqttClient(broker, s.device_id, s.mqtt_config)
+        simulator.schedule_clock = clock
+        simulator.playback.on_event = probe.listener(floor)
+        simulator.on_scheduled_routine = probe.scheduled(floor, simulator.on_scheduled_routine)
+        floors[floor] = simulator
+    for simulator in floors.values():
+        simulator.start()
+    return floors
+
+
+def wait_library(floors, timeout=120):
+    """Wait for the background transcoding of both libraries (phases measure the load only)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not any(s.transcoder.pending([f for files in s.audio_categories.values() for f in files])
+                   for s in floors.values() if s.config.get('transcode_audio', True)):
+            return True
+        time.sleep(0.1)
+    return False
+
+
+# ----------------------------------------------------------------- script
+
+def phase_commands(floors, broker, probe, args, rng):
+    """Layered PLAY of event sounds on every floor, one round every 0.5 s"""
+    for _ in range(args.commands):
+        for floor, simulator in floors.items():
+            available = [c for c, files in simulator.audio_categories.items()
+                         if files and c != 'alerts' and c not in SYNTHETIC_SECONDS]
+            command = {'action': 'PLAY', 'categories': rng.sample(available, min(2, len(available)))}
+            probe.stimulus([floor], 'command')
+            broker.publish(simulator.topics['cmd'], json.dumps(command))
+        time.sleep(0.5)
+
+
+def phase_motion(floors, broker, probe, args, rng):
+    """Bursts of motion triggers 10-50 ms apart; both floors subscribe to them"""
+    for _ in range(args.bursts):
+        for _ in range(args.burst_size):
+            device = f"motion_{rng.choice(MOTION_LOCATIONS)}"
+            probe.stimulus(floors, 'motion')
+            broker.publish(f"home/motion/{device}/detected", device.split('_', 1)[1])
+            time.sleep(rng.uniform(0.01, 0.05))
+        time.sleep(1.5)
+
+
+def phase_routines(floors, broker, probe, args, rng):
+    """Several routines started 0.2 s apart on each floor (scenes crossfade) + a joint event"""
+    for floor, simulator in floors.items():
+        for routine in list(simulator.schedules)[:args.routines]:
+            broker.publish(simulator.topics['cmd'], json.dumps({'action': 'ROUTINE', 'routine': routine}))
+            time.sleep(0.2)
+    broker.publish(floors['ground'].topics['cmd'], json.dumps({'action': 'JOINT', 'event': 'footsteps_upstairs',
+                                                                 'lead': 2}))
+    time.sleep(10)
+
+
+def phase_emergency(floors, broker, probe, args, rng):
+    for emergency in ('security', 'fire'):
+        probe.stimulus(floors, 'emergency')
+        broker.publish(f"home/emergency/{emergency}", 'harness')
+        time.sleep(2)
+
+
+PHASES = [
+    ('idle', lambda floors, broker, probe, args, rng: time.sleep(args.idle)),
+    ('commands', phase_commands),
+    ('motion', phase_motion),
+    ('routines', phase_routines),
+    ('emergency', phase_emergency),
+]
+
+
+def component_stats(simulator, probe):
+    mqtt = simulator.mqtt_client.stats()
+    return {
+        'playback': simulator.playback.stats(),
+        'tasks': simulator.tasks.stats(),
+        'ambience': simulator.ambience.stats() if simulator.ambience is not None else None,
+        'sound_cache': simulator.sound_cache.stats(),
+        'transcode': simulator.transcoder.stats(),
+        'sync': simulator.sync.stats(),
+        'mqtt': {key: mqtt[key] for key in ('received', 'handled', 'unmatched', 'handler_errors') if key in mqtt},
+        'scheduler': {'routines': probe.routines[simulator.floor], 'fired': simulator.scheduler.fired,
+                      'late_max_s': round(simulator.scheduler.late_max, 3)},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Harness headless dos dois andares (SDL dummy, MQTT em processo)')
+    parser.add_argument('--speed', type=float, default=HARNESS_CONFIG['speed'],
+                        help='Segundos virtuais por segundo real no agendador de rotinas')
+    parser.add_argument('--start', default=HARNESS_CONFIG['start'], help='Hora virtual inicial (HH:MM)')
+    parser.add_argument('--idle', type=float, default=HARNESS_CONFIG['idle'], help='Segundos da fase sem carga')
+    parser.add_argument('--commands', type=int, default=HARNESS_CONFIG['commands'], help='Comandos PLAY por andar')
+    parser.add_argument('--bursts', type=int, default=HARNESS_CONFIG['bursts'], help='Rajadas de movimento')
+    parser.add_argument('--burst-size', type=int, default=HARNESS_CONFIG['burst_size'], help='Gatilhos por rajada')
+    parser.add_argument('--routines', type=int, default=HARNESS_CONFIG['routines'], help='Rotinas sobrepostas por andar')
+    parser.add_argument('--settle', type=float, default=HARNESS_CONFIG['settle'], help='Espera no fim de cada fase (s)')
+    parser.add_argument('--real-audio', action='store_true',
+                        help='Usa ground/audio_files e first/audio_files em vez de sons sintéticos')
+    parser.add_argument('--json', help='Grava os resultados neste arquivo')
+    parser.add_argument('--verbose', action='store_true', help='Mostra a saída dos simuladores')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    random.seed(args.seed)
+    start = datetime.combine(datetime.now().date(), datetime.strptime(args.start, '%H:%M').time())
+    clock = ScaledClock(start.timestamp(), args.speed)
+    root = tempfile.mkdtemp(prefix='homeguard-harness-')
+    output = sys.stdout if args.verbose else open(os.path.join(root, 'simulators.log'), 'w')
+    broker = LocalBroker()
+    probe = Probe(HARNESS_CONFIG['sample_interval'])
+    results = {'args': vars(args)}
+
+    log(f"🧪 HomeGuard headless harness: SDL {os.environ['SDL_AUDIODRIVER']}, MQTT em processo, "
+        f"relógio virtual {args.speed:g}x desde {args.start}")
+    threads_before, rss_before = threading.active_count(), rss_mb()
+    floors = {}
+    try:
+        with contextlib.redirect_stdout(output):
+            base_dirs = {floor: prepare_floor(root, floor, config_name, simulator_class.AUDIO_CATEGORIES, args, rng)
+                         for floor, (simulator_class, config_name) in FLOORS.items()}
+            began = time.monotonic()
+            broker.start()
+            floors = start_floors(base_dirs, broker, probe, clock)
+            started = time.monotonic() - began
+            ready = wait_library(floors)
+            results['startup'] = {'seconds': round(started, 2),
+                                  'library_ready_s': round(time.monotonic() - began, 2) if ready else None,
+                                  'threads': threading.active_count() - threads_before,
+                                  'rss_mb': round(rss_mb() - rss_before, 1)}
+            log(f"   partida    {started:6.1f} s   +{results['startup']['threads']} threads"
+                f"   +{results['startup']['rss_mb']:.1f} MB   biblioteca pronta em "
+                f"{results['startup']['library_ready_s']} s")
+            probe.start()
+            for name, script in PHASES:
+                with probe.phase(name):
+                    script(floors, broker, probe, args, rng)
+                    time.sleep(args.settle)
+            results['threads'] = thread_groups()
+            results['phases'] = probe.phases
+            results['latency'] = probe.latency_summary()
+            results['floors'] = {floor: component_stats(simulator, probe) for floor, simulator in floors.items()}
+            results['virtual_time'] = datetime.fromtimestamp(clock.now()).strftime('%H:%M')
+    finally:
+        with contextlib.redirect_stdout(output):
+            if probe.running:
+                probe.stop()
+            for simulator in floors.values():
+                simulator.shutdown()
+            broker.stop()
+        if output is not sys.stdout:
+            output.close()
+            with open(output.name) as f:
+                results['errors'] = [line.rstrip() for line in f if line.startswith('❌') or 'Traceback' in line]
+        shutil.rmtree(root, ignore_errors=True)
+
+    log("   latência (publicação -> som iniciado):")
+    for kind, row in results['latency'].items():
+        if row['played']:
+            log(f"     {kind:<10} {row['played']:4d}/{row['sent']:<4d} tocaram   média {row['avg_ms']:7.2f} ms   "
+                f"p95 {row['p95_ms']:7.2f} ms   máx {row['max_ms']:7.2f} ms")
+        else:
+            log(f"     {kind:<10}    0/{row['sent']:<4d} tocaram")
+    log(f"   threads:   {', '.join(f'{name} x{count}' for name, count in sorted(results['threads'].items()))}")
+    for floor, stats in results['floors'].items():
+        playback, tasks, ambience = stats['playback'], stats['tasks'], stats['ambience']
+        log(f"   {floor:<7} tocados {playback['played']}, preemptados {playback['preempted']}, "
+            f"camadas máx {playback['layers_max']}, fila máx {tasks['wait_max_ms']} ms, "
+            f"rotinas agendadas {stats['scheduler']['routines']}"
+            + (f", ambiente RTF {ambience['rtf']} underruns {ambience['underruns']}" if ambience else ''))
+    for line in results.get('errors', [])[:10]:
+        log(f"   {line}")
+    log(f"   relógio virtual chegou a {results['virtual_time']}; MQTT: {broker.published} publicadas, "
+        f"{broker.delivered} entregas")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+        log(f"💾 Resultados em {args.json}")
+
+
+if __name__ == '__main__':
+    main()
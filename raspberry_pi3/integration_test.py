@@ -4,17 +4,24 @@ HomeGuard Integration Test
 Test script to demonstrate integration between motion sensors, relays, and audio system
 """
 
+import os
+import sys
 import time
 import json
 import threading
 import paho.mqtt.client as mqtt
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python'))
+from mqtt_client import load_mqtt_config
+
 class HomeGuardIntegrationTest:
     def __init__(self):
-        self.broker_host = "192.168.1.102"
-        self.broker_port = 1883
-        self.username = "homeguard"
-        self.password = "pu2clr123456"
+        # Broker/credenciais: homeguard_mqtt_config.json ou HOMEGUARD_MQTT_*
+        mqtt_config = load_mqtt_config()
+        self.broker_host = mqtt_config['host']
+        self.broker_port = mqtt_config['port']
+        self.username = mqtt_config['username']
+        self.password = mqtt_config['password']
         
         # Create MQTT client
         self.client = mqtt.Client()
@@ -172,8 +179,8 @@ class HomeGuardIntegrationTest:
         """Show system overview"""
         print("🏠 HomeGuard System Overview")
         print("=" * 40)
-        print("📡 MQTT Broker: 192.168.1.102:1883")
-        print("🔐 Credentials: homeguard / pu2clr123456")
+        print(f"📡 MQTT Broker: {self.broker_host}:{self.broker_port}")
+        print(f"🔐 User: {self.username or '(anônimo)'}")
         print()
         print("🎛️ Active Components:")
         print("   📱 ESP-01S Motion Detector (192.168.1.193)")
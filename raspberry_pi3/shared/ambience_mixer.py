@@ -0,0 +1,514 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Audio - Ambience Mixer
+Layered soundscapes mixed with NumPy and streamed to one reserved mixer channel
+
+A routine used to be a chain of isolated clips with 15-60 s of silence
+between them. A Soundscape mixes the routine as a scene instead:
+
+    bed     continuous layer (TV, radio, shower, background): random clip of
+            the category from a random offset, looped, with a crossfade into
+            the next clip
+    events  sporadic sounds on top (footsteps, doors, dogs): random file
+            every `every` seconds, random gain and stereo position
+
+    mixer = AmbienceMixer(files=lambda c: categories[c], sound_cache=cache)
+    mixer.start()
+    mixer.play(routine_layers(routine), duration=1200, name='afternoon_tv', on_end=done)
+    mixer.stop('afternoon_tv')      # fade out (a new scene crossfades with the old one)
+    mixer.cut()                     # emergency: silence now
+
+The mixer thread renders `chunk_seconds` blocks ahead (at most
+`ahead_chunks`, so ~2 s) into Sounds queued on a reserved channel; the
+playback engine keeps the other channels for alerts and responses.
+Each voice costs a few vectorized operations per block (slice, envelope,
+multiply-add) and long beds are read through np.memmap from the transcoded
+WAVs, so a 3-minute TV clip does not sit decoded in RAM. bench_ambience_mixer.py
+reports the real-time factor.
+"""
+
+import math
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+
+import numpy as np
+
+AMBIENCE_CONFIG = {
+    'sample_rate': 44100,    # mesmo formato do mixer / dos WAVs transcodificados
+    'channels': 2,
+    'chunk_seconds': 0.5,    # bloco renderizado por vez
+    'ahead_chunks': 4,       # blocos prontos à frente da reprodução
+    'crossfade': 3.0,        # s entre clipes de uma camada contínua e entre cenas
+    'event_fade': 0.02,      # s de fade nos sons pontuais (evita cliques)
+    'scene_fade': 4.0,       # entrada/saída da cena
+    'master_gain': 0.9,
+    'limiter_release': 0.05, # recuperação do limitador por bloco (camadas somadas acima de 0 dBFS)
+    'pcm_arrays': 32,        # PCM mantido fora do memmap (sons não-WAV)
+}
+
+# Categorias tocadas como camada contínua; as demais são eventos pontuais
+BED_CATEGORIES = ('tv_radio', 'background', 'shower')
+
+# Intervalo (s) entre eventos de cada categoria
+EVENT_EVERY = {'footsteps': (15, 60), 'doors': (45, 180), 'dogs': (90, 300), 'toilets': (120, 400)}
+DEFAULT_EVERY = (30, 120)
+
+SCENES = {
+    'tv_evening': [
+        {'category': 'tv_radio', 'mode': 'bed', 'gain': 0.5},
+        {'category': 'footsteps', 'mode': 'events', 'every': [20, 70], 'gain': [0.5, 0.9]},
+        {'category': 'doors', 'mode': 'events', 'every': [60, 240], 'gain': [0.4, 0.8]},
+    ],
+    'morning_house': [
+        {'category': 'background', 'mode': 'bed', 'gain': 0.3},
+        {'category': 'footsteps', 'mode': 'events', 'every': [15, 45], 'gain': [0.5, 0.9]},
+        {'category': 'doors', 'mode': 'events', 'every': [45, 180], 'gain': [0.4, 0.8]},
+        {'category': 'toilets', 'mode': 'events', 'every': [90, 300], 'gain': [0.4, 0.7]},
+        {'category': 'dogs', 'mode': 'events', 'every': [120, 400], 'gain': [0.3, 0.6]},
+    ],
+    'quiet_night': [
+        {'category': 'background', 'mode': 'bed', 'gain': 0.25},
+        {'category': 'footsteps', 'mode': 'events', 'every': [120, 600], 'gain': [0.3, 0.5]},
+    ],
+}
+
+
+def routine_layers(routine, scenes=SCENES):
+    """Layers of a routine: its `layers`, a named `scene`, or derived from `sounds`"""
+    if routine.get('layers'):
+        return routine['layers']
+    if routine.get('scene') in scenes:
+        return scenes[routine['scene']]
+    layers = []
+    for category in routine.get('sounds', []):
+        if category in BED_CATEGORIES:
+            layers.append({'category': category, 'mode': 'bed', 'gain': 0.5})
+        else:
+            layers.append({'category': category, 'mode': 'events',
+                           'every': EVENT_EVERY.get(category, DEFAULT_EVERY), 'gain': [0.5, 0.9]})
+    return layers
+
+
+def wav_pcm(path, sample_rate=AMBIENCE_CONFIG['sample_rate'], channels=AMBIENCE_CONFIG['channels']):
+    """np.memmap (frames, channels) of a 16-bit PCM WAV in the mixer format, else None"""
+    try:
+        with open(path, 'rb') as f:
+            if f.read(12)[8:] != b'WAVE':
+                return None
+            fmt = None
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    return None
+                chunk_id, size = header[:4], int.from_bytes(header[4:], 'little')
+                if chunk_id == b'fmt ':
+                    data = f.read(size + (size & 1))
+                    fmt = (int.from_bytes(data[0:2], 'little'), int.from_bytes(data[2:4], 'little'),
+                           int.from_bytes(data[4:8], 'little'), int.from_bytes(data[14:16], 'little'))
+                elif chunk_id == b'data':
+                    if fmt != (1, channels, sample_rate, 16):
+                        return None
+                    frames = size // (2 * channels)
+                    return np.memmap(path, dtype='<i2', mode='r', offset=f.tell(), shape=(frames, channels))
+                else:
+                    f.seek(size + (size & 1), 1)
+    except (OSError, ValueError):
+        return None
+
+
+def pan_gains(gain, pan):
+    """Constant-power stereo gains; pan -1 (left) .. 1 (right), 0 = both at `gain`"""
+    angle = (pan + 1) * math.pi / 4
+    return np.array([math.cos(angle), math.sin(angle)], dtype=np.float32) * (gain * math.sqrt(2))
+
+
+def _pcm_slice(pcm, start, count, loop):
+    """count frames of pcm from start (wrapping around when looping)"""
+    n = len(pcm)
+    if not loop or (start % n) + count <= n:
+        start %= n
+        return pcm[start:start + count]
+    parts = []
+    start %= n
+    while count > 0:
+        take = min(count, n - start)
+        parts.append(pcm[start:start + take])
+        count -= take
+        start = 0
+    return np.concatenate(parts)
+
+
+class Voice:
+    """One clip placed on the scene timeline (frames)"""
+
+    __slots__ = ('path', 'pcm', 'start', 'length', 'offset', 'gains', 'fade_in', 'fade_out', 'loop')
+
+    def __init__(self, path, pcm, start, length, offset, gains, fade_in, fade_out, loop):
+        self.path = path
+        self.pcm = pcm
+        self.start = start
+        self.length = length
+        self.offset = offset
+        self.gains = gains
+        self.fade_in = max(1, fade_in)
+        self.fade_out = max(1, fade_out)
+        self.loop = loop
+
+    @property
+    def end(self):
+        return self.start + self.length
+
+    def mix_into(self, buffer, block_start):
+        """Add this voice's part of [block_start, block_start + len(buffer)) to buffer"""
+        start = max(block_start, self.start)
+        end = min(block_start + len(buffer), self.end)
+        if end <= start:
+            return False
+        position = start - self.start
+        count = end - start
+        source = _pcm_slice(self.pcm, self.offset + position, count, self.loop)
+        target = buffer[start - block_start:end - block_start]
+        if position >= self.fade_in and position + count <= self.length - self.fade_out:
+            target += source * self.gains   # trecho sem envelope (o caso comum)
+        else:
+            index = np.arange(position, position + count, dtype=np.float32)
+            envelope = np.minimum(1.0, np.minimum((index + 1) / self.fade_in, (self.length - index) / self.fade_out))
+            target += source * (envelope[:, None] * self.gains)
+        return True
+
+
+class Soundscape:
+    """Layers planned voice by voice as the render position advances"""
+
+    def __init__(self, name, layers, files, pcm_loader, duration=None, rng=None,
+                 sample_rate=AMBIENCE_CONFIG['sample_rate'], fade=AMBIENCE_CONFIG['scene_fade'],
+                 crossfade=AMBIENCE_CONFIG['crossfade'], event_fade=AMBIENCE_CONFIG['event_fade'],
+                 on_end=None):
+        self.name = name
+        self.rate = sample_rate
+        self.pcm_loader = pcm_loader
+        self.rng = rng or random.Random()
+        self.crossfade = int(crossfade * sample_rate)
+        self.event_fade = int(event_fade * sample_rate)
+        self.fade_in = max(1, int(fade * sample_rate))
+        self.fade_out = self.fade_in
+        self.end = int(duration * sample_rate) if duration else None
+        self.position = 0
+        self.voices = []
+        self.on_end = on_end
+        self.state = 'playing'   # playing, done, stopped
+        self.voices_max = 0
+        self.layers = []
+        for layer in layers:
+            choices = list(files(layer['category']))
+            if not choices:
+                continue
+            layer = dict(layer, files=choices)
+            if layer.get('mode', 'events') == 'events':
+                # Primeiro evento em momento aleatório, não todos juntos no início
+                layer['next'] = int(self.rng.uniform(0, self._every(layer)[1]) * sample_rate)
+            else:
+                layer['next'] = 0
+            self.layers.append(layer)
+
+    @property
+    def done(self):
+        return self.end is not None and self.position >= self.end
+
+    def stop(self, fade=AMBIENCE_CONFIG['scene_fade']):
+        """Fade out from the current render position"""
+        fade_frames = max(1, int(fade * self.rate))
+        end = self.position + fade_frames
+        if self.end is None or end < self.end:
+            self.end = end
+            self.fade_out = fade_frames
+            self.state = 'stopped'
+
+    @staticmethod
+    def _every(layer):
+        return layer.get('every', EVENT_EVERY.get(layer['category'], DEFAULT_EVERY))
+
+    def _gain(self, layer):
+        gain = layer.get('gain', 0.7)
+        return self.rng.uniform(*gain) if isinstance(gain, (list, tuple)) else gain
+
+    def _voice(self, layer):
+        """Next voice of a layer (advances layer['next']); None when no file can be mixed"""
+        while layer['files']:
+            path = self.rng.choice(layer['files'])
+            pcm = self.pcm_loader(path)
+            if pcm is not None and len(pcm):
+                break
+            layer['files'].remove(path)  # não decodificável: não tenta de novo nesta cena
+        else:
+            layer['next'] = math.inf
+            return None
+
+        start = layer['next']
+        if layer.get('mode', 'events') == 'bed':
+            low, high = layer.get('clip', (90, 300))
+            length = int(self.rng.uniform(low, high) * self.rate)
+            fade = min(self.crossfade, length // 2)
+            voice = Voice(path, pcm, start, length, self.rng.randrange(len(pcm)),
+                          pan_gains(self._gain(layer), 0.0), fade, fade, loop=True)
+            layer['next'] = start + length - fade
+        else:
+            pan = layer.get('pan', 0.6)
+            voice = Voice(path, pcm, start, len(pcm), 0, pan_gains(self._gain(layer), self.rng.uniform(-pan, pan)),
+                          self.event_fade, self.event_fade, loop=False)
+            layer['next'] = start + int(self.rng.uniform(*self._every(layer)) * self.rate)
+        return voice
+
+    def mix_into(self, buffer):
+        """Add the next len(buffer) frames of the scene to buffer; returns active voices"""
+        frames = len(buffer)
+        block_end = self.position + frames
+        for layer in self.layers:
+            while layer['next'] < block_end and (self.end is None or layer['next'] < self.end):
+                voice = self._voice(layer)
+                if voice is not None:
+                    self.voices.append(voice)
+
+        scene = np.zeros_like(buffer) if self._enveloped(frames) else buffer
+        active = 0
+        for voice in self.voices:
+            active += voice.mix_into(scene, self.position)
+        if scene is not buffer:
+            index = np.arange(self.position, block_end, dtype=np.float32)
+            envelope = np.clip((index + 1) / self.fade_in, 0.0, 1.0)
+            if self.end is not None:
+                envelope *= np.clip((self.end - index) / self.fade_out, 0.0, 1.0)
+            buffer += scene * envelope[:, None]
+
+        self.voices = [voice for voice in self.voices if voice.end > block_end]
+        self.voices_max = max(self.voices_max, active)
+        self.position = block_end
+        return active
+
+    def _enveloped(self, frames):
+        """True when the block touches the fade-in or the fade-out"""
+        if self.position < self.fade_in:
+            return True
+        return self.end is not None and self.position + frames > self.end - self.fade_out
+
+
+class AmbienceMixer:
+    """Renders the active soundscapes ahead of time and streams them to a reserved channel"""
+
+    def __init__(self, files, sound_cache=None, pcm_loader=None, channel=0,
+                 chunk_seconds=AMBIENCE_CONFIG['chunk_seconds'], ahead_chunks=AMBIENCE_CONFIG['ahead_chunks'],
+                 master_gain=AMBIENCE_CONFIG['master_gain'], sample_rate=AMBIENCE_CONFIG['sample_rate'],
+                 channels=AMBIENCE_CONFIG['channels'], seed=None):
+        self.files = files                 # category -> paths
+        self.sound_cache = sound_cache
+        self.pcm_loader = pcm_loader or self.load_pcm
+        self.channel_index = channel
+        self.channel = None
+        self.rate = sample_rate
+        self.channels = channels
+        self.chunk_frames = int(chunk_seconds * sample_rate)
+        self.ahead = ahead_chunks
+        self.master_gain = master_gain
+        self.rng = random.Random(seed)
+        self.scenes = []
+        self.buffer = deque()              # (Sound, cenas que terminam nele) prontos para o canal
+        self.pcm = OrderedDict()           # path -> PCM (memmap ou cópia)
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = None
+        self.streaming = False
+        self.generation = 0                # muda a cada cut(): blocos antigos são descartados
+
+        self.chunks = 0
+        self.render_seconds = 0.0
+        self.underruns = 0
+        self.clipped = 0
+        self.voices_max = 0
+        self.limiter = 1.0                 # ganho atual do limitador
+
+    # ------------------------------------------------------------------ PCM
+
+    def load_pcm(self, path):
+        """PCM frames of a library file: memmap of its mixer-format WAV, else the decoded Sound"""
+        path = str(path)
+        with self.lock:
+            if path in self.pcm:
+                self.pcm.move_to_end(path)
+                return self.pcm[path]
+        resolved = self.sound_cache.resolve(path) if self.sound_cache is not None else path
+        pcm = wav_pcm(resolved, self.rate, self.channels)
+        if pcm is None and self.sound_cache is not None:
+            sound = self.sound_cache.get(path)
+            if sound is not None:
+                raw = sound.get_raw()
+                pcm = np.frombuffer(raw, dtype='<i2', count=len(raw) // 2).reshape(-1, self.channels)
+        with self.lock:
+            self.pcm[path] = pcm
+            while len(self.pcm) > AMBIENCE_CONFIG['pcm_arrays']:
+                self.pcm.popitem(last=False)
+        return pcm
+
+    def forget(self, paths):
+        """Drop PCM of files that changed or were removed from the library"""
+        with self.lock:
+            for path in map(str, paths):
+                self.pcm.pop(path, None)
+
+    # ------------------------------------------------------------------ API
+
+    def start(self):
+        import pygame
+        pygame.mixer.set_reserved(self.channel_index + 1)   # find_channel() não usa este canal
+        self.channel = pygame.mixer.Channel(self.channel_index)
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name='audio-ambience', daemon=True)
+        self.thread.start()
+
+    def shutdown(self):
+        self.running = False
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(2.0)
+            self.thread = None
+        self.cut()
+
+    def play(self, layers, duration=None, name='ambience', on_end=None):
+        """Start a scene (the scenes already playing crossfade out); returns the Soundscape"""
+        scene = Soundscape(name, layers, self.files, self.pcm_loader, duration,
+                           rng=random.Random(self.rng.random()), sample_rate=self.rate, on_end=on_end)
+        with self.lock:
+            for other in self.scenes:
+                other.stop(AMBIENCE_CONFIG['crossfade'])
+            self.scenes.append(scene)
+        self.wakeup.set()
+        return scene
+
+    def stop(self, name=None, fade=AMBIENCE_CONFIG['scene_fade']):
+        """Fade out all scenes or the one called `name`"""
+        with self.lock:
+            for scene in self.scenes:
+                if name is None or scene.name == name:
+                    scene.stop(fade)
+        self.wakeup.set()
+
+    def cut(self, fade_ms=300):
+        """Silence now (emergency/STOP): drops rendered audio and every scene"""
+        with self.lock:
+            scenes, self.scenes = self.scenes, []
+            scenes += [scene for _, ending in self.buffer for scene in ending]
+            self.buffer.clear()
+            self.generation += 1
+        if self.channel is not None:
+            self.channel.fadeout(fade_ms)
+        self.streaming = False
+        for scene in scenes:
+            scene.state = 'stopped'
+            self._finish(scene)
+
+    def busy(self):
+        with self.lock:
+            return bool(self.scenes) or any(ending for _, ending in self.buffer)
+
+    def stats(self):
+        rendered = self.chunks * self.chunk_frames / self.rate
+        with self.lock:
+            names = [scene.name for scene in self.scenes]
+        return {
+            'scenes': names,
+            'rendered_s': round(rendered, 1),
+            'rtf': round(self.render_seconds / rendered, 4) if rendered else 0.0,
+            'underruns': self.underruns,
+            'clipped': self.clipped,
+            'voices_max': self.voices_max,
+        }
+
+    # ------------------------------------------------------------- rendering
+
+    def render_chunk(self):
+        """Mix the next block of every scene; returns (int16 bytes, scenes ending in it) or None when idle"""
+        with self.lock:
+            scenes = list(self.scenes)
+        if not scenes:
+            return None
+        started = time.perf_counter()
+        buffer = np.zeros((self.chunk_frames, self.channels), dtype=np.float32)
+        voices = 0
+        for scene in scenes:
+            voices += scene.mix_into(buffer)
+        buffer *= self.master_gain
+        # Limitador por bloco: reduz o ganho em rampa quando as camadas somadas passam de 0 dBFS
+        peak = float(np.abs(buffer).max())
+        target = min(1.0, 32767 / peak) if peak > 0 else 1.0
+        previous, gain = self.limiter, min(target, self.limiter + AMBIENCE_CONFIG['limiter_release'])
+        if gain < 1.0 or previous < 1.0:
+            buffer *= np.linspace(previous, gain, len(buffer), dtype=np.float32)[:, None]
+        self.limiter = gain
+        if peak * max(previous, gain) > 32767:  # início da rampa ainda acima do limite
+            over = np.abs(buffer) > 32767
+            if over.any():
+                self.clipped += int(np.count_nonzero(over))
+                np.clip(buffer, -32768, 32767, out=buffer)
+        data = buffer.astype('<i2').tobytes()
+
+        finished = [scene for scene in scenes if scene.done]
+        if finished:
+            with self.lock:
+                self.scenes = [scene for scene in self.scenes if scene not in finished]
+            for scene in finished:
+                if scene.state == 'playing':
+                    scene.state = 'done'
+        self.chunks += 1
+        self.voices_max = max(self.voices_max, voices)
+        self.render_seconds += time.perf_counter() - started
+        return data, finished
+
+    def _finish(self, scene):
+        if scene.on_end is not None:
+            try:
+                scene.on_end(scene)
+            except Exception as e:
+                print(f"❌ Ambience callback error: {e}")
+
+    def _feed(self):
+        """Keep the reserved channel playing from the rendered blocks"""
+        with self.lock:
+            if not self.buffer:
+                if not self.channel.get_busy():
+                    self.streaming = False
+                return
+            if self.channel.get_busy() and self.channel.get_queue() is not None:
+                return
+            sound, ending = self.buffer.popleft()
+        if not self.channel.get_busy():
+            if self.streaming:
+                self.underruns += 1   # o canal esvaziou antes do próximo bloco
+            self.channel.play(sound)
+            self.streaming = True
+        else:
+            self.channel.queue(sound)
+        # on_end quando o último bloco da cena chega ao canal, não quando foi renderizado
+        for scene in ending:
+            self._finish(scene)
+
+    def _run(self):
+        import pygame
+        while self.running:
+            try:
+                self._feed()
+                if len(self.buffer) < self.ahead:
+                    generation = self.generation
+                    rendered = self.render_chunk()
+                    if rendered is not None:
+                        sound = pygame.mixer.Sound(buffer=rendered[0])
+                        with self.lock:
+                            if generation == self.generation:
+                                self.buffer.append((sound, rendered[1]))
+                        continue
+                self.wakeup.wait(self.chunk_frames / self.rate / 4)
+                self.wakeup.clear()
+            except Exception as e:
+                print(f"❌ Ambience mixer error: {e}")
+                self.cut()
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Audio - Audio Manifest
+Persistent index of the sound library (path, size, mtime, duration, format, hash)
+
+The simulators used to glob every category directory at startup and knew
+nothing about the files but their paths. AudioManifest keeps one entry per
+file in `<audio_path>/.audio_manifest.json`:
+
+    {"path", "category", "size", "mtime", "duration", "sample_rate", "channels", "sha1"}
+
+refresh() walks the category directories with os.scandir and only probes and
+hashes files whose size/mtime changed (or that are new); removed files are
+dropped. Startup is therefore a JSON read plus one scandir per category.
+Durations let routines pick sounds that fit the time left without decoding.
+
+watch(on_change) follows the directories with inotify (Linux, via libc) so a
+sound copied into audio_files/<category>/ is available without a restart;
+where inotify is not available it returns None and refresh() on start-up is
+all there is.
+
+Probing order: wave (stdlib) for WAV, mutagen if installed, the MP4 'mvhd'
+box for m4a duration, and as a last resort a one-time pygame decode (its
+result is stored, so it is not repeated on the next start).
+"""
+
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import select
+import struct
+import threading
+import time
+import wave
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.m4a', '.ogg')
+
+MANIFEST_CONFIG = {
+    'file_name': '.audio_manifest.json',
+    'debounce': 1.0,      # s sem eventos antes de reindexar (cópias grandes)
+}
+
+MANIFEST_VERSION = 1
+
+
+def file_sha1(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# ---------------------------------------------------------------- probing
+
+def _probe_wave(path):
+    with wave.open(path, 'rb') as w:
+        rate = w.getframerate()
+        return {'duration': w.getnframes() / rate if rate else None,
+                'sample_rate': rate, 'channels': w.getnchannels()}
+
+
+def _probe_mutagen(path):
+    import mutagen  # opcional
+    info = mutagen.File(path).info
+    return {'duration': getattr(info, 'length', None),
+            'sample_rate': getattr(info, 'sample_rate', None),
+            'channels': getattr(info, 'channels', None)}
+
+
+def _mp4_boxes(f, end):
+    """Yield (type, payload_start, box_end) of the boxes between f.tell() and end"""
+    while f.tell() + 8 <= end:
+        start = f.tell()
+        size, kind = struct.unpack('>I4s', f.read(8))
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+        elif size == 0:
+            size = end - start
+        if size < 8:
+            return
+        yield kind, f.tell(), start + size
+        f.seek(start + size)
+
+
+def _probe_mp4(path):
+    """Duration from moov/mvhd, sample rate and channels from the first mp4a entry"""
+    result = {}
+    with open(path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        size = f.tell()
+        f.seek(0)
+
+        def walk(end, depth=0):
+            for kind, payload, box_end in _mp4_boxes(f, end):
+                if kind == b'mvhd':
+                    version = f.read(1)[0]
+                    f.read(3)
+                    if version == 1:
+                        _, _, timescale, duration = struct.unpack('>QQIQ', f.read(28))
+                    else:
+                        _, _, timescale, duration = struct.unpack('>IIII', f.read(16))
+                    if timescale:
+                        result['duration'] = duration / timescale
+                elif kind == b'stsd' and 'sample_rate' not in result:
+                    f.read(8)  # version/flags + entry count
+                    f.read(8)  # sample entry size + format
+                    f.read(16)  # reserved, data reference, audio reserved
+                    channels, _, _, _, rate = struct.unpack('>HHHHI', f.read(12))
+                    result['channels'] = channels
+                    result['sample_rate'] = rate >> 16
+                elif kind in (b'moov', b'trak', b'mdia', b'minf', b'stbl') and depth < 6:
+                    walk(box_end, depth + 1)
+                f.seek(box_end)
+
+        walk(size)
+    if 'duration' not in result:
+        raise ValueError('no mvhd box')
+    return result
+
+
+def _probe_pygame(path):
+    import pygame
+    sound = pygame.mixer.Sound(path)
+    frequency, _, channels = pygame.mixer.get_init()
+    return {'duration': sound.get_length(), 'sample_rate': frequency, 'channels': channels}
+
+
+def probe_audio(path):
+    """{'duration', 'sample_rate', 'channels'} with None for what could not be read"""
+    extension = os.path.splitext(path)[1].lower()
+    probes = []
+    if extension == '.wav':
+        probes.append(_probe_wave)
+    probes.append(_probe_mutagen)
+    if extension in ('.m4a', '.mp4', '.aac'):
+        probes.append(_probe_mp4)
+    probes.append(_probe_pygame)
+    for probe in probes:
+        try:
+            info = probe(path)
+            if info.get('duration'):
+                return {'duration': round(info['duration'], 3),
+                        'sample_rate': info.get('sample_rate'),
+                        'channels': info.get('channels')}
+        except Exception:
+            continue
+    return {'duration': None, 'sample_rate': None, 'channels': None}
+
+
+# --------------------------------------------------------------- manifest
+
+class AudioManifest:
+    """Incrementally maintained index of audio_files/<category>/*"""
+
+    def __init__(self, base_path, categories, manifest_file=None, extensions=AUDIO_EXTENSIONS,
+                 prober=probe_audio):
+        self.base_path = str(base_path)
+        self.categories = list(categories)
+        self.manifest_file = manifest_file or os.path.join(self.base_path, MANIFEST_CONFIG['file_name'])
+        self.extensions = tuple(extensions)
+        self.prober = prober
+        self.entries = {}   # path -> entry
+        self.lock = threading.RLock()
+        self.watcher = None
+        self.last_refresh = {'added': 0, 'changed': 0, 'removed': 0, 'seconds': 0.0}
+
+    # ------------------------------------------------------------ storage
+
+    def load(self):
+        try:
+            with open(self.manifest_file, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"⚠️  Manifest {self.manifest_file} unreadable ({e}), rebuilding")
+            return False
+        if data.get('version') != MANIFEST_VERSION:
+            return False
+        with self.lock:
+            self.entries = {entry['path']: entry for entry in data.get('files', [])}
+        return True
+
+    def save(self):
+        with self.lock:
+            data = {'version': MANIFEST_VERSION, 'base_path': self.base_path,
+                    'files': sorted(self.entries.values(), key=lambda e: e['path'])}
+        tmp_path = self.manifest_file + '.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, indent=1)
+            os.replace(tmp_path, self.manifest_file)
+        except OSError as e:
+            print(f"⚠️  Cannot save manifest: {e}")
+
+    # ----------------------------------------------------------- indexing
+
+    def _scan(self, category):
+        """{path: stat} of the audio files of one category directory"""
+        found = {}
+        try:
+            with os.scandir(os.path.join(self.base_path, category)) as it:
+                for item in it:
+                    if item.is_file() and item.name.lower().endswith(self.extensions):
+                        found[os.path.join(self.base_path, category, item.name)] = item.stat()
+        except FileNotFoundError:
+            pass
+        return found
+
+    def refresh(self, categories=None):
+        """Re-index changed files of the given categories (all by default); returns the changes"""
+        started = time.perf_counter()
+        changes = {'added': [], 'changed': [], 'removed': []}
+        for category in categories or self.categories:
+            found = self._scan(category)
+            with self.lock:
+                known = {p for p, e in self.entries.items() if e['category'] == category}
+            for path in known - set(found):
+                with self.lock:
+                    del self.entries[path]
+                changes['removed'].append(path)
+            for path, stat in found.items():
+                with self.lock:
+                    entry = self.entries.get(path)
+                if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+                    continue
+                try:
+                    new_entry = dict(self.prober(path), path=path, category=category,
+                                     size=stat.st_size, mtime=stat.st_mtime_ns, sha1=file_sha1(path))
+                except OSError as e:
+                    print(f"⚠️  Cannot index {path}: {e}")
+                    continue
+                with self.lock:
+                    self.entries[path] = new_entry
+                changes['changed' if entry else 'added'].append(path)
+
+        self.last_refresh = dict({k: len(v) for k, v in changes.items()},
+                                 seconds=round(time.perf_counter() - started, 3))
+        if any(changes.values()):
+            self.save()
+        return changes
+
+    def open(self):
+        """Load the manifest and bring it up to date; returns the changes"""
+        loaded = self.load()
+        changes = self.refresh()
+        indexed = sum(len(v) for v in changes.values())
+        print(f"🗂️  Audio manifest: {len(self.entries)} files"
+              f" ({'loaded' if loaded else 'built'}, {indexed} indexed in {self.last_refresh['seconds']}s)")
+        return changes
+
+    # ------------------------------------------------------------ queries
+
+    def files(self, category):
+        with self.lock:
+            return sorted(p for p, e in self.entries.items() if e['category'] == category)
+
+    def entry(self, path):
+        with self.lock:
+            return self.entries.get(str(path))
+
+    def duration(self, path):
+        entry = self.entry(path)
+        return entry.get('duration') if entry else None
+
+    def stats(self):
+        with self.lock:
+            entries = list(self.entries.values())
+        known = [e['duration'] for e in entries if e.get('duration')]
+        return {
+            'files': len(entries),
+            'mb': round(sum(e['size'] for e in entries) / (1024 * 1024), 1),
+            'with_duration': len(known),
+            'total_minutes': round(sum(known) / 60, 1),
+            'last_refresh': self.last_refresh,
+        }
+
+    # ------------------------------------------------------------ watching
+
+    def watch(self, on_change, debounce=MANIFEST_CONFIG['debounce']):
+        """Re-index a category when its directory changes; on_change(changes). None without inotify"""
+        try:
+            self.watcher = InotifyWatcher([os.path.join(self.base_path, c) for c in self.categories])
+        except OSError as e:
+            print(f"⚠️  Audio directory watch unavailable ({e})")
+            return None
+
+        def run():
+            while True:
+                directories = self.watcher.read(debounce)
+                if directories is None:
+                    return
+                categories = [os.path.basename(d) for d in directories]
+                changes = self.refresh(categories)
+                if any(changes.values()):
+                    try:
+                        on_change(changes)
+                    except Exception as e:
+                        print(f"❌ Manifest change handler failed: {e}")
+
+        thread = threading.Thread(target=run, name='audio-manifest-watch', daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+
+
+class InotifyWatcher:
+    """Minimal inotify (libc) for a few directories: reports which ones changed"""
+
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_DELETE = 0x00000200
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+    EVENT = struct.Struct('iIII')
+
+    def __init__(self, directories):
+        name = ctypes.util.find_library('c')
+        libc = ctypes.CDLL(name, use_errno=True) if name else None
+        if libc is None or not hasattr(libc, 'inotify_init1'):
+            raise OSError('inotify not supported on this system')
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.directories = {}
+        for directory in directories:
+            if os.path.isdir(directory):
+                wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), self.MASK)
+                if wd >= 0:
+                    self.directories[wd] = directory
+        self.wake_read, self.wake_write = os.pipe()   # close() wakes up read()
+        self.closed = False
+
+    def read(self, debounce):
+        """Block until something changes, then until `debounce` s pass quietly; returns the directories"""
+        changed = set()
+        timeout = None
+        while not self.closed:
+            ready, _, _ = select.select([self.fd, self.wake_read], [], [], timeout)
+            if self.closed or self.wake_read in ready:
+                break
+            if not ready:
+                return changed  # quiet for `debounce` seconds
+            data = os.read(self.fd, 64 * 1024)
+            offset = 0
+            while offset + self.EVENT.size <= len(data):
+                wd, mask, cookie, length = self.EVENT.unpack_from(data, offset)
+                offset += self.EVENT.size + length
+                if wd in self.directories:
+                    changed.add(self.directories[wd])
+            if changed:
+                timeout = debounce
+        for fd in (self.fd, self.wake_read, self.wake_write):
+            os.close(fd)
+        return None
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            os.write(self.wake_write, b'x')
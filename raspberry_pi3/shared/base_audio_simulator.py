@@ -8,14 +8,30 @@ import pygame
 import json
 import random
 import time
-import schedule
-import threading
 import os
 import sys
 from datetime import datetime, timedelta
-import paho.mqtt.client as mqtt
 from pathlib import Path
 
+try:
+    from mqtt_client import ResilientMqttClient, load_mqtt_config
+except ImportError:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'python'))
+    from mqtt_client import ResilientMqttClient, load_mqtt_config
+
+from sound_cache import SoundCache, SOUND_CACHE_CONFIG
+from audio_manifest import AudioManifest
+from transcode_cache import TranscodeCache, TRANSCODE_CONFIG
+from playback_engine import PlaybackEngine, PLAYBACK_CONFIG, EMERGENCY, MOTION, ROUTINE
+from task_scheduler import TaskScheduler, TASK_CONFIG, COORDINATION
+from routine_scheduler import RoutineScheduler, SCHEDULER_CONFIG
+from floor_sync import FloorSync, SYNC_CONFIG, JOINT_EVENTS
+
+try:
+    from ambience_mixer import AmbienceMixer, SCENES, routine_layers
+except ImportError:  # numpy não instalado: rotinas tocam clipe a clipe
+    AmbienceMixer = None
+
 class BaseAudioPresenceSimulator:
     """Base class for audio presence simulation"""
     
@@ -27,46 +43,89 @@ class BaseAudioPresenceSimulator:
         self.floor_name = floor_config['floor_name']
         self.device_id = f"audio_presence_rpi3_{self.floor}"
         
-        # Load configuration
-        self.config = self.load_config(floor_config['config_file'])
+        # Load configuration (routines: config 'schedules' + audio_schedule.json);
+        # relative paths are taken from base_dir (default: working directory)
+        self.base_dir = Path(floor_config.get('base_dir') or '.')
+        self.config = self.load_config(self.base_dir / floor_config['config_file'])
+        self.schedule_file = self.base_dir / floor_config.get('schedule_file', 'audio_schedule.json')
+        self.schedules, self.schedule_jitter = self.load_schedules()
         
-        # MQTT Configuration
-        self.mqtt_broker = self.config.get('mqtt_broker', '192.168.1.102')
-        self.mqtt_port = self.config.get('mqtt_port', 1883)
-        self.mqtt_user = self.config.get('mqtt_user', 'homeguard')
-        self.mqtt_pass = self.config.get('mqtt_pass', 'pu2clr123456')
+        # MQTT Configuration (credentials: homeguard_mqtt_config.json or HOMEGUARD_MQTT_*)
+        self.mqtt_config = load_mqtt_config(defaults={
+            'host': self.config.get('mqtt_broker'),
+            'port': self.config.get('mqtt_port'),
+            'username': self.config.get('mqtt_user'),
+            'password': self.config.get('mqtt_pass'),
+        })
+        self.mqtt_broker = self.mqtt_config['host']
+        self.mqtt_port = self.mqtt_config['port']
         
-        # MQTT Topics
+        # MQTT Topics (named wildcards are captured by the client router)
         self.topics = {
             'cmd': f'home/audio/{self.floor}/cmnd',
             'status': f'home/audio/{self.floor}/status',
             'events': f'home/audio/{self.floor}/events',
             'heartbeat': f'home/audio/{self.floor}/heartbeat',
             'coordination': 'home/audio/coordination',
-            'motion_trigger': 'home/motion/+/detected',
-            'relay_trigger': 'home/relay/+/status',
-            'emergency': 'home/emergency/+'
+            'sync': 'home/audio/sync',
+            'sync_reply': f'home/audio/sync/{self.floor}',
+            'schedule': f'home/audio/{self.floor}/schedule',
+            'motion_trigger': 'home/motion/+device_id/detected',
+            'relay_trigger': 'home/relay/+device_id/status',
+            'emergency': 'home/emergency/+emergency_type'
         }
         
         # Audio system
         pygame.mixer.init(frequency=44100, size=-16, channels=2, buffer=1024)
         
         # Audio files paths
-        self.audio_base_path = Path(self.config.get('audio_path', './audio_files'))
+        self.audio_base_path = self.base_dir / self.config.get('audio_path', './audio_files')
         self.audio_categories = floor_config['audio_categories']
         
         # State variables
         self.presence_mode = self.config.get('default_mode', 'home')
-        self.is_playing = False
         self.current_schedule = None
         self.motion_triggered_sounds = self.config.get('motion_triggered', True)
         self.coordination_enabled = self.config.get('coordination_enabled', True)
+        self.active_routines = set()
         
         # Load audio files
         self.load_audio_files()
         
+        # Sources converted once to mixer-format WAV (44.1 kHz/16 bits, same loudness)
+        self.transcoder = TranscodeCache(self.manifest,
+                                         normalize=self.config.get('normalize_audio', TRANSCODE_CONFIG['normalize']),
+                                         target_dbfs=self.config.get('target_dbfs', TRANSCODE_CONFIG['target_dbfs']))
+        
+        # Decoded sounds in memory (LRU within the budget), warmed up by run()
+        self.sound_cache = SoundCache(budget_mb=self.config.get('sound_cache_mb', SOUND_CACHE_CONFIG['budget_mb']),
+                                      resolver=self.transcoder.resolve)
+        
+        # Mixer channels owned by one playback thread (layers, priorities, end events);
+        # cache misses are decoded on the task pool at the lowest priority
+        self.playback = PlaybackEngine(self.sound_cache,
+                                       channels=self.config.get('mixer_channels', PLAYBACK_CONFIG['channels']),
+                                       prefetch=lambda path: self.tasks.submit(self.sound_cache.get, path,
+                                                                               priority=COORDINATION,
+                                                                               key=f'decode:{path}'))
+        
+        # Routines mixed as layered soundscapes on a reserved channel (bed + events, crossfades)
+        self.ambience = None
+        if AmbienceMixer is not None and self.config.get('ambience', True):
+            self.ambience = AmbienceMixer(files=lambda category: self.audio_categories.get(category, []),
+                                          sound_cache=self.sound_cache,
+                                          channel=self.config.get('ambience_channel', 0))
+        
+        # All commands, responses and delayed routines run on a fixed pool, most urgent first
+        self.tasks = TaskScheduler(workers=self.config.get('task_workers', TASK_CONFIG['workers']))
+        
+        # Clock offset/latency to the other floors and joint events at agreed times
+        self.sync = FloorSync(self.floor, send=self.publish_sync, on_step=self.play_joint_step)
+        
         # Initialize MQTT client
         self.mqtt_client = None
+        self.scheduler = None
+        self.schedule_clock = None   # RoutineScheduler clock (None: wall clock)
         self.running = True
         self.start_time = None
         
@@ -92,117 +151,195 @@ class BaseAudioPresenceSimulator:
         return {
             "mqtt_broker": "192.168.1.102",
             "mqtt_port": 1883,
-            "mqtt_user": "homeguard",
-            "mqtt_pass": "pu2clr123456",
             "default_mode": "home",
             "motion_triggered": True,
             "coordination_enabled": True,
             "volume": 0.7
         }
 
+    def load_schedules(self):
+        """Routines of the config plus audio_schedule.json (same name overrides); returns (routines, jitter)"""
+        routines = dict(self.config.get('schedules', {}))
+        jitter = self.config.get('schedule_jitter', SCHEDULER_CONFIG['jitter_minutes'])
+        try:
+            with open(self.schedule_file, 'r') as f:
+                data = json.load(f)
+            routines.update(data.get('routines', {}))
+            jitter = data.get('jitter_minutes', jitter)
+        except FileNotFoundError:
+            pass
+        except (json.JSONDecodeError, OSError) as e:
+            print(f"⚠️  Falha ao carregar {self.schedule_file}: {e}")
+        return routines, jitter
+
     def load_audio_files(self):
-        """Load audio files from directories"""
+        """Load audio files from the manifest (only new/changed files are indexed)"""
+        self.manifest = AudioManifest(self.audio_base_path, self.audio_categories.keys())
+        self.manifest.open()
         for category in self.audio_categories.keys():
             category_path = self.audio_base_path / category
-            if category_path.exists():
-                audio_files = []
-                for ext in ['*.wav', '*.mp3', '*.m4a', '*.ogg']:
-                    audio_files.extend(category_path.glob(ext))
-                self.audio_categories[category] = [str(f) for f in audio_files]
-                if self.audio_categories[category]:
-                    print(f"📁 {category}: {len(self.audio_categories[category])} files")
-            else:
+            self.audio_categories[category] = self.manifest.files(category)
+            if not category_path.exists():
                 print(f"⚠️  Directory {category_path} not found")
-                self.audio_categories[category] = []
+            elif self.audio_categories[category]:
+                print(f"📁 {category}: {len(self.audio_categories[category])} files")
+
+    def on_audio_library_change(self, changes):
+        """Sound added/replaced/removed in audio_files: update categories without restart"""
+        for category in self.audio_categories.keys():
+            self.audio_categories[category] = self.manifest.files(category)
+        self.sound_cache.discard(changes['changed'] + changes['removed'])
+        if self.ambience is not None:
+            self.ambience.forget(changes['changed'] + changes['removed'])
+        for path in changes['added']:
+            print(f"🆕 {Path(path).parent.name}: {Path(path).name}")
+        for path in changes['removed']:
+            print(f"🗑️  {Path(path).parent.name}: {Path(path).name}")
+        if changes['added'] or changes['changed']:
+            self.prepare_sounds(changes['added'] + changes['changed'])
+
+    def prepare_sounds(self, paths, warm=None):
+        """Transcode paths in the background, then decode `warm` (default: all of them) into the cache"""
+        paths = list(paths)
+        warm = paths if warm is None else list(warm)
+        if self.config.get('transcode_audio', True):
+            self.transcoder.enqueue(paths, on_ready=self.sound_cache.discard,
+                                    on_done=lambda: self.sound_cache.warm(warm))
+        else:
+            self.sound_cache.warm(warm)
 
-    def play_sound_category(self, category, volume=None):
-        """Play random sound from category"""
+    def warm_up_files(self):
+        """Files to pre-decode, most urgent first: emergency, motion/relay responses, next routines"""
+        order = ['alerts', 'dogs']
+        for responses in (self.config.get('motion_responses', {}), self.config.get('relay_responses', {})):
+            for sounds in responses.values():
+                order.extend(sounds)
+        
+        now = datetime.now()
+        upcoming = []
+        for routine in self.schedules.values():
+            if routine.get('enabled', True) and routine.get('time'):
+                hour, minute = map(int, routine['time'].split(':'))
+                start = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+                if start < now - timedelta(minutes=routine.get('duration', 10)):
+                    start += timedelta(days=1)
+                upcoming.append((start, routine.get('sounds', [])))
+        for _, sounds in sorted(upcoming, key=lambda item: item[0]):
+            order.extend(sounds)
+        
+        files = []
+        for category in dict.fromkeys(order):
+            files.extend(self.audio_categories.get(category, []))
+        return files
+
+    @property
+    def is_playing(self):
+        """True while any sound is playing (state kept by the playback thread)"""
+        return self.playback.busy()
+
+    def play_sound_category(self, category, volume=None, priority=ROUTINE, delay=0, tag=None,
+                            exclusive=False, on_end=None, max_duration=None):
+        """Queue a random sound from category; returns its Playback (None if nothing to play)
+        
+        Never waits for the sound: SOUND_PLAYED is published and on_end(playback)
+        is called by the playback thread when it ends (or is stopped/preempted).
+        max_duration skips files longer than that (manifest durations, no decoding).
+        """
         if volume is None:
             volume = self.config.get('volume', 0.7)
             
         if category not in self.audio_categories:
             print(f"❌ Category {category} not found")
-            return False
+            return None
             
         files = self.audio_categories[category]
+        if max_duration is not None:
+            files = [f for f in files if (self.manifest.duration(f) or 0) <= max_duration]
         if not files:
             print(f"⚠️  No files in category {category}")
-            return False
-            
-        try:
-            sound_file = random.choice(files)
-            print(f"🔊 Playing {category}: {Path(sound_file).name} ({self.floor_name})")
-            
-            pygame.mixer.music.load(sound_file)
-            pygame.mixer.music.set_volume(volume)
-            pygame.mixer.music.play()
+            return None
             
-            # Wait for sound to finish
-            while pygame.mixer.music.get_busy():
-                time.sleep(0.1)
-                
-            self.publish_audio_event("SOUND_PLAYED", category, Path(sound_file).name)
-            return True
-            
-        except Exception as e:
-            print(f"❌ Error playing sound: {e}")
-            return False
+        sound_file = random.choice(files)
+        
+        def finished(playback):
+            if playback.state == 'done':
+                self.publish_audio_event("SOUND_PLAYED", category, Path(sound_file).name)
+            elif playback.state != 'stopped':
+                print(f"⏭️  {category}: {Path(sound_file).name} {playback.state}")
+            if on_end is not None:
+                on_end(playback)
+        
+        print(f"🔊 Playing {category}: {Path(sound_file).name} ({self.floor_name})")
+        return self.playback.play(sound_file, volume, priority=priority, delay=delay, tag=tag,
+                                  exclusive=exclusive, on_end=finished)
+
+    def play_layers(self, categories, volume=None, priority=ROUTINE, exclusive=False):
+        """Play one sound of each category at the same time (one mixer channel each)"""
+        playbacks = []
+        for category in categories:
+            playback = self.play_sound_category(category, volume, priority=priority, exclusive=exclusive)
+            if playback is not None:
+                playbacks.append(playback)
+            exclusive = False  # só o primeiro interrompe os outros sons
+        return playbacks
 
     def connect_mqtt(self):
-        """Connect to MQTT broker"""
+        """Connect to MQTT broker (reconnects with backoff; handlers run on the client workers)"""
         try:
-            self.mqtt_client = mqtt.Client()
-            self.mqtt_client.username_pw_set(self.mqtt_user, self.mqtt_pass)
-            
-            self.mqtt_client.on_connect = self.on_mqtt_connect
-            self.mqtt_client.on_message = self.on_mqtt_message
-            self.mqtt_client.on_disconnect = self.on_mqtt_disconnect
+            # Handlers only queue a prioritized task and return on the network thread
+            self.mqtt_client = self.create_mqtt_client()
+            self.subscribe_topics(self.mqtt_client)
+            self.mqtt_client.add_connect_listener(self.on_mqtt_connect)
+            self.mqtt_client.add_disconnect_listener(self.on_mqtt_disconnect)
             
             print(f"🔗 Connecting to MQTT: {self.mqtt_broker}:{self.mqtt_port}")
-            self.mqtt_client.connect(self.mqtt_broker, self.mqtt_port, 60)
-            self.mqtt_client.loop_start()
+            self.mqtt_client.start()
             return True
             
         except Exception as e:
             print(f"❌ MQTT connection failed: {e}")
             return False
 
-    def on_mqtt_connect(self, client, userdata, flags, rc):
-        """Callback when MQTT connection is established"""
-        if rc == 0:
-            print(f"✅ Connected to MQTT broker")
-            
-            for topic_name, topic in self.topics.items():
-                client.subscribe(topic)
-                print(f"📡 Subscribed: {topic}")
-                
-            self.publish_status("ONLINE")
-            
-        else:
-            print(f"❌ MQTT connection failed: {rc}")
+    def create_mqtt_client(self):
+        """MQTT client of this floor (the headless harness swaps in an in-process broker)"""
+        return ResilientMqttClient(self.device_id, config=self.mqtt_config, workers=0)
 
-    def on_mqtt_message(self, client, userdata, msg):
-        """Handle incoming MQTT messages"""
-        try:
-            topic = msg.topic
-            payload = msg.payload.decode('utf-8')
-            
-            if topic == self.topics['cmd']:
-                self.handle_command(payload)
-            elif 'motion' in topic and payload:
-                device_id = topic.split('/')[-2] if '/' in topic else 'unknown'
-                self.handle_motion_trigger(device_id, payload)
-            elif 'relay' in topic:
-                device_id = topic.split('/')[-2] if '/' in topic else 'unknown'
-                self.handle_relay_trigger(device_id, payload)
-            elif 'emergency' in topic:
-                emergency_type = topic.split('/')[-1] if '/' in topic else 'unknown'
-                self.handle_emergency(emergency_type, payload)
-            elif topic == self.topics['coordination']:
-                self.handle_coordination_message(payload)
-                
-        except Exception as e:
-            print(f"❌ Error processing MQTT message: {e}")
+    def on_mqtt_connect(self, client, session_present):
+        """Callback when MQTT connection is established (subscriptions are restored by the client)"""
+        print(f"✅ Connected to MQTT broker")
+        for topic, qos in client.subscriptions():
+            print(f"📡 Subscribed: {topic}")
+        self.publish_status("ONLINE")
+        # Algumas amostras logo na conexão; depois uma rodada a cada SYNC_CONFIG['interval']
+        for i in range(4):
+            self.tasks.submit(self.sync.ping, priority=COORDINATION, delay=2 * i)
+
+    def subscribe_topics(self, client):
+        """Topic handlers: queue a task with the payload text plus the topic captures"""
+        submit = self.tasks.submit
+        client.subscribe(self.topics['cmd'],
+                         lambda message: submit(self.handle_command, message.text, priority=MOTION))
+        client.subscribe(self.topics['motion_trigger'],
+                         lambda message: message.text and submit(
+                             self.handle_motion_trigger, message.captures['device_id'], message.text,
+                             priority=MOTION))
+        client.subscribe(self.topics['relay_trigger'],
+                         lambda message: submit(self.handle_relay_trigger, message.captures['device_id'],
+                                                message.text, priority=MOTION))
+        client.subscribe(self.topics['emergency'],
+                         lambda message: submit(self.handle_emergency, message.captures['emergency_type'],
+                                                message.text, priority=EMERGENCY))
+        client.subscribe(self.topics['coordination'],
+                         lambda message: submit(self.handle_coordination_message, message.text,
+                                                priority=COORDINATION))
+        # Sync runs on the network thread: the arrival timestamp must not wait in the queue
+        for name in ('sync', 'sync_reply'):
+            client.subscribe(self.topics[name], lambda message: self.sync.receive(message.json, message.timestamp))
+
+    def submit_routine(self, routine_type, priority=ROUTINE, delay=0, runner=None):
+        """Queue a routine once: a pending routine of the same type absorbs this request"""
+        return self.tasks.submit(runner or self.play_routine, routine_type, priority=priority,
+                                 delay=delay, key=f"routine:{routine_type}")
 
     def handle_command(self, command):
         """Handle direct commands"""
@@ -213,17 +350,18 @@ class BaseAudioPresenceSimulator:
                 
                 if action == 'PLAY':
                     category = cmd_data.get('category')
+                    categories = cmd_data.get('categories')
                     volume = cmd_data.get('volume', self.config.get('volume', 0.7))
-                    if category and not self.is_playing:
-                        self.is_playing = True
-                        threading.Thread(target=self._play_sound_thread, 
-                                       args=(category, volume)).start()
+                    if categories:
+                        # {"action": "PLAY", "categories": ["tv_radio", "footsteps"]} -> layered
+                        self.play_layers(categories, volume, priority=MOTION)
+                    elif category and not self.is_playing:
+                        self.play_sound_category(category, volume, priority=MOTION)
                         
                 elif action == 'ROUTINE':
                     routine_type = cmd_data.get('routine')
                     if routine_type:
-                        threading.Thread(target=self.play_routine, 
-                                       args=(routine_type,)).start()
+                        self.submit_routine(routine_type)
                                        
                 elif action == 'MODE':
                     mode = cmd_data.get('mode')
@@ -233,28 +371,33 @@ class BaseAudioPresenceSimulator:
                         self.publish_status(f"MODE_{mode.upper()}")
                         
                 elif action == 'STOP':
-                    pygame.mixer.music.stop()
-                    self.is_playing = False
-                    print("⏹️  Audio stopped")
+                    self.stop_audio()
+                    
+                elif action == 'SCHEDULE':
+                    self.publish_schedule(cmd_data.get('count', 5))
+                    
+                elif action == 'JOINT':
+                    # {"action": "JOINT", "event": "footsteps_upstairs", "lead": 5}
+                    self.start_joint_event(cmd_data.get('event'), cmd_data.get('lead', SYNC_CONFIG['lead']))
                     
             else:
                 # Simple text command
                 command_lower = command.lower()
                 if command_lower in self.audio_categories and not self.is_playing:
-                    self.is_playing = True
-                    threading.Thread(target=self._play_sound_thread, 
-                                   args=(command_lower,)).start()
+                    self.play_sound_category(command_lower, priority=MOTION)
                 elif command.upper() == 'STOP':
-                    pygame.mixer.music.stop()
-                    self.is_playing = False
+                    self.stop_audio()
                     
         except Exception as e:
             print(f"❌ Error handling command: {e}")
 
-    def _play_sound_thread(self, category, volume=None):
-        """Thread wrapper for playing sounds"""
-        self.play_sound_category(category, volume)
-        self.is_playing = False
+    def stop_audio(self):
+        """Stop every sound and drop pending routines and coordination responses"""
+        cancelled = self.tasks.cancel(min_priority=ROUTINE)
+        self.playback.stop()
+        if self.ambience is not None:
+            self.ambience.cut()
+        print(f"⏹️  Audio stopped ({cancelled} pending routines cancelled)")
 
     def handle_motion_trigger(self, device_id, location):
         """Handle motion detection - to be implemented by subclasses"""
@@ -268,14 +411,16 @@ class BaseAudioPresenceSimulator:
         """Handle emergency situations"""
         print(f"🚨 EMERGENCY: {emergency_type} - {self.floor_name}")
         
-        # All floors respond to emergencies immediately
+        # All floors respond to emergencies immediately: the alert interrupts
+        # routines/ambience and dogs are layered on top of it
         emergency_sounds = ['alerts']
         if 'security' in emergency_type.lower():
             emergency_sounds.append('dogs')
             
-        for sound_category in emergency_sounds:
-            if sound_category in self.audio_categories and self.audio_categories[sound_category]:
-                self.play_sound_category(sound_category, 1.0)  # Maximum volume
+        available = [c for c in emergency_sounds if self.audio_categories.get(c)]
+        if self.ambience is not None:
+            self.ambience.cut()
+        self.play_layers(available, 1.0, priority=EMERGENCY, exclusive=True)  # Maximum volume
                 
         self.publish_audio_event("EMERGENCY_RESPONSE", emergency_type, f"{self.floor_name} emergency response")
 
@@ -291,44 +436,93 @@ class BaseAudioPresenceSimulator:
                     routine_type = coord_data.get('routine_type')
                     print(f"🤝 Coordinating with {source_floor} floor: {routine_type}")
                     
-                    # Delayed response (2-5 minutes)
-                    delay = random.randint(120, 300)
-                    threading.Timer(delay, self.play_coordinated_routine, 
-                                  args=(routine_type,)).start()
+                    # Delayed response (2-5 minutes) at the instant agreed by the source floor,
+                    # queued once per routine type
+                    respond_at = coord_data.get('respond_at')
+                    if respond_at is not None:
+                        delay = max(0.0, self.sync.to_local(source_floor, respond_at) - time.time())
+                    else:
+                        delay = random.randint(120, 300)
+                    self.submit_routine(routine_type, priority=COORDINATION, delay=delay,
+                                        runner=self.play_coordinated_routine)
                                   
         except Exception as e:
             print(f"❌ Error handling coordination: {e}")
 
+    def start_joint_event(self, name, lead=SYNC_CONFIG['lead']):
+        """Announce a joint event (JOINT_EVENTS or config 'joint_events') to every floor"""
+        steps = dict(JOINT_EVENTS, **self.config.get('joint_events', {})).get(name)
+        if not steps:
+            print(f"❌ Joint event {name} not found")
+            return None
+        print(f"👣 Joint event '{name}' in {lead:.0f}s ({self.floor_name})")
+        return self.sync.announce(name, steps, lead=lead)
+
+    def play_joint_step(self, event_id, index, step, local_at):
+        """Play this floor's step of a joint event at local_at; its real start is reported"""
+        def started(playback):
+            if playback.started is not None:
+                self.sync.step_started(event_id, index, playback.started)
+        
+        self.play_sound_category(step['category'], step.get('volume'), priority=ROUTINE,
+                                 delay=max(0.0, local_at - time.time()), tag=f"joint:{event_id}",
+                                 on_end=started)
+
     def play_routine(self, routine_type):
         """Play scheduled routine"""
-        if routine_type not in self.config.get('schedules', {}):
+        if routine_type not in self.schedules:
             print(f"❌ Routine {routine_type} not found")
             return
             
-        routine = self.config['schedules'][routine_type]
+        if routine_type in self.active_routines:
+            print(f"⏭️  Routine '{routine_type}' already running ({self.floor_name})")
+            return
+        
+        routine = self.schedules[routine_type]
+        self.active_routines.add(routine_type)
         print(f"🎵 Starting {self.floor_name} routine: {routine.get('description', routine_type)}")
         
         # Publish coordination message
         if self.coordination_enabled:
             self.publish_coordination_message("ROUTINE_START", routine_type)
         
-        # Play routine sounds
+        # Mixed scene: continuous bed (TV, shower...) with events on top for the whole routine
+        if self.ambience is not None:
+            layers = routine_layers(routine, dict(SCENES, **self.config.get('ambience_scenes', {})))
+            if any(self.audio_categories.get(layer['category']) for layer in layers):
+                self.ambience.play(layers, routine.get('duration', 10) * 60, name=routine_type,
+                                   on_end=lambda scene: self._routine_finished(routine_type, scene.state == 'stopped'))
+                return
+        
+        # Play routine sounds: each sound queues the next one when it ends
         end_time = datetime.now() + timedelta(minutes=routine.get('duration', 10))
+        self._routine_step(routine_type, routine, end_time)
+
+    def _routine_finished(self, routine_type, stopped=False):
+        self.active_routines.discard(routine_type)
+        if stopped:
+            print(f"⏹️  Routine '{routine_type}' stopped ({self.floor_name})")
+        else:
+            print(f"✅ Routine '{routine_type}' completed ({self.floor_name})")
+
+    def _routine_step(self, routine_type, routine, end_time, delay=0):
+        """Queue one routine sound; its end schedules the next after a 15-60 s pause"""
+        # Only sounds that end before the routine does (durations from the manifest)
+        remaining = (end_time - datetime.now()).total_seconds() - delay
+        available_sounds = [s for s in routine.get('sounds', [])
+                            if any((self.manifest.duration(f) or 0) <= remaining
+                                   for f in self.audio_categories.get(s, []))]
+        if remaining <= 0 or not self.running or not available_sounds:
+            return self._routine_finished(routine_type)
         
-        while datetime.now() < end_time and self.running:
-            if not self.is_playing:
-                available_sounds = [s for s in routine.get('sounds', []) 
-                                  if s in self.audio_categories and self.audio_categories[s]]
-                if available_sounds:
-                    sound_category = random.choice(available_sounds)
-                    self.is_playing = True
-                    self.play_sound_category(sound_category)
-                    self.is_playing = False
-                    
+        def next_step(playback):
+            if playback.state == 'stopped':
+                return self._routine_finished(routine_type, stopped=True)
             pause_time = random.randint(15, 60)  # 15 seconds to 1 minute
-            time.sleep(pause_time)
-            
-        print(f"✅ Routine '{routine_type}' completed ({self.floor_name})")
+            self._routine_step(routine_type, routine, end_time, pause_time)
+        
+        self.play_sound_category(random.choice(available_sounds), priority=ROUTINE, delay=delay,
+                                 tag=f"routine:{routine_type}", on_end=next_step, max_duration=remaining)
 
     def play_coordinated_routine(self, routine_type):
         """Play routine in coordination with other floor"""
@@ -374,40 +568,61 @@ class BaseAudioPresenceSimulator:
                 "routine_type": routine_type,
                 "floor": self.floor,
                 "device_id": self.device_id,
-                "timestamp": datetime.now().isoformat()
+                "timestamp": datetime.now().isoformat(),
+                # Other floors answer at this instant of our clock (converted with FloorSync)
+                "respond_at": time.time() + random.randint(120, 300)
             }
             self.mqtt_client.publish(self.topics['coordination'], json.dumps(coord_data))
 
-    def on_mqtt_disconnect(self, client, userdata, rc):
-        """Handle MQTT disconnection"""
+    def publish_sync(self, message, to=None):
+        """FloorSync transport: broadcast on home/audio/sync or to one floor's sync topic"""
+        if self.mqtt_client:
+            topic = self.topics['sync'] if to is None else f"{self.topics['sync']}/{to}"
+            self.mqtt_client.publish(topic, json.dumps(message))
+
+    def on_mqtt_disconnect(self, client, rc):
+        """Handle MQTT disconnection (the client reconnects by itself)"""
         print(f"📡 MQTT disconnected: {rc}")
 
     def start_scheduler(self):
-        """Start the schedule system"""
-        schedule.clear()
-        
-        schedules_config = self.config.get('schedules', {})
-        for routine_name, routine_config in schedules_config.items():
-            if routine_config.get('enabled', True):
-                schedule_time = routine_config.get('time')
-                if schedule_time:
-                    schedule.every().day.at(schedule_time).do(
-                        lambda r=routine_name: threading.Thread(
-                            target=self.play_routine, args=(r,)
-                        ).start()
-                    )
-                    print(f"⏰ Scheduled {routine_name} at {schedule_time}")
+        """Start the routine scheduler (sleeps until the next routine or heartbeat)"""
+        self.scheduler = RoutineScheduler(on_routine=self.on_scheduled_routine, clock=self.schedule_clock,
+                                          seed=self.device_id, jitter_minutes=self.schedule_jitter)
+        self.scheduler.set_routines(self.schedules)
         
         # Heartbeat every 5 minutes
-        schedule.every(5).minutes.do(self.publish_heartbeat)
+        self.scheduler.every('heartbeat', SCHEDULER_CONFIG['heartbeat'], self.publish_heartbeat)
+        self.scheduler.every('sync', self.config.get('sync_interval', SYNC_CONFIG['interval']), self.sync.ping)
+        self.scheduler.watch(self.schedule_file, self.reload_schedules)
+        self.scheduler.start()
         
-        def schedule_runner():
-            while self.running:
-                schedule.run_pending()
-                time.sleep(30)
-                
-        threading.Thread(target=schedule_runner, daemon=True).start()
+        for event in self.scheduler.next_routines(len(self.schedules)):
+            print(f"⏰ Scheduled {event['routine']} at {event['time']}")
         print("⏰ Schedule system started")
+        self.publish_schedule()
+
+    def on_scheduled_routine(self, routine_type):
+        """Routine due: queue it and publish the updated plan"""
+        self.submit_routine(routine_type)
+        self.publish_schedule()
+
+    def reload_schedules(self, path=None):
+        """audio_schedule.json changed: only edited routines are rescheduled"""
+        self.schedules, self.schedule_jitter = self.load_schedules()
+        self.scheduler.set_routines(self.schedules, jitter_minutes=self.schedule_jitter)
+        self.publish_schedule()
+
+    def publish_schedule(self, count=5):
+        """Publish the next planned routines (retained)"""
+        if self.mqtt_client and self.scheduler:
+            schedule_data = {
+                "device_id": self.device_id,
+                "floor": self.floor,
+                "timestamp": datetime.now().isoformat(),
+                "jitter_minutes": self.scheduler.jitter_minutes,
+                "next": self.scheduler.next_routines(count)
+            }
+            self.mqtt_client.publish(self.topics['schedule'], json.dumps(schedule_data), retain=True)
 
     def publish_heartbeat(self):
         """Publish heartbeat"""
@@ -419,28 +634,71 @@ class BaseAudioPresenceSimulator:
                 "status": "alive",
                 "uptime": time.time() - self.start_time,
                 "mode": self.presence_mode,
-                "is_playing": self.is_playing
+                "is_playing": self.is_playing,
+                "sound_cache": self.sound_cache.stats(),
+                "playback": self.playback.stats(),
+                "ambience": self.ambience.stats() if self.ambience is not None else None,
+                "tasks": self.tasks.stats(),
+                "library": self.manifest.stats(),
+                "transcode": self.transcoder.stats(),
+                "sync": self.sync.stats()
             }
             self.mqtt_client.publish(self.topics['heartbeat'], json.dumps(heartbeat_data))
 
-    def run(self):
-        """Main run loop"""
+    def start(self):
+        """Start playback, tasks, MQTT and the scheduler; returns False if MQTT cannot start"""
         self.start_time = time.time()
         
         print(f"🎵 HomeGuard Audio System - {self.floor_name}")
         print("=" * 50)
         
+        self.playback.start()
+        if self.ambience is not None:
+            self.ambience.start()
+        self.tasks.start()
         if not self.connect_mqtt():
             print("❌ Failed to connect to MQTT broker")
             return False
             
         self.start_scheduler()
+        urgent = self.warm_up_files()
+        library = [f for files in self.audio_categories.values() for f in files]
+        self.prepare_sounds(urgent + library, warm=urgent)
+        if self.config.get('watch_audio', True):
+            self.manifest.watch(self.on_audio_library_change)
         
         print(f"✅ {self.floor_name} audio system running...")
         print("📡 MQTT Topics:")
         for name, topic in self.topics.items():
             print(f"   {name}: {topic}")
         print("=" * 50)
+        return True
+
+    def shutdown(self):
+        """Stop every thread of the simulator and go OFFLINE"""
+        self.running = False
+        
+        self.publish_status("OFFLINE")
+        self.sound_cache.stop()
+        self.manifest.stop()
+        self.transcoder.stop()
+        if self.scheduler:
+            self.scheduler.stop()
+        self.tasks.stop()
+        if self.ambience is not None:
+            self.ambience.shutdown()
+        self.playback.shutdown()
+        
+        if self.mqtt_client:
+            self.mqtt_client.stop(drain=False)
+            print(f"📡 MQTT: {self.mqtt_client.format_stats()}")
+            
+        print(f"✅ {self.floor_name} audio system stopped")
+
+    def run(self):
+        """Main run loop"""
+        if not self.start():
+            return False
         
         try:
             while self.running:
@@ -448,14 +706,6 @@ class BaseAudioPresenceSimulator:
                 
         except KeyboardInterrupt:
             print(f"\n⏹️  Shutting down {self.floor_name} audio system...")
-            self.running = False
-            
-            self.publish_status("OFFLINE")
+            self.shutdown()
             pygame.mixer.quit()
-            
-            if self.mqtt_client:
-                self.mqtt_client.loop_stop()
-                self.mqtt_client.disconnect()
-                
-            print(f"✅ {self.floor_name} audio system stopped")
             return True
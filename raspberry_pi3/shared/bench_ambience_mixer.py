@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Audio - Ambience Mixer Benchmark
+Real-time factor of the NumPy soundscape renderer (render time / audio time)
+
+RTF 0.05 means one second of ambience costs 50 ms of CPU; the Pi 3 stays
+comfortable well below 0.25. By default the sources are synthetic (no audio
+files or sound card needed); --audio-path mixes the real library from the
+transcoded WAVs (run transcode_cache.py first).
+
+Usage:
+    python3 bench_ambience_mixer.py
+    python3 bench_ambience_mixer.py --seconds 600 --events 6
+    python3 bench_ambience_mixer.py --audio-path ../ground/audio_files --scene tv_evening
+"""
+
+import argparse
+import os
+import random
+import time
+
+import numpy as np
+
+from ambience_mixer import AmbienceMixer, Soundscape, AMBIENCE_CONFIG, SCENES, wav_pcm
+
+
+def synthetic_library(rng, rate):
+    """Noise 'TV' beds of 2-3 min and 0.5-4 s event clips, as int16 stereo"""
+    library = {}
+
+    def clip(seconds, level):
+        frames = int(seconds * rate)
+        return (np.clip(rng.standard_normal((frames, 2)) * level, -1, 1) * 32767).astype('<i2')
+
+    library['tv_radio'] = {f"tv{i}.wav": clip(120 + 30 * i, 0.2) for i in range(3)}
+    library['background'] = {"hum.wav": clip(30, 0.05)}
+    for category in ('footsteps', 'doors', 'dogs'):
+        library[category] = {f"{category}{i}.wav": clip(0.5 + 0.7 * i, 0.4) for i in range(5)}
+    return library
+
+
+def real_library(audio_path, rate):
+    """Library files with a mixer-format WAV (transcoded or original), memory-mapped"""
+    from audio_manifest import AudioManifest
+    from transcode_cache import TranscodeCache
+
+    categories = sorted(name for name in os.listdir(audio_path)
+                        if not name.startswith('.') and os.path.isdir(os.path.join(audio_path, name)))
+    manifest = AudioManifest(audio_path, categories)
+    manifest.open()
+    transcoder = TranscodeCache(manifest)
+    library = {}
+    for category in categories:
+        for path in manifest.files(category):
+            pcm = wav_pcm(transcoder.resolve(path), rate)
+            if pcm is not None:
+                library.setdefault(category, {})[path] = pcm
+    return library
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark do mixer de ambiente (NumPy)')
+    parser.add_argument('--seconds', type=float, default=300, help='Segundos de áudio renderizados')
+    parser.add_argument('--scene', default='tv_evening', choices=sorted(SCENES))
+    parser.add_argument('--events', type=int, default=0,
+                        help='Camadas extras de eventos densos (a cada 2-6 s) para estressar o mixer')
+    parser.add_argument('--scenes', type=int, default=1, help='Cenas simultâneas (transição)')
+    parser.add_argument('--chunk', type=float, default=AMBIENCE_CONFIG['chunk_seconds'])
+    parser.add_argument('--audio-path', help='Biblioteca real (WAVs transcodificados) em vez de sons sintéticos')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rate = AMBIENCE_CONFIG['sample_rate']
+    rng = np.random.default_rng(args.seed)
+    library = real_library(args.audio_path, rate) if args.audio_path else synthetic_library(rng, rate)
+    pcm = {path: data for files in library.values() for path, data in files.items()}
+
+    mixer = AmbienceMixer(files=lambda category: list(library.get(category, {})),
+                          pcm_loader=pcm.get, chunk_seconds=args.chunk, seed=args.seed)
+    layers = list(SCENES[args.scene])
+    event_categories = [c for c in ('footsteps', 'doors', 'dogs') if library.get(c)]
+    for i in range(args.events):
+        layers.append({'category': event_categories[i % len(event_categories)], 'mode': 'events',
+                       'every': [2, 6], 'gain': [0.3, 0.6]})
+    # Cenas sem duração: todas ativas durante o teste (play() faria as anteriores saírem em crossfade)
+    for i in range(args.scenes):
+        mixer.scenes.append(Soundscape(f"scene{i}", layers, mixer.files, mixer.pcm_loader,
+                                       rng=random.Random(args.seed + i)))
+
+    chunks = int(args.seconds / args.chunk)
+    times = []
+    for _ in range(chunks):
+        started = time.perf_counter()
+        mixer.render_chunk()
+        times.append(time.perf_counter() - started)
+
+    audio_seconds = chunks * mixer.chunk_frames / rate
+    render_seconds = sum(times)
+    times_ms = np.array(times) * 1000
+    stats = mixer.stats()
+    print(f"🎛️  Ambience mixer: {len(layers)} layers x {args.scenes} scene(s), "
+          f"{audio_seconds:.0f} s of {rate} Hz stereo in {args.chunk * 1000:.0f} ms blocks")
+    print(f"   fontes:          {'biblioteca ' + args.audio_path if args.audio_path else 'sintéticas'} "
+          f"({sum(len(f) for f in library.values())} arquivos)")
+    print(f"   render:          {render_seconds:.3f} s")
+    print(f"   RTF:             {render_seconds / audio_seconds:.4f}  "
+          f"({audio_seconds / render_seconds:.0f}x mais rápido que o tempo real)")
+    print(f"   bloco:           média {times_ms.mean():.2f} ms, p99 {np.percentile(times_ms, 99):.2f} ms, "
+          f"máx {times_ms.max():.2f} ms (orçamento {args.chunk * 1000:.0f} ms)")
+    print(f"   vozes máx:       {stats['voices_max']}, amostras clipadas: {stats['clipped']}")
+
+
+if __name__ == '__main__':
+    main()
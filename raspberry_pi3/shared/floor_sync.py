@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Audio - Floor Sync
+NTP-style clock offset/latency between floors over MQTT and joint events at agreed times
+
+The floors coordinated with a fire-and-forget ROUTINE_START message and a
+random 2-5 minute delay: nobody knew how far apart the two clocks were or how
+long a message took. FloorSync measures it with the NTP exchange:
+
+    A: PING  {t1}                    (A's clock when sent)
+    B: PONG  {t1, t2, t3}            (B's clock when received / when replied)
+    A: receives at t4                (A's clock)
+       offset = ((t2 - t1) + (t3 - t4)) / 2      peer clock - local clock
+       delay  = (t4 - t1) - (t3 - t2)            round trip on the network
+
+PINGs are broadcast every `interval` seconds, so each floor keeps the last
+`window` samples of every other floor and uses the one with the smallest
+round trip (the least disturbed by queueing), as NTP's clock filter does.
+The error of that offset is at most half its round trip (asymmetric paths).
+The Pis have no RTC and may run for hours without NTP, so the drift between
+the clocks (slope of the offsets over the window) carries that sample to now.
+
+Joint events are steps of several floors at absolute times in the clock of
+the floor that announces them (footsteps crossing the ground floor and then
+going up the stairs):
+
+    sync.announce('footsteps_upstairs', JOINT_EVENTS['footsteps_upstairs'], lead=5)
+
+Each floor converts the times of its own steps to its clock and plays them;
+when a step has played, its real start is reported back and the announcing
+floor records the achieved sync error (in its clock, +/- the round-trip bound).
+
+The class does no I/O: send(message, to) publishes (to=None: every floor) and
+receive(message, received_at) is fed with the arrival timestamp, so
+floor_sync_harness.py runs two floors offline with skewed clocks.
+"""
+
+import itertools
+import statistics
+import threading
+import time
+from collections import OrderedDict, deque
+
+SYNC_CONFIG = {
+    'interval': 30,      # s entre rodadas de PING
+    'window': 8,         # amostras guardadas por andar (usa a de menor atraso)
+    'max_age': 900,      # s: amostras mais antigas não valem (deriva dos relógios)
+    'lead': 5.0,         # s entre o anúncio de um evento conjunto e o primeiro passo
+    'history': 20,       # eventos conjuntos guardados para estatística
+    'min_skew_span': 120,  # s cobertos pelas amostras antes de estimar a deriva
+}
+
+# Passos de cada andar, em segundos a partir do início do evento
+JOINT_EVENTS = {
+    'footsteps_upstairs': [
+        {'floor': 'ground', 'category': 'footsteps', 'at': 0},
+        {'floor': 'first', 'category': 'footsteps', 'at': 8},
+    ],
+    'footsteps_downstairs': [
+        {'floor': 'first', 'category': 'footsteps', 'at': 0},
+        {'floor': 'first', 'category': 'doors', 'at': 4},
+        {'floor': 'ground', 'category': 'footsteps', 'at': 10},
+    ],
+    'coming_home': [
+        {'floor': 'ground', 'category': 'doors', 'at': 0},
+        {'floor': 'ground', 'category': 'dogs', 'at': 2},
+        {'floor': 'ground', 'category': 'footsteps', 'at': 5},
+        {'floor': 'first', 'category': 'footsteps', 'at': 18},
+        {'floor': 'first', 'category': 'doors', 'at': 24},
+    ],
+}
+
+
+class FloorSync:
+    """Clock offsets to the other floors and joint events scheduled on them"""
+
+    def __init__(self, node, send, clock=time.time, on_step=None,
+                 window=SYNC_CONFIG['window'], max_age=SYNC_CONFIG['max_age'],
+                 history=SYNC_CONFIG['history']):
+        self.node = node
+        self.send = send               # send(message, to=None)
+        self.clock = clock
+        self.on_step = on_step         # on_step(event_id, index, step, local_at)
+        self.window = window
+        self.max_age = max_age
+        self.history = history
+        self.samples = {}              # peer -> deque of (offset, delay, local time)
+        self.pings = {}                # ping id -> t1 (respostas atrasadas são ignoradas)
+        self.events = OrderedDict()    # event id -> event (announced or received)
+        self.planned = {}              # (event id, index) -> (local time, synced)
+        self.lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.counts = {'pings': 0, 'pongs': 0, 'late_pongs': 0, 'announced': 0, 'joined': 0, 'reports': 0}
+
+    # ---------------------------------------------------------- clock sync
+
+    def ping(self):
+        """Broadcast a PING; every floor answers with its receive/send times"""
+        ping_id = f"{self.node}-{next(self._ids)}"
+        t1 = self.clock()
+        with self.lock:
+            self.pings[ping_id] = t1
+            while len(self.pings) > 4 * self.window:
+                self.pings.pop(next(iter(self.pings)))
+            self.counts['pings'] += 1
+        self.send({'type': 'PING', 'from': self.node, 'id': ping_id, 't1': t1})
+
+    def receive(self, message, received_at=None):
+        """Handle a sync message; received_at = local arrival time (taken as early as possible)"""
+        if not message or message.get('from') == self.node:
+            return
+        received_at = self.clock() if received_at is None else received_at
+        kind = message.get('type')
+        if kind == 'PING':
+            self.send({'type': 'PONG', 'from': self.node, 'id': message['id'], 't1': message['t1'],
+                       't2': received_at, 't3': self.clock()}, to=message['from'])
+        elif kind == 'PONG':
+            self._pong(message, received_at)
+        elif kind == 'JOINT':
+            self._joint(message)
+        elif kind == 'REPORT':
+            self._report(message)
+
+    def _pong(self, message, t4):
+        with self.lock:
+            t1 = self.pings.pop(message.get('id'), None)
+            if t1 is None or t1 != message['t1']:
+                self.counts['late_pongs'] += 1
+                return
+            t2, t3 = message['t2'], message['t3']
+            offset = ((t2 - t1) + (t3 - t4)) / 2
+            delay = max(0.0, (t4 - t1) - (t3 - t2))
+            samples = self.samples.setdefault(message['from'], deque(maxlen=self.window))
+            samples.append((offset, delay, t4))
+            self.counts['pongs'] += 1
+
+    def estimate(self, peer, at=None):
+        """{offset, rtt, bound, skew, samples, jitter} for peer at local time `at`, or None
+
+        offset = clock of peer - local clock; skew = drift between them (s/s).
+        """
+        now = self.clock()
+        with self.lock:
+            samples = [s for s in self.samples.get(peer, ()) if now - s[2] <= self.max_age]
+        if not samples:
+            return None
+        offset, delay, measured = min(samples, key=lambda s: s[1])
+        skew = self._skew(samples)
+        return {
+            'offset': offset + skew * ((now if at is None else at) - measured),
+            'rtt': delay,
+            'bound': delay / 2,   # erro máximo do offset (caminhos assimétricos)
+            'skew': skew,
+            'samples': len(samples),
+            'jitter': statistics.pstdev([s[0] for s in samples]) if len(samples) > 1 else 0.0,
+        }
+
+    @staticmethod
+    def _skew(samples):
+        """Least-squares slope of offset over time (0 while the window is too short)"""
+        times = [s[2] for s in samples]
+        if len(samples) < 4 or max(times) - min(times) < SYNC_CONFIG['min_skew_span']:
+            return 0.0
+        mean_t = statistics.mean(times)
+        mean_o = statistics.mean(s[0] for s in samples)
+        return (sum((s[2] - mean_t) * (s[0] - mean_o) for s in samples)
+                / sum((t - mean_t) ** 2 for t in times))
+
+    @property
+    def peers(self):
+        with self.lock:
+            return sorted(self.samples)
+
+    def to_local(self, peer, peer_time):
+        """Local time of an instant given in peer's clock (unchanged while not synced)"""
+        estimate = self.estimate(peer, at=peer_time)
+        return peer_time - estimate['offset'] if estimate else peer_time
+
+    def to_peer(self, peer, local_time):
+        estimate = self.estimate(peer, at=local_time)
+        return local_time + estimate['offset'] if estimate else local_time
+
+    # -------------------------------------------------------- joint events
+
+    def announce(self, name, steps, lead=SYNC_CONFIG['lead']):
+        """Schedule a joint event `lead` seconds from now on every floor; returns its id"""
+        at = self.clock() + lead
+        event_id = f"{self.node}-{name}-{next(self._ids)}"
+        event = {'id': event_id, 'name': name, 'from': self.node, 'at': at, 'steps': steps}
+        self._remember(event)
+        with self.lock:
+            self.counts['announced'] += 1
+        self.send(dict(event, type='JOINT'))
+        for index, step in enumerate(steps):
+            if step['floor'] == self.node:
+                self._plan(event_id, index, step, at + step['at'], synced=True)
+        return event_id
+
+    def _joint(self, message):
+        event = {key: message[key] for key in ('id', 'name', 'from', 'at', 'steps')}
+        self._remember(event)
+        with self.lock:
+            self.counts['joined'] += 1
+        synced = self.estimate(event['from']) is not None
+        for index, step in enumerate(event['steps']):
+            if step['floor'] == self.node:
+                self._plan(event['id'], index, step, self.to_local(event['from'], event['at'] + step['at']), synced)
+
+    def _remember(self, event):
+        event['results'] = {}
+        with self.lock:
+            self.events[event['id']] = event
+            while len(self.events) > self.history:
+                old_id, _ = self.events.popitem(last=False)
+                for key in [k for k in self.planned if k[0] == old_id]:
+                    del self.planned[key]
+
+    def _plan(self, event_id, index, step, local_at, synced):
+        with self.lock:
+            self.planned[(event_id, index)] = (local_at, synced)
+        if self.on_step is not None:
+            self.on_step(event_id, index, step, local_at)
+
+    def step_started(self, event_id, index, started_at):
+        """A step began playing at started_at (local clock): record or report its sync error"""
+        with self.lock:
+            planned = self.planned.pop((event_id, index), None)
+            event = self.events.get(event_id)
+        if planned is None or event is None:
+            return
+        local_at, synced = planned
+        if event['from'] == self.node:
+            self._record(event, index, started_at - local_at, 0.0, True)
+        else:
+            self.send({'type': 'REPORT', 'from': self.node, 'id': event_id, 'index': index,
+                       'started': started_at, 'late': started_at - local_at, 'synced': synced},
+                      to=event['from'])
+
+    def _report(self, message):
+        with self.lock:
+            event = self.events.get(message.get('id'))
+            self.counts['reports'] += 1
+        if event is None or event['from'] != self.node:
+            return
+        index = message['index']
+        planned = event['at'] + event['steps'][index]['at']
+        estimate = self.estimate(message['from'])
+        started = self.to_local(message['from'], message['started'])
+        self._record(event, index, started - planned, estimate['bound'] if estimate else None,
+                     message.get('synced', False))
+
+    def _record(self, event, index, error, bound, synced):
+        step = event['steps'][index]
+        event['results'][index] = {'floor': step['floor'], 'error': error, 'bound': bound, 'synced': synced}
+        bound_text = f" ±{bound * 1000:.1f}" if bound else ''
+        print(f"⏱️  Joint '{event['name']}' step {index} ({step['floor']}): "
+              f"{error * 1000:+.1f}{bound_text} ms{'' if synced else ' (unsynced)'}")
+
+    # --------------------------------------------------------------- stats
+
+    def sync_errors(self, remote_only=False):
+        """Achieved errors (s) of the steps of the events this floor announced"""
+        with self.lock:
+            events = list(self.events.values())
+        return [result['error'] for event in events if event['from'] == self.node
+                for result in event['results'].values()
+                if not remote_only or result['floor'] != self.node]
+
+    def stats(self):
+        peers = {}
+        for peer in self.peers:
+            estimate = self.estimate(peer)
+            if estimate:
+                peers[peer] = {'offset_ms': round(estimate['offset'] * 1000, 1),
+                               'rtt_ms': round(estimate['rtt'] * 1000, 1),
+                               'jitter_ms': round(estimate['jitter'] * 1000, 1),
+                               'skew_ppm': round(estimate['skew'] * 1e6, 1),
+                               'samples': estimate['samples']}
+        errors = [abs(error) * 1000 for error in self.sync_errors()]
+        with self.lock:
+            counts = dict(self.counts)
+        return dict(counts, peers=peers,
+                    steps_measured=len(errors),
+                    error_avg_ms=round(statistics.mean(errors), 1) if errors else None,
+                    error_max_ms=round(max(errors), 1) if errors else None)
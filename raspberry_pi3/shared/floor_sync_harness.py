@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Audio - Floor Sync Harness
+Two floors running FloorSync offline over a simulated MQTT link
+
+Discrete-event simulation on a true timeline: each floor has its own clock
+(offset + drift), messages take a base latency + jitter (optionally asymmetric
+and with losses) and each step starts after a random audio-engine delay.
+Since the true time of every start is known, the harness compares:
+
+    estimated offset   vs  true offset of the clocks
+    estimated error    (what the announcing floor records from the REPORTs)
+    true error         (difference of the true start times of the steps)
+    without sync       (the same events with no PING: clocks assumed equal)
+
+Usage:
+    python3 floor_sync_harness.py
+    python3 floor_sync_harness.py --offset-ms 800 --drift-ppm 50 --jitter-ms 40 --loss 0.05
+    python3 floor_sync_harness.py --asymmetry-ms 30   # limite do NTP: erro ~ assimetria / 2
+"""
+
+import argparse
+import contextlib
+import heapq
+import io
+import itertools
+import random
+import statistics
+
+from floor_sync import FloorSync, JOINT_EVENTS, SYNC_CONFIG
+
+
+class SimulatedLink:
+    """Event queue on the true timeline and an MQTT-like link between floors"""
+
+    def __init__(self, rng, latency, jitter, asymmetry, loss):
+        self.rng = rng
+        self.latency = latency
+        self.jitter = jitter
+        self.asymmetry = asymmetry
+        self.loss = loss
+        self.now = 0.0
+        self.queue = []
+        self._seq = itertools.count()
+        self.nodes = {}
+        self.sent = self.lost = 0
+
+    def at(self, when, action):
+        heapq.heappush(self.queue, (when, next(self._seq), action))
+
+    def run_until(self, end):
+        while self.queue and self.queue[0][0] <= end:
+            self.now, _, action = heapq.heappop(self.queue)
+            action()
+        self.now = end
+
+    def delay(self, sender):
+        # Broker no térreo: o primeiro andar tem o caminho mais longo num sentido
+        extra = self.asymmetry if sender == 'first' else 0.0
+        return self.latency / 2 + extra + self.rng.expovariate(1 / self.jitter) if self.jitter else self.latency / 2 + extra
+
+    def send(self, sender, message, to=None):
+        for name, node in self.nodes.items():
+            if name == sender or (to is not None and name != to):
+                continue
+            self.sent += 1
+            if self.rng.random() < self.loss:
+                self.lost += 1
+                continue
+            # Mensagem serializada no envio, como no MQTT
+            payload = dict(message)
+            self.at(self.now + self.delay(sender), lambda node=node, payload=payload: node.deliver(payload))
+
+
+class SimulatedFloor:
+    """A floor: skewed clock, FloorSync and an audio engine with start jitter"""
+
+    def __init__(self, name, link, offset, drift, engine_delay, rng, history):
+        self.name = name
+        self.link = link
+        self.offset = offset
+        self.drift = drift
+        self.engine_delay = engine_delay
+        self.rng = rng
+        self.starts = {}       # (event id, index) -> true start time
+        self.sync = FloorSync(name, send=lambda message, to=None: link.send(name, message, to),
+                              clock=self.clock, on_step=self.on_step, history=history)
+        link.nodes[name] = self
+
+    def clock(self):
+        return self.local(self.link.now)
+
+    def local(self, true_time):
+        return true_time + self.offset + self.drift * true_time
+
+    def true(self, local_time):
+        return (local_time - self.offset) / (1 + self.drift)
+
+    def deliver(self, message):
+        self.sync.receive(message, self.clock())
+
+    def on_step(self, event_id, index, step, local_at):
+        start = max(self.link.now, self.true(local_at)) + self.rng.uniform(0, self.engine_delay)
+
+        def started():
+            self.starts[(event_id, index)] = self.link.now
+            self.sync.step_started(event_id, index, self.clock())
+
+        self.link.at(start, started)
+
+
+def simulate(args, synced):
+    rng = random.Random(args.seed)
+    link = SimulatedLink(rng, args.latency_ms / 1000, args.jitter_ms / 1000, args.asymmetry_ms / 1000, args.loss)
+    history = 2 * args.events
+    ground = SimulatedFloor('ground', link, 0.0, 0.0, args.engine_ms / 1000, rng, history)
+    first = SimulatedFloor('first', link, args.offset_ms / 1000, args.drift_ppm / 1e6, args.engine_ms / 1000, rng, history)
+    floors = (ground, first)
+
+    if synced:
+        for floor in floors:
+            phase = rng.uniform(0, args.interval)
+            for k in range(int(args.duration / args.interval) + 1):
+                link.at(phase + k * args.interval, floor.sync.ping)
+
+    names = sorted(JOINT_EVENTS)
+    announced = []
+    start = args.warmup
+    step = (args.duration - args.warmup) / max(1, args.events)
+    for k in range(args.events):
+        floor = floors[k % 2]
+        name = names[k % len(names)]
+        link.at(start + k * step, lambda floor=floor, name=name: announced.append(
+            (floor, floor.sync.announce(name, JOINT_EVENTS[name], lead=args.lead))))
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        link.run_until(args.duration + 120)
+
+    true_errors, estimated_errors = [], []
+    for origin, event_id in announced:
+        event = origin.sync.events.get(event_id)
+        if event is None:
+            continue
+        for index, result in event['results'].items():
+            if result['floor'] == origin.name:
+                continue
+            # Instante verdadeiro em que o relógio de quem anunciou marcava o passo
+            planned_true = origin.true(event['at'] + event['steps'][index]['at'])
+            remote = ground if result['floor'] == 'ground' else first
+            true_errors.append(remote.starts[(event_id, index)] - planned_true)
+            estimated_errors.append(result['error'])
+
+    estimate = ground.sync.estimate('first')
+    true_offset = first.local(link.now) - ground.local(link.now)
+    return {
+        'link': link, 'estimate': estimate, 'true_offset': true_offset,
+        'true_errors': true_errors, 'estimated_errors': estimated_errors,
+        'steps': sum(1 for origin, event_id in announced
+                     for s in JOINT_EVENTS[event_id.split('-')[1]] if s['floor'] != origin.name),
+    }
+
+
+def summary(errors):
+    values = [abs(e) * 1000 for e in errors]
+    if not values:
+        return 'sem medidas'
+    values.sort()
+    p95 = values[min(len(values) - 1, int(0.95 * len(values)))]
+    return f"média {statistics.mean(values):7.1f} ms   p95 {p95:7.1f} ms   máx {values[-1]:7.1f} ms"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulação offline da sincronização entre andares')
+    parser.add_argument('--offset-ms', type=float, default=350, help='Relógio do primeiro andar adiantado (ms)')
+    parser.add_argument('--drift-ppm', type=float, default=30, help='Deriva do relógio do primeiro andar (ppm)')
+    parser.add_argument('--latency-ms', type=float, default=12, help='Latência base ida e volta via broker (ms)')
+    parser.add_argument('--jitter-ms', type=float, default=15, help='Jitter médio (exponencial) por mensagem (ms)')
+    parser.add_argument('--asymmetry-ms', type=float, default=0, help='Atraso extra só no sentido primeiro -> térreo (ms)')
+    parser.add_argument('--loss', type=float, default=0.01, help='Fração de mensagens perdidas')
+    parser.add_argument('--engine-ms', type=float, default=8, help='Atraso máximo do motor de áudio ao iniciar (ms)')
+    parser.add_argument('--interval', type=float, default=SYNC_CONFIG['interval'], help='Segundos entre PINGs')
+    parser.add_argument('--events', type=int, default=40, help='Eventos conjuntos anunciados')
+    parser.add_argument('--lead', type=float, default=SYNC_CONFIG['lead'])
+    parser.add_argument('--duration', type=float, default=3600, help='Segundos simulados')
+    parser.add_argument('--warmup', type=float, default=120, help='Segundos de PING antes do primeiro evento')
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    synced = simulate(args, synced=True)
+    baseline = simulate(args, synced=False)
+    link = synced['link']
+    estimate = synced['estimate']
+
+    print(f"🔄 Floor sync: {args.duration:.0f} s simulados, PING a cada {args.interval:.0f} s, "
+          f"{args.events} eventos conjuntos")
+    print(f"   link:            {args.latency_ms:.0f} ms + jitter {args.jitter_ms:.0f} ms, "
+          f"assimetria {args.asymmetry_ms:.0f} ms, perdas {link.lost}/{link.sent}")
+    if estimate:
+        error = (estimate['offset'] - synced['true_offset']) * 1000
+        print(f"   offset:          estimado {estimate['offset'] * 1000:+.1f} ms, "
+              f"real {synced['true_offset'] * 1000:+.1f} ms (erro {error:+.1f}, limite ±{estimate['bound'] * 1000:.1f})")
+        print(f"   RTT:             {estimate['rtt'] * 1000:.1f} ms (menor de {estimate['samples']} amostras, "
+              f"jitter do offset {estimate['jitter'] * 1000:.1f} ms)")
+        print(f"   deriva:          estimada {estimate['skew'] * 1e6:+.1f} ppm, real {args.drift_ppm:+.1f} ppm")
+    else:
+        print("   offset:          sem estimativa (nenhum PONG)")
+    print(f"   passos remotos:  {len(synced['true_errors'])}/{synced['steps']} medidos")
+    print(f"   erro real:       {summary(synced['true_errors'])}")
+    print(f"   erro registrado: {summary(synced['estimated_errors'])}")
+    print(f"   sem sync:        {summary(baseline['true_errors'])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Audio - Playback Engine
+Non-blocking multi-channel playback on pygame mixer channels
+
+One thread owns the mixer. Everybody else only queues commands, so no MQTT
+handler or routine ever waits for a sound to end:
+
+    engine.play(path, volume, priority=MOTION, on_end=callback)   # returns a Playback
+    engine.play(path, delay=30, tag='routine:morning')            # scheduled start
+    engine.stop(tag='routine:morning')                            # playing + scheduled
+    engine.busy()                                                 # anything playing?
+
+Each sound gets its own mixer channel, so several categories play layered at
+once. When no channel is free, the least urgent playback is stopped for a
+more urgent one; an exclusive play (emergency alert) fades out everything
+less urgent, including the streamed music. Priorities: EMERGENCY < MOTION <
+ROUTINE < AMBIENCE (lower = more urgent).
+
+End of sound: a decoded Sound has a known length, so the engine sleeps on its
+command queue until the moment it must end and then confirms it with the
+channel; streamed files (mixer.music, length unknown) are checked every
+MUSIC_CHECK seconds while they play. The engine thread never decodes: a
+sound not yet in the cache is streamed while `prefetch` decodes it in the
+background, so the next play is a hit. on_end(playback) runs on the engine
+thread for every outcome (done, stopped, preempted, rejected) and must not
+block; it may queue the next play (routines chain this way).
+"""
+
+import heapq
+import itertools
+import queue
+import threading
+import time
+
+import pygame
+
+EMERGENCY, MOTION, ROUTINE, AMBIENCE = 0, 1, 2, 3
+PRIORITY_NAMES = {EMERGENCY: 'emergency', MOTION: 'motion', ROUTINE: 'routine', AMBIENCE: 'ambience'}
+
+PLAYBACK_CONFIG = {
+    'channels': 8,        # sons simultâneos (camadas)
+    'fadeout_ms': 300,    # sons interrompidos por uma emergência
+    'end_margin': 0.02,   # folga (s) após a duração do som antes de confirmar o fim
+}
+
+MUSIC_CHECK = 0.5   # s entre verificações de um arquivo em streaming
+
+
+class Playback:
+    """One requested sound: state, channel and completion callback"""
+
+    _ids = itertools.count(1)
+
+    __slots__ = ('id', 'path', 'volume', 'priority', 'tag', 'exclusive', 'on_end', 'state',
+                 'channel', 'sound', 'streamed', 'requested', 'started', 'ended', 'done')
+
+    def __init__(self, path, volume, priority, tag=None, exclusive=False, on_end=None):
+        self.id = next(self._ids)
+        self.path = str(path)
+        self.volume = volume
+        self.priority = priority
+        self.tag = tag
+        self.exclusive = exclusive
+        self.on_end = on_end
+        self.state = 'queued'     # queued, scheduled, playing, done, stopped, preempted, rejected
+        self.channel = None
+        self.sound = None
+        self.streamed = False
+        self.requested = time.time()
+        self.started = None
+        self.ended = None
+        self.done = threading.Event()
+
+    @property
+    def finished(self):
+        return self.done.is_set()
+
+    def __repr__(self):
+        return f"Playback({self.id}, {self.path!r}, {PRIORITY_NAMES.get(self.priority)}, {self.state})"
+
+
+class PlaybackEngine:
+    """Mixer owner thread: command queue in, end-of-sound callbacks out"""
+
+    def __init__(self, sound_cache, channels=PLAYBACK_CONFIG['channels'], on_event=None,
+                 fadeout_ms=PLAYBACK_CONFIG['fadeout_ms'], prefetch=None):
+        self.cache = sound_cache
+        self.prefetch = prefetch or self._decode_later   # fn(path): decode into the cache off this thread
+        self.channels = channels
+        self.fadeout_ms = fadeout_ms
+        self.on_event = on_event        # fn(event, playback) for logging/MQTT
+        self.commands = queue.Queue()
+        self.timers = []                # heap (when, seq, action, playback)
+        self._seq = itertools.count()
+        self.playing = {}               # playback id -> Playback (mixer channels + music)
+        self.scheduled = {}             # playback id -> Playback waiting for its delay
+        self.music = None               # Playback streamed through mixer.music
+        self.fading = []                # channels fading out after a preemption (reusable at once)
+        self.lock = threading.Lock()    # protects playing/scheduled for readers
+        self.thread = None
+
+        self.counts = {'played': 0, 'done': 0, 'stopped': 0, 'preempted': 0, 'rejected': 0, 'streamed': 0}
+        self.max_layers = 0
+        self.start_delay_total = 0.0
+
+    # ---------------------------------------------------------------- API
+
+    def start(self):
+        pygame.mixer.set_num_channels(self.channels)
+        self.thread = threading.Thread(target=self._run, name='audio-playback', daemon=True)
+        self.thread.start()
+
+    def play(self, path, volume=0.7, priority=ROUTINE, delay=0, tag=None, exclusive=False, on_end=None):
+        """Queue a sound; returns its Playback immediately"""
+        playback = Playback(path, volume, priority, tag, exclusive, on_end)
+        self.commands.put(('play', playback, delay))
+        return playback
+
+    def stop(self, tag=None, min_priority=None):
+        """Stop playing and scheduled sounds (all, one tag, or priority >= min_priority)"""
+        self.commands.put(('stop', tag, min_priority))
+
+    def shutdown(self, timeout=2.0):
+        if self.thread is not None:
+            self.commands.put(('quit',))
+            self.thread.join(timeout)
+            self.thread = None
+
+    def busy(self, max_priority=AMBIENCE):
+        """True while a sound at least as urgent as max_priority is playing"""
+        with self.lock:
+            return any(p.priority <= max_priority for p in self.playing.values())
+
+    def active(self):
+        with self.lock:
+            return sorted(self.playing.values(), key=lambda p: p.priority)
+
+    def stats(self):
+        with self.lock:
+            playing = list(self.playing.values())
+            scheduled = len(self.scheduled)
+        started = self.counts['played']
+        return dict(self.counts,
+                    playing=len(playing),
+                    scheduled=scheduled,
+                    layers_max=self.max_layers,
+                    start_delay_ms=round(self.start_delay_total / started * 1000, 2) if started else 0.0,
+                    active=[f"{PRIORITY_NAMES.get(p.priority)}:{p.path.rsplit('/', 1)[-1]}" for p in playing])
+
+    # -------------------------------------------------------------- thread
+
+    def _run(self):
+        while True:
+            timeout = None
+            if self.timers:
+                timeout = max(0.0, self.timers[0][0] - time.monotonic())
+            try:
+                command = self.commands.get(timeout=timeout)
+            except queue.Empty:
+                command = None
+            if command is not None:
+                if command[0] == 'quit':
+                    self._stop_matching(None, None, 'stopped')
+                    return
+                self._execute(command)
+            self._run_timers()
+
+    def _execute(self, command):
+        try:
+            if command[0] == 'play':
+                _, playback, delay = command
+                if delay > 0:
+                    playback.state = 'scheduled'
+                    with self.lock:
+                        self.scheduled[playback.id] = playback
+                    self._timer(delay, 'start', playback)
+                else:
+                    self._start_safely(playback)
+            elif command[0] == 'stop':
+                self._stop_matching(command[1], command[2], 'stopped')
+        except Exception as e:
+            print(f"❌ Playback engine error: {e}")
+
+    def _timer(self, delay, action, playback):
+        heapq.heappush(self.timers, (time.monotonic() + delay, next(self._seq), action, playback))
+
+    def _run_timers(self):
+        now = time.monotonic()
+        while self.timers and self.timers[0][0] <= now:
+            _, _, action, playback = heapq.heappop(self.timers)
+            try:
+                if action == 'start' and playback.state == 'scheduled':
+                    with self.lock:
+                        self.scheduled.pop(playback.id, None)
+                    self._start_safely(playback)
+                elif action == 'check' and playback.state == 'playing':
+                    self._check_end(playback)
+            except Exception as e:
+                print(f"❌ Playback engine error: {e}")
+
+    # ------------------------------------------------------------ playback
+
+    def _start_safely(self, playback):
+        try:
+            self._start(playback)
+        except Exception as e:
+            print(f"❌ Cannot play {playback.path}: {e}")
+            self._finish(playback, 'rejected')
+
+    def _start(self, playback):
+        if playback.exclusive:
+            self._stop_matching(None, playback.priority + 1, 'preempted', fade=True)
+
+        # Decoding here would hold up EMERGENCY plays and stops queued behind
+        # this one: a cache miss streams now and is decoded for the next play
+        sound = self.cache.peek(playback.path)
+        if sound is None and not self.cache.streams(playback.path):
+            self.prefetch(playback.path)
+        if sound is not None:
+            channel = (pygame.mixer.find_channel(False) or self._fading_channel()
+                       or self._steal_channel(playback.priority))
+            if channel is None:
+                return self._finish(playback, 'rejected')
+            channel.play(sound)
+            channel.set_volume(playback.volume)
+            playback.channel, playback.sound = channel, sound
+            self._begin(playback)
+            self._timer(sound.get_length() + PLAYBACK_CONFIG['end_margin'], 'check', playback)
+            return
+
+        # Not cached yet, not decodable as Sound (m4a) or too large: stream it (one stream at a time)
+        current = self.music
+        if current is not None and current.state == 'playing':
+            if current.priority <= playback.priority:
+                return self._finish(playback, 'rejected')
+            pygame.mixer.music.stop()
+            self._finish(current, 'preempted')
+        pygame.mixer.music.load(self.cache.resolve(playback.path))
+        pygame.mixer.music.set_volume(playback.volume)
+        pygame.mixer.music.play()
+        playback.streamed = True
+        self.music = playback
+        self.counts['streamed'] += 1
+        self._begin(playback)
+        self._timer(MUSIC_CHECK, 'check', playback)
+
+    def _decode_later(self, path):
+        threading.Thread(target=self.cache.get, args=(path,), name='sound-cache-decode', daemon=True).start()
+
+    def _begin(self, playback):
+        playback.state = 'playing'
+        playback.started = time.time()
+        with self.lock:
+            self.playing[playback.id] = playback
+            self.max_layers = max(self.max_layers, len(self.playing))
+        self.counts['played'] += 1
+        self.start_delay_total += max(0.0, playback.started - playback.requested)
+        self._emit('started', playback)
+
+    def _fading_channel(self):
+        """A channel still fading out a preempted sound, cut short for the new one"""
+        while self.fading:
+            channel = self.fading.pop()
+            if channel.get_busy() and not any(p.channel is channel for p in self.playing.values()):
+                channel.stop()
+                return channel
+        return None
+
+    def _steal_channel(self, priority):
+        """Channel of the least urgent playback less urgent than `priority`, or None"""
+        candidates = [p for p in self.playing.values()
+                      if p.channel is not None and p.priority > priority]
+        if not candidates:
+            return None
+        victim = max(candidates, key=lambda p: (p.priority, -p.started))
+        victim.channel.stop()
+        channel = victim.channel
+        self._finish(victim, 'preempted')
+        return channel
+
+    def _check_end(self, playback):
+        if playback.streamed:
+            busy = self.music is playback and pygame.mixer.music.get_busy()
+            if busy:
+                return self._timer(MUSIC_CHECK, 'check', playback)
+        elif playback.channel.get_busy() and playback.channel.get_sound() is playback.sound:
+            return self._timer(PLAYBACK_CONFIG['end_margin'], 'check', playback)
+        self._finish(playback, 'done')
+
+    def _stop_matching(self, tag, min_priority, state, fade=False):
+        with self.lock:
+            targets = [p for p in list(self.playing.values()) + list(self.scheduled.values())
+                       if (tag is None or p.tag == tag)
+                       and (min_priority is None or p.priority >= min_priority)]
+        for playback in targets:
+            if playback.state == 'playing':
+                if playback.streamed:
+                    pygame.mixer.music.fadeout(self.fadeout_ms) if fade else pygame.mixer.music.stop()
+                elif fade:
+                    playback.channel.fadeout(self.fadeout_ms)
+                    self.fading.append(playback.channel)
+                else:
+                    playback.channel.stop()
+            self._finish(playback, state)
+
+    def _finish(self, playback, state):
+        if playback.finished:
+            return
+        playback.state = state
+        playback.ended = time.time()
+        with self.lock:
+            self.playing.pop(playback.id, None)
+            self.scheduled.pop(playback.id, None)
+        if self.music is playback:
+            self.music = None
+        self.counts[state] += 1
+        playback.done.set()
+        self._emit(state, playback)
+        if playback.on_end is not None:
+            try:
+                playback.on_end(playback)
+            except Exception as e:
+                print(f"❌ Playback callback error: {e}")
+
+    def _emit(self, event, playback):
+        if self.on_event is not None:
+            try:
+                self.on_event(event, playback)
+            except Exception as e:
+                print(f"❌ Playback event error: {e}")
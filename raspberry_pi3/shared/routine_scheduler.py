@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Audio - Routine Scheduler
+Heap of the next start of every daily routine and periodic job, one sleeping thread
+
+Replaces the `schedule` polling loop (run_pending every 30 s): the thread
+sleeps until the earliest entry is due, fires it and pushes its following
+occurrence, so routines start on time and an idle Pi does not wake up.
+
+Routines use the audio config format ({time: "HH:MM", enabled, days, jitter}).
+Each day gets its own random offset of up to +/- jitter minutes, drawn from
+(seed, routine, date): the morning routine does not start at exactly 07:00
+every day, and the planned time shown by next_events() is the one that will
+really be used, even after a reload.
+
+    scheduler = RoutineScheduler(on_routine=self.submit_routine, seed=self.device_id)
+    scheduler.set_routines(self.schedules)
+    scheduler.every('heartbeat', 300, self.publish_heartbeat)
+    scheduler.watch('audio_schedule.json', self.reload_schedules)
+    scheduler.start()
+    scheduler.next_events(5)     # [{'name', 'kind', 'time', 'in_seconds'}]
+"""
+
+import heapq
+import itertools
+import os
+import random
+import sys
+import threading
+from datetime import datetime, timedelta
+
+try:
+    from schedule_engine import SystemClock
+except ImportError:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'python'))
+    from schedule_engine import SystemClock
+
+SCHEDULER_CONFIG = {
+    'jitter_minutes': 10,   # variação diária (+/-) do horário de cada rotina
+    'watch_interval': 10,   # s entre verificações de mudança do arquivo de rotinas
+    'heartbeat': 300,       # s entre heartbeats
+}
+
+ALL_DAYS = '1234567'
+
+
+def jitter_offset(seed, name, day, jitter_minutes):
+    """Seconds to shift `name` on `day`: stable for a given (seed, routine, date)"""
+    if not jitter_minutes:
+        return 0.0
+    rng = random.Random(f"{seed}:{name}:{day.isoformat()}")
+    return rng.uniform(-jitter_minutes, jitter_minutes) * 60
+
+
+def routine_start(routine, name, after, seed='', jitter_minutes=0):
+    """Epoch of the next start of a routine strictly after `after` (local time), or None"""
+    if not routine.get('enabled', True) or not routine.get('time'):
+        return None
+    hour, minute = map(int, routine['time'].split(':'))
+    days = str(routine.get('days', ALL_DAYS))
+    jitter = routine.get('jitter', jitter_minutes)
+    first_day = datetime.fromtimestamp(after).date() - timedelta(days=1)  # jitter may cross midnight
+    for offset in range(9):
+        day = first_day + timedelta(days=offset)
+        if str(day.isoweekday()) not in days:
+            continue
+        when = datetime(day.year, day.month, day.day, hour, minute).timestamp()
+        when += jitter_offset(seed, name, day, jitter)
+        if when > after:
+            return when
+    return None
+
+
+class RoutineScheduler:
+    """Sleeps until the next routine or periodic job and fires it"""
+
+    ROUTINE = 'routine'
+    PERIODIC = 'periodic'
+
+    def __init__(self, on_routine, clock=None, seed='', jitter_minutes=SCHEDULER_CONFIG['jitter_minutes']):
+        # on_routine(name): called on the scheduler thread, must only queue work
+        self.on_routine = on_routine
+        self.clock = clock or SystemClock()
+        self.seed = seed
+        self.jitter_minutes = jitter_minutes
+        self.routines = {}     # name -> routine config
+        self.periodic = {}     # name -> (interval, function)
+        self.versions = {}     # (kind, name) -> version of its valid heap entry
+        self.heap = []         # (when, seq, kind, name, version)
+        self.seq = itertools.count()
+        self.lock = threading.RLock()
+        self.wakeup = threading.Event()
+        self.running = False
+        self.thread = None
+        self.fired = 0
+        self.late_max = 0.0    # maior atraso observado ao disparar (s)
+
+    # ------------------------------------------------------------ entries
+
+    def set_routines(self, routines, jitter_minutes=None):
+        """Replace the routines; only the ones that changed get a new heap entry"""
+        with self.lock:
+            if jitter_minutes is not None and jitter_minutes != self.jitter_minutes:
+                self.jitter_minutes = jitter_minutes
+                self.routines = {}  # every planned time changes
+            for name in list(self.routines):
+                if name not in routines:
+                    del self.routines[name]
+                    self.versions.pop((self.ROUTINE, name), None)
+            for name, routine in routines.items():
+                if self.routines.get(name) != routine:
+                    self.routines[name] = dict(routine)
+                    self._push(self.ROUTINE, name, self._next_routine(name, self.clock.now()))
+        self.wakeup.set()
+
+    def every(self, name, interval, function):
+        """Run function() every `interval` seconds (first run after one interval)"""
+        with self.lock:
+            self.periodic[name] = (interval, function)
+            self._push(self.PERIODIC, name, self.clock.now() + interval)
+        self.wakeup.set()
+
+    def watch(self, path, on_change, interval=SCHEDULER_CONFIG['watch_interval']):
+        """Call on_change(path) when the file's mtime changes (checked every `interval` s)"""
+        state = {'mtime': self._mtime(path)}
+
+        def check():
+            mtime = self._mtime(path)
+            if mtime != state['mtime']:
+                state['mtime'] = mtime
+                print(f"🔄 {os.path.basename(path)} changed, reloading routines")
+                on_change(path)
+
+        self.every(f"watch:{path}", interval, check)
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _next_routine(self, name, after):
+        return routine_start(self.routines[name], name, after, self.seed, self.jitter_minutes)
+
+    def _push(self, kind, name, when):
+        version = self.versions.get((kind, name), 0) + 1
+        self.versions[(kind, name)] = version
+        if when is not None:
+            heapq.heappush(self.heap, (when, next(self.seq), kind, name, version))
+
+    def next_events(self, count=10):
+        """Upcoming routines and jobs, earliest first"""
+        now = self.clock.now()
+        with self.lock:
+            valid = [entry for entry in self.heap if self.versions.get((entry[2], entry[3])) == entry[4]]
+            upcoming = heapq.nsmallest(count, valid)
+        return [{'name': name, 'kind': kind,
+                 'time': datetime.fromtimestamp(when).isoformat(timespec='seconds'),
+                 'in_seconds': round(when - now)}
+                for when, _, kind, name, _ in upcoming]
+
+    def next_routines(self, count=5):
+        """Upcoming routine starts only (what is published over MQTT)"""
+        now = self.clock.now()
+        with self.lock:
+            valid = [entry for entry in self.heap
+                     if entry[2] == self.ROUTINE and self.versions.get((entry[2], entry[3])) == entry[4]]
+            upcoming = heapq.nsmallest(count, valid)
+        return [{'routine': name,
+                 'time': datetime.fromtimestamp(when).isoformat(timespec='seconds'),
+                 'in_seconds': round(when - now)}
+                for when, _, _, name, _ in upcoming]
+
+    # ------------------------------------------------------------- firing
+
+    def run_pending(self):
+        """Fire everything due now; returns the time of the next entry (or None)"""
+        while True:
+            with self.lock:
+                if not self.heap:
+                    return None
+                when, _, kind, name, version = self.heap[0]
+                if self.versions.get((kind, name)) != version:
+                    heapq.heappop(self.heap)  # changed or removed
+                    continue
+                now = self.clock.now()
+                if when > now:
+                    return when
+                heapq.heappop(self.heap)
+                if kind == self.ROUTINE:
+                    self._push(kind, name, self._next_routine(name, when))
+                    action = (self.on_routine, (name,))
+                else:
+                    interval, function = self.periodic[name]
+                    self._push(kind, name, max(when + interval, now))
+                    action = (function, ())
+                self.fired += 1
+                self.late_max = max(self.late_max, now - when)
+            try:
+                action[0](*action[1])
+            except Exception as e:
+                print(f"❌ Scheduled {kind} '{name}' failed: {e}")
+
+    def run(self):
+        """Fire entries until stop(); sleeps until the next one or a change"""
+        self.running = True
+        while self.running:
+            # Cleared before run_pending(): a change made while it runs still wakes the wait
+            self.wakeup.clear()
+            next_time = self.run_pending()
+            timeout = None if next_time is None else max(0.0, next_time - self.clock.now())
+            self.clock.wait(self.wakeup, timeout)
+
+    def run_until(self, end_time):
+        """Fast-forward a VirtualClock to end_time, firing everything on the way"""
+        while True:
+            next_time = self.run_pending()
+            if next_time is None or next_time > end_time:
+                self.clock.set(end_time)
+                return self.fired
+            self.clock.set(next_time)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name='audio-scheduler', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
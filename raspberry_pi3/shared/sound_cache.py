@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Audio - Sound Cache
+Decoded pygame.mixer.Sound buffers kept in memory with LRU eviction
+
+pygame.mixer.music.load() reads and decodes the file from the SD card on every
+play. SoundCache decodes each file once into a mixer Sound (raw PCM) and keeps
+it while it fits in the memory budget; the least recently played sounds are
+dropped first. Files that SDL_mixer cannot load as a Sound (m4a on most builds)
+or that are larger than max_file_mb are remembered and return None, so the
+caller streams them with mixer.music as before.
+
+warm(paths) decodes files in a background thread at startup (emergency and
+motion categories first, then the upcoming routines), never evicting what is
+already cached, so the first trigger is already a cache hit.
+
+Usage:
+    cache = SoundCache(budget_mb=64)
+    cache.warm(['audio_files/alerts/siren.wav', ...])
+    sound = cache.get(path)          # Sound, or None -> stream with mixer.music
+    sound = cache.peek(path)         # only if already decoded (mixer thread)
+    cache.stats()                    # hits, misses, hit_rate, bytes, evictions...
+
+Entries are keyed by the library path; `resolver` maps it to the file
+actually read (the transcoded WAV of transcode_cache.py when there is one).
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+
+SOUND_CACHE_CONFIG = {
+    'budget_mb': 64,      # PCM decodificado: 44.1 kHz, 16 bits, estéreo ≈ 10 MB por minuto
+    'max_file_mb': 16,    # arquivos maiores (TV/rádio longos) continuam em streaming
+}
+
+MB = 1024 * 1024
+
+
+def _pygame_loader(path):
+    import pygame
+    return pygame.mixer.Sound(path)
+
+
+def sound_bytes(sound):
+    """Memory used by a decoded Sound (length x mixer rate x sample size x channels)"""
+    try:
+        import pygame
+        frequency, sample_format, channels = pygame.mixer.get_init()
+        return int(sound.get_length() * frequency * channels * (abs(sample_format) // 8))
+    except Exception:
+        return len(sound.get_raw())
+
+
+class SoundCache:
+    """Size-bounded LRU of decoded sounds, keyed by file path"""
+
+    def __init__(self, budget_mb=SOUND_CACHE_CONFIG['budget_mb'],
+                 max_file_mb=SOUND_CACHE_CONFIG['max_file_mb'], loader=None, sizer=None, resolver=None):
+        self.budget = int(budget_mb * MB)
+        self.max_file = int(max_file_mb * MB)
+        self.loader = loader or _pygame_loader
+        self.sizer = sizer or sound_bytes
+        self.resolver = resolver or str   # path -> file actually read (transcoded WAV)
+        self.entries = OrderedDict()   # path -> (sound, bytes), mais recente no fim
+        self.stream_only = set()       # não decodificáveis ou grandes demais
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self._loading = {}             # path -> Event (evita decodificar o mesmo arquivo duas vezes)
+        self._warm_thread = None
+        self._stop = threading.Event()
+
+        self.hits = 0
+        self.misses = 0
+        self.streamed = 0
+        self.evictions = 0
+        self.warmed = 0
+        self.decode_seconds = 0.0
+
+    def resolve(self, path):
+        return self.resolver(path)
+
+    def __contains__(self, path):
+        return str(path) in self.entries
+
+    def peek(self, path):
+        """Decoded Sound for `path` if it is already cached, else None (never decodes)"""
+        path = str(path)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None:
+                return None
+            self.entries.move_to_end(path)
+            self.hits += 1
+            return entry[0]
+
+    def streams(self, path):
+        """True for files that always play through mixer.music (not decodable or too large)"""
+        return str(path) in self.stream_only
+
+    def get(self, path):
+        """Decoded Sound for `path` (decoding it on a miss), or None to stream it"""
+        path = str(path)
+        while True:
+            with self.lock:
+                entry = self.entries.get(path)
+                if entry is not None:
+                    self.entries.move_to_end(path)
+                    self.hits += 1
+                    return entry[0]
+                if path in self.stream_only:
+                    self.streamed += 1
+                    return None
+                pending = self._loading.get(path)
+                if pending is None:
+                    self.misses += 1
+                    self._loading[path] = threading.Event()
+                    break
+            pending.wait()  # outra thread está decodificando este arquivo
+
+        sound = self._decode(path)
+        with self.lock:
+            if sound is not None and not self._insert(path, sound, evict=True):
+                self.stream_only.add(path)
+            elif sound is None:
+                self.streamed += 1
+            self._loading.pop(path).set()
+        return sound
+
+    def _decode(self, path):
+        started = time.perf_counter()
+        try:
+            sound = self.loader(self.resolve(path))
+        except Exception as e:
+            print(f"⚠️  {os.path.basename(path)}: not decodable as Sound ({e}), streaming it")
+            with self.lock:
+                self.stream_only.add(path)
+            return None
+        finally:
+            self.decode_seconds += time.perf_counter() - started
+        return sound
+
+    def _insert(self, path, sound, evict):
+        """Add a decoded sound (lock held); False if it cannot be kept"""
+        size = self.sizer(sound)
+        if size > self.max_file or size > self.budget:
+            return False
+        if not evict and self.bytes + size > self.budget:
+            return False
+        while self.bytes + size > self.budget and self.entries:
+            _, (_, old_size) = self.entries.popitem(last=False)
+            self.bytes -= old_size
+            self.evictions += 1
+        self.entries[path] = (sound, size)
+        self.bytes += size
+        return True
+
+    # ------------------------------------------------------------- warm-up
+
+    def warm(self, paths, background=True):
+        """Decode `paths` in order while they fit the budget (never evicts)"""
+        paths = [str(p) for p in paths]
+        if not background:
+            return self._warm(paths)
+        self._stop.clear()
+        self._warm_thread = threading.Thread(target=self._warm, args=(paths,), name='sound-cache-warm',
+                                             daemon=True)
+        self._warm_thread.start()
+        return self._warm_thread
+
+    def _warm(self, paths):
+        started = time.perf_counter()
+        for path in dict.fromkeys(paths):
+            if self._stop.is_set():
+                break
+            with self.lock:
+                if path in self.entries or path in self.stream_only or path in self._loading:
+                    continue
+                if self.bytes >= self.budget:
+                    break
+                self._loading[path] = threading.Event()
+            sound = self._decode(path)
+            with self.lock:
+                if sound is not None:
+                    if self._insert(path, sound, evict=False):
+                        self.warmed += 1
+                    elif self.sizer(sound) > self.max_file:
+                        self.stream_only.add(path)
+                self._loading.pop(path).set()
+        print(f"🔥 Sound cache warmed: {self.warmed} sounds, {self.bytes / MB:.1f} MB "
+              f"in {time.perf_counter() - started:.1f}s")
+        return self.warmed
+
+    def stop(self):
+        self._stop.set()
+
+    def discard(self, paths):
+        """Forget decoded sounds of files that changed or were removed"""
+        with self.lock:
+            for path in map(str, paths):
+                entry = self.entries.pop(path, None)
+                if entry is not None:
+                    self.bytes -= entry[1]
+                self.stream_only.discard(path)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.stream_only.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses + self.streamed
+            return {
+                'sounds': len(self.entries),
+                'mb': round(self.bytes / MB, 1),
+                'budget_mb': round(self.budget / MB, 1),
+                'hits': self.hits,
+                'misses': self.misses,
+                'streamed': self.streamed,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'warmed': self.warmed,
+                'decode_seconds': round(self.decode_seconds, 2),
+            }
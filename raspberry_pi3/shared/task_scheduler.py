@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Audio - Task Scheduler
+Fixed worker pool with a priority queue, delayed tasks, deduplication and cancellation
+
+Every piece of work of the audio simulator (MQTT commands, motion/relay
+responses, emergencies, routines, delayed coordination responses) is a task:
+
+    tasks = TaskScheduler(workers=2)
+    tasks.submit(self.handle_emergency, kind, details, priority=EMERGENCY)
+    tasks.submit(self.play_coordinated_routine, 'morning', priority=COORDINATION,
+                 delay=180, key='routine:morning')
+    tasks.cancel(min_priority=ROUTINE)          # STOP: drop pending routines
+
+Ready tasks run most urgent first (emergency > motion > routine >
+coordination), FIFO within a priority. Delayed tasks wait in a heap and the
+workers sleep until the earliest one is due, so there are no Timer threads:
+the thread count is `workers`, whatever the load.
+
+Keyed tasks are deduplicated: while a task with the same key is pending, a
+new submission is merged into it (the earlier, then more urgent, of the two
+is kept), so repeated coordination messages queue a routine only once.
+At most `max_pending` tasks wait; when full, the least urgent pending task
+is dropped for a more urgent one.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+from playback_engine import EMERGENCY, MOTION, ROUTINE
+
+COORDINATION = 3
+TASK_PRIORITY_NAMES = {EMERGENCY: 'emergency', MOTION: 'motion', ROUTINE: 'routine', COORDINATION: 'coordination'}
+
+TASK_CONFIG = {
+    'workers': 2,        # threads fixos para todo o trabalho do simulador
+    'max_pending': 64,   # tarefas aguardando (prontas + atrasadas)
+}
+
+
+class Task:
+    """A queued call (cancelled through TaskScheduler.cancel until a worker starts it)"""
+
+    __slots__ = ('seq', 'function', 'args', 'priority', 'due', 'key', 'state')
+
+    def __init__(self, seq, function, args, priority, due, key):
+        self.seq = seq
+        self.function = function
+        self.args = args
+        self.priority = priority
+        self.due = due
+        self.key = key
+        self.state = 'pending'   # pending, running, done, failed, cancelled, dropped
+
+    @property
+    def name(self):
+        return self.key or getattr(self.function, '__name__', 'task')
+
+    def __repr__(self):
+        return f"Task({self.name}, {TASK_PRIORITY_NAMES.get(self.priority)}, {self.state})"
+
+
+class TaskScheduler:
+    """Bounded pool running tasks by priority, with delays, dedup and cancellation"""
+
+    def __init__(self, workers=TASK_CONFIG['workers'], max_pending=TASK_CONFIG['max_pending'],
+                 name='audio-task', clock=time.monotonic):
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.name = name
+        self.clock = clock
+        self.ready = []      # heap (priority, seq, task)
+        self.delayed = []    # heap (due, seq, task)
+        self.keys = {}       # key -> pending Task
+        self.pending = 0
+        self.running = 0
+        self.condition = threading.Condition()
+        self._seq = itertools.count()
+        self.threads = []
+        self.stopped = False
+
+        self.counts = {'submitted': 0, 'done': 0, 'failed': 0, 'cancelled': 0,
+                       'deduplicated': 0, 'dropped': 0}
+        self.max_queue = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def start(self):
+        if not self.threads:
+            self.stopped = False
+            self.threads = [threading.Thread(target=self._worker, name=f'{self.name}-{i}', daemon=True)
+                            for i in range(self.workers)]
+            for thread in self.threads:
+                thread.start()
+
+    def stop(self, timeout=2.0):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        for thread in self.threads:
+            thread.join(timeout)
+        self.threads = []
+
+    # ---------------------------------------------------------------- API
+
+    def submit(self, function, *args, priority=ROUTINE, delay=0, key=None):
+        """Queue function(*args); returns its Task (the pending one if `key` was already queued)"""
+        with self.condition:
+            due = self.clock() + max(0, delay)
+            existing = self.keys.get(key) if key is not None else None
+            if existing is not None and existing.state == 'pending':
+                self.counts['deduplicated'] += 1
+                if (due, priority) >= (existing.due, existing.priority):
+                    return existing
+                self._discard(existing, 'cancelled')
+
+            task = Task(next(self._seq), function, args, priority, due, key)
+            if self.pending >= self.max_pending and not self._make_room(priority):
+                task.state = 'dropped'
+                self.counts['dropped'] += 1
+                print(f"⚠️  Task queue full, dropped {task.name}")
+                return task
+
+            if delay > 0:
+                heapq.heappush(self.delayed, (due, task.seq, task))
+            else:
+                heapq.heappush(self.ready, (priority, task.seq, task))
+            if key is not None:
+                self.keys[key] = task
+            self.pending += 1
+            self.counts['submitted'] += 1
+            self.max_queue = max(self.max_queue, self.pending)
+            self.condition.notify()
+            return task
+
+    def cancel(self, key=None, min_priority=None):
+        """Cancel pending tasks by key, or all with priority >= min_priority; returns how many"""
+        with self.condition:
+            if key is not None:
+                task = self.keys.get(key)
+                targets = [task] if task is not None and task.state == 'pending' else []
+            else:
+                targets = [task for _, _, task in self.ready + self.delayed
+                           if task.state == 'pending'
+                           and (min_priority is None or task.priority >= min_priority)]
+            for task in targets:
+                self._discard(task, 'cancelled')
+            return len(targets)
+
+    def is_pending(self, key):
+        with self.condition:
+            task = self.keys.get(key)
+            return task is not None and task.state == 'pending'
+
+    def stats(self):
+        with self.condition:
+            started = self.counts['done'] + self.counts['failed']
+            return dict(self.counts,
+                        workers=self.workers,
+                        threads=sum(1 for t in self.threads if t.is_alive()),
+                        pending=self.pending,
+                        delayed=sum(1 for _, _, t in self.delayed if t.state == 'pending'),
+                        running=self.running,
+                        max_queue=self.max_queue,
+                        wait_avg_ms=round(self.wait_total / started * 1000, 2) if started else 0.0,
+                        wait_max_ms=round(self.wait_max * 1000, 2))
+
+    # ------------------------------------------------------------ internals
+
+    def _discard(self, task, state):
+        """Take a pending task out (lock held); the heap entry is skipped lazily"""
+        task.state = state
+        self.pending -= 1
+        self.counts[state] += 1
+        if task.key is not None and self.keys.get(task.key) is task:
+            del self.keys[task.key]
+
+    def _make_room(self, priority):
+        """Drop the least urgent pending task if it is less urgent than `priority` (lock held)"""
+        candidates = [task for _, _, task in self.ready + self.delayed
+                      if task.state == 'pending' and task.priority > priority]
+        if not candidates:
+            return False
+        victim = max(candidates, key=lambda task: (task.priority, task.seq))
+        print(f"⚠️  Task queue full, dropped {victim.name}")
+        self._discard(victim, 'dropped')
+        return True
+
+    def _next_task(self):
+        """Most urgent due task, waiting for delayed ones (lock held); None on stop"""
+        while not self.stopped:
+            now = self.clock()
+            while self.delayed and self.delayed[0][0] <= now:
+                _, seq, task = heapq.heappop(self.delayed)
+                if task.state == 'pending':
+                    heapq.heappush(self.ready, (task.priority, seq, task))
+            while self.ready:
+                _, _, task = heapq.heappop(self.ready)
+                if task.state == 'pending':
+                    return task
+            timeout = None
+            if self.delayed:
+                timeout = max(0.0, self.delayed[0][0] - now)
+            self.condition.wait(timeout)
+        return None
+
+    def _worker(self):
+        while True:
+            with self.condition:
+                task = self._next_task()
+                if task is None:
+                    return
+                task.state = 'running'
+                self.pending -= 1
+                self.running += 1
+                if task.key is not None and self.keys.get(task.key) is task:
+                    del self.keys[task.key]
+                waited = max(0.0, self.clock() - task.due)
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+            try:
+                task.function(*task.args)
+                task.state = 'done'
+            except Exception as e:
+                task.state = 'failed'
+                print(f"❌ Task {task.name} failed: {e}")
+            with self.condition:
+                self.running -= 1
+                self.counts[task.state] += 1
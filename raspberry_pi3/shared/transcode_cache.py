@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Audio - Transcode Cache
+Each source converted once to mixer-native PCM WAV (44.1 kHz, 16 bits, stereo)
+
+The library mixes MP3/M4A/OGG/WAV files at several sample rates, so every
+decode pays for decompression plus resampling to the mixer format. This cache
+converts each source once into `<audio_path>/.pcm_cache/<sha1>.<variant>.wav`:
+a plain WAV already in the mixer format, which SDL only has to copy.
+
+The name is content-addressed (sha1 from the audio manifest): a renamed or
+duplicated file reuses the same WAV, a replaced file gets a new one, and
+variants no longer referenced by the manifest are removed by prune().
+
+Loudness: the RMS level of every source is measured once and a gain is baked
+into the WAV so all categories play at about `target_dbfs` (limited by
+`max_gain_db` and by the peak, so nothing clips). Needs numpy; without it the
+files are converted without normalization.
+
+Decoding: ffmpeg when installed (every format, m4a included), otherwise the
+pygame mixer itself (Sound.get_raw() is already PCM in the mixer format).
+The PCM goes through in chunks of `chunk_kb`: levels are measured while the
+WAV is written and the gain is applied in place afterwards, so memory does not
+grow with the length of the source. The pygame decoder holds the whole file,
+so without ffmpeg sources above `pygame_max_source_mb` are left to streaming.
+
+    transcoder = TranscodeCache(manifest)
+    cache = SoundCache(resolver=transcoder.resolve)
+    transcoder.enqueue(paths, on_ready=cache.discard)   # background, one file at a time
+    transcoder.resolve('audio_files/dogs/bark.mp3')     # cached WAV if ready, else the source
+
+Offline (before the first start, or after adding many files):
+    python3 transcode_cache.py audio_files
+"""
+
+import json
+import math
+import os
+import queue
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+TRANSCODE_CONFIG = {
+    'cache_dir': '.pcm_cache',   # dentro de audio_path
+    'frequency': 44100,          # mesmo formato do pygame.mixer.init()
+    'size': -16,
+    'channels': 2,
+    'normalize': True,
+    'target_dbfs': -20.0,        # nível RMS alvo
+    'max_gain_db': 12.0,         # não amplifica mais que isto (sons muito baixos)
+    'headroom_db': 1.0,          # pico máximo após o ganho, abaixo de 0 dBFS
+    'chunk_kb': 256,             # PCM processado por vez (nível, ganho, escrita)
+    'pygame_max_source_mb': 8,   # sem ffmpeg o PCM inteiro fica em memória: maiores continuam em streaming
+}
+
+INDEX_FILE = 'index.json'
+FULL_SCALE = 32768.0
+CHUNK_BYTES = TRANSCODE_CONFIG['chunk_kb'] * 1024
+
+
+def ffmpeg_decode(path, frequency, channels, chunk_size=CHUNK_BYTES):
+    """Raw s16le PCM of any file, resampled by ffmpeg, yielded in chunks"""
+    with tempfile.TemporaryFile() as errors:
+        process = subprocess.Popen(['ffmpeg', '-v', 'error', '-nostdin', '-i', path, '-f', 's16le',
+                                    '-acodec', 'pcm_s16le', '-ar', str(frequency), '-ac', str(channels), '-'],
+                                   stdout=subprocess.PIPE, stderr=errors)
+        finished = False
+        try:
+            for chunk in iter(lambda: process.stdout.read(chunk_size), b''):
+                yield chunk
+            finished = True
+        finally:
+            if not finished:
+                process.kill()
+            process.stdout.close()
+            process.wait()
+        if process.returncode != 0:
+            errors.seek(0)
+            raise RuntimeError(errors.read().decode(errors='replace').strip() or 'ffmpeg failed')
+
+
+def pygame_decode(path, frequency, channels, chunk_size=CHUNK_BYTES):
+    """Raw PCM through the mixer (must already be initialized in the target format)"""
+    import pygame
+    if pygame.mixer.get_init() != (frequency, -16, channels):
+        raise RuntimeError(f"mixer is {pygame.mixer.get_init()}, not ({frequency}, -16, {channels})")
+    size_mb = os.path.getsize(path) / (1024 * 1024)
+    if size_mb > TRANSCODE_CONFIG['pygame_max_source_mb']:
+        raise RuntimeError(f"{size_mb:.0f} MB: too large to decode in memory without ffmpeg, streaming it")
+    raw = pygame.mixer.Sound(path).get_raw()
+    for start in range(0, len(raw), chunk_size):
+        yield raw[start:start + chunk_size]
+
+
+class LevelMeter:
+    """RMS and peak of s16 PCM fed in chunks (needs numpy)"""
+
+    def __init__(self):
+        self.sum_squares = 0.0
+        self.samples = 0
+        self.peak = 0
+
+    def add(self, chunk):
+        if np is None or len(chunk) < 2:
+            return
+        samples = np.frombuffer(chunk, dtype='<i2', count=len(chunk) // 2).astype(np.float32)
+        self.sum_squares += float(np.dot(samples, samples))
+        self.samples += len(samples)
+        self.peak = max(self.peak, int(np.max(np.abs(samples))))
+
+    def levels(self):
+        """(rms_dbfs, peak_dbfs), or (None, None) without numpy/samples"""
+        if not self.samples:
+            return None, None
+        to_db = lambda value: round(20 * math.log10(value), 2) if value > 0 else -120.0  # noqa: E731
+        return to_db(math.sqrt(self.sum_squares / self.samples) / FULL_SCALE), to_db(self.peak / FULL_SCALE)
+
+
+def apply_gain(raw, gain_db):
+    if np is None or abs(gain_db) < 0.05:
+        return raw
+    samples = np.frombuffer(raw, dtype='<i2', count=len(raw) // 2).astype(np.float32)
+    samples *= 10 ** (gain_db / 20)
+    return np.clip(np.rint(samples), -32768, 32767).astype('<i2').tobytes()
+
+
+def apply_gain_in_place(path, data_bytes, gain_db, chunk_size=CHUNK_BYTES):
+    """Scale the PCM of a WAV written by the wave module (its data chunk is the last one)"""
+    with open(path, 'r+b') as f:
+        end = os.fstat(f.fileno()).st_size
+        position = end - data_bytes
+        while position < end:
+            f.seek(position)
+            chunk = f.read(min(chunk_size, end - position))
+            if not chunk:
+                break
+            f.seek(position)
+            f.write(apply_gain(chunk, gain_db))
+            position += len(chunk)
+
+
+class TranscodeCache:
+    """Content-addressed cache of mixer-format WAV files, filled by one background thread"""
+
+    def __init__(self, manifest, cache_dir=None, normalize=TRANSCODE_CONFIG['normalize'],
+                 target_dbfs=TRANSCODE_CONFIG['target_dbfs'], max_gain_db=TRANSCODE_CONFIG['max_gain_db'],
+                 frequency=TRANSCODE_CONFIG['frequency'], channels=TRANSCODE_CONFIG['channels']):
+        self.manifest = manifest
+        self.cache_dir = cache_dir or os.path.join(manifest.base_path, TRANSCODE_CONFIG['cache_dir'])
+        self.normalize = normalize and np is not None
+        self.target_dbfs = target_dbfs
+        self.max_gain_db = max_gain_db
+        self.frequency = frequency
+        self.channels = channels
+        self.decoder = ffmpeg_decode if shutil.which('ffmpeg') else pygame_decode
+        self.index = {}        # variant file name -> levels/gain/source
+        self.failed = {}       # sha1 -> {decoder, error}: not retried until the file or decoder changes
+        self.lock = threading.Lock()
+        self.jobs = queue.Queue()
+        self.thread = None
+        self.transcoded = 0
+        self.seconds = 0.0
+        if normalize and np is None:
+            print("⚠️  numpy not installed: transcoding without loudness normalization")
+        self._load_index()
+
+    # ------------------------------------------------------------ naming
+
+    @property
+    def variant(self):
+        """Suffix of the output format; a different format/target never reuses a file"""
+        suffix = f"{self.frequency}.s16.{self.channels}ch"
+        if self.normalize:
+            suffix += f".n{abs(self.target_dbfs):g}"
+        return suffix
+
+    def cached_name(self, path):
+        entry = self.manifest.entry(path)
+        if not entry or not entry.get('sha1'):
+            return None
+        return f"{entry['sha1']}.{self.variant}.wav"
+
+    def resolve(self, path):
+        """Cached WAV of `path` when it is ready, otherwise the source itself"""
+        name = self.cached_name(path)
+        with self.lock:
+            ready = name in self.index
+        return os.path.join(self.cache_dir, name) if ready else str(path)
+
+    # ------------------------------------------------------------- index
+
+    def _load_index(self):
+        try:
+            with open(os.path.join(self.cache_dir, INDEX_FILE), 'r') as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            data = {}
+        # Só vale o que ainda existe no disco
+        self.index = {name: info for name, info in data.get('files', {}).items()
+                      if os.path.exists(os.path.join(self.cache_dir, name))}
+        self.failed = {sha1: failure for sha1, failure in data.get('failed', {}).items()
+                       if failure.get('decoder') == self.decoder.__name__}
+
+    def _save_index(self):
+        with self.lock:
+            data = {'files': dict(self.index), 'failed': dict(self.failed)}
+        tmp_path = os.path.join(self.cache_dir, INDEX_FILE + '.tmp')
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(tmp_path, os.path.join(self.cache_dir, INDEX_FILE))
+        except OSError as e:
+            print(f"⚠️  Cannot save transcode index: {e}")
+
+    # ---------------------------------------------------------- transcoding
+
+    def pending(self, paths):
+        """Sources of `paths` that have no cached WAV yet"""
+        result = []
+        for path in dict.fromkeys(map(str, paths)):
+            name = self.cached_name(path)
+            entry = self.manifest.entry(path)
+            with self.lock:
+                if name and name not in self.index and entry['sha1'] not in self.failed:
+                    result.append(path)
+        return result
+
+    def transcode(self, path):
+        """Convert one source; returns the info stored in the index"""
+        name = self.cached_name(path)
+        started = time.perf_counter()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        target = os.path.join(self.cache_dir, name)
+        meter = LevelMeter()
+        data_bytes = 0
+        try:
+            with wave.open(target + '.tmp', 'wb') as w:
+                w.setnchannels(self.channels)
+                w.setsampwidth(2)
+                w.setframerate(self.frequency)
+                for chunk in self.decoder(str(path), self.frequency, self.channels):
+                    meter.add(chunk)
+                    w.writeframesraw(chunk)
+                    data_bytes += len(chunk)
+
+            rms_dbfs, peak_dbfs = meter.levels()
+            gain_db = 0.0
+            if self.normalize and rms_dbfs is not None and rms_dbfs > -90:
+                # O pico só limita o reforço: sons com picos altos nunca são atenuados por isso
+                peak_room = max(0.0, -TRANSCODE_CONFIG['headroom_db'] - peak_dbfs)
+                gain_db = min(self.target_dbfs - rms_dbfs, self.max_gain_db, peak_room)
+                gain_db = round(gain_db, 2)
+            if abs(gain_db) >= 0.05:
+                apply_gain_in_place(target + '.tmp', data_bytes, gain_db)
+            os.replace(target + '.tmp', target)
+        except BaseException:
+            try:
+                os.remove(target + '.tmp')
+            except OSError:
+                pass
+            raise
+
+        info = {'source': os.path.basename(str(path)), 'rms_dbfs': rms_dbfs, 'peak_dbfs': peak_dbfs,
+                'gain_db': gain_db, 'duration': round(data_bytes / (2 * self.channels * self.frequency), 3)}
+        with self.lock:
+            self.index[name] = info
+        self.transcoded += 1
+        self.seconds += time.perf_counter() - started
+        return info
+
+    def run(self, paths, on_ready=None):
+        """Transcode the pending `paths` in order; on_ready([path]) after each one"""
+        todo = self.pending(paths)
+        if not todo:
+            return 0
+        started = time.perf_counter()
+        done = 0
+        for path in todo:
+            if not self.pending([path]):
+                continue  # removido enquanto esperava, ou mesmo conteúdo já convertido
+            try:
+                info = self.transcode(path)
+            except Exception as e:
+                print(f"⚠️  Cannot transcode {os.path.basename(path)}: {e}")
+                with self.lock:
+                    self.failed[self.manifest.entry(path)['sha1']] = {'decoder': self.decoder.__name__,
+                                                                      'error': str(e)}
+                continue
+            done += 1
+            if info['gain_db']:
+                print(f"🎚️  {os.path.basename(path)}: {info['rms_dbfs']} dBFS RMS, {info['gain_db']:+} dB")
+            if on_ready is not None:
+                on_ready([path])
+        self._save_index()
+        if done:
+            print(f"🎚️  Transcoded {done} files to {self.frequency} Hz WAV "
+                  f"in {time.perf_counter() - started:.1f}s")
+        return done
+
+    def prune(self):
+        """Delete cached WAVs whose content is no longer in the library"""
+        with self.manifest.lock:
+            hashes = {e['sha1'] for e in self.manifest.entries.values() if e.get('sha1')}
+        wanted = {f"{sha1}.{self.variant}.wav" for sha1 in hashes}
+        with self.lock:
+            for sha1 in set(self.failed) - hashes:
+                del self.failed[sha1]
+        removed = 0
+        try:
+            names = os.listdir(self.cache_dir)
+        except FileNotFoundError:
+            return 0
+        for name in names:
+            if name.endswith('.wav') and name not in wanted:
+                try:
+                    os.remove(os.path.join(self.cache_dir, name))
+                    removed += 1
+                except OSError:
+                    pass
+                with self.lock:
+                    self.index.pop(name, None)
+        if removed:
+            self._save_index()
+        return removed
+
+    # ----------------------------------------------------------- background
+
+    def enqueue(self, paths, on_ready=None, on_done=None):
+        """Transcode `paths` on the background thread (started on first use)"""
+        self.jobs.put((list(paths), on_ready, on_done))
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._worker, name='audio-transcode', daemon=True)
+            self.thread.start()
+
+    def _worker(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            paths, on_ready, on_done = job
+            try:
+                self.run(paths, on_ready)
+                self.prune()
+                if on_done is not None:
+                    on_done()
+            except Exception as e:
+                print(f"❌ Transcode error: {e}")
+
+    def stop(self):
+        if self.thread is not None:
+            self.jobs.put(None)
+            self.thread = None
+
+    def stats(self):
+        with self.lock:
+            infos = list(self.index.values())
+        gains = [abs(i['gain_db']) for i in infos if i.get('gain_db') is not None]
+        return {
+            'files': len(infos),
+            'transcoded': self.transcoded,
+            'failed': len(self.failed),
+            'seconds': round(self.seconds, 1),
+            'normalize': self.normalize,
+            'gain_avg_db': round(sum(gains) / len(gains), 1) if gains else 0.0,
+        }
+
+
+def main():
+    """Offline run: transcode every category of an audio directory"""
+    import argparse
+    from audio_manifest import AudioManifest
+
+    parser = argparse.ArgumentParser(description='Transcode the audio library to mixer-native WAV')
+    parser.add_argument('audio_path', nargs='?', default='./audio_files')
+    parser.add_argument('--no-normalize', action='store_true', help='keep the original levels')
+    parser.add_argument('--target-dbfs', type=float, default=TRANSCODE_CONFIG['target_dbfs'])
+    args = parser.parse_args()
+
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')  # só decodifica, não toca
+    import pygame
+    pygame.mixer.init(frequency=TRANSCODE_CONFIG['frequency'], size=TRANSCODE_CONFIG['size'],
+                      channels=TRANSCODE_CONFIG['channels'])
+
+    categories = sorted(name for name in os.listdir(args.audio_path)
+                        if not name.startswith('.') and os.path.isdir(os.path.join(args.audio_path, name)))
+    manifest = AudioManifest(args.audio_path, categories)
+    manifest.open()
+    transcoder = TranscodeCache(manifest, normalize=not args.no_normalize, target_dbfs=args.target_dbfs)
+    paths = [path for category in categories for path in manifest.files(category)]
+    transcoder.run(paths)
+    transcoder.prune()
+    print(f"📊 {transcoder.stats()}")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,8 +6,14 @@ Ferramenta para consultar e gerenciar o banco de dados de sensores de movimento
 import os
 import sqlite3
 import argparse
+import sys
 from datetime import datetime, timedelta, timezone
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web'))
+from db_counters import table_count
+from motion_sessions import (SESSION_TABLE, ensure_session_tables, print_occupancy,
+                             rebuild_sessions, format_hour_of_week)
+
 DB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'db')
 DB_PATH = os.path.join(DB_DIR, 'homeguard.db')
 TABLE_NAME = 'motion_sensors'
@@ -56,9 +62,8 @@ def show_statistics():
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
         
-        # Total de registros
-        cursor.execute(f"SELECT COUNT(*) FROM {TABLE_NAME}")
-        total = cursor.fetchone()[0]
+        # Total de registros (contadores mantidos por triggers)
+        total = table_count(conn, TABLE_NAME)
         
         # Registros por sensor
         cursor.execute(f"""
@@ -123,6 +128,8 @@ def show_statistics():
             last_short = last[:10] if last else "N/A"
             print(f"{device_short:<20} {location_short:<15} {events:<8} {first_short:<12} {last_short:<12}")
         
+        show_occupancy(limit=5)
+        
     except Exception as e:
         print(f"❌ Erro ao consultar estatísticas: {e}")
 
@@ -195,6 +202,69 @@ def query_by_sensor(sensor_name, limit=50):
     except Exception as e:
         print(f"❌ Erro ao consultar sensor: {e}")
 
+def show_occupancy(limit=10):
+    """Mostra ocupação por cômodo, horários mais ocupados e transições"""
+    if not check_db_exists():
+        return
+    
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        ensure_session_tables(conn)
+        print_occupancy(conn, limit)
+        conn.close()
+        
+    except Exception as e:
+        print(f"❌ Erro ao consultar ocupação: {e}")
+
+def show_sessions(limit=20):
+    """Mostra as sessões de movimento mais recentes"""
+    if not check_db_exists():
+        return
+    
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        ensure_session_tables(conn)
+        cursor = conn.cursor()
+        
+        cursor.execute(f"""
+            SELECT sensor, start, end, duration, hour_of_week, previous_sensor, closed_by
+            FROM {SESSION_TABLE}
+            ORDER BY id DESC
+            LIMIT ?
+        """, (limit,))
+        
+        rows = cursor.fetchall()
+        conn.close()
+        
+        print(f"🏠 ÚLTIMAS {limit} SESSÕES DE MOVIMENTO")
+        print("=" * 80)
+        print(f"{'Sensor':<14} {'Início':<19} {'Fim':<9} {'Duração':<8} {'Hora/sem':<9} {'Veio de':<14} {'Fechada'}")
+        print("-" * 80)
+        
+        for sensor, start, end, duration, how, previous, closed_by in rows:
+            print(f"{sensor:<14} {start:<19} {end[11:]:<9} {duration:<8} {format_hour_of_week(how):<9} "
+                  f"{previous or '-':<14} {closed_by}")
+        
+        if not rows:
+            print("Nenhuma sessão registrada (use --rebuild-sessions para processar o histórico)")
+        
+    except Exception as e:
+        print(f"❌ Erro ao consultar sessões: {e}")
+
+def rebuild_session_tables():
+    """Recalcula sessões, histograma e transições a partir de motion_sensors"""
+    if not check_db_exists():
+        return
+    
+    try:
+        conn = sqlite3.connect(DB_PATH)
+        total = rebuild_sessions(conn)
+        conn.close()
+        print(f"✅ {total} sessões recalculadas a partir de {TABLE_NAME}")
+        
+    except Exception as e:
+        print(f"❌ Erro ao recalcular sessões: {e}")
+
 def cleanup_old_records(days=30):
     """Remove registros antigos do banco"""
     if not check_db_exists():
@@ -249,6 +319,10 @@ def main():
     parser.add_argument('--recent', type=int, default=20, help='Mostrar eventos recentes (padrão: 20)')
     parser.add_argument('--sensor', type=str, help='Consultar eventos de sensor específico')
     parser.add_argument('--cleanup', type=int, help='Remover registros anteriores a N dias')
+    parser.add_argument('--occupancy', action='store_true', help='Ocupação por cômodo/horário e transições')
+    parser.add_argument('--sessions', type=int, nargs='?', const=20, help='Mostrar sessões recentes (padrão: 20)')
+    parser.add_argument('--rebuild-sessions', action='store_true',
+                       help='Recalcular sessões e histogramas a partir de motion_sensors')
     
     args = parser.parse_args()
     
@@ -261,6 +335,12 @@ def main():
         query_by_sensor(args.sensor)
     elif args.cleanup:
         cleanup_old_records(args.cleanup)
+    elif args.occupancy:
+        show_occupancy()
+    elif args.sessions:
+        show_sessions(args.sessions)
+    elif args.rebuild_sessions:
+        rebuild_session_tables()
     else:
         show_recent_events(args.recent)
 
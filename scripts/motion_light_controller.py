@@ -9,12 +9,17 @@ Features:
 - Monitors both motion sensor and relay status
 - Configurable delay and retry logic
 - Automatic reconnection
+- Declarative rules for many rooms (python/rule_engine.py): motion or
+  sensor thresholds -> relay, off-delays and time-of-day conditions
 
 Usage:
     python motion_light_controller.py
     python motion_light_controller.py --light-delay 10  # Keep light on 10s extra after motion cleared
+    python motion_light_controller.py --rules ../python/examples/light_rules.json
 """
 
+import os
+import sys
 import json
 import time
 import argparse
@@ -27,10 +32,16 @@ except ImportError:
     print("❌ paho-mqtt not installed. Install with: pip install paho-mqtt")
     exit(1)
 
+try:
+    from rule_engine import RuleEngine
+except ImportError:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python'))
+    from rule_engine import RuleEngine
+
 class MotionLightController:
     def __init__(self, broker_host="192.168.1.102", broker_port=1883, 
                  username="homeguard", password="pu2clr123456", 
-                 light_delay=5):
+                 light_delay=5, rules_file=None):
         """
         Initialize Motion Light Controller
         
@@ -40,12 +51,14 @@ class MotionLightController:
             username: MQTT username
             password: MQTT password
             light_delay: Extra seconds to keep light on after motion cleared
+            rules_file: JSON rules (replaces the default home/motion1 -> home/relay1 rule)
         """
         self.broker_host = broker_host
         self.broker_port = broker_port
         self.username = username
         self.password = password
         self.light_delay = light_delay
+        self.rules_file = rules_file
         
         # MQTT Topics
         self.motion_topic = "home/motion1/motion"
@@ -57,9 +70,22 @@ class MotionLightController:
         self.motion_detected = False
         self.light_on = False
         self.last_motion_time = None
-        self.light_timer = None
         self.connected = False
         
+        # Rules: off-delays run on the engine's timer wheel (a single thread for all rules)
+        self.engine = RuleEngine(publish=self.publish_command)
+        self.engine.add_listener(self.on_rule_action)
+        if rules_file:
+            self.engine.load(rules_file)
+        else:
+            self.engine.add_rule({
+                'name': 'motion1',
+                'trigger': self.motion_topic,
+                'relay': self.relay_cmd_topic,
+                'status': self.relay_status_topic,
+                'off_delay': light_delay,
+            })
+        
         # Statistics
         self.motion_count = 0
         self.light_activations = 0
@@ -83,15 +109,7 @@ class MotionLightController:
             print(f"✅ Connected to MQTT broker at {self.broker_host}")
             
             # Subscribe to motion and relay topics
-            topics = [
-                self.motion_topic,
-                self.motion_status_topic,
-                self.relay_status_topic,
-                "home/motion1/heartbeat",
-                "home/motion1/config"
-            ]
-            
-            for topic in topics:
+            for topic in self.subscribed_topics():
                 client.subscribe(topic)
             
             print("📡 Subscribed to motion and relay topics")
@@ -109,24 +127,58 @@ class MotionLightController:
     def on_message(self, client, userdata, msg):
         """MQTT message callback"""
         try:
-            topic = msg.topic
-            payload = msg.payload.decode('utf-8')
-            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            
-            if topic == self.motion_topic:
-                self.handle_motion_event(payload, timestamp)
-            elif topic == self.relay_status_topic:
-                self.handle_relay_status(payload, timestamp)
-            elif topic == self.motion_status_topic:
-                self.handle_motion_status(payload, timestamp)
-            elif "heartbeat" in topic:
-                self.handle_heartbeat(payload, timestamp)
-            elif "config" in topic:
-                print(f"⚙️ [{timestamp}] Motion sensor config: {payload}")
-                
+            self.dispatch(msg.topic, msg.payload.decode('utf-8'))
         except Exception as e:
             print(f"❌ Error processing message: {e}")
     
+    def dispatch(self, topic, payload):
+        """Route a decoded message to its handler"""
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        
+        if topic.endswith('/motion'):
+            self.handle_motion_event(payload, timestamp)
+        elif topic == self.relay_status_topic:
+            self.handle_relay_status(payload, timestamp)
+        elif topic == self.motion_status_topic:
+            self.handle_motion_status(payload, timestamp)
+        elif "heartbeat" in topic:
+            self.handle_heartbeat(payload, timestamp)
+        elif "config" in topic:
+            print(f"⚙️ [{timestamp}] Motion sensor config: {payload}")
+        
+        # Rules bound to this topic (relay commands, off-delays)
+        self.engine.handle(topic, payload)
+    
+    # ---- Plugin for web/monitor_daemon.py (shared MQTT connection) ----
+    
+    def setup(self, daemon):
+        """Register on the unified monitor daemon instead of using our own client"""
+        self.client = daemon.client
+        handler = lambda message: self.dispatch(message.topic, message.text)
+        for topic in self.subscribed_topics():
+            daemon.register(topic, handler)
+        self.engine.start()
+    
+    def on_daemon_connect(self, daemon):
+        self.connected = True
+    
+    def on_daemon_disconnect(self, daemon):
+        self.connected = False
+    
+    def stop(self):
+        self.engine.stop()
+    
+    def subscribed_topics(self):
+        topics = self.engine.subscriptions()
+        if not self.rules_file:
+            topics += [
+                self.motion_status_topic,
+                self.relay_status_topic,
+                "home/motion1/heartbeat",
+                "home/motion1/config"
+            ]
+        return list(dict.fromkeys(topics))
+    
     def handle_motion_event(self, payload, timestamp):
         """Handle motion detection events"""
         try:
@@ -142,18 +194,6 @@ class MotionLightController:
                 
                 print(f"🚶 [{timestamp}] MOTION DETECTED at {location}")
                 print(f"   Device: {device_id}")
-                
-                # Cancel any pending light-off timer
-                if self.light_timer:
-                    self.light_timer.cancel()
-                    self.light_timer = None
-                    print("   ⏰ Cancelled light-off timer")
-                
-                # Turn light ON if not already on
-                if not self.light_on:
-                    self.turn_light_on()
-                else:
-                    print("   💡 Light already ON")
                     
             elif event == "MOTION_CLEARED":
                 self.motion_detected = False
@@ -161,9 +201,6 @@ class MotionLightController:
                 
                 print(f"✅ [{timestamp}] MOTION CLEARED at {location} (Duration: {duration})")
                 
-                # Start delayed light-off timer
-                self.start_light_off_timer()
-                
         except json.JSONDecodeError:
             print(f"🚶 [{timestamp}] Motion event (non-JSON): {payload}")
     
@@ -210,47 +247,19 @@ class MotionLightController:
         except json.JSONDecodeError:
             pass  # Ignore malformed heartbeats
     
-    def turn_light_on(self):
-        """Turn the light ON via relay"""
+    def publish_command(self, topic, payload):
+        """Send a relay command decided by the rule engine"""
         if self.connected:
-            self.client.publish(self.relay_cmd_topic, "ON")
-            print("   📤 Sent command: Light ON")
-        else:
-            print("   ❌ Cannot send command: Not connected to MQTT")
-    
-    def turn_light_off(self):
-        """Turn the light OFF via relay"""
-        if self.connected:
-            self.client.publish(self.relay_cmd_topic, "OFF")
-            print("   📤 Sent command: Light OFF")
-        else:
-            print("   ❌ Cannot send command: Not connected to MQTT")
-    
-    def start_light_off_timer(self):
-        """Start timer to turn light off after delay"""
-        if self.light_timer:
-            self.light_timer.cancel()
-        
-        if self.light_delay > 0:
-            print(f"   ⏰ Starting {self.light_delay}s timer to turn light OFF")
-            self.light_timer = threading.Timer(self.light_delay, self.delayed_light_off)
-            self.light_timer.start()
+            self.client.publish(topic, payload)
         else:
-            # Turn off immediately if no delay
-            self.turn_light_off()
+            print(f"   ❌ Cannot send {payload} to {topic}: Not connected to MQTT")
     
-    def delayed_light_off(self):
-        """Called by timer to turn light off"""
+    def on_rule_action(self, rule, relay, on, reason):
+        """Rule engine listener: report each command"""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Double-check no new motion was detected
-        if not self.motion_detected:
-            print(f"⏰ [{timestamp}] Timer expired - turning light OFF")
-            self.turn_light_off()
-        else:
-            print(f"⏰ [{timestamp}] Timer expired but motion still detected - keeping light ON")
-        
-        self.light_timer = None
+        if reason == 'off_delay':
+            print(f"⏰ [{timestamp}] {rule.name}: off-delay expired ({rule.off_delay:g}s)")
+        print(f"   📤 Sent command: {relay} {'ON' if on else 'OFF'} (rule {rule.name})")
     
     def show_status(self):
         """Show current system status"""
@@ -263,6 +272,7 @@ class MotionLightController:
         print(f"🚶 Motion Detected: {'✅ Yes' if self.motion_detected else '❌ No'}")
         print(f"💡 Light Status: {'🟢 ON' if self.light_on else '🔴 OFF'}")
         print(f"⏰ Light Delay: {self.light_delay} seconds")
+        print(f"📜 Rules: {len(self.engine.rules)}")
         print(f"📈 Motion Events: {self.motion_count}")
         print(f"💡 Light Activations: {self.light_activations}")
         print(f"⏱️ Uptime: {str(uptime).split('.')[0]}")
@@ -271,8 +281,10 @@ class MotionLightController:
             time_since_motion = datetime.now() - self.last_motion_time
             print(f"🕐 Last Motion: {str(time_since_motion).split('.')[0]} ago")
         
-        if self.light_timer:
-            print("⏰ Light-off timer: ACTIVE")
+        for relay, rules in self.engine.active_relays().items():
+            print(f"💡 {relay}: held by {', '.join(rules)}")
+        if self.engine.pending_timers():
+            print(f"⏰ Light-off timers: {self.engine.pending_timers()} ACTIVE")
         
         print("=" * 60)
     
@@ -289,6 +301,7 @@ class MotionLightController:
         try:
             # Connect to broker
             self.client.connect(self.broker_host, self.broker_port, 60)
+            self.engine.start()
             
             # Start status display timer
             def show_periodic_status():
@@ -309,8 +322,7 @@ class MotionLightController:
         except Exception as e:
             print(f"❌ Error: {e}")
         finally:
-            if self.light_timer:
-                self.light_timer.cancel()
+            self.engine.stop()
             self.client.disconnect()
 
 def main():
@@ -321,6 +333,7 @@ def main():
     parser.add_argument('--password', default='pu2clr123456', help='MQTT password')
     parser.add_argument('--light-delay', type=int, default=5, 
                        help='Seconds to keep light on after motion cleared (default: 5)')
+    parser.add_argument('--rules', help='JSON rules file (e.g. ../python/examples/light_rules.json)')
     
     args = parser.parse_args()
     
@@ -332,7 +345,8 @@ def main():
         broker_port=args.port,
         username=args.username,
         password=args.password,
-        light_delay=args.light_delay
+        light_delay=args.light_delay,
+        rules_file=args.rules
     )
     
     controller.start_controller()
@@ -19,11 +19,22 @@ except ImportError:
     print("❌ paho-mqtt não está instalado. Execute: pip install paho-mqtt")
     sys.exit(1)
 
+# Contadores mantidos por triggers (web/db_counters.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'web'))
+from db_counters import ensure_counters, table_count, kind_counts, latest_relay_status
+from motion_sessions import SessionBuilder, SESSION_TABLE, insert_sessions, print_occupancy
+
+# Roteador de tópicos compilado (python/topic_router.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python'))
+from topic_router import TopicRouter, subscription_filter
+
 # Configuração do banco de dados
 DB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'db')
 DB_PATH = os.path.join(DB_DIR, 'homeguard.db')
 MOTION_TABLE = 'motion_sensors'
 RELAY_TABLE = 'relay_activity'
+DEVICE_TABLE = 'device_registry'
+MOTION_DETECTIONS = 'motion_detections'  # contador de MOTION_DETECTED por sensor
 
 # Configuração MQTT padrão
 BROKER = '192.168.1.102'
@@ -31,29 +42,94 @@ PORT = 1883
 USERNAME = 'homeguard'
 PASSWORD = 'pu2clr123456'
 
-# Tópicos MQTT para monitoramento
-MOTION_TOPICS = [
-    'home/motion_garagem/motion',
-    'home/motion_area_servico/motion',
-    'home/motion_varanda/motion',
-    'home/motion_mezanino/motion',
-    'home/motion_adhoc/motion'
-]
+# Padrões de roteamento: cada handler recebe (topic, payload, timestamp_now, **capturas)
+MOTION_ROUTE = 'home/+device/motion'
+RELAY_ROUTE = 'home/relay/+device_id/+message_type'
 
-RELAY_TOPICS = [
-    'home/relay/ESP01_RELAY_001/status',
-    'home/relay/ESP01_RELAY_001/command',
-    'home/relay/ESP01_RELAY_002/status', 
-    'home/relay/ESP01_RELAY_002/command',
-    'home/relay/ESP01_RELAY_003/status',
-    'home/relay/ESP01_RELAY_003/command'
-]
+# Tópicos MQTT para monitoramento (novos sensores/relés são descobertos sem reiniciar),
+# derivados das rotas para que a assinatura e o roteamento nunca divirjam
+MOTION_TOPICS = [subscription_filter(MOTION_ROUTE)]
+RELAY_TOPICS = [subscription_filter(RELAY_ROUTE)]
 
 ALL_TOPICS = MOTION_TOPICS + RELAY_TOPICS
 
+# Dispositivos conhecidos - gravados em device_registry na primeira inicialização.
+# Nomes/locais podem ser editados direto na tabela; dispositivos novos entram
+# automaticamente quando publicam pela primeira vez.
+DEFAULT_DEVICES = [
+    ('relay', 'ESP01_RELAY_001', 'Luz da Sala', 'Sala'),
+    ('relay', 'ESP01_RELAY_002', 'Luz da Cozinha', 'Cozinha'),
+    ('relay', 'ESP01_RELAY_003', 'Bomba d\'Água', 'Externa'),
+    ('motion', 'motion_garagem', 'garagem', 'garagem'),
+    ('motion', 'motion_area_servico', 'area_servico', 'area_servico'),
+    ('motion', 'motion_varanda', 'varanda', 'varanda'),
+    ('motion', 'motion_mezanino', 'mezanino', 'mezanino'),
+    ('motion', 'motion_adhoc', 'adhoc', 'adhoc'),
+]
+
 # Fuso horário Brasil/Brasília (UTC-3)
 BR_TZ = timezone(timedelta(hours=-3))
 
+class DeviceRegistry:
+    """Cache em memória da tabela device_registry
+
+    Carregado uma vez na inicialização; por mensagem é só uma consulta ao dict.
+    Um dispositivo desconhecido é gravado na tabela na primeira mensagem.
+    """
+    
+    def __init__(self):
+        self.devices = {}  # (device_type, topic_id) -> {'name': ..., 'location': ...}
+    
+    def __len__(self):
+        return len(self.devices)
+    
+    def load(self, conn):
+        """Cria os dispositivos padrão (se faltarem) e carrega a tabela para o cache"""
+        now = datetime.now(BR_TZ).strftime('%Y-%m-%d %H:%M:%S')
+        conn.executemany(f"""
+            INSERT OR IGNORE INTO {DEVICE_TABLE} (device_type, topic_id, name, location, first_seen)
+            VALUES (?, ?, ?, ?, ?)
+        """, [device + (now,) for device in DEFAULT_DEVICES])
+        conn.commit()
+        
+        rows = conn.execute(f"SELECT device_type, topic_id, name, location FROM {DEVICE_TABLE}").fetchall()
+        self.devices = {(device_type, topic_id): {'name': name, 'location': location}
+                        for device_type, topic_id, name, location in rows}
+    
+    def lookup(self, device_type, topic_id, name=None, location='Unknown'):
+        """Nome/local do dispositivo; registra dispositivos novos (descoberta)"""
+        info = self.devices.get((device_type, topic_id))
+        if info is None:
+            info = self.discover(device_type, topic_id, name or topic_id, location or 'Unknown')
+        return info
+    
+    def discover(self, device_type, topic_id, name, location):
+        """Adiciona um dispositivo novo ao cache e à tabela"""
+        info = {'name': name, 'location': location}
+        # O cache é atualizado mesmo se a gravação falhar (não tenta de novo a cada mensagem)
+        self.devices[(device_type, topic_id)] = info
+        print(f"🆕 Novo dispositivo descoberto: {device_type} {topic_id} ({name} - {location})")
+        try:
+            conn = sqlite3.connect(DB_PATH, timeout=10)
+            conn.execute(f"""
+                INSERT OR IGNORE INTO {DEVICE_TABLE} (device_type, topic_id, name, location, first_seen)
+                VALUES (?, ?, ?, ?, ?)
+            """, (device_type, topic_id, name, location, datetime.now(BR_TZ).strftime('%Y-%m-%d %H:%M:%S')))
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            print(f"❌ Erro ao registrar dispositivo {topic_id}: {e}")
+        return info
+    
+    def by_type(self, device_type):
+        return sorted((topic_id, info) for (kind, topic_id), info in self.devices.items()
+                      if kind == device_type)
+
+registry = DeviceRegistry()
+
+# Sessões de ocupação (detected/cleared pareados) - web/motion_sessions.py
+sessions = SessionBuilder()
+
 def init_db():
     """Inicializa o banco de dados e cria as tabelas se não existirem"""
     try:
@@ -98,6 +174,18 @@ def init_db():
             )
         """)
         
+        # Registro de dispositivos (carregado em memória pelo DeviceRegistry)
+        cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {DEVICE_TABLE} (
+                device_type TEXT NOT NULL,
+                topic_id TEXT NOT NULL,
+                name TEXT NOT NULL,
+                location TEXT NOT NULL,
+                first_seen TEXT NOT NULL,
+                PRIMARY KEY (device_type, topic_id)
+            )
+        """)
+        
         # Criar índices para tabela motion_sensors
         cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_motion_sensor ON {MOTION_TABLE}(sensor)")
         cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_motion_event ON {MOTION_TABLE}(event)")
@@ -111,22 +199,30 @@ def init_db():
         cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_relay_status ON {RELAY_TABLE}(current_status)")
         
         conn.commit()
+        
+        # Contadores por tabela/sensor/hora (evita COUNT(*) nas estatísticas)
+        ensure_counters(conn)
+        
+        registry.load(conn)
+        sessions.load(conn, datetime.now(BR_TZ).replace(tzinfo=None))
         conn.close()
         print(f"✅ Banco de dados inicializado: {DB_PATH}")
-        print(f"📊 Tabelas criadas: {MOTION_TABLE}, {RELAY_TABLE}")
+        print(f"📊 Tabelas criadas: {MOTION_TABLE}, {RELAY_TABLE}, {DEVICE_TABLE}, {SESSION_TABLE}")
+        print(f"📋 Dispositivos registrados: {len(registry)}")
         
     except Exception as e:
         print(f"❌ Erro ao inicializar banco de dados: {e}")
         sys.exit(1)
 
 def insert_motion_data(sensor, event, device_id, location, rssi, count, duration, 
-                      timestamp_device, unix_timestamp, raw_payload):
-    """Insere dados de movimento no banco de dados"""
+                      timestamp_device, unix_timestamp, raw_payload, timestamp_received=None):
+    """Insere dados de movimento no banco de dados (e as sessões que o evento fechar)"""
     try:
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
         
-        timestamp_received = datetime.now(BR_TZ).strftime('%Y-%m-%d %H:%M:%S')
+        if timestamp_received is None:
+            timestamp_received = datetime.now(BR_TZ).strftime('%Y-%m-%d %H:%M:%S')
         
         cursor.execute(f"""
             INSERT INTO {MOTION_TABLE} 
@@ -136,6 +232,9 @@ def insert_motion_data(sensor, event, device_id, location, rssi, count, duration
         """, (sensor, event, device_id, location, rssi, count, duration, 
               timestamp_device, unix_timestamp, timestamp_received, raw_payload))
         
+        # Mesma transação: sessão fechada por MOTION_CLEARED ou por timeout
+        insert_sessions(conn, sessions.process(sensor, event, location, timestamp_received))
+        
         conn.commit()
         conn.close()
         
@@ -208,19 +307,11 @@ def on_message(client, userdata, msg):
         # Decodificar payload
         payload = msg.payload.decode('utf-8')
         topic = msg.topic
-        topic_parts = topic.split('/')
         
         timestamp_now = datetime.now(BR_TZ).strftime('%H:%M:%S')
         
-        # Verificar se é um tópico de movimento
-        if 'motion' in topic and len(topic_parts) >= 2:
-            process_motion_message(topic, topic_parts, payload, timestamp_now)
-        
-        # Verificar se é um tópico de relé
-        elif 'relay' in topic and len(topic_parts) >= 4:
-            process_relay_message(topic, topic_parts, payload, timestamp_now)
-        
-        else:
+        # Roteamento pelo padrão do tópico (device_id/message_type vêm das capturas)
+        if not router.dispatch(topic, topic, payload, timestamp_now):
             print(f"⚠️ [{timestamp_now}] Tópico não reconhecido: {topic}")
         
     except Exception as e:
@@ -228,151 +319,158 @@ def on_message(client, userdata, msg):
         print(f"   Tópico: {msg.topic}")
         print(f"   Payload: {msg.payload.decode('utf-8', errors='ignore')}")
 
-def process_motion_message(topic, topic_parts, payload, timestamp_now):
+def parse_motion_message(device, payload, data=None):
+    """Colunas de motion_sensors extraídas de uma mensagem de movimento"""
+    # Parse JSON (o daemon unificado já entrega o JSON decodificado)
+    if data is None:
+        data = json.loads(payload)
+    
+    # Nome do sensor vem do registro (home/motion_garagem/motion -> garagem)
+    default_name = device.replace('motion_', '')
+    sensor = registry.lookup('motion', device, default_name,
+                             data.get('location', default_name))['name']
+    
+    # Extrair dados da mensagem
+    rssi = data.get('rssi', None)
+    duration = data.get('duration', None)
+    
+    # Converter RSSI se for string
+    if rssi and isinstance(rssi, str) and rssi.endswith('dBm'):
+        try:
+            rssi = int(rssi.replace('dBm', ''))
+        except ValueError:
+            rssi = None
+    
+    # Converter duration se for string
+    if duration and isinstance(duration, str) and duration.endswith('s'):
+        try:
+            duration = int(duration.replace('s', ''))
+        except ValueError:
+            duration = None
+    
+    return {
+        'sensor': sensor,
+        'event': data.get('event', 'UNKNOWN'),
+        'device_id': data.get('device_id', None),
+        'location': data.get('location', sensor),
+        'rssi': rssi,
+        'count': data.get('count', None),
+        'duration': duration,
+        'timestamp_device': data.get('timestamp', None),
+        'unix_timestamp': data.get('unix_timestamp', None),
+        'raw_payload': payload
+    }
+
+def print_motion_event(row, timestamp_now):
+    """Mostra um evento de movimento no console"""
+    event = row['event']
+    print(f"[{timestamp_now}] 📊 MOTION {row['sensor'].upper()}: {event} (ID: {row['device_id']})")
+    
+    if event == "MOTION_DETECTED":
+        print(f"               🚶 Movimento detectado em {row['location']}")
+    elif event == "MOTION_CLEARED":
+        if row['duration']:
+            print(f"               ✅ Movimento finalizado após {row['duration']}s")
+        else:
+            print(f"               ✅ Movimento finalizado")
+
+def process_motion_message(topic, payload, timestamp_now, device):
     """Processa mensagens de sensores de movimento"""
     try:
-        # Extrair nome do sensor do tópico
-        sensor = topic_parts[1].replace('motion_', '')
-        
-        # Parse JSON
-        data = json.loads(payload)
-        
-        # Extrair dados da mensagem
-        event = data.get('event', 'UNKNOWN')
-        device_id = data.get('device_id', None)
-        location = data.get('location', sensor)
-        rssi = data.get('rssi', None)
-        count = data.get('count', None)
-        duration = data.get('duration', None)
-        timestamp_device = data.get('timestamp', None)
-        unix_timestamp = data.get('unix_timestamp', None)
-        
-        # Converter RSSI se for string
-        if rssi and isinstance(rssi, str) and rssi.endswith('dBm'):
-            try:
-                rssi = int(rssi.replace('dBm', ''))
-            except ValueError:
-                rssi = None
-        
-        # Converter duration se for string
-        if duration and isinstance(duration, str) and duration.endswith('s'):
-            try:
-                duration = int(duration.replace('s', ''))
-            except ValueError:
-                duration = None
+        row = parse_motion_message(device, payload)
         
         # Inserir no banco de dados
-        success = insert_motion_data(
-            sensor=sensor,
-            event=event,
-            device_id=device_id,
-            location=location,
-            rssi=rssi,
-            count=count,
-            duration=duration,
-            timestamp_device=timestamp_device,
-            unix_timestamp=unix_timestamp,
-            raw_payload=payload
-        )
-        
-        if success:
-            print(f"[{timestamp_now}] 📊 MOTION {sensor.upper()}: {event} (ID: {device_id})")
-            
-            if event == "MOTION_DETECTED":
-                print(f"               🚶 Movimento detectado em {location}")
-            elif event == "MOTION_CLEARED":
-                if duration:
-                    print(f"               ✅ Movimento finalizado após {duration}s")
-                else:
-                    print(f"               ✅ Movimento finalizado")
+        if insert_motion_data(**row):
+            print_motion_event(row, timestamp_now)
         
     except json.JSONDecodeError:
         print(f"❌ Erro ao decodificar JSON do tópico de movimento {topic}: {payload}")
     except Exception as e:
         print(f"❌ Erro ao processar mensagem de movimento: {e}")
 
-def process_relay_message(topic, topic_parts, payload, timestamp_now):
-    """Processa mensagens de relés"""
-    try:
-        # topic format: home/relay/ESP01_RELAY_XXX/status ou /command
-        device_id = topic_parts[2]  # ESP01_RELAY_001, ESP01_RELAY_002, etc
-        message_type = topic_parts[3]  # status ou command
-        
-        # Determinar device name e location baseado no device_id
-        device_mapping = {
-            'ESP01_RELAY_001': {'name': 'Luz da Sala', 'location': 'Sala'},
-            'ESP01_RELAY_002': {'name': 'Luz da Cozinha', 'location': 'Cozinha'},
-            'ESP01_RELAY_003': {'name': 'Bomba d\'Água', 'location': 'Externa'}
-        }
-        
-        device_info = device_mapping.get(device_id, {'name': device_id, 'location': 'Unknown'})
-        device_name = device_info['name']
-        location = device_info['location']
+def parse_relay_message(device_id, message_type, payload):
+    """Colunas de relay_activity extraídas de uma mensagem de relé"""
+    # topic format: home/relay/ESP01_RELAY_XXX/status ou /command
+    # device_id: ESP01_RELAY_001, ESP01_RELAY_002, etc; message_type: status ou command
+    
+    # Device name e location vêm do registro de dispositivos (cache em memória)
+    device_info = registry.lookup('relay', device_id)
+    rssi = None
+    uptime = None
+    
+    # Processar diferentes tipos de mensagem
+    if message_type == 'status':
+        # Mensagem de status: payload é simples: "on" ou "off"
+        current_status = payload.strip().upper()
+        event = f"STATUS_REPORT"
+        command_source = "DEVICE"
+        
+    elif message_type == 'command':
+        # Mensagem de comando: payload é o comando enviado
+        event = f"COMMAND_RECEIVED"
+        current_status = payload.strip().upper()
+        command_source = "EXTERNAL" 
         
-        # Processar diferentes tipos de mensagem
-        if message_type == 'status':
-            # Mensagem de status: payload é simples: "on" ou "off"
-            current_status = payload.strip().upper()
-            event = f"STATUS_REPORT"
+    else:
+        # Outros tipos de mensagem (como info)
+        try:
+            # Tentar parsear como JSON para mensagens info
+            data = json.loads(payload)
+            event = "INFO_REPORT"
+            current_status = data.get('relay_state', 'UNKNOWN').upper()
             command_source = "DEVICE"
-            rssi = None
-            uptime = None
-            
-        elif message_type == 'command':
-            # Mensagem de comando: payload é o comando enviado
-            event = f"COMMAND_RECEIVED"
+            rssi = data.get('rssi', None)
+            uptime = data.get('uptime', None)
+        except json.JSONDecodeError:
+            # Se não for JSON, tratar como mensagem simples
+            event = f"MESSAGE_{message_type.upper()}"
             current_status = payload.strip().upper()
-            command_source = "EXTERNAL" 
-            rssi = None
-            uptime = None
-            
-        else:
-            # Outros tipos de mensagem (como info)
-            try:
-                # Tentar parsear como JSON para mensagens info
-                data = json.loads(payload)
-                event = "INFO_REPORT"
-                current_status = data.get('relay_state', 'UNKNOWN').upper()
-                command_source = "DEVICE"
-                rssi = data.get('rssi', None)
-                uptime = data.get('uptime', None)
-            except json.JSONDecodeError:
-                # Se não for JSON, tratar como mensagem simples
-                event = f"MESSAGE_{message_type.upper()}"
-                current_status = payload.strip().upper()
-                command_source = "DEVICE"
-                rssi = None
-                uptime = None
+            command_source = "DEVICE"
+    
+    return {
+        'device_name': device_info['name'],
+        'device_id': device_id,
+        'location': device_info['location'],
+        'event': event,
+        'current_status': current_status,
+        'command_source': command_source,
+        'rssi': rssi,
+        'uptime': uptime,
+        'raw_payload': payload
+    }
+
+def print_relay_event(row, timestamp_now):
+    """Mostra um evento de relé no console"""
+    current_status = row['current_status']
+    event = row['event']
+    status_icon = "🟢" if current_status in ['ON', 'on'] else "🔴" if current_status in ['OFF', 'off'] else "⚪"
+    
+    print(f"[{timestamp_now}] 🔌 RELAY {row['device_name']}: {event}")
+    print(f"               {status_icon} Status: {current_status} | Local: {row['location']}")
+    
+    if event == "COMMAND_RECEIVED":
+        print(f"               📤 Comando recebido: {current_status}")
+    elif event == "STATUS_REPORT":
+        print(f"               📊 Relatório de status: {current_status}")
+
+def process_relay_message(topic, payload, timestamp_now, device_id, message_type):
+    """Processa mensagens de relés"""
+    try:
+        row = parse_relay_message(device_id, message_type, payload)
         
         # Inserir no banco de dados
-        success = insert_relay_data(
-            device_name=device_name,
-            device_id=device_id,
-            location=location,
-            event=event,
-            current_status=current_status,
-            command_source=command_source,
-            rssi=rssi,
-            uptime=uptime,
-            raw_payload=payload
-        )
-        
-        if success:
-            status_icon = "🟢" if current_status in ['ON', 'on'] else "🔴" if current_status in ['OFF', 'off'] else "⚪"
-            
-            print(f"[{timestamp_now}] 🔌 RELAY {device_name}: {event}")
-            print(f"               {status_icon} Status: {current_status} | Local: {location}")
-            
-            if event == "COMMAND_RECEIVED":
-                print(f"               📤 Comando recebido: {current_status}")
-            elif event == "STATUS_REPORT":
-                print(f"               📊 Relatório de status: {current_status}")
+        if insert_relay_data(**row):
+            print_relay_event(row, timestamp_now)
         
     except Exception as e:
         print(f"❌ Erro ao processar mensagem de relé: {e}")
         print(f"   Tópico: {topic}")
         print(f"   Payload: {payload}")
 
+router = TopicRouter()
+router.add(MOTION_ROUTE, process_motion_message)
+router.add(RELAY_ROUTE, process_relay_message)
+
 def signal_handler(signum, frame):
     """Handler para capturar Ctrl+C e encerrar graciosamente"""
     print("\n🛑 Encerrando monitor de atividades...")
@@ -384,51 +482,16 @@ def show_statistics():
         conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
         
-        # Estatísticas de sensores de movimento
-        cursor.execute(f"SELECT COUNT(*) FROM {MOTION_TABLE}")
-        motion_records = cursor.fetchone()[0]
-        
-        # Estatísticas de relés
-        cursor.execute(f"SELECT COUNT(*) FROM {RELAY_TABLE}")
-        relay_records = cursor.fetchone()[0]
+        # Totais e registros por sensor/relé vêm dos contadores (sem varrer as tabelas)
+        motion_records = table_count(conn, MOTION_TABLE)
+        relay_records = table_count(conn, RELAY_TABLE)
+        motion_sensor_counts = kind_counts(conn, MOTION_TABLE)
+        relay_counts = kind_counts(conn, RELAY_TABLE)
         
-        # Registros por sensor de movimento
-        cursor.execute(f"""
-            SELECT sensor, COUNT(*) 
-            FROM {MOTION_TABLE} 
-            GROUP BY sensor 
-            ORDER BY COUNT(*) DESC
-        """)
-        motion_sensor_counts = cursor.fetchall()
-        
-        # Registros por relé
-        cursor.execute(f"""
-            SELECT device_name, COUNT(*) 
-            FROM {RELAY_TABLE} 
-            GROUP BY device_name 
-            ORDER BY COUNT(*) DESC
-        """)
-        relay_counts = cursor.fetchall()
-        
-        # Eventos de movimento por sensor
-        cursor.execute(f"""
-            SELECT sensor, COUNT(*) 
-            FROM {MOTION_TABLE} 
-            WHERE event = 'MOTION_DETECTED'
-            GROUP BY sensor 
-            ORDER BY COUNT(*) DESC
-        """)
-        motion_detection_counts = cursor.fetchall()
-        
-        # Status atual dos relés
-        cursor.execute(f"""
-            SELECT device_name, current_status, MAX(timestamp_received) as last_update
-            FROM {RELAY_TABLE} 
-            WHERE event IN ('STATUS_REPORT', 'COMMAND_RECEIVED')
-            GROUP BY device_name
-            ORDER BY last_update DESC
-        """)
-        relay_status = cursor.fetchall()
+        # Detecções por sensor e status atual dos relés também vêm de tabelas
+        # mantidas por triggers (motion_detections / relay_status)
+        motion_detection_counts = kind_counts(conn, MOTION_DETECTIONS)
+        relay_status = latest_relay_status(conn)
         
         # Últimos registros de movimento
         cursor.execute(f"""
@@ -501,11 +564,24 @@ def show_statistics():
         else:
             print("   Nenhum registro de relé")
         
+        # Ocupação pré-calculada (motion_occupancy / motion_transitions)
+        conn = sqlite3.connect(DB_PATH)
+        print_occupancy(conn, limit=5)
+        conn.close()
+        
         print("=" * 80)
         
     except Exception as e:
         print(f"❌ Erro ao mostrar estatísticas: {e}")
 
+def show_devices():
+    """Lista o registro de dispositivos"""
+    for device_type, title in (('motion', '🚶 SENSORES DE MOVIMENTO'), ('relay', '🔌 RELÉS')):
+        print(f"\n{title}:")
+        print("-" * 40)
+        for topic_id, info in registry.by_type(device_type):
+            print(f"   {topic_id}: {info['name']} ({info['location']})")
+
 def main():
     """Função principal"""
     parser = argparse.ArgumentParser(
@@ -521,6 +597,8 @@ def main():
                        help='MQTT password')
     parser.add_argument('--stats', action='store_true', 
                        help='Mostrar estatísticas do banco e sair')
+    parser.add_argument('--devices', action='store_true',
+                       help='Listar o registro de dispositivos e sair')
     
     args = parser.parse_args()
     
@@ -530,6 +608,11 @@ def main():
         show_statistics()
         return
     
+    if args.devices:
+        init_db()
+        show_devices()
+        return
+    
     # Configurar handler para Ctrl+C
     signal.signal(signal.SIGINT, signal_handler)
     
@@ -20,6 +20,8 @@ Usage:
 """
 
 import json
+import os
+import sys
 import time
 import ssl
 import argparse
@@ -34,6 +36,18 @@ except ImportError:
     print("❌ paho-mqtt not installed. Install with: pip install paho-mqtt")
     exit(1)
 
+try:
+    from liveness import LivenessTracker, ONLINE, STALE, OFFLINE
+except ImportError:
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'python'))
+    from liveness import LivenessTracker, ONLINE, STALE, OFFLINE
+
+LIVENESS_STATUS = {
+    ONLINE: "🟢 ONLINE",
+    STALE: "🟡 STALE",
+    OFFLINE: "🔴 OFFLINE",
+}
+
 class MotionSensorMonitor:
     def __init__(self, broker_host="192.168.1.102", broker_port=1883, 
                  username="homeguard", password="pu2clr123456", 
@@ -95,6 +109,10 @@ class MotionSensorMonitor:
                 "secure": None
             }
         
+        # Liveness: 60s heartbeats -> STALE after 2 min, OFFLINE after 5 min without messages
+        self.liveness = LivenessTracker(default_interval=60, stale_after=2, offline_after=5)
+        self.liveness.add_listener(self._on_liveness_change)
+        
         # Statistics
         self.start_time = datetime.now()
         self.total_motion_events = 0
@@ -154,19 +172,9 @@ class MotionSensorMonitor:
             print(f"✅ Connected to MQTT broker at {self.broker_host}:{self.broker_port} ({tls_status})")
             
             # Subscribe to all sensor topics
-            for location in self.locations:
-                if location in self.location_to_topic:
-                    topic_base = f"home/{self.location_to_topic[location]}"
-                    topics = [
-                        f"{topic_base}/status",
-                        f"{topic_base}/motion", 
-                        f"{topic_base}/heartbeat",
-                        f"{topic_base}/config"
-                    ]
-                    
-                    for topic in topics:
-                        client.subscribe(topic)
-                        print(f"📡 Subscribed to {topic}")
+            for topic in self.sensor_topics():
+                client.subscribe(topic)
+                print(f"📡 Subscribed to {topic}")
             
             print("=" * 80)
             print("🏠 HomeGuard Motion Sensor Monitor Started")
@@ -198,28 +206,70 @@ class MotionSensorMonitor:
     def on_message(self, client, userdata, msg):
         """MQTT message callback"""
         try:
-            topic = msg.topic
-            payload = msg.payload.decode('utf-8')
-            timestamp = datetime.now()
-            
-            # Parse topic to extract location
-            location = self.extract_location_from_topic(topic)
-            if not location:
-                return
-                
-            # Handle different message types
-            if "/status" in topic:
-                self.handle_status_message(location, payload, timestamp)
-            elif "/motion" in topic:
-                self.handle_motion_message(location, payload, timestamp)
-            elif "/heartbeat" in topic:
-                self.handle_heartbeat_message(location, payload, timestamp)
-            elif "/config" in topic:
-                self.handle_config_message(location, payload, timestamp)
-                
+            self.dispatch(msg.topic, msg.payload.decode('utf-8'))
         except Exception as e:
             print(f"❌ Error processing message: {e}")
     
+    def dispatch(self, topic, payload):
+        """Route a decoded message to its handler"""
+        timestamp = datetime.now()
+        
+        # Parse topic to extract location
+        location = self.extract_location_from_topic(topic)
+        if not location:
+            return
+        
+        self.liveness.seen(location)
+            
+        # Handle different message types
+        if "/status" in topic:
+            self.handle_status_message(location, payload, timestamp)
+        elif "/motion" in topic:
+            self.handle_motion_message(location, payload, timestamp)
+        elif "/heartbeat" in topic:
+            self.handle_heartbeat_message(location, payload, timestamp)
+        elif "/config" in topic:
+            self.handle_config_message(location, payload, timestamp)
+    
+    def sensor_topics(self):
+        """Topics of every monitored location"""
+        topics = []
+        for location in self.locations:
+            if location in self.location_to_topic:
+                topic_base = f"home/{self.location_to_topic[location]}"
+                topics += [
+                    f"{topic_base}/status",
+                    f"{topic_base}/motion", 
+                    f"{topic_base}/heartbeat",
+                    f"{topic_base}/config"
+                ]
+        return topics
+    
+    def setup(self, daemon):
+        """Plugin for web/monitor_daemon.py: share the daemon's MQTT connection"""
+        self.client = daemon.client
+        handler = lambda message: self.dispatch(message.topic, message.text)
+        for topic in self.sensor_topics():
+            daemon.register(topic, handler)
+        self.liveness.start()
+    
+    def stop(self):
+        self.liveness.stop()
+    
+    def _on_liveness_change(self, record, previous):
+        """Online/stale/offline transition of a location"""
+        location = record['device_id']
+        self.sensors[location]["online"] = record['state'] == ONLINE
+        if previous is not None:
+            self.print_event(LIVENESS_STATUS[record['state']].split()[0],
+                             f"{location} is {record['state'].upper()} (was {previous.upper()})", datetime.now())
+    
+    def on_daemon_connect(self, daemon):
+        self.connected = True
+    
+    def on_daemon_disconnect(self, daemon):
+        self.connected = False
+    
     def extract_location_from_topic(self, topic):
         """Extract location from MQTT topic"""
         for location, topic_suffix in self.location_to_topic.items():
@@ -361,17 +411,8 @@ class MotionSensorMonitor:
         for location in self.locations:
             sensor = self.sensors[location]
             
-            # Determine online status
-            if sensor["last_seen"]:
-                time_since_seen = (current_time - sensor["last_seen"]).seconds
-                if time_since_seen < 120:  # 2 minutes
-                    status = "🟢 ONLINE"
-                elif time_since_seen < 300:  # 5 minutes
-                    status = "🟡 STALE"
-                else:
-                    status = "🔴 OFFLINE"
-            else:
-                status = "❓ UNKNOWN"
+            # Online status is maintained by the liveness tracker
+            status = LIVENESS_STATUS.get(self.liveness.state(location), "❓ UNKNOWN")
             
             # Security status
             if sensor["secure"] is True:
@@ -453,6 +494,7 @@ class MotionSensorMonitor:
         try:
             # Connect to broker
             self.client.connect(self.broker_host, self.broker_port, 60)
+            self.liveness.start()
             
             # Start periodic status updates
             def show_periodic_status():
@@ -491,6 +533,7 @@ class MotionSensorMonitor:
         except Exception as e:
             print(f"❌ Error: {e}")
         finally:
+            self.liveness.stop()
             self.client.disconnect()
 
 def main():
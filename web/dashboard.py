@@ -5,40 +5,19 @@ Sistema de painéis para visualizar dados dos sensores via views do banco
 """
 
 from flask import Flask, render_template, jsonify, request
-import sqlite3
 import json
 import os
 from datetime import datetime, timedelta
 from collections import defaultdict
 
+from storage import get_storage
+
 # Configuração
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
-DB_PATH = os.path.join(PROJECT_ROOT, 'db', 'homeguard.db')
 
 app = Flask(__name__)
 
-class DatabaseManager:
-    @staticmethod
-    def get_connection():
-        return sqlite3.connect(DB_PATH)
-    
-    @staticmethod
-    def execute_query(query, params=None):
-        """Execute query and return results"""
-        conn = DatabaseManager.get_connection()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        
-        if params:
-            cursor.execute(query, params)
-        else:
-            cursor.execute(query)
-        
-        results = cursor.fetchall()
-        conn.close()
-        return results
-
 # ================ ROTAS PRINCIPAIS ================
 
 @app.route('/')
@@ -75,21 +54,14 @@ def relay_panel():
 
 @app.route('/api/temperature/data')
 def api_temperature_data():
-    """API para dados de temperatura usando view"""
+    """API para dados de temperatura"""
     limit = request.args.get('limit', 50, type=int)
     hours = request.args.get('hours', 24, type=int)
     
     print(f"[DEBUG] Temperature API chamada - hours={hours}, limit={limit}")
     
-    query = f"""
-        SELECT * FROM vw_temperature_activity 
-        WHERE created_at >= datetime('now', '-{hours} hours')
-        ORDER BY created_at DESC 
-        LIMIT {limit}
-    """
-    
     try:
-        results = DatabaseManager.execute_query(query)
+        results = get_storage().sensor_readings('temperature', hours, limit)
         print(f"[DEBUG] Query executada - {len(results)} resultados")
         
         data = []
@@ -117,21 +89,14 @@ def api_temperature_data():
 
 @app.route('/api/humidity/data')
 def api_humidity_data():
-    """API para dados de umidade usando view"""
+    """API para dados de umidade"""
     limit = request.args.get('limit', 50, type=int)
     hours = request.args.get('hours', 24, type=int)
     
     print(f"[DEBUG] Humidity API chamada - hours={hours}, limit={limit}")
     
-    query = f"""
-        SELECT * FROM vw_humidity_activity 
-        WHERE created_at >= datetime('now', '-{hours} hours')
-        ORDER BY created_at DESC 
-        LIMIT {limit}
-    """
-    
     try:
-        results = DatabaseManager.execute_query(query)
+        results = get_storage().sensor_readings('humidity', hours, limit)
         print(f"[DEBUG] Query executada - {len(results)} resultados")
         
         data = []
@@ -159,18 +124,11 @@ def api_humidity_data():
 
 @app.route('/api/motion/data')
 def api_motion_data():
-    """API para dados de movimento usando view"""
+    """API para dados de movimento"""
     limit = request.args.get('limit', 50, type=int)
     hours = request.args.get('hours', 24, type=int)
     
-    query = f"""
-        SELECT * FROM vw_motion_activity 
-        WHERE created_at >= datetime('now', '-{hours} hours')
-        ORDER BY created_at DESC 
-        LIMIT {limit}
-    """
-    
-    results = DatabaseManager.execute_query(query)
+    results = get_storage().sensor_readings('motion', hours, limit)
     
     data = []
     for row in results:
@@ -185,18 +143,11 @@ def api_motion_data():
 
 @app.route('/api/relay/data')
 def api_relay_data():
-    """API para dados de relés usando view"""
+    """API para dados de relés"""
     limit = request.args.get('limit', 50, type=int)
     hours = request.args.get('hours', 24, type=int)
     
-    query = f"""
-        SELECT * FROM vw_relay_activity 
-        WHERE created_at >= datetime('now', '-{hours} hours')
-        ORDER BY created_at DESC 
-        LIMIT {limit}
-    """
-    
-    results = DatabaseManager.execute_query(query)
+    results = get_storage().sensor_readings('relay', hours, limit)
     
     data = []
     for row in results:
@@ -215,24 +166,8 @@ def api_temperature_stats():
     """Estatísticas de temperatura por dispositivo"""
     hours = request.args.get('hours', 24, type=int)
     
-    query = f"""
-        SELECT 
-            device_id,
-            location,
-            sensor_type,
-            COUNT(*) as total_readings,
-            ROUND(AVG(CAST(temperature AS REAL)), 2) as avg_temp,
-            ROUND(MIN(CAST(temperature AS REAL)), 2) as min_temp,
-            ROUND(MAX(CAST(temperature AS REAL)), 2) as max_temp,
-            ROUND(AVG(CAST(rssi AS INTEGER)), 0) as avg_rssi,
-            MAX(created_at) as last_reading
-        FROM vw_temperature_activity 
-        WHERE created_at >= datetime('now', '-{hours} hours')
-        GROUP BY device_id
-        ORDER BY last_reading DESC
-    """
-    
-    results = DatabaseManager.execute_query(query)
+    results = get_storage().sensor_stats('temperature', hours, value_field='temperature')
+    results.sort(key=lambda row: row['last_at'], reverse=True)
     
     stats = []
     for row in results:
@@ -240,12 +175,12 @@ def api_temperature_stats():
             'device_id': row['device_id'],
             'location': row['location'],
             'sensor_type': row['sensor_type'],
-            'total_readings': row['total_readings'],
-            'avg_temp': row['avg_temp'],
-            'min_temp': row['min_temp'],
-            'max_temp': row['max_temp'],
+            'total_readings': row['total'],
+            'avg_temp': row['avg_value'],
+            'min_temp': row['min_value'],
+            'max_temp': row['max_value'],
             'avg_rssi': row['avg_rssi'],
-            'last_reading': row['last_reading']
+            'last_reading': row['last_at']
         })
     
     return jsonify(stats)
@@ -255,24 +190,8 @@ def api_humidity_stats():
     """Estatísticas de umidade por dispositivo"""
     hours = request.args.get('hours', 24, type=int)
     
-    query = f"""
-        SELECT 
-            device_id,
-            location,
-            sensor_type,
-            COUNT(*) as total_readings,
-            ROUND(AVG(CAST(humidity AS REAL)), 2) as avg_humidity,
-            ROUND(MIN(CAST(humidity AS REAL)), 2) as min_humidity,
-            ROUND(MAX(CAST(humidity AS REAL)), 2) as max_humidity,
-            ROUND(AVG(CAST(rssi AS INTEGER)), 0) as avg_rssi,
-            MAX(created_at) as last_reading
-        FROM vw_humidity_activity 
-        WHERE created_at >= datetime('now', '-{hours} hours')
-        GROUP BY device_id
-        ORDER BY last_reading DESC
-    """
-    
-    results = DatabaseManager.execute_query(query)
+    results = get_storage().sensor_stats('humidity', hours, value_field='humidity')
+    results.sort(key=lambda row: row['last_at'], reverse=True)
     
     stats = []
     for row in results:
@@ -280,12 +199,12 @@ def api_humidity_stats():
             'device_id': row['device_id'],
             'location': row['location'],
             'sensor_type': row['sensor_type'],
-            'total_readings': row['total_readings'],
-            'avg_humidity': row['avg_humidity'],
-            'min_humidity': row['min_humidity'],
-            'max_humidity': row['max_humidity'],
+            'total_readings': row['total'],
+            'avg_humidity': row['avg_value'],
+            'min_humidity': row['min_value'],
+            'max_humidity': row['max_value'],
             'avg_rssi': row['avg_rssi'],
-            'last_reading': row['last_reading']
+            'last_reading': row['last_at']
         })
     
     return jsonify(stats)
@@ -295,58 +214,60 @@ def api_motion_stats():
     """Estatísticas de movimento por dispositivo"""
     hours = request.args.get('hours', 24, type=int)
     
-    query = f"""
-        SELECT 
-            device_id,
-            location,
-            COUNT(*) as total_detections,
-            MAX(created_at) as last_detection,
-            MIN(created_at) as first_detection
-        FROM vw_motion_activity 
-        WHERE created_at >= datetime('now', '-{hours} hours')
-        GROUP BY device_id
-        ORDER BY total_detections DESC
-    """
-    
-    results = DatabaseManager.execute_query(query)
+    results = get_storage().sensor_stats('motion', hours)
+    results.sort(key=lambda row: row['total'], reverse=True)
     
     stats = []
     for row in results:
         stats.append({
             'device_id': row['device_id'],
             'location': row['location'],
-            'total_detections': row['total_detections'],
-            'last_detection': row['last_detection'],
-            'first_detection': row['first_detection']
+            'total_detections': row['total'],
+            'last_detection': row['last_at'],
+            'first_detection': row['first_at']
         })
     
     return jsonify(stats)
 
+@app.route('/api/motion/occupancy')
+def api_motion_occupancy():
+    """Cômodos mais ocupados por hora da semana e transições (tabelas de sessões)"""
+    limit = request.args.get('limit', 10, type=int)
+    
+    occupancy = get_storage().motion_occupancy(limit)
+    
+    return jsonify({
+        'rooms': [
+            {'sensor': sensor, 'sessions': sessions, 'total_seconds': total_seconds}
+            for sensor, sessions, total_seconds in occupancy['rooms']
+        ],
+        'busiest_hours': [
+            {'sensor': sensor, 'weekday': hour_of_week // 24, 'hour': hour_of_week % 24,
+             'sessions': sessions, 'total_seconds': total_seconds}
+            for sensor, hour_of_week, sessions, total_seconds in occupancy['busiest_hours']
+        ],
+        'transitions': [
+            {'from': from_sensor, 'to': to_sensor, 'count': count}
+            for from_sensor, to_sensor, count in occupancy['transitions']
+        ]
+    })
+
 @app.route('/api/dashboard/summary')
 def api_dashboard_summary():
     """Resumo geral para o dashboard"""
     hours = request.args.get('hours', 24, type=int)
+    storage = get_storage()
     
     # Contar dispositivos ativos por tipo
-    queries = {
-        'temperature': f"SELECT COUNT(DISTINCT device_id) as count FROM vw_temperature_activity WHERE created_at >= datetime('now', '-{hours} hours')",
-        'humidity': f"SELECT COUNT(DISTINCT device_id) as count FROM vw_humidity_activity WHERE created_at >= datetime('now', '-{hours} hours')",
-        'motion': f"SELECT COUNT(DISTINCT device_id) as count FROM vw_motion_activity WHERE created_at >= datetime('now', '-{hours} hours')",
-        'relay': f"SELECT COUNT(DISTINCT topic) as count FROM vw_relay_activity WHERE created_at >= datetime('now', '-{hours} hours')"
+    summary = {
+        'temperature_devices': storage.count_distinct('temperature', hours, 'device_id'),
+        'humidity_devices': storage.count_distinct('humidity', hours, 'device_id'),
+        'motion_devices': storage.count_distinct('motion', hours, 'device_id'),
+        'relay_devices': storage.count_distinct('relay', hours, 'topic')
     }
     
-    summary = {}
-    for sensor_type, query in queries.items():
-        result = DatabaseManager.execute_query(query)
-        summary[f'{sensor_type}_devices'] = result[0]['count'] if result else 0
-    
-    # Total de eventos nas últimas horas
-    total_events_query = f"""
-        SELECT COUNT(*) as total FROM activity 
-        WHERE created_at >= datetime('now', '-{hours} hours')
-    """
-    result = DatabaseManager.execute_query(total_events_query)
-    summary['total_events'] = result[0]['total'] if result else 0
+    # Total de eventos nas últimas horas (contadores por hora, sem varrer a tabela)
+    summary['total_events'] = storage.count_since('activity', hours)
     
     return jsonify(summary)
 
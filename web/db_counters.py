@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Row Counters
+Trigger-maintained counters so statistics never need COUNT(*) over big tables
+
+Tables:
+    row_counters(table_name, kind, row_count)           -> totals per table/kind
+    hourly_counters(table_name, kind, hour, row_count)  -> per-hour ('YYYY-MM-DD HH')
+    counter_state(table_name, initialized_at)           -> backfill bookkeeping
+    relay_status(device_name, current_status, last_update) -> latest relay status
+
+"kind" is the topic kind for `activity` (motion, relay, ...), the sensor name
+for `motion_sensors` and `motion_detections` (MOTION_DETECTED rows only) and
+the device name for `relay_activity`. Triggers keep the counters exact for
+every writer (logger, monitors, cleanup scripts).
+"""
+
+import fnmatch
+
+# Topic kind rules (GLOB patterns, first match wins) - shared by SQL and Python
+TOPIC_KIND_RULES = (
+    ('system', ('system/*',)),
+    ('relay', ('home/relay*', 'home/*/relay*')),
+    ('motion', ('home/motion*', 'home/*/motion*')),
+    ('temperature', ('home/temperature/*',)),
+    ('humidity', ('home/humidity/*',)),
+    ('sensor', ('home/sensor/*',)),
+    ('audio', ('home/audio/*',)),
+    ('RDA5807', ('home/RDA5807/*',)),
+)
+
+
+def topic_kind(topic):
+    """Classify a topic into a device family (same rules as the SQL triggers)"""
+    for kind, patterns in TOPIC_KIND_RULES:
+        for pattern in patterns:
+            if fnmatch.fnmatchcase(topic, pattern):
+                return kind
+    return 'other'
+
+
+def _topic_kind_sql(column):
+    cases = []
+    for kind, patterns in TOPIC_KIND_RULES:
+        condition = ' OR '.join(f"{column} GLOB '{pattern}'" for pattern in patterns)
+        cases.append(f"WHEN {condition} THEN '{kind}'")
+    return f"CASE {' '.join(cases)} ELSE 'other' END"
+
+
+# table -> (kind expression, timestamp column), expressions use the {row} placeholder
+COUNTED_TABLES = {
+    'activity': (_topic_kind_sql('{row}.topic'), 'created_at'),
+    'motion_sensors': ("COALESCE({row}.sensor, 'unknown')", 'created_at'),
+    'relay_activity': ("COALESCE({row}.device_name, 'unknown')", 'created_at'),
+}
+
+# Counters over part of a table: counter -> (source table, row condition, kind expression, timestamp column)
+FILTERED_COUNTERS = {
+    'motion_detections': ('motion_sensors', "{row}.event = 'MOTION_DETECTED'",
+                          "COALESCE({row}.sensor, 'unknown')", 'created_at'),
+}
+
+# Latest status report/command per relay, kept on insert into relay_activity
+RELAY_STATUS_TABLE = 'relay_status'
+RELAY_STATUS_EVENTS = "('STATUS_REPORT', 'COMMAND_RECEIVED')"
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS row_counters (
+        table_name TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        row_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (table_name, kind)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS hourly_counters (
+        table_name TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        hour TEXT NOT NULL,
+        row_count INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (table_name, hour, kind)
+    )''',
+    '''CREATE TABLE IF NOT EXISTS counter_state (
+        table_name TEXT PRIMARY KEY,
+        initialized_at TEXT NOT NULL
+    )''',
+    f'''CREATE TABLE IF NOT EXISTS {RELAY_STATUS_TABLE} (
+        device_name TEXT PRIMARY KEY,
+        current_status TEXT,
+        last_update TEXT
+    )'''
+]
+
+
+def _trigger_sql(name, table, kind_expr, time_column, condition=None):
+    insert_kind = kind_expr.format(row='NEW')
+    delete_kind = kind_expr.format(row='OLD')
+    insert_when = f" WHEN {condition.format(row='NEW')}" if condition else ''
+    delete_when = f" WHEN {condition.format(row='OLD')}" if condition else ''
+    return [
+        f'''CREATE TRIGGER IF NOT EXISTS trg_{name}_count_insert AFTER INSERT ON {table}{insert_when}
+        BEGIN
+            INSERT INTO row_counters (table_name, kind, row_count)
+            VALUES ('{name}', {insert_kind}, 1)
+            ON CONFLICT (table_name, kind) DO UPDATE SET row_count = row_count + 1;
+            INSERT INTO hourly_counters (table_name, kind, hour, row_count)
+            VALUES ('{name}', {insert_kind}, substr(NEW.{time_column}, 1, 13), 1)
+            ON CONFLICT (table_name, hour, kind) DO UPDATE SET row_count = row_count + 1;
+        END''',
+        f'''CREATE TRIGGER IF NOT EXISTS trg_{name}_count_delete AFTER DELETE ON {table}{delete_when}
+        BEGIN
+            UPDATE row_counters SET row_count = row_count - 1
+            WHERE table_name = '{name}' AND kind = {delete_kind};
+            UPDATE hourly_counters SET row_count = row_count - 1
+            WHERE table_name = '{name}' AND kind = {delete_kind}
+              AND hour = substr(OLD.{time_column}, 1, 13);
+        END'''
+    ]
+
+
+def _init_counter(cursor, name, table, kind_expr, time_column, condition=None):
+    """Triggers plus backfill of one counter"""
+    for statement in _trigger_sql(name, table, kind_expr, time_column, condition):
+        cursor.execute(statement)
+
+    kind = kind_expr.format(row=table)
+    where = f"WHERE {condition.format(row=table)}" if condition else ''
+    cursor.execute('DELETE FROM row_counters WHERE table_name = ?', (name,))
+    cursor.execute('DELETE FROM hourly_counters WHERE table_name = ?', (name,))
+    cursor.execute(f'''
+        INSERT INTO hourly_counters (table_name, kind, hour, row_count)
+        SELECT '{name}', {kind}, substr({time_column}, 1, 13), COUNT(*)
+        FROM {table}
+        {where}
+        GROUP BY 2, 3
+    ''')
+    cursor.execute('''
+        INSERT INTO row_counters (table_name, kind, row_count)
+        SELECT table_name, kind, SUM(row_count)
+        FROM hourly_counters
+        WHERE table_name = ?
+        GROUP BY kind
+    ''', (name,))
+
+
+def _init_relay_status(cursor):
+    """Trigger plus backfill of relay_status (newest timestamp_received wins)"""
+    cursor.execute(f'''CREATE TRIGGER IF NOT EXISTS trg_{RELAY_STATUS_TABLE}_insert AFTER INSERT ON relay_activity
+        WHEN NEW.event IN {RELAY_STATUS_EVENTS}
+        BEGIN
+            INSERT INTO {RELAY_STATUS_TABLE} (device_name, current_status, last_update)
+            VALUES (COALESCE(NEW.device_name, 'unknown'), NEW.current_status, NEW.timestamp_received)
+            ON CONFLICT (device_name) DO UPDATE SET
+                current_status = excluded.current_status, last_update = excluded.last_update
+            WHERE excluded.last_update >= {RELAY_STATUS_TABLE}.last_update;
+        END''')
+    cursor.execute(f'DELETE FROM {RELAY_STATUS_TABLE}')
+    # SQLite takes the bare columns from the MAX() row
+    cursor.execute(f'''
+        INSERT INTO {RELAY_STATUS_TABLE} (device_name, current_status, last_update)
+        SELECT COALESCE(device_name, 'unknown'), current_status, MAX(timestamp_received)
+        FROM relay_activity
+        WHERE event IN {RELAY_STATUS_EVENTS}
+        GROUP BY 1
+    ''')
+
+
+def _existing_tables(cursor):
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def ensure_counters(conn):
+    """
+    Create counter tables/triggers and backfill tables not yet counted.
+    Cheap when everything is already initialized (no write transaction).
+    """
+    cursor = conn.cursor()
+    tables = _existing_tables(cursor)
+    sources = {table: table for table in COUNTED_TABLES}
+    sources.update((name, spec[0]) for name, spec in FILTERED_COUNTERS.items())
+    sources[RELAY_STATUS_TABLE] = 'relay_activity'
+    pending = [name for name, table in sources.items() if table in tables]
+
+    if 'counter_state' in tables:
+        cursor.execute('SELECT table_name FROM counter_state')
+        done = {row[0] for row in cursor.fetchall()}
+        pending = [name for name in pending if name not in done]
+    if not pending:
+        return
+
+    # The backfill and trigger creation share one write transaction,
+    # so no row can be counted twice or missed
+    in_transaction = conn.in_transaction
+    if not in_transaction:
+        cursor.execute('BEGIN IMMEDIATE')
+    try:
+        for statement in SCHEMA:
+            cursor.execute(statement)
+
+        for name in pending:
+            if name == RELAY_STATUS_TABLE:
+                _init_relay_status(cursor)
+            elif name in FILTERED_COUNTERS:
+                table, condition, kind_expr, time_column = FILTERED_COUNTERS[name]
+                _init_counter(cursor, name, table, kind_expr, time_column, condition)
+            else:
+                kind_expr, time_column = COUNTED_TABLES[name]
+                _init_counter(cursor, name, name, kind_expr, time_column)
+            cursor.execute('''
+                INSERT OR REPLACE INTO counter_state (table_name, initialized_at)
+                VALUES (?, datetime('now'))
+            ''', (name,))
+
+        if not in_transaction:
+            conn.commit()
+    except Exception:
+        if not in_transaction:
+            conn.rollback()
+        raise
+
+
+def latest_relay_status(conn):
+    """[(device_name, current_status, last_update), ...], most recently updated first"""
+    ensure_counters(conn)
+    cursor = conn.cursor()
+    cursor.execute(f'''
+        SELECT device_name, current_status, last_update FROM {RELAY_STATUS_TABLE}
+        ORDER BY last_update DESC
+    ''')
+    return cursor.fetchall()
+
+
+def table_count(conn, table):
+    """Total rows in `table` (O(number of kinds))"""
+    ensure_counters(conn)
+    cursor = conn.cursor()
+    cursor.execute('SELECT COALESCE(SUM(row_count), 0) FROM row_counters WHERE table_name = ?', (table,))
+    return cursor.fetchone()[0]
+
+
+def kind_counts(conn, table):
+    """[(kind, rows), ...] for `table`, largest first"""
+    ensure_counters(conn)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT kind, row_count FROM row_counters
+        WHERE table_name = ? AND row_count > 0
+        ORDER BY row_count DESC
+    ''', (table,))
+    return cursor.fetchall()
+
+
+def count_since(conn, table, hours, kind=None):
+    """
+    Rows of `table` in the last `hours` hours, at hour granularity
+    (the current partial hour and the oldest hour are both included)
+    """
+    ensure_counters(conn)
+    query = '''
+        SELECT COALESCE(SUM(row_count), 0) FROM hourly_counters
+        WHERE table_name = ? AND hour >= strftime('%Y-%m-%d %H', 'now', ?)
+    '''
+    params = [table, f'-{int(hours)} hours']
+    if kind is not None:
+        query += ' AND kind = ?'
+        params.append(kind)
+
+    cursor = conn.cursor()
+    cursor.execute(query, params)
+    return cursor.fetchone()[0]
@@ -4,127 +4,73 @@ HomeGuard Database Query Utilities
 Provides utilities to query and analyze activity data
 """
 
-import sqlite3
 import json
 import argparse
-import os
-from datetime import datetime, timedelta
 from collections import Counter
 
-# Database configuration - usando caminho relativo
-SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
-DB_PATH = os.path.join(PROJECT_ROOT, 'db', 'homeguard.db')
-
-def get_connection():
-    """Get database connection"""
-    return sqlite3.connect(DB_PATH)
+from storage import get_storage
 
 def show_stats():
     """Show database statistics"""
-    conn = get_connection()
-    cursor = conn.cursor()
+    storage = get_storage()
     
-    # Total records
-    cursor.execute("SELECT COUNT(*) FROM activity")
-    total_records = cursor.fetchone()[0]
+    # Total records (maintained counters, no table scan)
+    total_records = storage.table_count('activity')
+    kinds = storage.kind_counts('activity')
     
     # Date range
-    cursor.execute("SELECT MIN(created_at), MAX(created_at) FROM activity")
-    date_range = cursor.fetchone()
+    date_range = storage.date_range('activity')
     
     # Topic distribution
-    cursor.execute("""
-        SELECT topic, COUNT(*) as count 
-        FROM activity 
-        WHERE topic NOT LIKE 'system/%'
-        GROUP BY topic 
-        ORDER BY count DESC 
-        LIMIT 10
-    """)
-    top_topics = cursor.fetchall()
+    top_topics = storage.top_topics(10)
     
     # Device activity
-    cursor.execute("""
-        SELECT 
-            CASE 
-                WHEN topic LIKE 'home/motion/%' THEN substr(topic, 13, instr(substr(topic, 13), '/') - 1)
-                WHEN topic LIKE 'home/sensor/%' THEN substr(topic, 13, instr(substr(topic, 13), '/') - 1)
-                WHEN topic LIKE 'home/relay/%' THEN substr(topic, 12, instr(substr(topic, 12), '/') - 1)
-                WHEN topic LIKE 'home/temperature/%' THEN substr(topic, 18, instr(substr(topic, 18), '/') - 1)
-                WHEN topic LIKE 'home/humidity/%' THEN substr(topic, 15, instr(substr(topic, 15), '/') - 1)
-                WHEN topic LIKE 'home/RDA5807/%' THEN 'RDA5807'
-                ELSE 'other'
-            END as device_id,
-            COUNT(*) as message_count
-        FROM activity 
-        WHERE topic LIKE 'home/%'
-        GROUP BY device_id
-        ORDER BY message_count DESC
-    """)
-    devices = cursor.fetchall()
+    devices = storage.device_activity()
     
     print("📊 HomeGuard Database Statistics")
     print("=" * 50)
+    print(f"🗄️  Storage: {storage.describe()}")
     print(f"📝 Total Records: {total_records:,}")
     print(f"📅 Date Range: {date_range[0]} to {date_range[1]}")
     print()
     
+    print("🧩 Messages by Topic Kind:")
+    for kind, count in kinds:
+        print(f"   {kind:<20} {count:>6} messages")
+    print()
+    
     print("🔥 Top 10 Topics:")
-    for topic, count in top_topics:
-        print(f"   {topic:<40} {count:>6} messages")
+    for row in top_topics:
+        print(f"   {row['topic']:<40} {row['count']:>6} messages")
     print()
     
     print("🏠 Device Activity:")
-    for device, count in devices:
-        print(f"   {device:<20} {count:>6} messages")
-    
-    conn.close()
+    for row in devices:
+        print(f"   {row['device_id']:<20} {row['message_count']:>6} messages")
 
 def show_recent(limit=20):
     """Show recent activity"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT created_at, topic, message 
-        FROM activity 
-        ORDER BY id DESC 
-        LIMIT ?
-    """, (limit,))
-    
-    records = cursor.fetchall()
+    records = get_storage().query_range(limit=limit)
     
     print(f"📋 Recent {len(records)} Activities:")
     print("=" * 80)
     
-    for created_at, topic, message in records:
+    for record in records:
+        message = record['message']
         # Truncate long messages
         display_msg = message[:60] + "..." if len(message) > 60 else message
-        print(f"{created_at} | {topic:<35} | {display_msg}")
-    
-    conn.close()
+        print(f"{record['created_at']} | {record['topic']:<35} | {display_msg}")
 
 def show_device_activity(device_id):
     """Show activity for specific device"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    cursor.execute("""
-        SELECT created_at, topic, message 
-        FROM activity 
-        WHERE topic LIKE ?
-        ORDER BY id DESC 
-        LIMIT 50
-    """, (f'%{device_id}%',))
-    
-    records = cursor.fetchall()
+    records = get_storage().query_range(topic_like=f'%{device_id}%', limit=50)
     
     print(f"🔍 Activity for device: {device_id}")
     print("=" * 80)
     
-    for created_at, topic, message in records:
-        print(f"{created_at} | {topic}")
+    for record in records:
+        message = record['message']
+        print(f"{record['created_at']} | {record['topic']}")
         if message.startswith('{'):
             try:
                 json_data = json.loads(message)
@@ -135,40 +81,25 @@ def show_device_activity(device_id):
         else:
             print(f"   {message}")
         print("-" * 40)
-    
-    conn.close()
 
 def export_to_json(output_file, hours=24):
     """Export recent data to JSON file"""
-    conn = get_connection()
-    cursor = conn.cursor()
-    
-    # Calculate time threshold
-    time_threshold = (datetime.now() - timedelta(hours=hours)).strftime('%Y-%m-%d %H:%M:%S')
-    
-    cursor.execute("""
-        SELECT id, created_at, topic, message 
-        FROM activity 
-        WHERE created_at >= ?
-        ORDER BY id DESC
-    """, (time_threshold,))
-    
-    records = cursor.fetchall()
+    records = get_storage().query_range(hours=hours)
     
     # Convert to list of dictionaries
     data = []
     for record in records:
         row = {
-            'id': record[0],
-            'created_at': record[1],
-            'topic': record[2],
-            'message': record[3]
+            'id': record['id'],
+            'created_at': str(record['created_at']),
+            'topic': record['topic'],
+            'message': record['message']
         }
         
         # Try to parse message as JSON
         try:
-            if record[3].startswith('{'):
-                row['message_json'] = json.loads(record[3])
+            if record['message'].startswith('{'):
+                row['message_json'] = json.loads(record['message'])
         except:
             pass
             
@@ -179,7 +110,6 @@ def export_to_json(output_file, hours=24):
         json.dump(data, f, indent=2)
     
     print(f"✅ Exported {len(data)} records to {output_file}")
-    conn.close()
 
 def main():
     parser = argparse.ArgumentParser(description='HomeGuard Database Query Utilities')
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+HomeGuard DB Replicator
+Continuous replication SQLite (edge buffer on the Pi) -> MySQL (long-term store)
+
+Each table is tailed by its autoincrement `id` high-water mark:
+    SELECT ... FROM <table> WHERE id > <hwm> ORDER BY id LIMIT <batch>
+and the batch is upserted into the target, so replaying a batch after a crash
+or an outage is harmless. The position of every table is saved in a JSON state
+file after each committed batch, together with the replication lag.
+
+Only inserts are replicated (rows are never updated in place by the HomeGuard
+writers); deletions made by cleanup scripts are not propagated, the long-term
+store keeps the history.
+
+Usage:
+    python3 db_replicator.py                      # replicate to MySQL (homeguard_mysql_config.json)
+    python3 db_replicator.py --target-sqlite /tmp/replica.db   # offline target
+    python3 db_replicator.py --once               # single pass, then exit
+    python3 db_replicator.py --status             # show position and lag
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import signal
+import sqlite3
+import sys
+import threading
+import time
+from datetime import datetime
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+
+try:
+    from storage import MySQLTarget, load_mysql_config
+except ImportError:
+    sys.path.insert(0, SCRIPT_DIR)
+    from storage import MySQLTarget, load_mysql_config
+
+REPLICATION_CONFIG = {
+    'source_path': os.path.join(PROJECT_ROOT, 'db', 'homeguard.db'),
+    'state_path': os.path.join(PROJECT_ROOT, 'db', 'replication_state.json'),
+    'mysql_config_file': 'homeguard_mysql_config.json',
+    'tables': ['activity', 'motion_sensors', 'relay_activity', 'dht11_sensors', 'sensor_alerts'],
+    'time_column': 'created_at',
+    'batch_size': 500,
+    'poll_interval': 2.0,     # idle wait when every table is caught up
+    'backoff_initial': 1.0,   # target unreachable: 1s, 2s, 4s, ... up to backoff_max
+    'backoff_max': 60.0
+}
+
+logger = logging.getLogger('homeguard.replicator')
+
+
+class SQLiteTarget:
+    """Second SQLite file as target (offline runs and tests)"""
+
+    name = 'SQLite'
+    placeholder = '?'
+
+    def __init__(self, path):
+        self.path = path
+
+    def describe(self):
+        return self.path
+
+    def connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        return sqlite3.connect(self.path, timeout=10.0)
+
+    def columns(self, conn, table):
+        return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+    def create_table(self, conn, table, source_columns):
+        definitions = []
+        for _, name, col_type, _, _, pk in source_columns:
+            if name == 'id':
+                definitions.append('id INTEGER PRIMARY KEY')
+            else:
+                definitions.append(f'{name} {col_type or ""}'.strip())
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {table} ({", ".join(definitions)})')
+        conn.commit()
+
+    def upsert_sql(self, table, columns):
+        updates = ', '.join(f'{c} = excluded.{c}' for c in columns if c != 'id')
+        action = f'DO UPDATE SET {updates}' if updates else 'DO NOTHING'
+        return (f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))}) '
+                f'ON CONFLICT (id) {action}')
+
+    def upsert_many(self, conn, sql, rows):
+        conn.executemany(sql, rows)
+
+
+class ReplicationState:
+    """High-water marks and lag per table, persisted atomically"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.tables = {}
+        try:
+            with open(path, 'r') as f:
+                self.tables = json.load(f).get('tables', {})
+        except (OSError, ValueError):
+            pass
+
+    def high_water_mark(self, table):
+        with self.lock:
+            return self.tables.get(table, {}).get('last_id', 0)
+
+    def update(self, table, **values):
+        with self.lock:
+            self.tables.setdefault(table, {'last_id': 0, 'rows_replicated': 0}).update(values)
+
+    def save(self, target_name, connected, error=None):
+        with self.lock:
+            data = {
+                'timestamp': time.time(),
+                'updated_at': datetime.now().isoformat(),
+                'target': target_name,
+                'connected': connected,
+                'last_error': error,
+                'tables': self.tables
+            }
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, indent=2)
+            os.replace(tmp_path, self.path)
+
+
+class Replicator:
+    """Tails the source tables and ships batches to the target"""
+
+    def __init__(self, source_path, target, state_path, tables, batch_size=500, poll_interval=2.0,
+                 backoff_initial=1.0, backoff_max=60.0, time_column='created_at'):
+        self.source_path = source_path
+        self.target = target
+        self.state = ReplicationState(state_path)
+        self.tables = tables
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self.time_column = time_column
+
+        self.stop_event = threading.Event()
+        self.source_conn = None
+        self.target_conn = None
+        self.plans = {}  # table -> (select_sql, upsert_sql, columns, has_time_column)
+
+    # ----------------------------------------------------------- connections
+
+    def _open_source(self):
+        if self.source_conn is None:
+            # Read-only: never blocks the logger's writes
+            self.source_conn = sqlite3.connect(f'file:{os.path.abspath(self.source_path)}?mode=ro',
+                                               uri=True, timeout=10.0)
+        return self.source_conn
+
+    def _open_target(self):
+        if self.target_conn is None:
+            self.target_conn = self.target.connect()
+            self.plans = {}
+            logger.info(f"🔗 Conectado ao destino {self.target.name}: {self.target.describe()}")
+        return self.target_conn
+
+    def _close_target(self):
+        if self.target_conn is not None:
+            try:
+                self.target_conn.close()
+            except Exception:
+                pass
+            self.target_conn = None
+
+    def close(self):
+        self._close_target()
+        if self.source_conn is not None:
+            self.source_conn.close()
+            self.source_conn = None
+
+    # ----------------------------------------------------------------- plans
+
+    def _plan(self, table):
+        """Column intersection and SQL for a table (None if not in the source)"""
+        if table in self.plans:
+            return self.plans[table]
+
+        source_columns = self._open_source().execute(f'PRAGMA table_info({table})').fetchall()
+        if not source_columns:
+            self.plans[table] = None
+            return None
+
+        target_columns = self.target.columns(self.target_conn, table)
+        if not target_columns:
+            logger.info(f"🆕 Criando tabela {table} no destino")
+            self.target.create_table(self.target_conn, table, source_columns)
+            target_columns = self.target.columns(self.target_conn, table)
+
+        columns = [col[1] for col in source_columns if col[1] in target_columns]
+        if 'id' not in columns:
+            raise ValueError(f"tabela {table} sem coluna 'id' na origem ou no destino")
+
+        select_sql = (f'SELECT {", ".join(columns)} FROM {table} '
+                      f'WHERE id > ? ORDER BY id LIMIT {self.batch_size}')
+        has_time_column = any(col[1] == self.time_column for col in source_columns)
+        self.plans[table] = (select_sql, self.target.upsert_sql(table, columns), columns, has_time_column)
+        return self.plans[table]
+
+    # ------------------------------------------------------------------- lag
+
+    def _lag(self, table, last_id, has_time_column):
+        """Rows behind and age (seconds) of the oldest row not yet replicated"""
+        source = self._open_source()
+        max_id = source.execute(f'SELECT MAX(id) FROM {table}').fetchone()[0] or 0
+        lag_seconds = 0.0
+        if has_time_column and max_id > last_id:
+            row = source.execute(f'''
+                SELECT strftime('%s', 'now') - strftime('%s', {self.time_column})
+                FROM {table} WHERE id > ? ORDER BY id LIMIT 1
+            ''', (last_id,)).fetchone()
+            lag_seconds = float(row[0]) if row and row[0] is not None else None
+        return max(0, max_id - last_id), lag_seconds
+
+    # ------------------------------------------------------------ replication
+
+    def replicate_table(self, table):
+        """Ship one batch; returns the number of rows replicated"""
+        plan = self._plan(table)
+        if plan is None:
+            return 0
+        select_sql, upsert_sql, columns, has_time_column = plan
+
+        last_id = self.state.high_water_mark(table)
+        rows = self._open_source().execute(select_sql, (last_id,)).fetchall()
+        if rows:
+            self.target.upsert_many(self.target_conn, upsert_sql, rows)
+            self.target_conn.commit()
+            last_id = rows[-1][columns.index('id')]
+
+        lag_rows, lag_seconds = self._lag(table, last_id, has_time_column)
+        replicated = self.state.tables.get(table, {}).get('rows_replicated', 0) + len(rows)
+        self.state.update(table, last_id=last_id, rows_replicated=replicated,
+                          lag_rows=lag_rows, lag_seconds=lag_seconds)
+        return len(rows)
+
+    def run_once(self):
+        """One pass over every table until caught up; returns rows replicated"""
+        self._open_target()
+        total = 0
+        for table in self.tables:
+            while not self.stop_event.is_set():
+                count = self.replicate_table(table)
+                total += count
+                if count:
+                    self.state.save(self.target.name, connected=True)
+                if count < self.batch_size:
+                    break
+        self.state.save(self.target.name, connected=True)
+        return total
+
+    def run(self):
+        """Replicate until stopped, backing off while the target is unreachable"""
+        backoff = self.backoff_initial
+        logger.info(f"🚀 Replicando {self.source_path} -> {self.target.name} {self.target.describe()}")
+
+        while not self.stop_event.is_set():
+            try:
+                count = self.run_once()
+                backoff = self.backoff_initial
+                if count:
+                    logger.info(f"📤 {count} registros replicados")
+                self.stop_event.wait(self.poll_interval)
+
+            except Exception as e:
+                self._close_target()
+                try:
+                    self.state.save(self.target.name, connected=False, error=str(e))
+                except OSError:
+                    pass
+                delay = backoff * random.uniform(0.8, 1.2)
+                logger.warning(f"⚠️  Falha na replicação ({e}); nova tentativa em {delay:.1f}s")
+                self.stop_event.wait(delay)
+                backoff = min(backoff * 2, self.backoff_max)
+
+        self.close()
+        logger.info("🛑 Replicação parada")
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def show_status(state_path):
+    """Print position and lag from the state file"""
+    try:
+        with open(state_path, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        print(f"❌ Estado de replicação não encontrado: {state_path}")
+        return False
+
+    age = time.time() - data.get('timestamp', 0)
+    print(f"🔁 Replicação -> {data.get('target')} (atualizado há {age:.0f}s)")
+    print(f"   Conectado: {'✅' if data.get('connected') else '❌'}")
+    if data.get('last_error'):
+        print(f"   Último erro: {data['last_error']}")
+    print(f"\n{'Tabela':<16} {'Último id':>10} {'Replicados':>12} {'Atraso':>10} {'Idade':>10}")
+    print("-" * 62)
+    for table, info in data.get('tables', {}).items():
+        lag_seconds = info.get('lag_seconds')
+        age_text = f"{lag_seconds:.0f}s" if lag_seconds is not None else '-'
+        print(f"{table:<16} {info.get('last_id', 0):>10} {info.get('rows_replicated', 0):>12,} "
+              f"{info.get('lag_rows', 0):>10,} {age_text:>10}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HomeGuard - Replicação contínua SQLite → MySQL')
+    parser.add_argument('--source', default=REPLICATION_CONFIG['source_path'], help='SQLite de origem')
+    parser.add_argument('--target-sqlite', help='Replicar para outro arquivo SQLite (modo offline)')
+    parser.add_argument('--mysql-config', default=REPLICATION_CONFIG['mysql_config_file'],
+                        help='Arquivo de configuração MySQL')
+    parser.add_argument('--state', default=REPLICATION_CONFIG['state_path'], help='Arquivo de estado')
+    parser.add_argument('--tables', nargs='+', default=REPLICATION_CONFIG['tables'])
+    parser.add_argument('--batch-size', type=int, default=REPLICATION_CONFIG['batch_size'])
+    parser.add_argument('--once', action='store_true', help='Uma passada e sair')
+    parser.add_argument('--status', action='store_true', help='Mostrar posição e atraso')
+    args = parser.parse_args()
+
+    if args.status:
+        sys.exit(0 if show_status(args.state) else 1)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.target_sqlite:
+        target = SQLiteTarget(args.target_sqlite)
+    else:
+        target = MySQLTarget(load_mysql_config(args.mysql_config))
+
+    replicator = Replicator(
+        args.source, target, args.state, args.tables,
+        batch_size=args.batch_size,
+        poll_interval=REPLICATION_CONFIG['poll_interval'],
+        backoff_initial=REPLICATION_CONFIG['backoff_initial'],
+        backoff_max=REPLICATION_CONFIG['backoff_max'],
+        time_column=REPLICATION_CONFIG['time_column']
+    )
+
+    if args.once:
+        try:
+            count = replicator.run_once()
+            print(f"✅ {count} registros replicados")
+        finally:
+            replicator.close()
+        show_status(args.state)
+        return
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: replicator.stop())
+    signal.signal(signal.SIGINT, lambda signum, frame: replicator.stop())
+    replicator.run()
+
+
+if __name__ == '__main__':
+    main()
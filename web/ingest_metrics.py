@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Ingest Metrics
+Lightweight counters/histograms for the MQTT activity logger
+
+Exposes:
+- GET /metrics       -> Prometheus text format
+- GET /metrics.json  -> same data as JSON
+- a JSON snapshot file rewritten periodically (read by `mqtt_service.py status`)
+"""
+
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from db_counters import topic_kind
+
+# Histogram buckets
+COMMIT_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 200, 500)
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics)"""
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        cumulative = []
+        running = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            running += count
+            cumulative.append((bound, running))
+        return {'buckets': cumulative, 'sum': round(self.sum, 6), 'count': self.count}
+
+
+class IngestMetrics:
+    """Thread-safe metrics registry for the ingest path"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start_time = time.time()
+        self.messages_by_kind = {}
+        self.dropped_total = 0
+        self.reconnects_total = 0
+        self.commit_latency = Histogram(COMMIT_LATENCY_BUCKETS)
+        self.batch_size = Histogram(BATCH_SIZE_BUCKETS)
+        # Rolling per-minute counts for "last hour" without touching the DB
+        self.minute_counts = [0] * 60
+        self.minute_stamp = [0] * 60
+        # Callables returning {name: value} merged into every snapshot
+        self.gauge_sources = []
+
+    def message_received(self, topic):
+        kind = topic_kind(topic)
+        minute = int(time.time() // 60)
+        slot = minute % 60
+        with self.lock:
+            self.messages_by_kind[kind] = self.messages_by_kind.get(kind, 0) + 1
+            if self.minute_stamp[slot] != minute:
+                self.minute_stamp[slot] = minute
+                self.minute_counts[slot] = 0
+            self.minute_counts[slot] += 1
+
+    def message_dropped(self):
+        with self.lock:
+            self.dropped_total += 1
+
+    def reconnected(self):
+        with self.lock:
+            self.reconnects_total += 1
+
+    def batch_committed(self, size, latency):
+        with self.lock:
+            self.batch_size.observe(size)
+            self.commit_latency.observe(latency)
+
+    def add_gauge_source(self, source):
+        self.gauge_sources.append(source)
+
+    def snapshot(self):
+        """All metrics as a plain dict"""
+        now = time.time()
+        current_minute = int(now // 60)
+        with self.lock:
+            last_hour = sum(count for count, stamp in zip(self.minute_counts, self.minute_stamp)
+                            if current_minute - stamp < 60)
+            data = {
+                'timestamp': now,
+                'uptime_seconds': round(now - self.start_time, 1),
+                'messages_total': sum(self.messages_by_kind.values()),
+                'messages_last_hour': last_hour,
+                'messages_by_kind': dict(self.messages_by_kind),
+                'dropped_total': self.dropped_total,
+                'reconnects_total': self.reconnects_total,
+                'batch_size': self.batch_size.snapshot(),
+                'commit_latency_seconds': self.commit_latency.snapshot()
+            }
+
+        gauges = {}
+        for source in self.gauge_sources:
+            try:
+                gauges.update(source())
+            except Exception:
+                pass
+        data['gauges'] = gauges
+        return data
+
+    def render_prometheus(self):
+        """Prometheus text exposition format"""
+        data = self.snapshot()
+        lines = [
+            '# TYPE homeguard_ingest_messages_total counter'
+        ]
+        for kind, count in sorted(data['messages_by_kind'].items()):
+            lines.append(f'homeguard_ingest_messages_total{{kind="{kind}"}} {count}')
+
+        lines += [
+            '# TYPE homeguard_ingest_dropped_total counter',
+            f"homeguard_ingest_dropped_total {data['dropped_total']}",
+            '# TYPE homeguard_ingest_reconnects_total counter',
+            f"homeguard_ingest_reconnects_total {data['reconnects_total']}",
+            '# TYPE homeguard_ingest_uptime_seconds gauge',
+            f"homeguard_ingest_uptime_seconds {data['uptime_seconds']}"
+        ]
+
+        for name in ('batch_size', 'commit_latency_seconds'):
+            metric = f'homeguard_ingest_{name}'
+            histogram = data[name]
+            lines.append(f'# TYPE {metric} histogram')
+            for bound, count in histogram['buckets']:
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {count}')
+            lines.append(f"{metric}_sum {histogram['sum']}")
+            lines.append(f"{metric}_count {histogram['count']}")
+
+        for name, value in sorted(data['gauges'].items()):
+            metric = f'homeguard_ingest_{name}'
+            lines.append(f'# TYPE {metric} gauge')
+            lines.append(f'{metric} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write_snapshot(self, path):
+        """Atomically rewrite the JSON snapshot file"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, path)
+
+
+def read_snapshot(path, max_age=None):
+    """Load a snapshot written by write_snapshot (None if missing or stale)"""
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if max_age is not None and time.time() - data.get('timestamp', 0) > max_age:
+        return None
+    return data
+
+
+class MetricsExporter:
+    """Serves /metrics over HTTP and refreshes the snapshot file"""
+
+    def __init__(self, metrics, host, port, snapshot_path, snapshot_interval):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.server = None
+        self.stop_event = threading.Event()
+
+    def _make_handler(self):
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body = metrics.render_prometheus().encode('utf-8')
+                    content_type = 'text/plain; version=0.0.4'
+                elif self.path == '/metrics.json':
+                    body = json.dumps(metrics.snapshot()).encode('utf-8')
+                    content_type = 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # keep scrapes out of the logger output
+
+        return Handler
+
+    def _snapshot_loop(self):
+        while not self.stop_event.wait(self.snapshot_interval):
+            try:
+                self.metrics.write_snapshot(self.snapshot_path)
+            except OSError:
+                pass
+
+    def start(self):
+        if self.port:
+            self.server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+            self.server.daemon_threads = True
+            threading.Thread(target=self.server.serve_forever, name='metrics-http', daemon=True).start()
+        if self.snapshot_path:
+            threading.Thread(target=self._snapshot_loop, name='metrics-snapshot', daemon=True).start()
+
+    def stop(self):
+        self.stop_event.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if self.snapshot_path:
+            try:
+                self.metrics.write_snapshot(self.snapshot_path)
+            except OSError:
+                pass
@@ -8,6 +8,9 @@ import sqlite3
 import os
 from datetime import datetime
 
+from db_counters import ensure_counters
+from motion_sessions import ensure_session_tables
+
 # Database configuration - usando caminho relativo ao script
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)  # Vai para a pasta pai (HomeGuard)
@@ -43,6 +46,12 @@ def init_database():
     # Commit changes
     conn.commit()
     
+    # Trigger-maintained row counters (replace COUNT(*) scans)
+    ensure_counters(conn)
+    
+    # Motion sessions and precomputed occupancy (dashboard /api/motion/occupancy)
+    ensure_session_tables(conn)
+    
     # Insert initial record
     cursor.execute('''
         INSERT INTO activity (topic, message) 
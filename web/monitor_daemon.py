@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Monitor Daemon
+One MQTT connection and one batched DB writer for every monitor
+
+Replaces running side by side:
+    web/mqtt_activity_logger.py, scripts/motion_monitor_sqlite.py,
+    python/motion_monitor.py, scripts/motion_light_controller.py,
+    templates/motion_sensor/motion_sensor_monitor.py
+
+Each message is received once, decoded once (mqtt_client.Message: text, topic
+levels and JSON are computed a single time and shared) and dispatched to the
+handlers registered for matching topic patterns (python/topic_router.py, so
+named wildcards such as home/relay/+device_id/# fill message.captures). All persistence goes
+through the ActivityWriter of the activity logger (batches + spill journal).
+
+The connection is a python/mqtt_client.py ResilientMqttClient: handlers run on
+its worker pool instead of the network thread (one worker by default, since
+plugins keep state across topics; --workers N spreads topics over N threads,
+each topic still handled in order) and reconnects use exponential backoff.
+
+Plugin API - any object with:
+    setup(daemon)                -> daemon.register(pattern, handler) for each topic
+    on_daemon_connect(daemon)    -> optional
+    on_daemon_disconnect(daemon) -> optional
+    stop()                       -> optional
+
+Handlers receive an mqtt_client.Message and may use daemon.publish(),
+daemon.log_activity() and daemon.store_row().
+
+Usage:
+    python3 monitor_daemon.py                                  # activity + motion-db
+    python3 monitor_daemon.py --plugins activity,motion-db,motion-light
+"""
+
+import argparse
+import logging
+import os
+import signal
+import sqlite3
+import sys
+from datetime import datetime
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+
+try:
+    import mqtt_activity_logger as activity_logger
+except ImportError:
+    sys.path.insert(0, SCRIPT_DIR)
+    import mqtt_activity_logger as activity_logger
+
+from mqtt_activity_logger import ActivityWriter, MQTT_CONFIG, METRICS_CONFIG, metrics
+from ingest_metrics import MetricsExporter
+
+sys.path.insert(0, os.path.join(PROJECT_ROOT, 'python'))
+from mqtt_client import ResilientMqttClient, minimal_subscriptions
+from liveness import (LivenessTracker, MqttLivenessPublisher, LIVENESS_CONFIG, LIVENESS_COLUMNS,
+                      heartbeat_interval, init_liveness_table, liveness_event)
+
+logger = logging.getLogger('homeguard.monitor')
+
+
+class MonitorDaemon:
+    """Shared MQTT connection, handler dispatch and DB writer"""
+
+    def __init__(self, mqtt_config=MQTT_CONFIG, workers=1, client_id='', clean_session=True):
+        self.mqtt_config = mqtt_config
+        self.plugins = []
+        self.writer = None
+        self.exporter = None
+
+        self.client = ResilientMqttClient(client_id, config=mqtt_config, clean_session=clean_session,
+                                          workers=workers)
+        self.router = self.client.router
+        self.client.add_connect_listener(self._on_connect)
+        self.client.add_disconnect_listener(self._on_disconnect)
+
+    @property
+    def connected(self):
+        return self.client.connected
+
+    # ------------------------------------------------------------ plugin API
+
+    def register(self, pattern, handler):
+        """Call handler(message) for every message matching the pattern
+
+        Named wildcards ('+device_id', '#rest') are available as message.captures.
+        """
+        self.client.subscribe(pattern, handler)
+
+    def add_plugin(self, plugin):
+        plugin.setup(self)
+        self.plugins.append(plugin)
+        return plugin
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        return self.client.publish(topic, payload, qos=qos, retain=retain)
+
+    def log_activity(self, topic, message):
+        """Queue a message for the `activity` table"""
+        metrics.message_received(topic)
+        self.writer.submit(topic, message)
+
+    def store_row(self, table, row):
+        """Queue a row ({column: value}) for any other table"""
+        self.writer.submit_row(table, row)
+
+    def subscriptions(self):
+        return minimal_subscriptions(self.router.subscriptions())
+
+    # ---------------------------------------------------------- MQTT events
+
+    def _on_connect(self, client, session_present):
+        if client.connect_count > 1:
+            metrics.reconnected()
+        for plugin in self.plugins:
+            if hasattr(plugin, 'on_daemon_connect'):
+                plugin.on_daemon_connect(self)
+
+    def _on_disconnect(self, client, rc):
+        for plugin in self.plugins:
+            if hasattr(plugin, 'on_daemon_disconnect'):
+                plugin.on_daemon_disconnect(self)
+
+    def dispatch(self, message):
+        """Run every handler whose pattern matches, in the calling thread"""
+        return self.client.dispatch(message)
+
+    # ------------------------------------------------------------- lifecycle
+
+    def start(self, with_metrics=True):
+        self.writer = ActivityWriter()
+        self.writer.start()
+        activity_logger.activity_writer = self.writer
+        metrics.add_gauge_source(self.client.gauges)
+
+        if with_metrics:
+            self.exporter = MetricsExporter(metrics, METRICS_CONFIG['http_host'], METRICS_CONFIG['http_port'],
+                                            METRICS_CONFIG['snapshot_path'], METRICS_CONFIG['snapshot_interval'])
+            try:
+                self.exporter.start()
+            except OSError as e:
+                logger.warning(f"⚠️  Metrics endpoint unavailable: {e}")
+
+    def run(self):
+        """Connect (retrying with backoff) and process messages until client.disconnect()"""
+        self.client.run()
+
+    def stop(self):
+        # Handlers still queued run before the plugins stop and the writer is flushed
+        self.client.stop()
+        for plugin in self.plugins:
+            if hasattr(plugin, 'stop'):
+                try:
+                    plugin.stop()
+                except Exception as e:
+                    logger.error(f"❌ Error stopping plugin {plugin}: {e}")
+        if self.writer is not None:
+            self.writer.stop()
+            activity_logger.activity_writer = None
+            self.writer = None
+        if self.exporter is not None:
+            self.exporter.stop()
+            self.exporter = None
+        logger.info(f"✅ Monitor daemon stopped ({self.client.format_stats()}, "
+                    f"{self.client.handler_errors} handler errors)")
+
+
+# ================ PLUGINS ================
+
+class ActivityLogPlugin:
+    """Every message under MQTT_CONFIG['topic'] -> `activity` (mqtt_activity_logger)"""
+
+    def __init__(self, topic=MQTT_CONFIG['topic']):
+        self.topic = topic
+
+    def setup(self, daemon):
+        self.daemon = daemon
+        daemon.register(self.topic, self.handle)
+
+    def on_daemon_connect(self, daemon):
+        daemon.log_activity('system/mqtt', 'MQTT client connected successfully')
+
+    def handle(self, message):
+        self.daemon.log_activity(message.topic, message.text)
+
+
+class MotionDatabasePlugin:
+    """Motion sensors and relays -> motion_sensors / motion_sessions / relay_activity (motion_monitor_sqlite)"""
+
+    def __init__(self, verbose=True):
+        sys.path.insert(0, os.path.join(PROJECT_ROOT, 'scripts'))
+        import motion_monitor_sqlite
+        self.monitor = motion_monitor_sqlite
+        self.verbose = verbose
+
+    def setup(self, daemon):
+        self.daemon = daemon
+        self.monitor.init_db()
+        daemon.register(self.monitor.MOTION_ROUTE, self.handle_motion)
+        daemon.register(self.monitor.RELAY_ROUTE, self.handle_relay)
+
+    def _received_at(self):
+        return datetime.now(self.monitor.BR_TZ).strftime('%Y-%m-%d %H:%M:%S')
+
+    def handle_motion(self, message):
+        data = message.json
+        if data is None:
+            logger.warning(f"❌ Invalid motion JSON on {message.topic}: {message.text}")
+            return
+        row = self.monitor.parse_motion_message(message.captures['device'], message.text, data)
+        row['timestamp_received'] = self._received_at()
+        self.daemon.store_row(self.monitor.MOTION_TABLE, row)
+        for session in self.monitor.sessions.process(row['sensor'], row['event'], row['location'],
+                                                     row['timestamp_received']):
+            self.daemon.store_row(self.monitor.SESSION_TABLE, session)
+        if self.verbose:
+            self.monitor.print_motion_event(row, row['timestamp_received'][11:])
+
+    def handle_relay(self, message):
+        captures = message.captures
+        row = self.monitor.parse_relay_message(captures['device_id'], captures['message_type'], message.text)
+        row['timestamp_received'] = self._received_at()
+        self.daemon.store_row(self.monitor.RELAY_TABLE, row)
+        if self.verbose:
+            self.monitor.print_relay_event(row, row['timestamp_received'][11:])
+
+
+class LivenessPlugin:
+    """Online/stale/offline state of every device -> home/liveness/<id> (retained) + device_liveness"""
+
+    # Heartbeat esperado por tipo de dispositivo (s), quando o payload não informa
+    KIND_INTERVALS = {'relay': 30, 'motion': 60, 'sensor': 600, 'temperature': 600, 'humidity': 600}
+    IGNORED_TYPES = ('command', 'cmnd', 'schedule')  # publicados por outros clientes, não pelo dispositivo
+
+    def __init__(self, default_interval=LIVENESS_CONFIG['default_interval']):
+        self.tracker = LivenessTracker(default_interval=default_interval)
+
+    def setup(self, daemon):
+        self.daemon = daemon
+        conn = sqlite3.connect(activity_logger.DB_CONFIG['path'])
+        init_liveness_table(conn)
+        conn.close()
+
+        self.tracker.add_listener(MqttLivenessPublisher(daemon.publish))
+        self.tracker.add_listener(self.store_event)
+        daemon.register('home/+kind/+device_id/+message_type', self.handle)
+        daemon.register('home/+device_id/heartbeat', self.handle)
+        daemon.register('home/+device_id/status', self.handle)
+        daemon.register('homeguard/+device_id/+message_type', self.handle)
+        self.tracker.start()
+
+    def handle(self, message):
+        captures = message.captures
+        if captures.get('message_type') in self.IGNORED_TYPES or captures.get('kind') == 'liveness':
+            return
+        device_id = captures['device_id']
+        if message.text == 'OFFLINE':
+            self.tracker.mark_offline(device_id, now=message.timestamp)
+            return
+        interval = heartbeat_interval(message.json, self.KIND_INTERVALS.get(captures.get('kind')))
+        self.tracker.seen(device_id, interval=interval, now=message.timestamp)
+
+    def store_event(self, record, previous):
+        event = liveness_event(record, previous)
+        self.daemon.store_row(LIVENESS_CONFIG['table'], {column: event[column] for column in LIVENESS_COLUMNS})
+        logger.info(f"💓 {record['device_id']}: {previous or 'new'} -> {record['state']}")
+
+    def stop(self):
+        self.tracker.stop()
+
+
+def _load_light_controller(args):
+    sys.path.insert(0, os.path.join(PROJECT_ROOT, 'scripts'))
+    from motion_light_controller import MotionLightController
+    return MotionLightController(light_delay=args.light_delay, rules_file=args.rules)
+
+
+def _load_motion_console(args):
+    sys.path.insert(0, os.path.join(PROJECT_ROOT, 'python'))
+    from motion_monitor import MotionMonitor
+    return MotionMonitor()
+
+
+def _load_sensor_console(args):
+    sys.path.insert(0, os.path.join(PROJECT_ROOT, 'templates', 'motion_sensor'))
+    from motion_sensor_monitor import MotionSensorMonitor
+    return MotionSensorMonitor()
+
+
+PLUGIN_FACTORIES = {
+    'activity': lambda args: ActivityLogPlugin(),
+    'motion-db': lambda args: MotionDatabasePlugin(verbose=not args.quiet),
+    'liveness': lambda args: LivenessPlugin(),
+    'motion-light': _load_light_controller,
+    'motion-console': _load_motion_console,
+    'sensor-console': _load_sensor_console,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HomeGuard Monitor Daemon (MQTT + DB unificados)')
+    parser.add_argument('--plugins', default='activity,motion-db',
+                        help=f"Plugins separados por vírgula: {', '.join(PLUGIN_FACTORIES)}")
+    parser.add_argument('--light-delay', type=int, default=5, help='Atraso do plugin motion-light (s)')
+    parser.add_argument('--rules', help='Regras JSON do plugin motion-light (python/examples/light_rules.json)')
+    parser.add_argument('--quiet', action='store_true', help='Não imprimir eventos no console')
+    parser.add_argument('--no-metrics', action='store_true', help='Não iniciar o endpoint /metrics')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Threads para os handlers (cada tópico continua em ordem)')
+    parser.add_argument('--client-id', default='', help='Client id MQTT (com --persistent o padrão é homeguard-<host>-monitor_daemon)')
+    parser.add_argument('--persistent', action='store_true',
+                        help='Sessão persistente: o broker guarda mensagens QoS 1 enquanto o daemon está parado')
+    args = parser.parse_args()
+
+    daemon = MonitorDaemon(workers=args.workers, client_id=args.client_id,
+                           clean_session=not args.persistent)
+    for name in args.plugins.split(','):
+        name = name.strip()
+        if name not in PLUGIN_FACTORIES:
+            parser.error(f"plugin desconhecido: {name}")
+        daemon.add_plugin(PLUGIN_FACTORIES[name](args))
+        logger.info(f"🧩 Plugin loaded: {name}")
+
+    daemon.start(with_metrics=not args.no_metrics)
+
+    def shutdown(signum, frame):
+        logger.info(f"🛑 Received signal {signum}. Shutting down...")
+        daemon.client.disconnect()
+
+    signal.signal(signal.SIGINT, shutdown)
+    signal.signal(signal.SIGTERM, shutdown)
+
+    try:
+        daemon.run()
+    finally:
+        daemon.stop()
+
+
+if __name__ == '__main__':
+    main()
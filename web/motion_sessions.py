@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Motion Sessions
+Pairs MOTION_DETECTED / MOTION_CLEARED rows into occupancy sessions
+
+Tables:
+    motion_sessions(sensor, location, start, end, duration, hour_of_week,
+                    previous_sensor, closed_by)               -> one row per session
+    motion_occupancy(sensor, hour_of_week, sessions, total_seconds)
+                                                              -> hour-of-week histogram
+    motion_transitions(from_sensor, to_sensor, transitions)   -> room-to-room counts
+
+SessionBuilder keeps the open session of each sensor in memory and emits a
+motion_sessions row when it closes (cleared, or no event for `timeout`
+seconds when the clear was lost). Triggers on motion_sessions keep the two
+histogram tables exact, like db_counters, so any writer (monitor script,
+batched daemon writer, rebuild) updates them. Hour of week: 0 = Monday 00h.
+
+"Which rooms are busiest when" is then a read of a few hundred rows:
+    busiest_hours(conn), top_transitions(conn)
+"""
+
+from datetime import datetime, timedelta
+
+SESSION_TABLE = 'motion_sessions'
+OCCUPANCY_TABLE = 'motion_occupancy'
+TRANSITION_TABLE = 'motion_transitions'
+MOTION_TABLE = 'motion_sensors'
+
+SESSION_CONFIG = {
+    'timeout': 600,            # segundos sem evento até fechar uma sessão sem MOTION_CLEARED
+    'transition_window': 300,  # intervalo máximo (s) entre cômodos para contar uma transição
+}
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+SESSION_COLUMNS = ('sensor', 'location', 'start', 'end', 'duration', 'hour_of_week',
+                   'previous_sensor', 'closed_by')
+
+SCHEMA = [
+    f'''CREATE TABLE IF NOT EXISTS {SESSION_TABLE} (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sensor TEXT NOT NULL,
+        location TEXT,
+        start TEXT NOT NULL,
+        end TEXT NOT NULL,
+        duration INTEGER NOT NULL,
+        hour_of_week INTEGER NOT NULL,
+        previous_sensor TEXT,
+        closed_by TEXT NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''',
+    f'''CREATE TABLE IF NOT EXISTS {OCCUPANCY_TABLE} (
+        sensor TEXT NOT NULL,
+        hour_of_week INTEGER NOT NULL,
+        sessions INTEGER NOT NULL DEFAULT 0,
+        total_seconds INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (sensor, hour_of_week)
+    )''',
+    f'''CREATE TABLE IF NOT EXISTS {TRANSITION_TABLE} (
+        from_sensor TEXT NOT NULL,
+        to_sensor TEXT NOT NULL,
+        transitions INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (from_sensor, to_sensor)
+    )''',
+    f"CREATE INDEX IF NOT EXISTS idx_sessions_sensor ON {SESSION_TABLE}(sensor, start)",
+    f"CREATE INDEX IF NOT EXISTS idx_sessions_start ON {SESSION_TABLE}(start)",
+    f'''CREATE TRIGGER IF NOT EXISTS trg_{SESSION_TABLE}_insert AFTER INSERT ON {SESSION_TABLE}
+    BEGIN
+        INSERT INTO {OCCUPANCY_TABLE} (sensor, hour_of_week, sessions, total_seconds)
+        VALUES (NEW.sensor, NEW.hour_of_week, 1, NEW.duration)
+        ON CONFLICT (sensor, hour_of_week) DO UPDATE
+            SET sessions = sessions + 1, total_seconds = total_seconds + NEW.duration;
+        INSERT INTO {TRANSITION_TABLE} (from_sensor, to_sensor, transitions)
+        SELECT NEW.previous_sensor, NEW.sensor, 1 WHERE NEW.previous_sensor IS NOT NULL
+        ON CONFLICT (from_sensor, to_sensor) DO UPDATE SET transitions = transitions + 1;
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS trg_{SESSION_TABLE}_delete AFTER DELETE ON {SESSION_TABLE}
+    BEGIN
+        UPDATE {OCCUPANCY_TABLE} SET sessions = sessions - 1, total_seconds = total_seconds - OLD.duration
+        WHERE sensor = OLD.sensor AND hour_of_week = OLD.hour_of_week;
+        UPDATE {TRANSITION_TABLE} SET transitions = transitions - 1
+        WHERE from_sensor = OLD.previous_sensor AND to_sensor = OLD.sensor;
+    END''',
+]
+
+
+def ensure_session_tables(conn):
+    for statement in SCHEMA:
+        conn.execute(statement)
+    conn.commit()
+
+
+def hour_of_week(moment):
+    return moment.weekday() * 24 + moment.hour
+
+
+class SessionBuilder:
+    """Incremental detected/cleared pairing, one open session per sensor"""
+
+    def __init__(self, timeout=SESSION_CONFIG['timeout'],
+                 transition_window=SESSION_CONFIG['transition_window']):
+        self.timeout = timedelta(seconds=timeout)
+        self.transition_window = timedelta(seconds=transition_window)
+        self.open = {}              # sensor -> {'location', 'start', 'last_seen', 'previous_sensor'}
+        self.last_activity = None   # (sensor, datetime) of the latest event of any sensor
+
+    def process(self, sensor, event, location, when):
+        """Feed one motion row; returns the motion_sessions rows closed by it"""
+        if isinstance(when, str):
+            when = datetime.strptime(when[:19], TIME_FORMAT)
+        closed = self.expire(when)
+
+        session = self.open.get(sensor)
+        if event == 'MOTION_DETECTED':
+            if session is None:
+                self.open[sensor] = {
+                    'location': location,
+                    'start': when,
+                    'last_seen': when,
+                    'previous_sensor': self._previous_sensor(sensor, when),
+                }
+            else:
+                session['last_seen'] = when
+        elif event == 'MOTION_CLEARED' and session is not None:
+            closed.append(self._close(sensor, when, 'cleared'))
+        else:
+            return closed  # status/heartbeat or a clear without a detection
+
+        self.last_activity = (sensor, when)
+        return closed
+
+    def _previous_sensor(self, sensor, when):
+        if self.last_activity is None:
+            return None
+        last_sensor, last_when = self.last_activity
+        if last_sensor != sensor and when - last_when <= self.transition_window:
+            return last_sensor
+        return None
+
+    def expire(self, now):
+        """Close sessions whose clear never arrived; returns their rows"""
+        if isinstance(now, str):
+            now = datetime.strptime(now[:19], TIME_FORMAT)
+        expired = [sensor for sensor, session in self.open.items()
+                   if now - session['last_seen'] > self.timeout]
+        return [self._close(sensor, self.open[sensor]['last_seen'], 'timeout') for sensor in expired]
+
+    def _close(self, sensor, end, closed_by):
+        session = self.open.pop(sensor)
+        start = session['start']
+        return {
+            'sensor': sensor,
+            'location': session['location'],
+            'start': start.strftime(TIME_FORMAT),
+            'end': end.strftime(TIME_FORMAT),
+            'duration': max(0, int((end - start).total_seconds())),
+            'hour_of_week': hour_of_week(start),
+            'previous_sensor': session['previous_sensor'],
+            'closed_by': closed_by,
+        }
+
+    # ------------------------------------------------------------- database
+
+    def load(self, conn, now=None):
+        """Create the tables and rebuild open sessions from recent motion rows
+
+        `now` must be in the clock of timestamp_received (BR_TZ in the monitors).
+        """
+        ensure_session_tables(conn)
+        last_end = dict(conn.execute(f"SELECT sensor, MAX(end) FROM {SESSION_TABLE} GROUP BY sensor").fetchall())
+        since = ((now or datetime.now()) - self.timeout - self.transition_window).strftime(TIME_FORMAT)
+        rows = conn.execute(f"""
+            SELECT sensor, event, location, timestamp_received FROM {MOTION_TABLE}
+            WHERE timestamp_received >= ? ORDER BY id
+        """, (since,)).fetchall()
+        for sensor, event, location, received in rows:
+            if last_end.get(sensor) and received <= last_end[sensor]:
+                self.last_activity = (sensor, datetime.strptime(received[:19], TIME_FORMAT))
+                continue  # already part of a stored session
+            # Sessions closed by this replay were already written before the restart
+            self.process(sensor, event, location, received)
+        return len(self.open)
+
+
+def insert_sessions(conn, sessions):
+    if sessions:
+        conn.executemany(f"INSERT INTO {SESSION_TABLE} ({', '.join(SESSION_COLUMNS)}) "
+                         f"VALUES ({', '.join('?' for _ in SESSION_COLUMNS)})",
+                         [tuple(session[column] for column in SESSION_COLUMNS) for session in sessions])
+    return len(sessions)
+
+
+def rebuild_sessions(conn, timeout=SESSION_CONFIG['timeout'],
+                     transition_window=SESSION_CONFIG['transition_window']):
+    """Recompute every session and histogram from motion_sensors"""
+    ensure_session_tables(conn)
+    builder = SessionBuilder(timeout, transition_window)
+    total = 0
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        for table in (SESSION_TABLE, OCCUPANCY_TABLE, TRANSITION_TABLE):
+            conn.execute(f"DELETE FROM {table}")
+        cursor = conn.execute(f"SELECT sensor, event, location, timestamp_received FROM {MOTION_TABLE} ORDER BY id")
+        batch = []
+        for sensor, event, location, received in cursor:
+            batch.extend(builder.process(sensor, event, location, received))
+            if len(batch) >= 1000:
+                total += insert_sessions(conn, batch)
+                batch = []
+        total += insert_sessions(conn, batch)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return total
+
+
+# ================ QUERIES ================
+
+WEEKDAYS = ('Seg', 'Ter', 'Qua', 'Qui', 'Sex', 'Sáb', 'Dom')
+
+BUSIEST_HOURS_SQL = f"""
+    SELECT sensor, hour_of_week, sessions, total_seconds FROM {OCCUPANCY_TABLE}
+    WHERE sessions > 0 ORDER BY total_seconds DESC, sessions DESC LIMIT ?
+"""
+
+SENSOR_SUMMARY_SQL = f"""
+    SELECT sensor, SUM(sessions) AS sessions, SUM(total_seconds) AS total_seconds
+    FROM {OCCUPANCY_TABLE} GROUP BY sensor HAVING SUM(sessions) > 0 ORDER BY total_seconds DESC
+"""
+
+TRANSITIONS_SQL = f"""
+    SELECT from_sensor, to_sensor, transitions FROM {TRANSITION_TABLE}
+    WHERE transitions > 0 ORDER BY transitions DESC LIMIT ?
+"""
+
+
+def format_hour_of_week(value):
+    return f"{WEEKDAYS[value // 24]} {value % 24:02d}h"
+
+
+def busiest_hours(conn, limit=10):
+    """[(sensor, hour_of_week, sessions, total_seconds)] with the most occupied time"""
+    return conn.execute(BUSIEST_HOURS_SQL, (limit,)).fetchall()
+
+
+def sensor_summary(conn):
+    """[(sensor, sessions, total_seconds)]"""
+    return conn.execute(SENSOR_SUMMARY_SQL).fetchall()
+
+
+def top_transitions(conn, limit=10):
+    """[(from_sensor, to_sensor, transitions)]"""
+    return conn.execute(TRANSITIONS_SQL, (limit,)).fetchall()
+
+
+def print_occupancy(conn, limit=10):
+    """Console report shared by db_utility.py and motion_monitor_sqlite.py"""
+    summary = sensor_summary(conn)
+    print("\n🏠 OCUPAÇÃO (sessões de movimento):")
+    print("-" * 40)
+    if not summary:
+        print("   Nenhuma sessão registrada")
+        return
+    for sensor, sessions, total_seconds in summary:
+        average = total_seconds / sessions if sessions else 0
+        print(f"   {sensor}: {sessions} sessões, {total_seconds // 60} min no total (média {average:.0f}s)")
+
+    print("\n🕐 Horários mais ocupados:")
+    for sensor, how, sessions, total_seconds in busiest_hours(conn, limit):
+        print(f"   {format_hour_of_week(how)}  {sensor}: {sessions} sessões, {total_seconds // 60} min")
+
+    transitions = top_transitions(conn, limit)
+    if transitions:
+        print("\n🚶 Transições entre cômodos:")
+        for from_sensor, to_sensor, count in transitions:
+            print(f"   {from_sensor} → {to_sensor}: {count}")
@@ -3,45 +3,76 @@
 HomeGuard MQTT Activity Logger
 Captures all MQTT messages from home/* topics and logs to SQLite database
 
-Equivalent to: mosquitto_sub -h 192.168.1.102 -u homeguard -P pu2clr123456 -t "home/#" -v
+Equivalent to: mosquitto_sub -h <broker> -u <user> -P <password> -t "home/#" -v
+Broker and credentials: homeguard_mqtt_config.json or HOMEGUARD_MQTT_* (python/mqtt_client.py)
 
 Author: HomeGuard System
 Date: September 6, 2025
 """
 
-import paho.mqtt.client as mqtt
-import sqlite3
-import json
 import logging
 import signal
 import sys
 import os
+import queue
+from collections import deque
 from datetime import datetime
-from threading import Lock
+from threading import Lock, Thread, Event
 import time
 
-# Configuration
-MQTT_CONFIG = {
-    'host': '192.168.1.102',
-    'port': 1883,
-    'username': 'homeguard',
-    'password': 'pu2clr123456',
-    'topic': 'home/#',
-    'keepalive': 60
-}
+try:
+    from spill_journal import SpillJournal, DeadLetterFile, TableRow, record_kind
+    from ingest_metrics import IngestMetrics, MetricsExporter
+    from storage import open_storage, StorageError, STORAGE_CONFIG
+except ImportError:
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from spill_journal import SpillJournal, DeadLetterFile, TableRow, record_kind
+    from ingest_metrics import IngestMetrics, MetricsExporter
+    from storage import open_storage, StorageError, STORAGE_CONFIG
 
-# Database configuration - usando caminho relativo
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+
+try:
+    from mqtt_client import ResilientMqttClient, load_mqtt_config
+except ImportError:
+    sys.path.insert(0, os.path.join(PROJECT_ROOT, 'python'))
+    from mqtt_client import ResilientMqttClient, load_mqtt_config
+
+# Configuration (host/credenciais: homeguard_mqtt_config.json ou HOMEGUARD_MQTT_*)
+MQTT_CONFIG = load_mqtt_config(topic='home/#')
+
+# Database configuration - usando caminho relativo
 DB_CONFIG = {
     'path': os.path.join(PROJECT_ROOT, 'db', 'homeguard.db'),
-    'timeout': 20.0
+    'timeout': 20.0,
+    # Ingest writer: commits that cannot finish within the deadline
+    # (database locked by VACUUM/backup) are spilled to the journal
+    'commit_deadline': 2.0,
+    'batch_size': 200,
+    'queue_size': 10000,
+    'replay_interval': 1.0,
+    'journal_path': os.path.join(PROJECT_ROOT, 'db', 'activity_spill.journal'),
+    # Rows the database refuses for good (JSON lines, one per row)
+    'dead_letter_path': os.path.join(PROJECT_ROOT, 'db', 'activity_dead_letter.jsonl')
+}
+
+# Metrics: GET http://<host>:9108/metrics (Prometheus) + periodic JSON snapshot
+METRICS_CONFIG = {
+    'http_host': '0.0.0.0',
+    'http_port': 9108,
+    'snapshot_path': os.path.join(PROJECT_ROOT, 'logs', 'mqtt_metrics.json'),
+    'snapshot_interval': 15
 }
 
 # Global variables
 db_lock = Lock()
 message_count = 0
+connect_count = 0
 start_time = time.time()
+activity_writer = None
+direct_storage = None
+metrics = IngestMetrics()
 
 # Setup logging - usando caminho relativo
 LOG_FILE = os.path.join(SCRIPT_DIR, 'mqtt_logger.log')
@@ -55,82 +86,302 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+class ActivityWriter(Thread):
+    """
+    Background writer for the activity table.
+    Messages are queued by the MQTT callbacks and committed in batches.
+    When a commit cannot finish within DB_CONFIG['commit_deadline'] the batch
+    goes to the spill journal, and is replayed in order once the database
+    is writable again. The MQTT loop never waits on the database: when the
+    queue is full, messages wait in an overflow list that the writer takes
+    after the queue, so the journal keeps the arrival order.
+    
+    Rows for other tables (submit_row) share the same queue, batches and
+    journal. Only lock/busy errors are retried; rows refused for good (missing
+    column, constraint) go to the dead-letter file instead of blocking the rest.
+    """
+
+    def __init__(self):
+        super().__init__(name='activity-writer', daemon=True)
+        self.queue = queue.Queue(maxsize=DB_CONFIG['queue_size'])
+        self.journal = SpillJournal(DB_CONFIG['journal_path'])
+        self.dead_letter = DeadLetterFile(DB_CONFIG['dead_letter_path'])
+        self.stop_event = Event()
+        self.storage = None
+        self.committed_total = 0
+        self.spilling = False
+        self.next_replay = 0.0
+        # Queue full: later messages wait here (in arrival order) for the writer thread
+        self.overflow = deque()
+        self.overflow_lock = Lock()
+
+        if self.journal.has_pending():
+            logger.warning(f"📒 Spill journal has {self.journal.pending_records} pending messages, replaying...")
+
+    def submit(self, topic, message):
+        """Queue a message without blocking the caller"""
+        self._enqueue((time.time(), topic, message))
+
+    def submit_row(self, table, row):
+        """Queue a row ({column: value}) for another table without blocking"""
+        self._enqueue(TableRow(table, tuple(row), tuple(row.values())))
+
+    def _enqueue(self, item):
+        with self.overflow_lock:
+            # Once the queue overflows, everything goes behind the overflow until
+            # the writer catches up, so the journal keeps the arrival order
+            if not self.overflow:
+                try:
+                    self.queue.put_nowait(item)
+                    return
+                except queue.Full:
+                    pass
+            self.overflow.append(item)
+
+    def _storage(self):
+        if self.storage is None:
+            self.storage = open_storage(sqlite_path=DB_CONFIG['path'], timeout=DB_CONFIG['commit_deadline'],
+                                        pool_size=1)
+        return self.storage
+
+    def _insert(self, items):
+        """One transaction for a run of entries of the same kind"""
+        first = items[0]
+        with db_lock:
+            started = time.monotonic()
+            if isinstance(first, TableRow):
+                self._storage().insert_batch(first.table, first.columns, [item.values for item in items])
+            else:
+                self._storage().insert_activity(items)
+        if not isinstance(first, TableRow):
+            metrics.batch_committed(len(items), time.monotonic() - started)
+        self.committed_total += len(items)
+
+    def _commit(self, items):
+        """Insert a run; returns how many items are done (inserted or dead-lettered)
+
+        Fewer than len(items) means the database is not writable right now.
+        """
+        try:
+            self._insert(items)
+            return len(items)
+        except StorageError as e:
+            if e.transient:
+                self._not_writable(e)
+                return 0
+
+        # Refused for good: isolate the poison rows one by one
+        done = 0
+        for item in items:
+            try:
+                self._insert([item])
+            except StorageError as e:
+                if e.transient:
+                    self._not_writable(e)
+                    return done
+                self.dead_letter.append(item, e)
+                metrics.message_dropped()
+                logger.error(f"☠️  Row refused by the database ({e}), moved to {DB_CONFIG['dead_letter_path']}")
+            done += 1
+        return done
+
+    def _not_writable(self, error):
+        if not self.spilling:
+            logger.warning(f"📒 Database not writable ({error}), spilling to journal")
+        self.spilling = True
+        self.next_replay = time.monotonic() + DB_CONFIG['replay_interval']
+
+    def _replay(self):
+        """Drain the journal back into the database, oldest first"""
+        # While the database is busy, retry at most once per replay_interval
+        if time.monotonic() < self.next_replay:
+            return False
+        
+        while self.journal.has_pending():
+            entries, end_offset = self.journal.peek(DB_CONFIG['batch_size'])
+            if not entries:
+                self.next_replay = time.monotonic() + DB_CONFIG['replay_interval']
+                return False
+            done = self._commit(entries)
+            if done < len(entries):
+                if done:
+                    _, end_offset = self.journal.peek(done)
+                    self.journal.commit(end_offset, done)
+                return False
+            self.journal.commit(end_offset, done)
+
+        if self.spilling:
+            logger.info(f"✅ Spill journal drained ({self.journal.replayed_total} messages replayed)")
+            self.spilling = False
+        return True
+
+    def _take_overflow(self):
+        """Next batch of overflowed messages, once every older queued message is taken"""
+        with self.overflow_lock:
+            if not self.overflow or not self.queue.empty():
+                return []
+            count = min(len(self.overflow), DB_CONFIG['batch_size'])
+            return [self.overflow.popleft() for _ in range(count)]
+
+    def _drain_queue(self, first):
+        batch = [first]
+        while len(batch) < DB_CONFIG['batch_size']:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        # Preserve ordering: nothing goes straight to the DB while the journal has
+        # a backlog, and a busy database is retried only once per replay_interval
+        if self.journal.has_pending() or time.monotonic() < self.next_replay:
+            self.journal.append(batch)
+            self._replay()
+            return
+
+        start = 0
+        while start < len(batch):
+            kind = record_kind(batch[start])
+            end = start + 1
+            while end < len(batch) and record_kind(batch[end]) == kind:
+                end += 1
+            done = self._commit(batch[start:end])
+            if done < end - start:
+                self.journal.append(batch[start + done:])
+                return
+            start = end
+
+    def run(self):
+        while not self.stop_event.is_set():
+            overflow = self._take_overflow()
+            if overflow:
+                self._write(overflow)
+                continue
+            try:
+                first = self.queue.get(timeout=DB_CONFIG['replay_interval'])
+            except queue.Empty:
+                if self.journal.has_pending():
+                    self._replay()
+                continue
+            self._write(self._drain_queue(first))
+
+    def stop(self):
+        """Flush pending messages (to the DB or the journal) and close"""
+        self.stop_event.set()
+        if self.is_alive():
+            self.join()
+
+        while True:
+            try:
+                batch = self._drain_queue(self.queue.get_nowait())
+            except queue.Empty:
+                batch = self._take_overflow()
+                if not batch:
+                    break
+            self._write(batch)
+
+        if self.storage is not None:
+            self.storage.close()
+            self.storage = None
+        if self.journal.has_pending():
+            logger.warning(f"📒 {self.journal.pending_records} messages kept in spill journal for next start")
+        self.journal.close()
+
+    def stats(self):
+        """Writer and journal metrics"""
+        stats = {
+            'queue_depth': self.queue.qsize() + len(self.overflow),
+            'committed_total': self.committed_total,
+            'dead_letter_total': self.dead_letter.total
+        }
+        stats.update(self.journal.stats())
+        return stats
+
+def get_ingest_stats():
+    """Current writer/journal gauges (empty if the writer is not running)"""
+    stats = activity_writer.stats() if activity_writer else {}
+    try:
+        stats['db_size_bytes'] = sum(os.path.getsize(DB_CONFIG['path'] + suffix)
+                                     for suffix in ('', '-wal')
+                                     if os.path.exists(DB_CONFIG['path'] + suffix))
+    except OSError:
+        pass
+    return stats
+
+metrics.add_gauge_source(get_ingest_stats)
+
 def log_to_database(topic, message):
     """Insert MQTT message into database"""
-    global message_count
+    global message_count, direct_storage
     
+    metrics.message_received(topic)
     try:
-        with db_lock:
-            conn = sqlite3.connect(DB_CONFIG['path'], timeout=DB_CONFIG['timeout'])
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                INSERT INTO activity (topic, message) 
-                VALUES (?, ?)
-            ''', (topic, message))
-            
-            conn.commit()
-            message_count += 1
-            
-            # Log every 10 messages or important topics
-            if (message_count % 10 == 0 or 
-                'status' in topic or 
-                'command' in topic or
-                message_count <= 5):
-                logger.info(f"📝 Logged message #{message_count}: {topic}")
-            
-            conn.close()
-            return True
+        if activity_writer is not None:
+            activity_writer.submit(topic, message)
+        else:
+            with db_lock:
+                if direct_storage is None:
+                    direct_storage = open_storage(sqlite_path=DB_CONFIG['path'], timeout=DB_CONFIG['timeout'],
+                                                  pool_size=1)
+                direct_storage.insert_activity([(time.time(), topic, message)])
+        
+        message_count += 1
+        
+        # Log every 10 messages or important topics
+        if (message_count % 10 == 0 or 
+            'status' in topic or 
+            'command' in topic or
+            message_count <= 5):
+            logger.info(f"📝 Logged message #{message_count}: {topic}")
+        
+        return True
             
-    except sqlite3.Error as e:
+    except StorageError as e:
         logger.error(f"❌ Database error: {e}")
+        metrics.message_dropped()
         return False
     except Exception as e:
         logger.error(f"❌ Unexpected error logging to database: {e}")
+        metrics.message_dropped()
         return False
 
-def on_connect(client, userdata, flags, rc):
-    """Callback for when the client receives a CONNACK response from the server"""
-    if rc == 0:
-        logger.info("✅ Connected to MQTT broker successfully")
-        client.subscribe(MQTT_CONFIG['topic'])
-        logger.info(f"📡 Subscribed to topic: {MQTT_CONFIG['topic']}")
-        
-        # Log connection to database
-        log_to_database('system/mqtt', 'MQTT client connected successfully')
-        
-    else:
-        logger.error(f"❌ Failed to connect to MQTT broker. Return code: {rc}")
+def on_connect(client, session_present):
+    """Connection (or reconnection) established; subscriptions are restored by the client"""
+    global connect_count
+    connect_count += 1
+    if connect_count > 1:
+        metrics.reconnected()
+    log_to_database('system/mqtt', 'MQTT client connected successfully')
 
-def on_disconnect(client, userdata, rc):
+def on_disconnect(client, rc):
     """Callback for when the client disconnects from the server"""
     if rc != 0:
-        logger.warning("🔌 Unexpected MQTT disconnection. Will auto-reconnect.")
         log_to_database('system/mqtt', f'MQTT client disconnected unexpectedly: {rc}')
     else:
         logger.info("🔌 MQTT client disconnected gracefully")
 
-def on_message(client, userdata, msg):
-    """Callback for when a PUBLISH message is received from the server"""
+def on_message(message):
+    """Every message under MQTT_CONFIG['topic'] (runs on the client worker, not the network thread)"""
     try:
-        topic = msg.topic
-        message = msg.payload.decode('utf-8')
+        topic = message.topic
+        text = message.text
         
         # Log to database
-        success = log_to_database(topic, message)
+        success = log_to_database(topic, text)
         
         # Console output similar to mosquitto_sub -v
-        print(f"{topic} {message}")
+        print(f"{topic} {text}")
         
         # Special handling for JSON messages
-        if message.startswith('{') and message.endswith('}'):
-            try:
-                json_data = json.loads(message)
+        if text.startswith('{') and text.endswith('}'):
+            json_data = message.json
+            if json_data is None:
+                logger.debug(f"⚠️  Invalid JSON in message: {topic}")
+            else:
                 device_id = json_data.get('device_id', json_data.get('RELAY_ID', 'unknown'))
                 if device_id != 'unknown':
                     logger.debug(f"📊 JSON message from device: {device_id}")
-            except json.JSONDecodeError:
-                logger.debug(f"⚠️  Invalid JSON in message: {topic}")
         
         if not success:
             logger.warning(f"⚠️  Failed to log message: {topic}")
@@ -163,43 +414,50 @@ class MQTTActivityLogger:
         self.client = None
         self.running = False
         self.start_time = None
+        self.exporter = None
         
     def start(self):
         """Start the MQTT logger"""
-        global start_time
+        global start_time, activity_writer
         start_time = time.time()
         self.start_time = start_time
         self.running = True
         
+        activity_writer = ActivityWriter()
+        activity_writer.start()
+        
+        self.exporter = MetricsExporter(metrics, METRICS_CONFIG['http_host'], METRICS_CONFIG['http_port'],
+                                        METRICS_CONFIG['snapshot_path'], METRICS_CONFIG['snapshot_interval'])
+        try:
+            self.exporter.start()
+            logger.info(f"📈 Metrics: http://{METRICS_CONFIG['http_host']}:{METRICS_CONFIG['http_port']}/metrics")
+        except OSError as e:
+            logger.warning(f"⚠️  Metrics endpoint unavailable: {e}")
+        
         logger.info("🚀 Starting HomeGuard MQTT Activity Logger")
         logger.info(f"🏠 MQTT Broker: {MQTT_CONFIG['host']}:{MQTT_CONFIG['port']}")
         logger.info(f"📡 Topic filter: {MQTT_CONFIG['topic']}")
-        logger.info(f"💾 Database: {DB_CONFIG['path']}")
+        logger.info(f"💾 Database: {DB_CONFIG['path']} (storage backend: {STORAGE_CONFIG['backend']})")
+        logger.info(f"📒 Spill journal: {DB_CONFIG['journal_path']}")
         
         # Setup signal handlers
         signal.signal(signal.SIGINT, signal_handler)
         signal.signal(signal.SIGTERM, signal_handler)
         
-        # Create MQTT client
-        self.client = mqtt.Client()
-        self.client.username_pw_set(MQTT_CONFIG['username'], MQTT_CONFIG['password'])
-        
-        # Set callbacks
-        self.client.on_connect = on_connect
-        self.client.on_disconnect = on_disconnect
-        self.client.on_message = on_message
+        # Create MQTT client (one worker keeps the activity rows in arrival order)
+        self.client = ResilientMqttClient(config=MQTT_CONFIG, workers=1)
+        self.client.subscribe(MQTT_CONFIG['topic'], on_message)
+        self.client.add_connect_listener(on_connect)
+        self.client.add_disconnect_listener(on_disconnect)
+        metrics.add_gauge_source(self.client.gauges)
         
         try:
-            # Connect to broker
-            logger.info("🔌 Connecting to MQTT broker...")
-            self.client.connect(MQTT_CONFIG['host'], MQTT_CONFIG['port'], MQTT_CONFIG['keepalive'])
-            
-            # Start the loop
+            # Start the loop (connects and reconnects with backoff)
             logger.info("👂 Starting to listen for MQTT messages...")
             logger.info("💡 Press Ctrl+C to stop")
             logger.info("-" * 60)
             
-            self.client.loop_forever()
+            self.client.run()
             
         except KeyboardInterrupt:
             logger.info("\n🛑 Keyboard interrupt received")
@@ -213,11 +471,21 @@ class MQTTActivityLogger:
     
     def stop(self):
         """Stop the MQTT logger"""
+        global activity_writer
         self.running = False
         if self.client:
             logger.info("🔌 Disconnecting from MQTT broker...")
-            self.client.disconnect()
-            self.client.loop_stop()
+            self.client.stop()
+            logger.info(f"📡 MQTT: {self.client.format_stats()}")
+            self.client = None
+        
+        # Flush queued messages before reporting
+        if activity_writer is not None:
+            activity_writer.stop()
+        if self.exporter is not None:
+            self.exporter.stop()
+            self.exporter = None
+        activity_writer = None
         
         # Log final statistics
         if self.start_time:
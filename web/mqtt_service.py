@@ -13,11 +13,15 @@ from datetime import datetime
 
 # Import mqtt_activity_logger from the same directory
 try:
-    from mqtt_activity_logger import MQTTActivityLogger
+    from mqtt_activity_logger import MQTTActivityLogger, DB_CONFIG, METRICS_CONFIG
+    from ingest_metrics import read_snapshot
+    from storage import open_storage
 except ImportError:
     # If that fails, try adding current directory to path
     sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
-    from mqtt_activity_logger import MQTTActivityLogger
+    from mqtt_activity_logger import MQTTActivityLogger, DB_CONFIG, METRICS_CONFIG
+    from ingest_metrics import read_snapshot
+    from storage import open_storage
 
 # Service configuration - usando caminhos relativos
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
@@ -110,27 +114,36 @@ class MQTTLoggerService:
                 os.kill(pid, 0)  # Check if process exists
                 print(f"✅ Service running (PID {pid})")
                 
-                # Show recent statistics if database exists
-                try:
-                    from web.db_query import get_connection
-                    conn = get_connection()
-                    cursor = conn.cursor()
-                    
-                    # Get total records
-                    cursor.execute("SELECT COUNT(*) FROM activity")
-                    total_records = cursor.fetchone()[0]
-                    
-                    # Get recent activity count (last hour)
-                    cursor.execute("""
-                        SELECT COUNT(*) FROM activity 
-                        WHERE created_at >= datetime('now', '-1 hour')
-                    """)
-                    recent_count = cursor.fetchone()[0]
+                # Show ingest counters from the metrics snapshot (no table scan)
+                snapshot = read_snapshot(METRICS_CONFIG['snapshot_path'],
+                                         max_age=METRICS_CONFIG['snapshot_interval'] * 4)
+                if snapshot:
+                    gauges = snapshot.get('gauges', {})
+                    latency = snapshot['commit_latency_seconds']
+                    avg_latency = latency['sum'] / latency['count'] * 1000 if latency['count'] else 0
                     
-                    print(f"📊 Total messages: {total_records:,}")
-                    print(f"🕐 Last hour: {recent_count} messages")
-                    
-                    conn.close()
+                    print(f"📊 Messages since start: {snapshot['messages_total']:,}")
+                    print(f"🕐 Last hour: {snapshot['messages_last_hour']} messages")
+                    print(f"📦 Queue depth: {gauges.get('queue_depth', 0)}")
+                    print(f"⏱️  Avg commit latency: {avg_latency:.1f} ms")
+                    print(f"📒 Spilled: {gauges.get('journal_spilled_total', 0)} "
+                          f"(pending {gauges.get('journal_pending_records', 0)}, "
+                          f"lag {gauges.get('journal_replay_lag_seconds', 0)}s)")
+                    print(f"⚠️  Dropped: {snapshot['dropped_total']} | 🔌 Reconnects: {snapshot['reconnects_total']}")
+                    if 'db_size_bytes' in gauges:
+                        print(f"💾 Database size: {gauges['db_size_bytes'] / (1024 * 1024):.1f} MB")
+                else:
+                    print(f"📊 Metrics snapshot unavailable: {METRICS_CONFIG['snapshot_path']}")
+                
+                # Database totals (SQLite: trigger-maintained counters, O(1))
+                try:
+                    storage = open_storage(sqlite_path=DB_CONFIG['path'], timeout=DB_CONFIG['timeout'], pool_size=1)
+                    try:
+                        print(f"🗄️  Total messages in database: {storage.table_count('activity'):,}")
+                        if not snapshot:
+                            print(f"🕐 Last hour (database): {storage.count_since('activity', 1)} messages")
+                    finally:
+                        storage.close()
                 except Exception as e:
                     print(f"📊 Database info unavailable: {e}")
                 
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Spill Journal
+Append-only, memory-mapped journal used by the MQTT activity logger when the
+SQLite database is locked or too slow to commit (VACUUM, backups, ...)
+
+Layout:
+    header  -> magic, generation, read_offset
+    records -> length, crc32, generation, timestamp, payload
+    payload -> JSON [topic, message] for `activity`,
+               {"row": [table, columns, values]} for any other table (TableRow)
+
+Records are only valid when their generation matches the header and the CRC
+checks out, so a torn write after a crash is simply discarded on recovery.
+When the replayer drains the journal the generation is bumped and the file
+is reused from the beginning.
+
+Rows that a database refuses for good (missing column, constraint) are moved
+to a DeadLetterFile (JSON lines) so they never block the records behind them.
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import namedtuple
+from datetime import datetime
+
+JOURNAL_MAGIC = b'HGSJ'
+HEADER = struct.Struct('<4sIQ')
+RECORD = struct.Struct('<IIId')
+DEFAULT_SIZE = 1024 * 1024  # 1 MB, grows on demand
+
+# Row for a table other than `activity` (motion_sensors, relay_activity, ...)
+TableRow = namedtuple('TableRow', 'table columns values')
+
+
+def record_kind(entry):
+    """Entries of the same kind go to the database in one statement"""
+    return (entry.table, entry.columns) if isinstance(entry, TableRow) else None
+
+
+class SpillJournal:
+    """Crash-safe FIFO of (timestamp, topic, message) entries and TableRows"""
+
+    def __init__(self, path, initial_size=DEFAULT_SIZE):
+        self.path = path
+        self.initial_size = max(initial_size, HEADER.size + RECORD.size)
+        self.lock = threading.Lock()
+
+        self.generation = 1
+        self.read_offset = HEADER.size
+        self.write_offset = HEADER.size
+        self.pending_records = 0
+        self.oldest_timestamp = None
+
+        # Lifetime counters (this process)
+        self.spilled_total = 0
+        self.replayed_total = 0
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        size = os.fstat(self.fd).st_size
+        if size < self.initial_size:
+            os.ftruncate(self.fd, self.initial_size)
+            size = self.initial_size
+        self.mm = mmap.mmap(self.fd, size)
+        self._recover()
+
+    # ---------------------------------------------------------------- layout
+
+    def _write_header(self):
+        self.mm[:HEADER.size] = HEADER.pack(JOURNAL_MAGIC, self.generation, self.read_offset)
+
+    def _read_record(self, offset):
+        """Return (next_offset, timestamp, payload) or None if not a valid record"""
+        end = offset + RECORD.size
+        if end > len(self.mm):
+            return None
+
+        length, crc, generation, timestamp = RECORD.unpack_from(self.mm, offset)
+        if length == 0 or generation != self.generation or end + length > len(self.mm):
+            return None
+
+        payload = self.mm[end:end + length]
+        if zlib.crc32(payload, zlib.crc32(struct.pack('<Id', generation, timestamp))) != crc:
+            return None
+
+        return end + length, timestamp, payload
+
+    def _recover(self):
+        """Rebuild in-memory offsets from the file after a (re)start"""
+        magic, generation, read_offset = HEADER.unpack_from(self.mm, 0)
+        if magic != JOURNAL_MAGIC or not HEADER.size <= read_offset <= len(self.mm):
+            self.generation = 1
+            self.read_offset = HEADER.size
+            self.mm[HEADER.size:HEADER.size + RECORD.size] = bytes(RECORD.size)
+            self._write_header()
+            self.mm.flush()
+        else:
+            self.generation = generation
+            self.read_offset = read_offset
+
+        offset = self.read_offset
+        while True:
+            record = self._read_record(offset)
+            if record is None:
+                break
+            if self.oldest_timestamp is None:
+                self.oldest_timestamp = record[1]
+            offset = record[0]
+            self.pending_records += 1
+
+        self.write_offset = offset
+
+    def _ensure_capacity(self, needed):
+        size = len(self.mm)
+        if self.write_offset + needed <= size:
+            return
+
+        while self.write_offset + needed > size:
+            size *= 2
+
+        self.mm.flush()
+        self.mm.close()
+        os.ftruncate(self.fd, size)
+        self.mm = mmap.mmap(self.fd, size)
+
+    def _reset(self):
+        """Journal fully drained: start a new generation at the beginning"""
+        self.generation += 1
+        self.read_offset = HEADER.size
+        self.write_offset = HEADER.size
+        self.pending_records = 0
+        self.oldest_timestamp = None
+
+        if len(self.mm) > self.initial_size:
+            self.mm.close()
+            os.ftruncate(self.fd, self.initial_size)
+            self.mm = mmap.mmap(self.fd, self.initial_size)
+
+        self._write_header()
+
+    # ------------------------------------------------------------------- API
+
+    def append(self, entries):
+        """Append [(timestamp, topic, message) or TableRow, ...] and flush to disk"""
+        if not entries:
+            return
+
+        with self.lock:
+            for entry in entries:
+                if isinstance(entry, TableRow):
+                    timestamp = time.time()
+                    record = {'row': [entry.table, list(entry.columns), list(entry.values)]}
+                else:
+                    timestamp, topic, message = entry
+                    record = [topic, message]
+                payload = json.dumps(record, ensure_ascii=False).encode('utf-8')
+                crc = zlib.crc32(payload, zlib.crc32(struct.pack('<Id', self.generation, timestamp)))
+
+                self._ensure_capacity(RECORD.size + len(payload))
+                start = self.write_offset + RECORD.size
+                # Payload first, header last: a torn record never validates
+                self.mm[start:start + len(payload)] = payload
+                RECORD.pack_into(self.mm, self.write_offset, len(payload), crc, self.generation, timestamp)
+                self.write_offset = start + len(payload)
+
+                if self.oldest_timestamp is None:
+                    self.oldest_timestamp = timestamp
+                self.pending_records += 1
+                self.spilled_total += 1
+
+            # Terminate the log so recovery never walks into stale bytes
+            if self.write_offset + RECORD.size <= len(self.mm):
+                self.mm[self.write_offset:self.write_offset + RECORD.size] = bytes(RECORD.size)
+
+            self.mm.flush()
+
+    def peek(self, limit):
+        """Return (entries, end_offset) for up to `limit` oldest records of one kind
+
+        A run stops where the kind changes (activity <-> a table), so each
+        peek is a single insert and the database sees the journal order.
+        """
+        entries = []
+        with self.lock:
+            offset = self.read_offset
+            while len(entries) < limit and offset < self.write_offset:
+                record = self._read_record(offset)
+                if record is None:
+                    break
+                next_offset, timestamp, payload = record
+                decoded = json.loads(payload.decode('utf-8'))
+                if isinstance(decoded, dict):
+                    table, columns, values = decoded['row']
+                    entry = TableRow(table, tuple(columns), tuple(values))
+                else:
+                    entry = (timestamp, decoded[0], decoded[1])
+                if entries and record_kind(entry) != record_kind(entries[0]):
+                    break
+                entries.append(entry)
+                offset = next_offset
+        return entries, offset
+
+    def commit(self, end_offset, count):
+        """Mark records up to `end_offset` as replayed into the database"""
+        with self.lock:
+            self.read_offset = end_offset
+            self.pending_records = max(0, self.pending_records - count)
+            self.replayed_total += count
+
+            if self.read_offset >= self.write_offset:
+                self._reset()
+            else:
+                record = self._read_record(self.read_offset)
+                self.oldest_timestamp = record[1] if record else None
+                self._write_header()
+
+            self.mm.flush()
+
+    def has_pending(self):
+        return self.pending_records > 0
+
+    def stats(self):
+        """Journal metrics: backlog size and replay lag"""
+        with self.lock:
+            lag = time.time() - self.oldest_timestamp if self.oldest_timestamp else 0.0
+            return {
+                'journal_pending_records': self.pending_records,
+                'journal_pending_bytes': self.write_offset - self.read_offset,
+                'journal_file_bytes': len(self.mm) if self.mm is not None else 0,
+                'journal_spilled_total': self.spilled_total,
+                'journal_replayed_total': self.replayed_total,
+                'journal_replay_lag_seconds': round(max(0.0, lag), 3)
+            }
+
+    def close(self):
+        with self.lock:
+            if self.mm is not None:
+                self.mm.flush()
+                self.mm.close()
+                self.mm = None
+            if self.fd is not None:
+                os.close(self.fd)
+                self.fd = None
+
+
+class DeadLetterFile:
+    """JSON lines with the rows a database refused for good, for inspection/reload"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.total = 0
+
+    def append(self, entry, error):
+        if isinstance(entry, TableRow):
+            table, row = entry.table, dict(zip(entry.columns, entry.values))
+        else:
+            timestamp, topic, message = entry
+            table, row = 'activity', {'created_at': timestamp, 'topic': topic, 'message': message}
+        line = json.dumps({'failed_at': datetime.now().isoformat(timespec='seconds'), 'error': str(error),
+                           'table': table, 'row': row}, ensure_ascii=False)
+        with self.lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+            self.total += 1
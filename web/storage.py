@@ -0,0 +1,787 @@
+#!/usr/bin/env python3
+"""
+HomeGuard Storage
+Common storage interface for the logger, dashboard and CLIs, with a SQLite
+backend (default, Raspberry Pi) and a MySQL/MariaDB backend (larger installs)
+
+Operations:
+    insert_activity / insert_batch   -> batched writes
+    query_range                      -> rows of a time window
+    sensor_readings / sensor_stats   -> JSON fields of sensor messages, aggregates
+    count_since / table_count / ...  -> counters
+    latest_state                     -> last message of every topic
+
+Each backend keeps its own connection pool and writes the SQL in its own
+dialect (datetime modifiers vs INTERVAL, json_extract vs JSON_UNQUOTE, ...).
+
+Backend selection: STORAGE_CONFIG['backend'] or the HOMEGUARD_STORAGE
+environment variable ('sqlite' or 'mysql'). The MySQL connection settings
+come from homeguard_mysql_config.json, like the migration tools.
+"""
+
+import abc
+import json
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from db_counters import COUNTED_TABLES, TOPIC_KIND_RULES, table_count, kind_counts, count_since
+from motion_sessions import ensure_session_tables, busiest_hours, sensor_summary, top_transitions
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PROJECT_ROOT = os.path.dirname(SCRIPT_DIR)
+
+STORAGE_CONFIG = {
+    'backend': os.environ.get('HOMEGUARD_STORAGE', 'sqlite'),
+    'sqlite_path': os.path.join(PROJECT_ROOT, 'db', 'homeguard.db'),
+    'mysql_config_file': 'homeguard_mysql_config.json',
+    'pool_size': 4,
+    'timeout': 20.0
+}
+
+ACTIVITY_COLUMNS = ('id', 'created_at', 'topic', 'message')
+
+# Sensor messages stored in `activity` (replace the vw_*_activity views)
+SENSOR_KINDS = {
+    'temperature': {
+        'topic': '%temperature%',
+        'fields': ('device_id', 'name', 'location', 'sensor_type', 'temperature', 'unit', 'rssi', 'uptime')
+    },
+    'humidity': {
+        'topic': '%humidity%',
+        'fields': ('device_id', 'name', 'location', 'sensor_type', 'humidity', 'unit', 'rssi', 'uptime')
+    },
+    'motion': {
+        'topic': '%motion%',
+        'fields': ('device_id', 'name', 'location')
+    },
+    'relay': {
+        'topic': '%relay%',
+        'fields': ()
+    }
+}
+
+
+class StorageError(Exception):
+    """Any storage failure
+
+    transient=True: locked/busy database or lost connection, a retry may succeed
+    (the caller may spill/retry); False: the statement or the rows are wrong
+    (missing table/column, constraint) and retrying them never succeeds.
+    """
+
+    def __init__(self, message, transient=True):
+        super().__init__(message)
+        self.transient = transient
+
+
+def sqlite_transient(error):
+    """Locked/busy (VACUUM, backup, another writer) or file not reachable"""
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    text = str(error).lower()
+    return any(word in text for word in ('locked', 'busy', 'unable to open', 'disk i/o'))
+
+
+# Lock wait timeout, deadlock, too many connections, server gone/unreachable
+MYSQL_TRANSIENT_ERRNOS = {1040, 1205, 1213, 2002, 2003, 2006, 2013, 2055}
+
+
+def mysql_transient(error):
+    from mysql.connector import errors
+    return (getattr(error, 'errno', None) in MYSQL_TRANSIENT_ERRNOS
+            or isinstance(error, (errors.InterfaceError, errors.PoolError)))
+
+
+class SQLiteDialect:
+    name = 'sqlite'
+    placeholder = '?'
+
+    def since(self, column, hours):
+        return f"{column} >= datetime('now', ?)", f'-{int(hours)} hours'
+
+    def since_hour(self, column, hours):
+        return f"{column} >= strftime('%Y-%m-%d %H:00:00', 'now', ?)", f'-{int(hours)} hours'
+
+    def json_field(self, column, field):
+        return f"json_extract({column}, '$.{field}')"
+
+    def json_valid(self, column):
+        return f"json_valid({column})"
+
+    def to_real(self, expr):
+        return f"CAST({expr} AS REAL)"
+
+    def to_int(self, expr):
+        return f"CAST({expr} AS INTEGER)"
+
+    def from_unixtime(self):
+        return "datetime(?, 'unixepoch', 'utc')"
+
+    def topic_segment(self, column, prefix):
+        """Device id after `prefix` ('home/motion/<id>/...')"""
+        start = len(prefix) + 2
+        return f"substr({column}, {start}, instr(substr({column}, {start}), '/') - 1)"
+
+
+# SQLite declared type -> MySQL column type (tables created by the migration and the replicator)
+SQLITE_TO_MYSQL_TYPES = {
+    'INTEGER': 'BIGINT',
+    'INT': 'BIGINT',
+    'REAL': 'DOUBLE',
+    'FLOAT': 'DOUBLE',
+    'DOUBLE': 'DOUBLE',
+    'DATETIME': 'DATETIME',
+    'TIMESTAMP': 'DATETIME',
+    'BOOLEAN': 'BOOLEAN',
+    'TEXT': 'TEXT'
+}
+
+
+class MySQLDialect:
+    name = 'mysql'
+    placeholder = '%s'
+
+    def create_table_sql(self, table, sqlite_columns, key='id'):
+        """CREATE TABLE for the rows of SQLite's PRAGMA table_info(table)"""
+        definitions = []
+        for _, name, col_type, not_null, _, _ in sqlite_columns:
+            if name == key:
+                definitions.append(f"`{name}` BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY")
+                continue
+            mysql_type = SQLITE_TO_MYSQL_TYPES.get((col_type or 'TEXT').split('(')[0].upper(), 'TEXT')
+            definitions.append(f"`{name}` {mysql_type}{' NOT NULL' if not_null else ''}")
+        return (f"CREATE TABLE IF NOT EXISTS `{table}` ({', '.join(definitions)}) "
+                f"ENGINE=InnoDB DEFAULT CHARSET=utf8mb4")
+
+    def upsert_sql(self, table, columns, key='id'):
+        """Batch upsert keyed on `key`: copying a row again is harmless"""
+        # Only the key: `key` = `key` keeps the existing row (an empty SET is a syntax error)
+        updates = ', '.join(f'`{c}` = VALUES(`{c}`)' for c in columns if c != key) or f'`{key}` = `{key}`'
+        # executemany() turns this INSERT into a single multi-row INSERT
+        return (f"INSERT INTO `{table}` ({', '.join(f'`{c}`' for c in columns)}) "
+                f"VALUES ({', '.join(['%s'] * len(columns))}) ON DUPLICATE KEY UPDATE {updates}")
+
+    def since(self, column, hours):
+        return f"{column} >= UTC_TIMESTAMP() - INTERVAL %s HOUR", int(hours)
+
+    def since_hour(self, column, hours):
+        return (f"{column} >= DATE_FORMAT(UTC_TIMESTAMP() - INTERVAL %s HOUR, '%Y-%m-%d %H:00:00')",
+                int(hours))
+
+    def json_field(self, column, field):
+        return f"JSON_UNQUOTE(JSON_EXTRACT({column}, '$.{field}'))"
+
+    def json_valid(self, column):
+        return f"JSON_VALID({column})"
+
+    def to_real(self, expr):
+        return f"CAST({expr} AS DECIMAL(12,4))"
+
+    def to_int(self, expr):
+        return f"CAST({expr} AS SIGNED)"
+
+    def from_unixtime(self):
+        # Sessions run with time_zone '+00:00'
+        return "FROM_UNIXTIME(%s)"
+
+    def topic_segment(self, column, prefix):
+        depth = prefix.count('/') + 1
+        return f"SUBSTRING_INDEX(SUBSTRING_INDEX({column}, '/', {depth + 1}), '/', -1)"
+
+
+class MySQLTarget:
+    """MySQL/MariaDB copy target shared by the migrator and the replicator
+    (DDL, column introspection and batched upserts)"""
+
+    name = 'MySQL'
+    placeholder = '%s'
+    dialect = MySQLDialect()
+
+    def __init__(self, config, connection_timeout=10):
+        self.config = config
+        self.connection_timeout = connection_timeout
+
+    def describe(self):
+        return f"{self.config['host']}:{self.config['port']}/{self.config['database']}"
+
+    def connect(self):
+        import mysql.connector
+        return mysql.connector.connect(
+            host=self.config['host'],
+            port=self.config['port'],
+            database=self.config['database'],
+            user=self.config['user'],
+            password=self.config['password'],
+            charset=self.config.get('charset', 'utf8mb4'),
+            autocommit=False,
+            connection_timeout=self.connection_timeout
+        )
+
+    def columns(self, conn, table):
+        """Columns of `table` on the target (empty if it does not exist)"""
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = %s AND table_name = %s
+            ORDER BY ordinal_position
+        """, (self.config['database'], table))
+        columns = [row[0] for row in cursor.fetchall()]
+        cursor.close()
+        return columns
+
+    def create_table(self, conn, table, sqlite_columns, key='id'):
+        """CREATE TABLE from the SQLite PRAGMA table_info rows"""
+        cursor = conn.cursor()
+        cursor.execute(self.dialect.create_table_sql(table, sqlite_columns, key))
+        conn.commit()
+        cursor.close()
+
+    def upsert_sql(self, table, columns, key='id'):
+        return self.dialect.upsert_sql(table, columns, key)
+
+    def upsert_many(self, conn, sql, rows):
+        cursor = conn.cursor()
+        try:
+            cursor.executemany(sql, rows)
+        finally:
+            cursor.close()
+
+
+class ConnectionPool:
+    """Fixed-size pool; callers block while every connection is in use"""
+
+    def __init__(self, factory, size, errors, transient=lambda error: True):
+        self.factory = factory
+        self.errors = errors
+        self.transient = transient
+        self.idle = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self):
+        self.slots.acquire()
+        conn = None
+        try:
+            try:
+                conn = self.idle.get_nowait()
+            except queue.Empty:
+                conn = self.factory()
+            yield conn
+            # Ends the read snapshot (MySQL) before the connection is reused
+            conn.rollback()
+            self.idle.put(conn)
+        except self.errors as e:
+            # A failed connection may be broken (lost server, locked file): discard it
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+            raise StorageError(str(e), transient=self.transient(e)) from e
+        except Exception:
+            if conn is not None:
+                conn.rollback()
+                self.idle.put(conn)
+            raise
+        finally:
+            self.slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+class StorageBackend(abc.ABC):
+    """Dialect-independent operations (subclasses provide pool and dialect)"""
+
+    dialect = None
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    @abc.abstractmethod
+    def describe(self):
+        """One-line description of the database (logs, --status)"""
+
+    def close(self):
+        self.pool.close()
+
+    # ----------------------------------------------------------------- core
+
+    def fetch_all(self, sql, params=()):
+        """Rows as dictionaries"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sql, params)
+                names = [col[0] for col in cursor.description]
+                return [dict(zip(names, row)) for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+
+    def fetch_value(self, sql, params=()):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sql, params)
+                row = cursor.fetchone()
+                return row[0] if row else None
+            finally:
+                cursor.close()
+
+    def insert_batch(self, table, columns, rows):
+        """Insert many rows in one transaction"""
+        if not rows:
+            return 0
+        sql = (f"INSERT INTO {table} ({', '.join(columns)}) "
+               f"VALUES ({', '.join([self.dialect.placeholder] * len(columns))})")
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.executemany(sql, rows)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+        return len(rows)
+
+    def insert_activity(self, entries):
+        """Insert [(unix_timestamp, topic, message), ...] into `activity`"""
+        if not entries:
+            return 0
+        p = self.dialect.placeholder
+        sql = f"INSERT INTO activity (created_at, topic, message) VALUES ({self.dialect.from_unixtime()}, {p}, {p})"
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.executemany(sql, entries)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+        return len(entries)
+
+    # -------------------------------------------------------------- queries
+
+    def query_range(self, table='activity', hours=None, topic_like=None, columns=ACTIVITY_COLUMNS,
+                    limit=None, newest_first=True):
+        """Rows of `table` from the last `hours` hours (all rows if None)"""
+        p = self.dialect.placeholder
+        conditions, params = [], []
+        if hours is not None:
+            condition, param = self.dialect.since('created_at', hours)
+            conditions.append(condition)
+            params.append(param)
+        if topic_like is not None:
+            conditions.append(f"topic LIKE {p}")
+            params.append(topic_like)
+
+        sql = f"SELECT {', '.join(columns)} FROM {table}"
+        if conditions:
+            sql += f" WHERE {' AND '.join(conditions)}"
+        sql += f" ORDER BY id {'DESC' if newest_first else 'ASC'}"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        return self.fetch_all(sql, params)
+
+    def _sensor_source(self, kind, hours):
+        """Subquery with the JSON fields of a sensor kind (what the views used to do)"""
+        spec = SENSOR_KINDS[kind]
+        condition, param = self.dialect.since('created_at', hours)
+        fields = ''.join(f", {self.dialect.json_field('message', field)} AS {field}"
+                         for field in spec['fields'])
+        sql = (f"SELECT id, created_at, topic, message{fields} FROM activity "
+               f"WHERE topic LIKE {self.dialect.placeholder} AND {condition}")
+        if spec['fields']:
+            sql += f" AND {self.dialect.json_valid('message')}"
+        return sql, [spec['topic'], param]
+
+    def sensor_readings(self, kind, hours=24, limit=50):
+        """Latest messages of a sensor kind with their JSON fields"""
+        source, params = self._sensor_source(kind, hours)
+        return self.fetch_all(f"{source} ORDER BY created_at DESC LIMIT {int(limit)}", params)
+
+    def sensor_stats(self, kind, hours=24, value_field=None):
+        """Per-device count, first/last and avg/min/max of `value_field`"""
+        source, params = self._sensor_source(kind, hours)
+        d = self.dialect
+        columns = [
+            'device_id',
+            'MAX(location) AS location',
+            'COUNT(*) AS total',
+            'MIN(created_at) AS first_at',
+            'MAX(created_at) AS last_at'
+        ]
+        if value_field:
+            value = d.to_real(value_field)
+            columns += [
+                'MAX(sensor_type) AS sensor_type',
+                f'ROUND(AVG({value}), 2) AS avg_value',
+                f'ROUND(MIN({value}), 2) AS min_value',
+                f'ROUND(MAX({value}), 2) AS max_value',
+                f"ROUND(AVG({d.to_int('rssi')}), 0) AS avg_rssi"
+            ]
+        sql = f"SELECT {', '.join(columns)} FROM ({source}) s GROUP BY device_id"
+        return self.fetch_all(sql, params)
+
+    def count_distinct(self, kind, hours, field):
+        source, params = self._sensor_source(kind, hours)
+        return self.fetch_value(f"SELECT COUNT(DISTINCT {field}) FROM ({source}) s", params) or 0
+
+    @abc.abstractmethod
+    def latest_state(self, topic_like='home/%'):
+        """Last message of every topic matching `topic_like`"""
+
+    def date_range(self, table='activity'):
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(f"SELECT MIN(created_at), MAX(created_at) FROM {table}")
+                return cursor.fetchone()
+            finally:
+                cursor.close()
+
+    def top_topics(self, limit=10):
+        return self.fetch_all(f"""
+            SELECT topic, COUNT(*) AS count
+            FROM activity
+            WHERE topic NOT LIKE 'system/%'
+            GROUP BY topic
+            ORDER BY count DESC
+            LIMIT {int(limit)}
+        """)
+
+    def device_activity(self):
+        """Message count per device id (topic segment after the device family)"""
+        cases = ' '.join(
+            f"WHEN topic LIKE '{prefix}/%' THEN {self.dialect.topic_segment('topic', prefix)}"
+            for prefix in ('home/motion', 'home/sensor', 'home/relay', 'home/temperature', 'home/humidity')
+        )
+        return self.fetch_all(f"""
+            SELECT
+                CASE {cases}
+                    WHEN topic LIKE 'home/RDA5807/%' THEN 'RDA5807'
+                    ELSE 'other'
+                END AS device_id,
+                COUNT(*) AS message_count
+            FROM activity
+            WHERE topic LIKE 'home/%'
+            GROUP BY 1
+            ORDER BY message_count DESC
+        """)
+
+    # ------------------------------------------------------------- counters
+
+    @abc.abstractmethod
+    def table_count(self, table):
+        """Total rows of `table`"""
+
+    @abc.abstractmethod
+    def kind_counts(self, table):
+        """[(kind, rows), ...] of `table`, largest first"""
+
+    @abc.abstractmethod
+    def count_since(self, table, hours):
+        """Rows of `table` in the last `hours` hours (hour granularity)"""
+
+    def motion_occupancy(self, limit=10):
+        """Precomputed occupancy (motion_sessions tables); empty where they are not maintained"""
+        return {'rooms': [], 'busiest_hours': [], 'transitions': []}
+
+
+class SQLiteStorage(StorageBackend):
+    """SQLite backend; counters come from the trigger-maintained tables"""
+
+    dialect = SQLiteDialect()
+
+    def __init__(self, path, pool_size=4, timeout=20.0):
+        self.path = path
+        self.timeout = timeout
+        self.sessions_ready = False
+        super().__init__(ConnectionPool(self._connect, pool_size, sqlite3.Error, sqlite_transient))
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False)
+
+    def describe(self):
+        return f"SQLite {self.path}"
+
+    def latest_state(self, topic_like='home/%'):
+        # SQLite returns the bare columns of the MAX(id) row: one pass, no self-join
+        return self.fetch_all("""
+            SELECT topic, message, created_at, MAX(id) AS id
+            FROM activity
+            WHERE topic LIKE ?
+            GROUP BY topic
+            ORDER BY topic
+        """, (topic_like,))
+
+    def _with_conn(self, function, *args):
+        with self.pool.connection() as conn:
+            return function(conn, *args)
+
+    def table_count(self, table):
+        return self._with_conn(table_count, table)
+
+    def kind_counts(self, table):
+        return self._with_conn(kind_counts, table)
+
+    def count_since(self, table, hours):
+        return self._with_conn(count_since, table, hours)
+
+    def motion_occupancy(self, limit=10):
+        def query(conn):
+            # init_database.py creates the tables; older databases get them once per process
+            if not self.sessions_ready:
+                ensure_session_tables(conn)
+                self.sessions_ready = True
+            return {
+                'rooms': sensor_summary(conn),
+                'busiest_hours': busiest_hours(conn, limit),
+                'transitions': top_transitions(conn, limit),
+            }
+        return self._with_conn(query)
+
+
+def _topic_kind_like_sql(column):
+    """MySQL version of the db_counters topic kinds (GLOB '*' -> LIKE '%')"""
+    cases = []
+    for kind, patterns in TOPIC_KIND_RULES:
+        condition = ' OR '.join(f"{column} LIKE BINARY '{pattern.replace('*', '%')}'" for pattern in patterns)
+        cases.append(f"WHEN {condition} THEN '{kind}'")
+    return f"CASE {' '.join(cases)} ELSE 'other' END"
+
+
+# db_counters tables on MySQL (same names and meaning, kept by MySQL triggers)
+MYSQL_COUNTER_SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS row_counters (
+        table_name VARCHAR(64) NOT NULL,
+        kind VARCHAR(191) NOT NULL,
+        row_count BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (table_name, kind)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4''',
+    '''CREATE TABLE IF NOT EXISTS hourly_counters (
+        table_name VARCHAR(64) NOT NULL,
+        kind VARCHAR(191) NOT NULL,
+        hour CHAR(13) NOT NULL,
+        row_count BIGINT NOT NULL DEFAULT 0,
+        PRIMARY KEY (table_name, hour, kind)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4''',
+    '''CREATE TABLE IF NOT EXISTS counter_state (
+        table_name VARCHAR(64) PRIMARY KEY,
+        initialized_at DATETIME NOT NULL
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4'''
+]
+
+
+def _mysql_counter_kind(table):
+    """db_counters kind expression of `table` in MySQL ({row} placeholder)"""
+    if table == 'activity':
+        return _topic_kind_like_sql('{row}.topic')
+    return COUNTED_TABLES[table][0]
+
+
+def _mysql_trigger_sql(table):
+    """{trigger name: CREATE TRIGGER} keeping row_counters/hourly_counters of `table`"""
+    kind_expr, time_column = _mysql_counter_kind(table), COUNTED_TABLES[table][1]
+    insert_kind = kind_expr.format(row='NEW')
+    delete_kind = kind_expr.format(row='OLD')
+    return {
+        f'trg_{table}_count_insert': f'''CREATE TRIGGER trg_{table}_count_insert AFTER INSERT ON `{table}`
+        FOR EACH ROW BEGIN
+            INSERT INTO row_counters (table_name, kind, row_count)
+            VALUES ('{table}', {insert_kind}, 1)
+            ON DUPLICATE KEY UPDATE row_count = row_count + 1;
+            INSERT INTO hourly_counters (table_name, kind, hour, row_count)
+            VALUES ('{table}', {insert_kind}, LEFT(NEW.{time_column}, 13), 1)
+            ON DUPLICATE KEY UPDATE row_count = row_count + 1;
+        END''',
+        f'trg_{table}_count_delete': f'''CREATE TRIGGER trg_{table}_count_delete AFTER DELETE ON `{table}`
+        FOR EACH ROW BEGIN
+            UPDATE row_counters SET row_count = row_count - 1
+            WHERE table_name = '{table}' AND kind = {delete_kind};
+            UPDATE hourly_counters SET row_count = row_count - 1
+            WHERE table_name = '{table}' AND kind = {delete_kind}
+              AND hour = LEFT(OLD.{time_column}, 13);
+        END'''
+    }
+
+
+class MySQLStorage(StorageBackend):
+    """MySQL/MariaDB backend using the connector's own pool
+
+    Counters come from the same row_counters/hourly_counters tables as on
+    SQLite, created with their triggers and backfilled on first use (the
+    replicator's upserts only fire the insert trigger for new rows).
+    """
+
+    dialect = MySQLDialect()
+
+    def __init__(self, config, pool_size=4):
+        import mysql.connector
+        from mysql.connector import pooling
+
+        self.config = config
+        self.counters_ready = False
+        self.counters_lock = threading.Lock()
+        try:
+            mysql_pool = pooling.MySQLConnectionPool(
+                pool_name='homeguard',
+                pool_size=pool_size,
+                host=config['host'],
+                port=config['port'],
+                database=config['database'],
+                user=config['user'],
+                password=config['password'],
+                charset=config.get('charset', 'utf8mb4'),
+                autocommit=False,
+                time_zone='+00:00'
+            )
+        except mysql.connector.Error as e:
+            raise StorageError(str(e)) from e
+        # Pooled connections go back to the MySQL pool on close()
+        super().__init__(ConnectionPool(mysql_pool.get_connection, pool_size, mysql.connector.Error,
+                                        mysql_transient))
+
+    def describe(self):
+        return f"MySQL {self.config['host']}:{self.config['port']}/{self.config['database']}"
+
+    def latest_state(self, topic_like='home/%'):
+        # Index-friendly self-join on the newest id per topic
+        return self.fetch_all("""
+            SELECT a.topic, a.message, a.created_at, a.id
+            FROM activity a
+            JOIN (SELECT topic, MAX(id) AS id FROM activity WHERE topic LIKE %s GROUP BY topic) l
+              ON a.id = l.id
+            ORDER BY a.topic
+        """, (topic_like,))
+
+    def ensure_counters(self):
+        """Create counter tables/triggers and backfill the tables not yet counted"""
+        with self.counters_lock:
+            if self.counters_ready:
+                return
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    self._ensure_counters(conn, cursor)
+                finally:
+                    cursor.close()
+            self.counters_ready = True
+
+    def _ensure_counters(self, conn, cursor):
+        cursor.execute("SELECT table_name FROM information_schema.tables WHERE table_schema = DATABASE()")
+        tables = {row[0] for row in cursor.fetchall()}
+        pending = [t for t in COUNTED_TABLES if t in tables]
+        if 'counter_state' in tables:
+            cursor.execute("SELECT table_name FROM counter_state")
+            done = {row[0] for row in cursor.fetchall()}
+            pending = [t for t in pending if t not in done]
+        if not pending:
+            return
+
+        for statement in MYSQL_COUNTER_SCHEMA:
+            cursor.execute(statement)
+        cursor.execute("SELECT trigger_name FROM information_schema.triggers WHERE trigger_schema = DATABASE()")
+        triggers = {row[0] for row in cursor.fetchall()}
+
+        for table in pending:
+            # DDL commits on its own: the triggers count from here on
+            for name, statement in _mysql_trigger_sql(table).items():
+                if name not in triggers:
+                    cursor.execute(statement)
+
+            # The DELETE and the locking INSERT ... SELECT wait for in-flight
+            # writers and block new ones until COMMIT: no row counted twice or missed
+            kind = _mysql_counter_kind(table).format(row=table)
+            time_column = COUNTED_TABLES[table][1]
+            cursor.execute("DELETE FROM row_counters WHERE table_name = %s", (table,))
+            cursor.execute("DELETE FROM hourly_counters WHERE table_name = %s", (table,))
+            cursor.execute(f"""
+                INSERT INTO hourly_counters (table_name, kind, hour, row_count)
+                SELECT '{table}', {kind}, LEFT({time_column}, 13), COUNT(*)
+                FROM `{table}`
+                GROUP BY 2, 3
+            """)
+            cursor.execute("""
+                INSERT INTO row_counters (table_name, kind, row_count)
+                SELECT table_name, kind, SUM(row_count)
+                FROM hourly_counters
+                WHERE table_name = %s
+                GROUP BY kind
+            """, (table,))
+            cursor.execute("REPLACE INTO counter_state (table_name, initialized_at) VALUES (%s, UTC_TIMESTAMP())",
+                           (table,))
+            conn.commit()
+
+    def table_count(self, table):
+        if table not in COUNTED_TABLES:
+            return self.fetch_value(f"SELECT COUNT(*) FROM {table}") or 0
+        self.ensure_counters()
+        return self.fetch_value("SELECT COALESCE(SUM(row_count), 0) FROM row_counters WHERE table_name = %s",
+                                (table,)) or 0
+
+    def kind_counts(self, table):
+        if table not in COUNTED_TABLES:
+            return [('all', self.table_count(table))]
+        self.ensure_counters()
+        rows = self.fetch_all("""
+            SELECT kind, row_count FROM row_counters
+            WHERE table_name = %s AND row_count > 0
+            ORDER BY row_count DESC
+        """, (table,))
+        return [(row['kind'], row['row_count']) for row in rows]
+
+    def count_since(self, table, hours):
+        if table not in COUNTED_TABLES:
+            condition, param = self.dialect.since_hour('created_at', hours)
+            return self.fetch_value(f"SELECT COUNT(*) FROM {table} WHERE {condition}", (param,)) or 0
+        self.ensure_counters()
+        return self.fetch_value("""
+            SELECT COALESCE(SUM(row_count), 0) FROM hourly_counters
+            WHERE table_name = %s AND hour >= DATE_FORMAT(UTC_TIMESTAMP() - INTERVAL %s HOUR, '%Y-%m-%d %H')
+        """, (table, int(hours))) or 0
+
+
+def load_mysql_config(filename):
+    """homeguard_mysql_config.json lookup (current dir, web/, project root, home)"""
+    for config_path in (filename, os.path.join(SCRIPT_DIR, filename),
+                        os.path.join(PROJECT_ROOT, filename), f'~/{filename}'):
+        expanded_path = os.path.expanduser(config_path)
+        if os.path.exists(expanded_path):
+            with open(expanded_path, 'r') as f:
+                return json.load(f)['mysql']
+    raise FileNotFoundError(f'{filename} não encontrado')
+
+
+def open_storage(**overrides):
+    """Create the configured backend (keyword arguments override STORAGE_CONFIG)"""
+    config = dict(STORAGE_CONFIG, **overrides)
+    if config['backend'] == 'mysql':
+        return MySQLStorage(load_mysql_config(config['mysql_config_file']), pool_size=config['pool_size'])
+    if config['backend'] == 'sqlite':
+        return SQLiteStorage(config['sqlite_path'], pool_size=config['pool_size'], timeout=config['timeout'])
+    raise ValueError(f"Unknown storage backend: {config['backend']}")
+
+
+_default_storage = None
+_default_lock = threading.Lock()
+
+
+def get_storage():
+    """Shared backend built from STORAGE_CONFIG (created on first use)"""
+    global _default_storage
+    with _default_lock:
+        if _default_storage is None:
+            _default_storage = open_storage()
+        return _default_storage